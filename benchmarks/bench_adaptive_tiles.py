@@ -0,0 +1,120 @@
+"""
+Бенчмарк плиток по содержимому: текст без потерь, фото - JPEG
+
+Те же экраны, что в bench_tile_delta (slide, ide, video, 1280x720), или
+записанный урок (--recording: кадры screen/*.jpg записи LessonRecorder).
+
+Три варианта TileEncoder (ключевые кадры + дельты плиток):
+- JPEG --quality (как у профилей large/ultra - мелкий шрифт размыт)
+- JPEG --high (качество, до которого преподаватели поднимают ползунок)
+- adaptive: плитки текста - WebP без потерь, остальные - JPEG --quality
+
+Для каждого: трафик, четкость текста - PSNR холста студента на плитках
+текста (lossless_tiles исходного кадра; inf - без искажений), PSNR
+остальных плиток и время кодирования.
+
+Запуск:
+    python -m benchmarks.bench_adaptive_tiles
+    python -m benchmarks.bench_adaptive_tiles --quality 50 --high 90
+    python -m benchmarks.bench_adaptive_tiles --recording recordings/lesson_20240101_100000
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_tile_delta import WIDTH, HEIGHT, slide_frames, ide_frames, video_frames
+from benchmarks.bench_video_codec import recording_frames
+from src.streaming.tile_delta import TileEncoder, TileCanvas, TILE_LOSSLESS_FORMAT, TILE_SIZE, lossless_tiles
+
+
+def tile_mask(frame: np.ndarray) -> np.ndarray:
+    """Маска пикселей плиток текста (по целым плиткам кадра)"""
+    height, width = frame.shape[:2]
+    rows, cols = height // TILE_SIZE, width // TILE_SIZE
+    tiles = frame[:rows * TILE_SIZE, :cols * TILE_SIZE].reshape(rows, TILE_SIZE, cols, TILE_SIZE, 3)
+    text = lossless_tiles(tiles.swapaxes(1, 2).reshape(-1, TILE_SIZE, TILE_SIZE, 3)).reshape(rows, cols)
+    mask = np.zeros((height, width), dtype=bool)
+    mask[:rows * TILE_SIZE, :cols * TILE_SIZE] = np.repeat(np.repeat(text, TILE_SIZE, 0), TILE_SIZE, 1)
+    return mask
+
+
+def psnr(squared_error: float, pixels: int) -> float:
+    if not pixels:
+        return float('nan')
+    mse = squared_error / pixels
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def run(frames: list, quality: int, adaptive: bool, args) -> dict:
+    encoder = TileEncoder(quality, adaptive=adaptive)
+    start = time.perf_counter()
+    encoded = [encoder.encode(frame, i, now=i / args.fps) for i, frame in enumerate(frames)]
+    encode_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    canvas = TileCanvas()
+    errors = {True: [0.0, 0], False: [0.0, 0]}
+    for i, (frame, data) in enumerate(zip(frames, encoded)):
+        shown = canvas.apply(data, i)
+        diff = cv2.absdiff(shown, frame).astype(np.float32)
+        squared = (diff * diff).mean(axis=2)
+        mask = tile_mask(frame)
+        for text, pixels in ((True, mask), (False, ~mask)):
+            errors[text][0] += float(squared[pixels].sum())
+            errors[text][1] += int(pixels.sum())
+    
+    total = sum(len(data) for data in encoded)
+    stats = encoder.get_stats()
+    return {
+        'mbps': total * 8 * args.fps / len(frames) / 1_000_000,
+        'text_psnr': psnr(*errors[True]),
+        'other_psnr': psnr(*errors[False]),
+        'lossless': stats['lossless_tiles'] / stats['tiles_sent'] if stats['tiles_sent'] else 0.0,
+        'encode_ms': encode_ms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Плитки по содержимому: трафик и четкость текста")
+    parser.add_argument("--frames", type=int, default=240, help="Кадров на экран")
+    parser.add_argument("--fps", type=float, default=24.0, help="Кадров в секунду")
+    parser.add_argument("--quality", type=int, default=60, help="Качество JPEG (профиль large)")
+    parser.add_argument("--high", type=int, default=90, help="Повышенное качество JPEG для сравнения")
+    parser.add_argument("--recording", help="Папка записи урока вместо синтетических экранов")
+    args = parser.parse_args()
+    
+    if args.recording:
+        contents = {"lesson": recording_frames(args.recording, args.frames)}
+    else:
+        contents = {
+            "slide": list(slide_frames(args.frames)),
+            "ide": list(ide_frames(args.frames, args.fps)),
+            "video": list(video_frames(args.frames)),
+        }
+    
+    variants = [
+        (f"JPEG {args.quality}", args.quality, False),
+        (f"JPEG {args.high}", args.high, False),
+        (f"adaptive {args.quality}", args.quality, True),
+    ]
+    print(f"Экран {WIDTH}x{HEIGHT}, {args.frames} кадров, {args.fps:g} к/с, плитки {TILE_SIZE}, "
+          f"без потерь - {TILE_LOSSLESS_FORMAT[1:].upper()}")
+    print(f"{'Экран':>6} | {'вариант':>12} | {'Мбит/с':>7} | {'PSNR текста':>11} | {'PSNR прочего':>12} | "
+          f"{'без потерь':>10} | {'кодир., мс':>10}")
+    print("-" * 90)
+    for name, frames in contents.items():
+        for label, quality, adaptive in variants:
+            r = run(frames, quality, adaptive, args)
+            print(f"{name:>6} | {label:>12} | {r['mbps']:>7.2f} | {r['text_psnr']:>8.1f} dB | "
+                  f"{r['other_psnr']:>9.1f} dB | {r['lossless'] * 100:>9.0f}% | {r['encode_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк сборщиков TCP пакетов
+
+Сравнивает TCPPacketAssembler (bytes += data, срез на каждый пакет)
+и RingPacketAssembler (recv_into в буфер, пакеты как memoryview)
+на сообщениях 1 KB, 64 KB и 1 MB.
+
+Запуск:
+    python -m benchmarks.bench_assembler
+    python -m benchmarks.bench_assembler --total-mb 64 --fragment 16384
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.network.protocol import Protocol, TCPPacketAssembler, RingPacketAssembler
+from src.common.constants import MessageType, BUFFER_SIZE
+
+
+class FakeSocket:
+    """
+    Имитация TCP сокета: отдает заранее подготовленный поток
+    фрагментами не больше fragment байт (как recv() из ядра)
+    """
+    
+    def __init__(self, stream: bytes, fragment: int):
+        self._stream = memoryview(stream)
+        self._pos = 0
+        self._fragment = fragment
+    
+    def recv(self, size: int) -> bytes:
+        n = min(size, self._fragment, len(self._stream) - self._pos)
+        data = self._stream[self._pos:self._pos + n].tobytes()
+        self._pos += n
+        return data
+    
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        size = nbytes or len(buffer)
+        n = min(size, self._fragment, len(self._stream) - self._pos)
+        buffer[:n] = self._stream[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+def build_stream(message_size: int, total_bytes: int) -> tuple:
+    """Собрать поток бинарных пакетов суммарным размером ~total_bytes"""
+    packet = Protocol.pack_binary(MessageType.SCREEN_FRAME, {"frame_id": 0}, os.urandom(message_size))
+    count = max(1, total_bytes // len(packet))
+    return packet * count, count
+
+
+def run_old(stream: bytes, fragment: int) -> int:
+    """Старый путь: recv() + TCPPacketAssembler.feed()"""
+    sock = FakeSocket(stream, fragment)
+    assembler = TCPPacketAssembler()
+    packets = 0
+    while True:
+        data = sock.recv(BUFFER_SIZE)
+        if not data:
+            break
+        packets += len(assembler.feed(data))
+    return packets
+
+
+def run_ring(stream: bytes, fragment: int) -> int:
+    """Новый путь: RingPacketAssembler.recv_into() + read_packets()"""
+    sock = FakeSocket(stream, fragment)
+    assembler = RingPacketAssembler()
+    packets = 0
+    while assembler.recv_into(sock):
+        packets += len(assembler.read_packets())
+    return packets
+
+
+def measure(func, stream: bytes, fragment: int, expected: int, repeats: int) -> float:
+    """Лучшая пропускная способность (байт/сек) из нескольких прогонов"""
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        assembled = func(stream, fragment)
+        elapsed = time.perf_counter() - start
+        assert assembled == expected, f"собрано {assembled}, ожидалось {expected}"
+        best = max(best, len(stream) / elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сборщиков TCP пакетов")
+    parser.add_argument("--total-mb", type=int, default=32, help="Объем потока на размер сообщения, МБ")
+    parser.add_argument("--fragment", type=int, default=16 * 1024, help="Размер фрагмента recv(), байт")
+    parser.add_argument("--repeats", type=int, default=3, help="Количество прогонов")
+    args = parser.parse_args()
+    
+    sizes = [("1 KB", 1024), ("64 KB", 64 * 1024), ("1 MB", 1024 * 1024)]
+    
+    print(f"Поток: {args.total_mb} МБ на размер, фрагмент recv: {args.fragment} байт")
+    print(f"{'Сообщение':>10} | {'TCPPacketAssembler':>20} | {'RingPacketAssembler':>20} | {'Ускорение':>9}")
+    print("-" * 70)
+    
+    for label, size in sizes:
+        stream, count = build_stream(size, args.total_mb * 1024 * 1024)
+        old = measure(run_old, stream, args.fragment, count, args.repeats)
+        ring = measure(run_ring, stream, args.fragment, count, args.repeats)
+        print(f"{label:>10} | {old / 1e6:>15.1f} MB/s | {ring / 1e6:>15.1f} MB/s | {ring / old:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Бенчмарк конвейера захвата: последовательный цикл против CapturePipeline
+
+Экран 1920x1080 (BGRA, как у mss), трансляция 1920x1080 JPEG, --fps
+кадров в секунду. "Захват" - копия готового кадра (сам mss не нужен),
+"сеть" - задержка --send-ms на кадр (рассылка 30 студентам по TCP).
+
+- serial: как был _capture_loop - конвертация, imencode и рассылка в
+  одном потоке, следующий захват только после отправки
+- pipeline: CapturePipeline с --workers потоками кодирования
+
+Для каждого: отправлено кадров в секунду, пропущено, задержка стадий
+и полная задержка от захвата до отправки.
+
+Запуск:
+    python -m benchmarks.bench_capture_pipeline
+    python -m benchmarks.bench_capture_pipeline --fps 30 --seconds 5 --workers 3 --send-ms 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.streaming.capture_pipeline import CapturePipeline, ENCODE_WORKERS
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_screen() -> np.ndarray:
+    """Экран 1920x1080 (BGRA): окна и строки текста"""
+    rng = np.random.default_rng(1)
+    frame = np.full((HEIGHT, WIDTH, 3), 235, dtype=np.uint8)
+    for _ in range(6):
+        x, y = int(rng.integers(0, 1400)), int(rng.integers(0, 700))
+        color = tuple(int(c) for c in rng.integers(150, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + 500, y + 350), color, -1)
+    for line in range(40):
+        text = "".join(chr(int(c)) for c in rng.integers(65, 122, 60))
+        cv2.putText(frame, text, (20, 30 + line * 26), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 30, 30), 1)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+
+def convert(raw: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(np.array(raw), cv2.COLOR_BGRA2BGR)
+
+
+def make_encode(quality: int):
+    def encode(frame: np.ndarray, frame_id: int) -> bytes:
+        return cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+    return encode
+
+
+def make_send(send_ms: float):
+    def send(data: bytes, frame_id: int):
+        time.sleep(send_ms / 1000)
+    return send
+
+
+def run_serial(screen: np.ndarray, args) -> dict:
+    encode, send = make_encode(args.quality), make_send(args.send_ms)
+    interval = 1.0 / args.fps
+    sent = dropped = 0
+    total_ms = 0.0
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        raw = screen.copy()
+        send(encode(convert(raw), sent), sent)
+        sent += 1
+        elapsed = time.perf_counter() - start
+        total_ms += elapsed * 1000
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
+        else:
+            dropped += 1
+    return {"fps": sent / args.seconds, "dropped": dropped, "total_ms": total_ms / max(1, sent), "stages": None}
+
+
+def run_pipeline(screen: np.ndarray, args) -> dict:
+    pipeline = CapturePipeline(convert, make_encode(args.quality), make_send(args.send_ms), workers=args.workers)
+    pipeline.start()
+    interval = 1.0 / args.fps
+    dropped = 0
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        raw = screen.copy()
+        if not pipeline.submit(raw, time.perf_counter() - start):
+            dropped += 1
+        elapsed = time.perf_counter() - start
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
+        else:
+            dropped += 1
+    stats = pipeline.get_stats()
+    pipeline.stop()
+    return {
+        "fps": stats["frames_sent"] / args.seconds,
+        "dropped": dropped,
+        "total_ms": stats["stages"]["total"]["avg_ms"],
+        "stages": stats["stages"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвейер захвата экрана: последовательно и по стадиям")
+    parser.add_argument("--fps", type=float, default=30.0, help="Кадров в секунду")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Длительность каждого прогона")
+    parser.add_argument("--workers", type=int, default=ENCODE_WORKERS, help="Потоков кодирования")
+    parser.add_argument("--quality", type=int, default=85, help="Качество JPEG")
+    parser.add_argument("--send-ms", type=float, default=8.0, help="Рассылка одного кадра, мс")
+    args = parser.parse_args()
+    
+    screen = make_screen()
+    print(f"Экран {WIDTH}x{HEIGHT}, цель {args.fps:g} к/с, JPEG {args.quality}, рассылка {args.send_ms:g} мс, "
+          f"потоков кодирования: {args.workers}")
+    print(f"{'Цикл':>8} | {'к/с':>6} | {'пропущено':>9} | {'захват->отправка, мс':>20}")
+    print("-" * 54)
+    results = {"serial": run_serial(screen, args), "pipeline": run_pipeline(screen, args)}
+    for name, result in results.items():
+        print(f"{name:>8} | {result['fps']:>6.1f} | {result['dropped']:>9} | {result['total_ms']:>20.1f}")
+    
+    print("\nСтадии конвейера, мс (среднее / максимум):")
+    for stage, timer in results["pipeline"]["stages"].items():
+        print(f"  {stage:>8}: {timer['avg_ms']:>6.1f} / {timer['max_ms']:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Бенчмарк склейки мелких сообщений
+
+К серверу подключаются --students студентов (сырые сокеты, чтение
+одним потоком через selectors). Преподаватель рисует на доске
+(WHITEBOARD_COMMAND с частотой --rate в секунду), студенты шлют PING
+каждые --ping-interval секунд и получают PONG. Сравниваются системные
+вызовы send() на сервере без склейки и со склейкой.
+
+Склеивать есть что, только если сообщения идут чаще окна склейки:
+при 200 командах в секунду и окне 2 мс выигрыша почти нет, при 500 -
+вдвое меньше send().
+
+Запуск:
+    python -m benchmarks.bench_coalescing
+    python -m benchmarks.bench_coalescing --students 50 --rate 1000 --core selectors
+"""
+
+import argparse
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import MessageType, ServerCore, COALESCE_WINDOW, COALESCE_MAX_BYTES
+from src.network.protocol import MessageBuilder
+from src.network.server import create_teacher_server
+
+
+class Students:
+    """Студенты на сырых сокетах: читают все, периодически шлют PING"""
+    
+    def __init__(self, port: int, count: int):
+        self.sockets = []
+        for i in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(MessageBuilder.student_connect(f"Студент {i}", f"bench-coalesce-{i}"))
+            self.sockets.append(sock)
+        
+        self.received = 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+    
+    def _read_loop(self):
+        selector = selectors.DefaultSelector()
+        for sock in self.sockets:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+        
+        while not self.done.is_set():
+            for key, _ in selector.select(timeout=0.1):
+                try:
+                    self.received += len(key.fileobj.recv(65536))
+                except (BlockingIOError, OSError):
+                    pass
+        selector.close()
+    
+    def ping_all(self):
+        packet = MessageBuilder.ping()
+        for sock in self.sockets:
+            try:
+                sock.send(packet)
+            except (BlockingIOError, OSError):
+                pass
+    
+    def close(self):
+        self.done.set()
+        self.thread.join()
+        for sock in self.sockets:
+            sock.close()
+
+
+def run(args, coalesce_bytes: int) -> dict:
+    """Прогон с заданным пределом склейки (0 - выключена)"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    
+    server = create_teacher_server("Бенчмарк", port=port, core=args.core)
+    server.coalesce_window = args.window_ms / 1000
+    server.coalesce_bytes = coalesce_bytes
+    server.start()
+    
+    students = Students(port, args.students)
+    while server.get_student_count() < args.students:
+        time.sleep(0.01)
+    before = server.get_stats()
+    
+    command = {"tool": "pen", "color": "#1e88e5", "width": 3, "points": [(400, 300), (405, 302)]}
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    next_ping = start
+    sent = 0
+    while time.perf_counter() - start < args.seconds:
+        server.broadcast_to_all(MessageType.WHITEBOARD_COMMAND, command)
+        sent += 1
+        if time.perf_counter() >= next_ping:
+            students.ping_all()
+            next_ping += args.ping_interval
+        time.sleep(max(0.0, start + sent * interval - time.perf_counter()))
+    
+    time.sleep(0.2)
+    after = server.get_stats()
+    students.close()
+    server.stop()
+    
+    calls = after['send_calls'] - before['send_calls']
+    packets = after['packets_written'] - before['packets_written']
+    return {"calls": calls, "packets": packets, "seconds": args.seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Склейка мелких сообщений: системные вызовы send()")
+    parser.add_argument("--students", type=int, default=50, help="Количество студентов")
+    parser.add_argument("--rate", type=float, default=500.0, help="Команд доски в секунду")
+    parser.add_argument("--ping-interval", type=float, default=0.5, help="Интервал PING студентов, сек")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Длительность прогона, сек")
+    parser.add_argument("--window-ms", type=float, default=COALESCE_WINDOW * 1000, help="Окно склейки, мс")
+    parser.add_argument("--core", choices=[ServerCore.THREADED, ServerCore.SELECTORS],
+                        default=ServerCore.THREADED, help="Ядро сервера")
+    args = parser.parse_args()
+    
+    print(f"Студентов: {args.students}, доска: {args.rate:.0f}/с, PING каждые {args.ping_interval} с, "
+          f"ядро: {args.core}")
+    print(f"{'Режим':>22} | {'пакетов':>8} | {'send()':>8} | {'send()/с':>9} | {'пакетов на send':>15}")
+    print("-" * 75)
+    
+    for title, coalesce_bytes in (("без склейки", 0),
+                                  (f"склейка {args.window_ms:.0f} мс", COALESCE_MAX_BYTES)):
+        result = run(args, coalesce_bytes)
+        per_call = result['packets'] / result['calls'] if result['calls'] else 0.0
+        print(f"{title:>22} | {result['packets']:>8} | {result['calls']:>8} | "
+              f"{result['calls'] / result['seconds']:>9.0f} | {per_call:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Бенчмарк кодеков сжатия на реальных payload приложения
+
+Для каждого типа сообщения собирается payload тем же путем, что и
+в приложении (serialize_message), и сжимается всеми доступными
+кодеками: zlib-6 (как Protocol.pack раньше сжимал всё), zlib-1,
+zstd, lz4. Выводятся CPU время, скорость и степень сжатия, а также
+кодек, который выбирает COMPRESSION_POLICY.
+
+Кадр экрана захватывается через mss (если есть дисплей), иначе
+рисуется синтетический рабочий стол. Чанк файла - из --file
+(по умолчанию - исходники проекта, как типичный документ).
+
+Запуск:
+    python -m benchmarks.bench_codecs
+    python -m benchmarks.bench_codecs --file lecture.pdf --repeats 50
+"""
+
+import argparse
+import base64
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import MessageType, Codec
+from src.common.utils import serialize_message
+from src.network import codecs
+from src.network.codecs import available_codecs, choose_codec
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def capture_screen_jpeg(quality: int = 70) -> tuple:
+    """JPEG кадр экрана: настоящий (mss) или синтетический рабочий стол"""
+    import cv2
+    import numpy as np
+    
+    try:
+        import mss
+        with mss.mss() as sct:
+            shot = sct.grab(sct.monitors[1])
+        frame = cv2.cvtColor(np.array(shot), cv2.COLOR_BGRA2BGR)
+        source = "захват экрана"
+    except Exception:
+        # Окно с текстом на светлом фоне + панель задач
+        frame = np.full((1080, 1920, 3), 240, dtype=np.uint8)
+        frame[1040:] = (60, 60, 60)
+        rng = random.Random(1)
+        for line in range(40):
+            text = " ".join(rng.choice(["урок", "grammar", "translate", "слово", "exercise", "Present"])
+                            for _ in range(10))
+            cv2.putText(frame, text, (40, 40 + line * 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 20), 1)
+        source = "синтетический рабочий стол"
+    
+    frame = cv2.resize(frame, (1280, 720))
+    _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes(), source
+
+
+def read_file_chunk(path: str, size: int = 64 * 1024) -> bytes:
+    """Кусок файла как в FileSender (64 KB)"""
+    if path:
+        with open(path, 'rb') as f:
+            return f.read(size)
+    
+    data = b""
+    for source in sorted(glob.glob(os.path.join(ROOT, "src", "**", "*.py"), recursive=True)):
+        with open(source, 'rb') as f:
+            data += f.read()
+        if len(data) >= size:
+            break
+    return data[:size]
+
+
+def build_payloads(file_path: str) -> list:
+    """(название, тип сообщения, payload) - как их сериализует приложение"""
+    jpeg, source = capture_screen_jpeg()
+    rng = random.Random(2)
+    
+    stroke = {
+        "tool": "pen", "color": "#1e88e5", "width": 3,
+        "points": [(400 + i + rng.randint(-3, 3), 300 + i // 2 + rng.randint(-3, 3)) for i in range(200)]
+    }
+    activity = {
+        "timestamp": time.time(),
+        "active_window": "Microsoft Word - Упражнение 5.docx",
+        "active_process": "WINWORD.EXE",
+        "idle_time": 3.5,
+        "is_active": True,
+        "open_windows": [f"Окно {i} - Google Chrome" for i in range(10)]
+    }
+    exam = {
+        "exam_id": "unit5",
+        "title": "Контрольная работа: Unit 5",
+        "questions": [
+            {"id": i, "question": f"Переведите предложение №{i}: 'I have been learning English for {i} years'",
+             "options": ["Вариант А", "Вариант Б", "Вариант В", "Вариант Г"]}
+            for i in range(30)
+        ]
+    }
+    chunk = read_file_chunk(file_path)
+    
+    return [
+        (f"Кадр экрана, base64 в JSON ({source})", MessageType.SCREEN_FRAME,
+         serialize_message(MessageType.SCREEN_FRAME, {"frame_id": 1, "payload": base64.b64encode(jpeg).decode()})),
+        ("Кадр экрана, бинарное вложение", MessageType.SCREEN_FRAME, jpeg),
+        ("Доска: штрих 200 точек", MessageType.WHITEBOARD_COMMAND,
+         serialize_message(MessageType.WHITEBOARD_COMMAND, stroke)),
+        ("Отчет активности", MessageType.ACTIVITY_REPORT,
+         serialize_message(MessageType.ACTIVITY_REPORT, activity)),
+        ("Экзамен: 30 вопросов", MessageType.EXAM_START,
+         serialize_message(MessageType.EXAM_START, exam)),
+        ("Чанк файла 64 KB (base64)", MessageType.FILE_TRANSFER_DATA,
+         serialize_message(MessageType.FILE_TRANSFER_DATA, {"chunk_index": 0, "data": base64.b64encode(chunk).decode()})),
+    ]
+
+
+def candidates() -> list:
+    """(подпись, кодек, быстрый zlib) для всех доступных кодеков"""
+    result = [("zlib-6", Codec.ZLIB, False), ("zlib-1", Codec.ZLIB, True)]
+    if codecs.ZSTD_AVAILABLE:
+        result.append((f"zstd-{codecs.ZSTD_LEVEL}", Codec.ZSTD, False))
+    if codecs.LZ4_AVAILABLE:
+        result.append(("lz4", Codec.LZ4, False))
+    return result
+
+
+def measure(codec: str, fast: bool, payload: bytes, repeats: int) -> tuple:
+    """(лучшее время сжатия в секундах, размер после сжатия)"""
+    best = float("inf")
+    compressed = b""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        compressed = codecs.compress(codec, payload, fallback_fast=fast)
+        best = min(best, time.perf_counter() - start)
+    return best, len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк кодеков сжатия")
+    parser.add_argument("--file", default="", help="Файл для чанка FILE_TRANSFER_DATA")
+    parser.add_argument("--repeats", type=int, default=20, help="Прогонов на измерение")
+    args = parser.parse_args()
+    
+    missing = [name for name, flag in (("zstandard", codecs.ZSTD_AVAILABLE), ("lz4", codecs.LZ4_AVAILABLE)) if not flag]
+    if missing:
+        print(f"Не установлены: {', '.join(missing)} - политика заменит их на zlib\n")
+    
+    old_total = new_total = 0.0
+    for title, msg_type, payload in build_payloads(args.file):
+        policy = choose_codec(msg_type, len(payload), available_codecs())
+        print(f"{title}: {len(payload)} байт, политика: {policy}")
+        print(f"  {'кодек':>8} | {'CPU, мкс':>9} | {'МБ/с':>7} | {'сжатие':>7}")
+        
+        for label, codec, fast in candidates():
+            seconds, size = measure(codec, fast, payload, args.repeats)
+            print(f"  {label:>8} | {seconds * 1e6:>9.0f} | {len(payload) / seconds / 1e6:>7.0f} | "
+                  f"{len(payload) / size:>6.2f}x")
+            if label == "zlib-6":
+                old_total += seconds
+        
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            codecs.compress_for(msg_type, payload, available_codecs())
+        new_total += (time.perf_counter() - start) / args.repeats
+        print()
+    
+    print(f"CPU на набор сообщений: zlib-6 для всего {old_total * 1e3:.2f} мс, "
+          f"по политике {new_total * 1e3:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
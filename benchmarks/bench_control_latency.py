@@ -0,0 +1,183 @@
+"""
+Бенчмарк задержки управляющих команд во время рассылки файла
+
+Сервер преподавателя рассылает файл (FILE_TRANSFER_DATA чанками по 64 KB
+в base64, как FileSender), а каждые --interval секунд отправляет
+LOCK_SCREEN с меткой времени. Студент читает сокет со скоростью
+--link-mbps (имитация сети) и меряет, сколько команда шла до него.
+
+Режим --fifo ставит команды в ту же полосу, что и файл, - так вела себя
+отправка до приоритетных полос (одна очередь, без фрагментации).
+
+Граница задержки с полосами: (SO_SNDBUF + SO_RCVBUF + фрагмент) / скорость
+сети - команда ждет только то, что уже отдано ядру.
+
+Запуск:
+    python -m benchmarks.bench_control_latency
+    python -m benchmarks.bench_control_latency --file-mb 500 --link-mbps 100
+    python -m benchmarks.bench_control_latency --file-mb 50 --fifo
+"""
+
+import argparse
+import base64
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import (
+    MessageType, ServerCore, BULK_FRAGMENT_SIZE, STUDENT_SEND_BUFFER
+)
+from src.network.protocol import Protocol, MessageBuilder, RingPacketAssembler
+from src.network.server import create_teacher_server
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Буфер приема студента: данные копятся у отправителя, как в реальной сети
+RECEIVE_BUFFER = 64 * 1024
+
+
+class ThrottledStudent:
+    """Студент, читающий сокет не быстрее заданной скорости сети"""
+    
+    def __init__(self, port: int, link_mbps: float):
+        self.rate = link_mbps * 1e6 / 8
+        self.latencies = []
+        self.file_bytes = 0
+        self.done = threading.Event()
+        
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.sock.connect(('127.0.0.1', port))
+        self.sock.sendall(MessageBuilder.student_connect("Бенчмарк", "bench-latency"))
+        
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+    
+    def _read_loop(self):
+        assembler = RingPacketAssembler()
+        start = time.perf_counter()
+        total = 0
+        
+        while not self.done.is_set():
+            # Не быстрее скорости сети
+            ahead = total / self.rate - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+            
+            try:
+                received = assembler.recv_into(self.sock, max_bytes=max(1500, int(self.rate * 0.002)))
+            except OSError:
+                break
+            if not received:
+                break
+            total += received
+            
+            for packet in assembler.read_packets():
+                message = Protocol.unpack(packet)
+                if not message:
+                    continue
+                if message["type"] == MessageType.LOCK_SCREEN:
+                    self.latencies.append(time.perf_counter() - message["data"]["sent_at"])
+                elif message["type"] == MessageType.FILE_TRANSFER_DATA:
+                    self.file_bytes += CHUNK_SIZE
+    
+    def close(self):
+        self.done.set()
+        self.sock.close()
+
+
+def enqueue(server, packet: bytes, msg_type: str):
+    """Поставить готовый пакет в очереди всех студентов (как broadcast_to_all)"""
+    with server._students_lock:
+        handlers = list(server.client_handlers.values())
+    for handler in handlers:
+        handler.send_packet(packet, msg_type)
+
+
+def push_file(server, total_bytes: int):
+    """
+    Разослать файл чанками FILE_TRANSFER_DATA
+    
+    Чанк упаковывается один раз: упаковка (JSON + zlib) медленнее
+    сети и сама по себе не дала бы очереди заполниться.
+    """
+    chunk = base64.b64encode(os.urandom(CHUNK_SIZE)).decode('ascii')
+    packet = Protocol.pack(MessageType.FILE_TRANSFER_DATA, {
+        "transfer_id": "bench",
+        "chunk_index": 0,
+        "data": chunk
+    })
+    for _ in range(total_bytes // CHUNK_SIZE):
+        enqueue(server, packet, MessageType.FILE_TRANSFER_DATA)
+
+
+def send_lock(server, fifo: bool):
+    """Отправить LOCK_SCREEN с меткой времени"""
+    packet = Protocol.pack(MessageType.LOCK_SCREEN, {"sent_at": time.perf_counter()})
+    
+    # FIFO - старое поведение: команда в общей очереди за чанками файла
+    enqueue(server, packet, MessageType.FILE_TRANSFER_DATA if fifo else MessageType.LOCK_SCREEN)
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка команд во время рассылки файла")
+    parser.add_argument("--file-mb", type=int, default=500, help="Размер рассылаемого файла, МБ")
+    parser.add_argument("--link-mbps", type=float, default=100.0, help="Скорость сети студента, Мбит/с")
+    parser.add_argument("--interval", type=float, default=0.1, help="Интервал отправки LOCK_SCREEN, сек")
+    parser.add_argument("--core", choices=[ServerCore.THREADED, ServerCore.SELECTORS],
+                        default=ServerCore.THREADED, help="Ядро сервера")
+    parser.add_argument("--fifo", action="store_true", help="Команды в общей очереди (как до полос)")
+    args = parser.parse_args()
+    
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    
+    server = create_teacher_server("Бенчмарк", port=port, core=args.core)
+    server.start()
+    student = ThrottledStudent(port, args.link_mbps)
+    while server.get_student_count() < 1:
+        time.sleep(0.01)
+    
+    total_bytes = args.file_mb * 1024 * 1024
+    pusher = threading.Thread(target=push_file, args=(server, total_bytes), daemon=True)
+    start = time.perf_counter()
+    pusher.start()
+    
+    while pusher.is_alive():
+        send_lock(server, args.fifo)
+        time.sleep(args.interval)
+    
+    # Дожидаемся последних чанков у студента
+    while student.file_bytes < total_bytes and time.perf_counter() - start < 3600:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    
+    student.close()
+    server.stop()
+    
+    rate = args.link_mbps * 1e6 / 8
+    bound = (2 * STUDENT_SEND_BUFFER + 2 * RECEIVE_BUFFER + BULK_FRAGMENT_SIZE) / rate
+    latencies = [value * 1000 for value in student.latencies]
+    
+    print(f"Файл: {args.file_mb} МБ, сеть: {args.link_mbps:.0f} Мбит/с, ядро: {args.core}, "
+          f"режим: {'FIFO' if args.fifo else 'приоритетные полосы'}")
+    print(f"Передано за {elapsed:.1f} с ({student.file_bytes * 8 / elapsed / 1e6:.1f} Мбит/с)")
+    if latencies:
+        print(f"LOCK_SCREEN: {len(latencies)} шт, p50 {percentile(latencies, 0.5):.1f} мс, "
+              f"p99 {percentile(latencies, 0.99):.1f} мс, max {max(latencies):.1f} мс")
+    print(f"Граница (буферы ядра + фрагмент): {bound * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Бенчмарк рассылки кадра всем студентам: копии payload
+
+Сравнивает два пути отправки кадра --students студентам:
+- старый: пакет склеивается в bytes (pack_binary - одна копия кадра
+  на рассылку), недописанный хвост отправляется срезом
+  packet[total_sent:] - новый объект, копия для каждого студента
+- новый: Protocol.pack_parts оставляет кадр отдельной частью,
+  send_buffers отправляет части через sendmsg и продвигается по
+  memoryview
+
+Сокет-обертка проверяет каждый буфер, переданный ядру: если он не
+является общим буфером рассылки (кадром или склеенным пакетом) или
+memoryview на него, его байты скопированы для этого студента.
+Копии при упаковке считаются через tracemalloc (пик выделенной памяти).
+
+Сокеты с таймаутом (как у клиента во время подключения) - запись
+бывает частичной, это и есть случай, где старый путь копировал хвост.
+
+Запуск:
+    python -m benchmarks.bench_fanout
+    python -m benchmarks.bench_fanout --students 50 --frames 100 --frame-kb 512
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import MessageType, STUDENT_SEND_BUFFER
+from src.network.protocol import Protocol
+from src.network.send_queue import batch_buffers, send_buffers
+
+
+class CountingSocket:
+    """Обертка сокета: считает байты кадра, переданные ядру из копий"""
+    
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.shared: tuple = ()
+        self.shared_bytes = 0
+        self.copied_bytes = 0
+        self.calls = 0
+    
+    def _account(self, buffer, sent: int):
+        base = buffer.obj if isinstance(buffer, memoryview) else buffer
+        # Заголовок и метаданные - десятки байт, интересен только кадр
+        if len(buffer) < 1024:
+            return
+        if any(base is shared for shared in self.shared):
+            self.shared_bytes += sent
+        else:
+            self.copied_bytes += sent
+    
+    def send(self, data) -> int:
+        sent = self.sock.send(data)
+        self.calls += 1
+        self._account(data, sent)
+        return sent
+    
+    def sendmsg(self, buffers) -> int:
+        sent = self.sock.sendmsg(buffers)
+        self.calls += 1
+        remaining = sent
+        for buffer in buffers:
+            part = min(remaining, len(buffer))
+            self._account(buffer, part)
+            remaining -= part
+        return sent
+
+
+def drain(sock: socket.socket, done: threading.Event):
+    """Студент: читает все, что приходит"""
+    buffer = bytearray(256 * 1024)
+    while not done.is_set():
+        try:
+            if not sock.recv_into(buffer):
+                break
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+
+
+def old_send(sock, packet: bytes):
+    """Старая запись: хвост пакета срезом bytes"""
+    total_sent = 0
+    while total_sent < len(packet):
+        total_sent += sock.send(packet[total_sent:])
+
+
+def make_students(count: int, done: threading.Event) -> list:
+    students = []
+    for _ in range(count):
+        server_side, student_side = socket.socketpair()
+        server_side.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STUDENT_SEND_BUFFER)
+        server_side.settimeout(5.0)
+        student_side.settimeout(0.2)
+        threading.Thread(target=drain, args=(student_side, done), daemon=True).start()
+        students.append((CountingSocket(server_side), student_side))
+    return students
+
+
+def run(path: str, args) -> dict:
+    frame = os.urandom(args.frame_kb * 1024)
+    done = threading.Event()
+    students = make_students(args.students, done)
+    
+    pack_peak = 0
+    start = time.perf_counter()
+    for frame_id in range(args.frames):
+        tracemalloc.start()
+        if path == "old":
+            packet = Protocol.pack_binary(MessageType.SCREEN_FRAME, {"frame_id": frame_id}, frame, "payload")
+        else:
+            packet = Protocol.pack_parts(Protocol.BINARY_VERSION, MessageType.SCREEN_FRAME,
+                                         {"frame_id": frame_id}, frame, "payload")
+        pack_peak = max(pack_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        
+        # Общие для всех студентов буферы этой рассылки
+        shared = (frame, packet) if path == "old" else (frame,)
+        for sock, _ in students:
+            sock.shared = shared
+            if path == "old":
+                old_send(sock, packet)
+            else:
+                send_buffers(sock, batch_buffers([packet]))
+    elapsed = time.perf_counter() - start
+    
+    done.set()
+    for sock, student_side in students:
+        sock.sock.close()
+        student_side.close()
+    
+    sockets = [sock for sock, _ in students]
+    return {
+        "elapsed": elapsed,
+        "pack_copies": pack_peak / len(frame),
+        "copied_per_student": sum(s.copied_bytes for s in sockets) / len(sockets) / args.frames,
+        "shared_per_student": sum(s.shared_bytes for s in sockets) / len(sockets) / args.frames,
+        "calls": sum(s.calls for s in sockets) / len(sockets) / args.frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Копии payload при рассылке кадра")
+    parser.add_argument("--students", type=int, default=30, help="Количество студентов")
+    parser.add_argument("--frames", type=int, default=50, help="Количество кадров")
+    parser.add_argument("--frame-kb", type=int, default=1024, help="Размер кадра, KB")
+    args = parser.parse_args()
+    
+    print(f"Студентов: {args.students}, кадров: {args.frames} по {args.frame_kb} KB")
+    print(f"{'Путь':>28} | {'копий при упаковке':>18} | {'скопировано/студент':>19} | "
+          f"{'из общего/студент':>17} | {'вызовов':>7} | {'МБ/с':>6}")
+    print("-" * 110)
+    
+    for title, path in (("старый (bytes, срезы)", "old"), ("новый (части, sendmsg)", "new")):
+        result = run(path, args)
+        total_mb = args.students * args.frames * args.frame_kb / 1024
+        print(f"{title:>28} | {result['pack_copies']:>18.1f} | "
+              f"{result['copied_per_student'] / 1024:>16.0f} KB | "
+              f"{result['shared_per_student'] / 1024:>14.0f} KB | {result['calls']:>7.1f} | "
+              f"{total_mb / result['elapsed']:>6.0f}")
+
+
+if __name__ == "__main__":
+    main()
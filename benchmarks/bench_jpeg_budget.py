@@ -0,0 +1,112 @@
+"""
+Бенчмарк JPEG в бюджете кадра: размер кадров при постоянном качестве и с JpegBudgetEncoder
+
+Экран 1280x720, --frames кадров:
+- slide: слайд с курсором (bench_tile_delta)
+- video: слайд с окном видео 640x360 (bench_tile_delta)
+- browser: видео во весь экран с зерном (самые тяжелые кадры)
+- mixed: слайд -> видео во весь экран -> слайд (смена сложности)
+
+Бюджет - PerformanceManager.calculate_frame_budget(профиль --profile) или --budget.
+
+Для каждого экрана: средний и максимальный кадр, доля кадров больше
+бюджета, среднее качество, доля перекодирований и время кодирования.
+
+Запуск:
+    python -m benchmarks.bench_jpeg_budget
+    python -m benchmarks.bench_jpeg_budget --profile large --frames 240
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_tile_delta import WIDTH, HEIGHT, slide_frames, video_frames
+from src.core.performance_manager import PerformanceManager
+from src.streaming.jpeg_budget import JpegBudgetEncoder, BUDGET_TOLERANCE
+
+
+def browser_frames(count: int):
+    """Видео во весь экран: плавный градиент и зерно"""
+    rng = np.random.default_rng(2)
+    yy, xx = np.mgrid[0:HEIGHT, 0:WIDTH]
+    for i in range(count):
+        red = 128 + 100 * np.sin(xx / 60 + i / 5)
+        green = 128 + 100 * np.sin(yy / 45 - i / 7)
+        blue = 128 + 100 * np.sin((xx + yy) / 80 + i / 3)
+        frame = np.dstack([blue, green, red]) + rng.normal(0, 18, (HEIGHT, WIDTH, 1))
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def mixed_frames(count: int):
+    third = count // 3
+    yield from slide_frames(third)
+    yield from browser_frames(third)
+    yield from slide_frames(count - 2 * third)
+
+
+def run(frames: list, budget: int, quality: int) -> dict:
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    start = time.perf_counter()
+    fixed = [len(cv2.imencode('.jpg', frame, params)[1]) for frame in frames]
+    fixed_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    encoder = JpegBudgetEncoder(budget, quality)
+    start = time.perf_counter()
+    sized = [len(encoder.encode(frame)) for frame in frames]
+    budget_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    limit = budget * BUDGET_TOLERANCE
+    stats = encoder.get_stats()
+    return {
+        "fixed_kb": np.mean(fixed) / 1024,
+        "fixed_max_kb": max(fixed) / 1024,
+        "fixed_over": sum(size > limit for size in fixed) / len(frames),
+        "budget_kb": np.mean(sized) / 1024,
+        "budget_max_kb": max(sized) / 1024,
+        "budget_over": sum(size > limit for size in sized) / len(frames),
+        "quality": stats["avg_quality"],
+        "reencodes": stats["reencode_ratio"],
+        "fixed_ms": fixed_ms,
+        "budget_ms": budget_ms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JPEG в бюджете кадра")
+    parser.add_argument("--frames", type=int, default=180, help="Кадров на экран")
+    parser.add_argument("--profile", default="medium", help="Профиль PerformanceManager (бюджет и качество)")
+    parser.add_argument("--budget", type=int, help="Бюджет кадра, байт (вместо профиля)")
+    args = parser.parse_args()
+    
+    profile = PerformanceManager.get_profile_by_name(args.profile)
+    budget = args.budget or PerformanceManager.calculate_frame_budget(profile, (WIDTH, HEIGHT))
+    quality = profile.screen_quality
+    contents = {
+        "slide": list(slide_frames(args.frames)),
+        "video": list(video_frames(args.frames)),
+        "browser": list(browser_frames(args.frames)),
+        "mixed": list(mixed_frames(args.frames)),
+    }
+    
+    print(f"Экран {WIDTH}x{HEIGHT}, {args.frames} кадров, профиль {profile.name}: "
+          f"JPEG {quality}, бюджет {budget / 1024:.0f} KB")
+    print(f"{'Экран':>7} | {'средний, KB':>15} | {'максимум, KB':>15} | {'> бюджета':>13} | "
+          f"{'качество':>8} | {'перекод.':>8} | {'мс на кадр':>12}")
+    print("-" * 100)
+    for name, frames in contents.items():
+        r = run(frames, budget, quality)
+        print(f"{name:>7} | {r['fixed_kb']:>6.1f} -> {r['budget_kb']:>5.1f} | "
+              f"{r['fixed_max_kb']:>6.1f} -> {r['budget_max_kb']:>5.1f} | "
+              f"{r['fixed_over'] * 100:>4.0f}% -> {r['budget_over'] * 100:>3.0f}% | {r['quality']:>8.1f} | "
+              f"{r['reencodes'] * 100:>7.1f}% | {r['fixed_ms']:>4.1f} -> {r['budget_ms']:>4.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Бенчмарк FEC для multicast трансляции экрана: доля доставленных кадров
+
+Кадр --frame-kb режется на фрагменты по MTU (около 70 фрагментов на
+100 KB). Сокет заменен прокладкой, которая теряет датаграммы случайно
+с заданной вероятностью; остальные сразу попадают в FrameReassembler.
+Для каждой доли потерь и избыточности FEC выводится доля собранных
+кадров и CPU отправителя на кадр.
+
+Запуск:
+    python -m benchmarks.bench_multicast_fec
+    python -m benchmarks.bench_multicast_fec --frames 1000 --frame-kb 150 --ratios 0,0.05,0.1,0.2
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.network.multicast import MulticastConfig, MulticastSender, FrameReassembler
+
+
+class LossySocket:
+    """Прокладка вместо UDP сокета: теряет датаграммы с вероятностью loss"""
+    
+    def __init__(self, loss: float, deliver, seed: int):
+        self.loss = loss
+        self.deliver = deliver
+        self.random = random.Random(seed)
+    
+    def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+        return self.sendto(b''.join(buffers), address)
+    
+    def sendto(self, data, address):
+        if self.random.random() >= self.loss:
+            self.deliver(data)
+        return len(data)
+    
+    def close(self):
+        pass
+
+
+def run(loss: float, ratio: float, args) -> dict:
+    reassembler = FrameReassembler()
+    delivered = []
+    
+    def deliver(datagram):
+        if reassembler.add(datagram) is not None:
+            delivered.append(True)
+    
+    sender = MulticastSender(MulticastConfig(fec_ratio=ratio))
+    sender.sock.close()
+    sender.sock = LossySocket(loss, deliver, seed=args.seed)
+    
+    frame = os.urandom(args.frame_kb * 1024)
+    start = time.process_time()
+    for _ in range(args.frames):
+        sender.send(frame, compress=False)
+    cpu = time.process_time() - start
+    stats = sender.get_stats()
+    sender.close()
+    
+    return {
+        "delivered": len(delivered) / args.frames,
+        "overhead": stats["parity_sent"] / max(1, stats["fragments_sent"] - stats["parity_sent"]),
+        "recovered": reassembler.get_stats()["fragments_recovered"],
+        "cpu_ms": cpu / args.frames * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FEC multicast: доставка кадров при потерях")
+    parser.add_argument("--frames", type=int, default=300, help="Кадров на измерение")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    parser.add_argument("--losses", default="0.005,0.01,0.03,0.05", help="Доли потерь через запятую")
+    parser.add_argument("--ratios", default="0,0.1,0.2,0.25", help="Избыточность FEC через запятую")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора потерь")
+    args = parser.parse_args()
+    
+    losses = [float(value) for value in args.losses.split(",")]
+    ratios = [float(value) for value in args.ratios.split(",")]
+    
+    print(f"Кадров: {args.frames} по {args.frame_kb} KB")
+    print(f"{'Потери':>7} | {'FEC':>5} | {'избыточность':>12} | {'доставлено':>10} | "
+          f"{'восстановлено':>13} | {'CPU/кадр':>9}")
+    print("-" * 75)
+    
+    for loss in losses:
+        for ratio in ratios:
+            result = run(loss, ratio, args)
+            print(f"{loss * 100:>6.1f}% | {ratio:>5.2f} | {result['overhead'] * 100:>11.1f}% | "
+                  f"{result['delivered'] * 100:>9.1f}% | {result['recovered']:>13} | "
+                  f"{result['cpu_ms']:>6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Бенчмарк NACK для multicast трансляции экрана: доставка и объем повторов
+
+Класс из --students студентов, у каждого свои случайные потери
+датаграмм (у --bad-students студентов за "плохой" точкой доступа потери
+в несколько раз выше), плюс общие потери --shared-loss (на коммутаторе
+или у отправителя - фрагмент теряют все сразу). Сокет заменен прокладкой, которая раздает
+датаграмму всем FrameReassembler с потерями; время модельное, поэтому
+задержки NACK и окна агрегации не зависят от нагрузки машины.
+
+На кадр: отправка, затем раунды NACK (через NACK_DELAY и NACK_RETRY),
+каждый раунд NackAggregator отправляет повторы - в группу (тоже с
+потерями) или одному студенту (без потерь, TCP).
+
+Выводится доля доставленных кадров без NACK и с NACK, число NACK,
+повторов и коэффициент агрегации (запрошенных фрагментов на повтор).
+
+Запуск:
+    python -m benchmarks.bench_multicast_nack
+    python -m benchmarks.bench_multicast_nack --students 30 --loss 0.01 --bad-loss 0.05 --fec 0.1
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.network.multicast import (MulticastConfig, MulticastSender, FrameReassembler, NackAggregator,
+                                   NACK_DELAY, NACK_JITTER, NACK_RETRY, NACK_MAX_ATTEMPTS)
+
+
+class ClassroomSocket:
+    """Прокладка вместо UDP сокета: раздает датаграмму студентам с их потерями"""
+    
+    def __init__(self, students: list, shared_loss: float, seed: int):
+        self.students = students
+        self.shared_loss = shared_loss
+        self.random = random.Random(seed)
+        self.now = 0.0
+    
+    def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+        return self.sendto(b''.join(buffers), address)
+    
+    def sendto(self, data, address):
+        if self.random.random() < self.shared_loss:
+            return len(data)
+        for student in self.students:
+            if self.random.random() >= student['loss']:
+                student['deliver'](data, self.now)
+        return len(data)
+    
+    def close(self):
+        pass
+
+
+def make_students(args) -> list:
+    students = []
+    for i in range(args.students):
+        student = {
+            'id': f"student-{i:02d}",
+            'loss': args.bad_loss if i < args.bad_students else args.loss,
+            'reassembler': FrameReassembler(timeout=1.0),
+            'delivered': 0
+        }
+        
+        def deliver(datagram, now, student=student):
+            if student['reassembler'].add(datagram, now=now) is not None:
+                student['delivered'] += 1
+        
+        student['deliver'] = deliver
+        students.append(student)
+    return students
+
+
+def run(use_nack: bool, args) -> dict:
+    students = make_students(args)
+    sock = ClassroomSocket(students, args.shared_loss, args.seed)
+    by_id = {student['id']: student for student in students}
+    
+    sender = MulticastSender(MulticastConfig(fec_ratio=args.fec))
+    sender.sock.close()
+    sender.sock = sock
+    
+    def send_unicast(student_id, datagram):
+        by_id[student_id]['deliver'](datagram, sock.now)
+        return True
+    
+    aggregator = NackAggregator(sender, send_unicast, window=0)
+    frame = os.urandom(args.frame_kb * 1024)
+    frame_interval = 1.0 / args.fps
+    # Моменты раундов NACK после отправки кадра
+    rounds = [NACK_DELAY + NACK_JITTER + NACK_RETRY * attempt for attempt in range(NACK_MAX_ATTEMPTS)]
+    
+    for frame_number in range(args.frames):
+        sock.now = frame_number * frame_interval
+        sender.send(frame, compress=False)
+        if not use_nack:
+            continue
+        
+        start = sock.now
+        for delay in rounds:
+            sock.now = start + delay
+            for student in students:
+                for message_id, missing in student['reassembler'].collect_nacks(now=sock.now):
+                    aggregator.add(student['id'], message_id, missing, now=sock.now)
+            aggregator.flush(now=sock.now)
+    
+    stats = aggregator.get_stats()
+    sender_stats = sender.get_stats()
+    sender.close()
+    
+    delivered = [student['delivered'] / args.frames for student in students]
+    resends = stats['multicast_resends'] + stats['unicast_resends']
+    return {
+        'delivered': sum(delivered) / len(delivered),
+        'worst': min(delivered),
+        'nacks': stats['nacks_received'],
+        'requested': stats['fragments_requested'],
+        'multicast': stats['multicast_resends'],
+        'unicast': stats['unicast_resends'],
+        'aggregation': stats['fragments_requested'] / resends if resends else 0.0,
+        'repair_share': resends / max(1, sender_stats['fragments_sent'] - resends),
+        'per_student': stats['per_student']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NACK multicast: доставка кадров и объем повторов")
+    parser.add_argument("--students", type=int, default=30, help="Студентов в классе")
+    parser.add_argument("--frames", type=int, default=300, help="Кадров")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    parser.add_argument("--fps", type=float, default=10.0, help="Кадров в секунду (модельное время)")
+    parser.add_argument("--loss", type=float, default=0.01, help="Доля потерь у обычного студента")
+    parser.add_argument("--bad-loss", type=float, default=0.05, help="Доля потерь за плохой точкой доступа")
+    parser.add_argument("--bad-students", type=int, default=3, help="Студентов за плохой точкой доступа")
+    parser.add_argument("--shared-loss", type=float, default=0.005, help="Доля потерь сразу у всех")
+    parser.add_argument("--fec", type=float, default=0.1, help="Избыточность FEC")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора потерь")
+    args = parser.parse_args()
+    
+    print(f"Студентов: {args.students} (плохих: {args.bad_students}), кадров: {args.frames} "
+          f"по {args.frame_kb} KB, потери {args.loss * 100:.1f}% / {args.bad_loss * 100:.1f}% "
+          f"+ общие {args.shared_loss * 100:.1f}%, "
+          f"FEC {args.fec:g}")
+    print(f"{'Режим':>10} | {'доставлено':>10} | {'худший':>7} | {'NACK':>6} | {'запрошено':>9} | "
+          f"{'в группу':>8} | {'одному':>6} | {'агрегация':>9} | {'повторы':>7}")
+    print("-" * 100)
+    
+    for title, use_nack in (("без NACK", False), ("с NACK", True)):
+        result = run(use_nack, args)
+        print(f"{title:>10} | {result['delivered'] * 100:>9.1f}% | {result['worst'] * 100:>6.1f}% | "
+              f"{result['nacks']:>6} | {result['requested']:>9} | {result['multicast']:>8} | "
+              f"{result['unicast']:>6} | {result['aggregation']:>9.1f} | {result['repair_share'] * 100:>6.1f}%")
+    
+    if result['per_student']:
+        print("\nNACK по студентам (больше всего):")
+        top = sorted(result['per_student'].items(), key=lambda item: -item[1]['nacks'])[:5]
+        for student_id, counters in top:
+            print(f"  {student_id}: NACK {counters['nacks']}, фрагментов {counters['fragments']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Бенчмарк пейсинга multicast: потери в очереди точки доступа
+
+Точка доступа отправляет multicast на базовой скорости (--link-mbps) и
+держит в очереди не больше --queue-kb; что не поместилось, теряется
+для всех студентов сразу. Кадр --frame-kb уходит --fps раз в секунду:
+- залпом: все фрагменты кадра в один момент (как было)
+- с пейсингом: MulticastPacer растягивает кадр на интервал кадра и
+  держит предел --cap-mbps
+
+Время модельное: MulticastPacer.pump() вызывается с расчетным временем,
+поэтому результат не зависит от нагрузки машины. Выводится доля
+потерянных датаграмм, доставленных кадров (без FEC и NACK), пиковая
+очередь и задержка кадра (от начала отправки до выхода последнего
+фрагмента из точки доступа).
+
+Запуск:
+    python -m benchmarks.bench_multicast_pacing
+    python -m benchmarks.bench_multicast_pacing --frame-kb 150 --fps 15 --link-mbps 24 --queue-kb 32
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.network.multicast import FrameReassembler, MulticastPacer, split_fragments
+
+
+class AccessPointQueue:
+    """Очередь точки доступа: отправка со скоростью link, переполнение - потеря"""
+    
+    def __init__(self, link_mbps: float, queue_bytes: int):
+        self.rate = link_mbps * 1_000_000 / 8
+        self.capacity = queue_bytes
+        self.busy_until = 0.0  # Когда очередь опустеет
+        self.sent = 0
+        self.dropped = 0
+        self.peak = 0
+    
+    def offer(self, size: int, now: float):
+        """Датаграмма пришла в момент now; вернуть время выхода или None (потеря)"""
+        queued = max(0.0, self.busy_until - now) * self.rate
+        if queued + size > self.capacity:
+            self.dropped += 1
+            return None
+        self.peak = max(self.peak, int(queued + size))
+        self.busy_until = max(now, self.busy_until) + size / self.rate
+        self.sent += 1
+        return self.busy_until
+
+
+def run(paced: bool, args) -> dict:
+    ap = AccessPointQueue(args.link_mbps, args.queue_kb * 1024)
+    reassembler = FrameReassembler(timeout=1.0)
+    now = [0.0]
+    delivered = []
+    latencies = []
+    frame_start = {}
+    
+    def transmit(header, chunk):
+        datagram = header + bytes(chunk)
+        left_at = ap.offer(len(datagram), now[0])
+        if left_at is None:
+            return
+        message_id = int.from_bytes(datagram[4:8], 'big')
+        if reassembler.add(datagram, now=left_at) is not None:
+            delivered.append(message_id)
+            latencies.append(left_at - frame_start[message_id])
+    
+    pacer = MulticastPacer(transmit, max_bitrate_mbps=args.cap_mbps if paced else 0.0,
+                           frame_interval=1.0 / args.fps)
+    frame = os.urandom(args.frame_kb * 1024)
+    interval = 1.0 / args.fps
+    
+    for message_id in range(args.frames):
+        start = message_id * interval
+        now[0] = start
+        frame_start[message_id] = start
+        fragments = split_fragments(message_id, frame, timestamp=start)
+        if not paced:
+            for header, chunk in fragments:
+                transmit(header, chunk)
+            continue
+        
+        pacer.submit(message_id, fragments, now=start)
+        # Отправляем до начала следующего кадра
+        while True:
+            wait = pacer.pump(now[0])
+            if wait is None or now[0] + wait >= start + interval:
+                break
+            now[0] += wait
+    
+    latencies.sort()
+    total = ap.sent + ap.dropped
+    return {
+        'loss': ap.dropped / total if total else 0.0,
+        'delivered': len(delivered) / args.frames,
+        'peak_kb': ap.peak / 1024,
+        'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+        'latency_max': latencies[-1] if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пейсинг multicast: потери в очереди точки доступа")
+    parser.add_argument("--frames", type=int, default=300, help="Кадров")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    parser.add_argument("--fps", type=float, default=10.0, help="Кадров в секунду")
+    parser.add_argument("--link-mbps", type=float, default=24.0, help="Скорость multicast точки доступа, Мбит/с")
+    parser.add_argument("--queue-kb", type=int, default=32, help="Очередь точки доступа, KB")
+    parser.add_argument("--cap-mbps", type=float, default=20.0, help="Предел пейсера, Мбит/с")
+    args = parser.parse_args()
+    
+    print(f"Кадров: {args.frames} по {args.frame_kb} KB, {args.fps:g} к/с "
+          f"({args.frame_kb * 8 * args.fps / 1000:.1f} Мбит/с); точка доступа: {args.link_mbps:g} Мбит/с, "
+          f"очередь {args.queue_kb} KB")
+    print(f"{'Отправка':>22} | {'потери':>7} | {'доставлено':>10} | {'пик очереди':>11} | "
+          f"{'p50, мс':>7} | {'max, мс':>7}")
+    print("-" * 80)
+    
+    for title, paced in (("залпом", False), (f"пейсинг {args.cap_mbps:g} Мбит/с", True)):
+        result = run(paced, args)
+        print(f"{title:>22} | {result['loss'] * 100:>6.1f}% | {result['delivered'] * 100:>9.1f}% | "
+              f"{result['peak_kb']:>8.0f} KB | {result['latency_p50'] * 1000:>7.1f} | "
+              f"{result['latency_max'] * 1000:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
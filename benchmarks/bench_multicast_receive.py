@@ -0,0 +1,147 @@
+"""
+Бенчмарк приема multicast: CPU и пробуждения потока приема студента
+
+Сравнивает два цикла приема на UDP сокете 127.0.0.1 (без multicast -
+важен только путь приема):
+- старый: recvfrom(65536) на каждую датаграмму (новый bytes), сборка
+  копирует фрагмент, таймаут сокета вместо select
+- новый: MulticastReceiver - select(), вычитывание пачкой через
+  recv_into в буферы пула, фрагменты без копии до сборки кадра
+
+Отправитель шлет кадры --frame-kb по фрагментам (как MulticastSender,
+залпом) с частотой --fps. Выводится CPU потока приема на датаграмму и
+на кадр, пробуждения потока на кадр, доля собранных кадров и потери в
+очереди сокета (Linux, SO_RXQ_OVFL).
+
+Запуск:
+    python -m benchmarks.bench_multicast_receive
+    python -m benchmarks.bench_multicast_receive --frames 1000 --fps 100 --frame-kb 150
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.network.multicast import (MulticastConfig, MulticastReceiver, FrameReassembler, is_fragment,
+                                   split_fragments)
+
+
+def make_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+def old_loop(sock: socket.socket, state: dict):
+    """Прежний цикл приема MulticastReceiver"""
+    reassembler = FrameReassembler()
+    sock.settimeout(0.01)
+    start = time.thread_time()
+    while state['running']:
+        try:
+            data, _ = sock.recvfrom(65536)
+        except socket.timeout:
+            reassembler.evict_expired()
+            continue
+        state['datagrams'] += 1
+        if is_fragment(data) and reassembler.add(data) is not None:
+            state['frames'] += 1
+    state['cpu'] = time.thread_time() - start
+
+
+def new_loop(sock: socket.socket, state: dict):
+    """MulticastReceiver с подмененным сокетом"""
+    receiver = MulticastReceiver(MulticastConfig())
+    receiver.sock = sock
+    sock.setblocking(False)
+    receiver._enable_kernel_drops()
+    receiver.on_data = lambda data: state.__setitem__('frames', state['frames'] + 1)
+    receiver.running = True
+    state['receiver'] = receiver
+    
+    start = time.thread_time()
+    watcher = threading.Thread(target=lambda: (state_wait(state), setattr(receiver, 'running', False)))
+    watcher.start()
+    receiver._receive_loop()
+    state['cpu'] = time.thread_time() - start
+    state['datagrams'] = receiver.datagrams_received
+    watcher.join()
+
+
+def state_wait(state: dict):
+    while state['running']:
+        time.sleep(0.01)
+
+
+def run(loop, args) -> dict:
+    sock = make_socket()
+    address = sock.getsockname()
+    state = {'running': True, 'datagrams': 0, 'frames': 0, 'cpu': 0.0}
+    thread = threading.Thread(target=loop, args=(sock, state), daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    frame = os.urandom(args.frame_kb * 1024)
+    interval = 1.0 / args.fps
+    sent = 0
+    next_frame = time.perf_counter()
+    for message_id in range(args.frames):
+        for header, chunk in split_fragments(message_id, frame):
+            sender.sendmsg([header, chunk], [], 0, address)
+            sent += 1
+        next_frame += interval
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    
+    time.sleep(0.3)
+    state['running'] = False
+    thread.join()
+    sender.close()
+    sock.close()
+    
+    result = {
+        'sent': sent,
+        'datagrams': state['datagrams'],
+        'frames': state['frames'],
+        'cpu': state['cpu'],
+        'batch': 1.0,
+        'kernel_drops': None
+    }
+    receiver = state.get('receiver')
+    if receiver is not None:
+        stats = receiver.get_stats()
+        result['batch'] = stats['avg_batch']
+        result['kernel_drops'] = stats['kernel_drops']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прием multicast: CPU и пробуждения потока приема")
+    parser.add_argument("--frames", type=int, default=500, help="Кадров")
+    parser.add_argument("--fps", type=float, default=200.0, help="Кадров в секунду")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    args = parser.parse_args()
+    
+    print(f"Кадров: {args.frames} по {args.frame_kb} KB, {args.fps:g} к/с")
+    print(f"{'Цикл':>8} | {'мкс/датаграмма':>14} | {'мс/кадр':>7} | {'пробуждений/кадр':>16} | "
+          f"{'собрано':>8} | {'потери ядра':>11}")
+    print("-" * 80)
+    
+    for title, loop in (("старый", old_loop), ("новый", new_loop)):
+        result = run(loop, args)
+        per_datagram = result['cpu'] / max(1, result['datagrams']) * 1_000_000
+        per_frame = result['cpu'] / max(1, result['frames']) * 1000
+        wakeups = result['datagrams'] / result['batch'] / args.frames
+        drops = "-" if result['kernel_drops'] is None else str(result['kernel_drops'])
+        print(f"{title:>8} | {per_datagram:>14.1f} | {per_frame:>7.2f} | {wakeups:>16.1f} | "
+              f"{result['frames'] / args.frames * 100:>7.1f}% | {drops:>11}")
+
+
+if __name__ == "__main__":
+    main()
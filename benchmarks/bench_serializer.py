@@ -0,0 +1,74 @@
+"""
+Бенчмарк сериализации частых сообщений: JSON (v2/v3) и компактный формат (v4)
+
+Меряет сериализацию + десериализацию одного сообщения для типов,
+которые идут с высокой частотой: VOICE_DATA (метаданные вложения),
+WHITEBOARD_COMMAND, ACTIVITY_REPORT, PING/PONG.
+
+Компактный формат требует msgpack (pip install msgpack).
+
+Запуск:
+    python -m benchmarks.bench_serializer
+    python -m benchmarks.bench_serializer --count 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import MessageType
+from src.common.utils import serialize_message, deserialize_message
+from src.network.serializer import MSGPACK_AVAILABLE, serialize_compact, deserialize_compact
+
+
+def build_messages() -> list:
+    """(название, тип, data) - как их отправляет приложение"""
+    return [
+        ("PING", MessageType.PING, {}),
+        ("VOICE_DATA (метаданные)", MessageType.VOICE_DATA,
+         {"student_id": "a1b2c3d4e5f6_192.168.1.23", "sample_rate": 44100, "channels": 1,
+          "_attachment": "audio"}),
+        ("WHITEBOARD_COMMAND", MessageType.WHITEBOARD_COMMAND,
+         {"tool": "pen", "color": "#1e88e5", "width": 3,
+          "points": [(400 + i, 300 + i // 2) for i in range(20)]}),
+        ("ACTIVITY_REPORT", MessageType.ACTIVITY_REPORT,
+         {"timestamp": time.time(), "active_window": "Microsoft Word - Упражнение 5.docx",
+          "active_process": "WINWORD.EXE", "idle_time": 3.5, "is_active": True,
+          "open_windows": [f"Окно {i} - Google Chrome" for i in range(10)]}),
+    ]
+
+
+def measure(serialize, deserialize, msg_type: str, data: dict, count: int) -> tuple:
+    """(микросекунд на сообщение, размер в байтах)"""
+    payload = serialize(msg_type, data)
+    start = time.perf_counter()
+    for _ in range(count):
+        deserialize(serialize(msg_type, data))
+    return (time.perf_counter() - start) / count * 1e6, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации сообщений")
+    parser.add_argument("--count", type=int, default=20000, help="Сообщений на измерение")
+    args = parser.parse_args()
+    
+    if not MSGPACK_AVAILABLE:
+        print("msgpack не установлен - измеряется только JSON\n")
+    
+    print(f"{'Сообщение':>24} | {'JSON, мкс':>10} | {'байт':>5} | {'v4, мкс':>8} | {'байт':>5} | {'Ускорение':>9}")
+    print("-" * 80)
+    
+    for title, msg_type, data in build_messages():
+        json_us, json_size = measure(serialize_message, deserialize_message, msg_type, data, args.count)
+        line = f"{title:>24} | {json_us:>10.2f} | {json_size:>5}"
+        if MSGPACK_AVAILABLE:
+            compact_us, compact_size = measure(serialize_compact, deserialize_compact, msg_type, data, args.count)
+            line += f" | {compact_us:>8.2f} | {compact_size:>5} | {json_us / compact_us:>8.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
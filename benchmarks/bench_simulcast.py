@@ -0,0 +1,105 @@
+"""
+Бенчмарк simulcast: цена слоев для преподавателя и выигрыш студента
+
+Преподаватель: время кодирования одного захваченного кадра 1920x1080
+- один слой (как было)
+- все слои за один проход (encode_layers: каждый слой уменьшается из
+  предыдущего)
+- все слои по отдельности (конвертация цвета и уменьшение из полного
+  кадра заново на каждый слой)
+
+Кадры - BGRA, как их отдает mss; конвертация в BGR входит в замер.
+
+Студент: время декодирования и размер кадра каждого слоя - на слабом
+ПК декодирование растет пропорционально, поэтому выигрыш слабого
+студента от нижнего слоя виден и здесь.
+
+Кадр синтетический: "текст" и окна на светлом фоне, похоже на экран
+преподавателя.
+
+Запуск:
+    python -m benchmarks.bench_simulcast
+    python -m benchmarks.bench_simulcast --frames 100
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common.constants import SIMULCAST_LAYERS
+from src.streaming.screen_capture_optimized import encode_layers, make_layers
+
+
+def make_screen(seed: int) -> np.ndarray:
+    """Экран 1920x1080 (BGRA, как у mss): окна и строки текста"""
+    rng = np.random.default_rng(seed)
+    frame = np.full((1080, 1920, 3), 235, dtype=np.uint8)
+    for _ in range(6):
+        x, y = int(rng.integers(0, 1400)), int(rng.integers(0, 700))
+        color = tuple(int(c) for c in rng.integers(150, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + 500, y + 350), color, -1)
+    for line in range(40):
+        text = "".join(chr(int(c)) for c in rng.integers(65, 122, 60))
+        cv2.putText(frame, text, (20, 30 + line * 26), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 30, 30), 1)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+
+def encode_once(frame: np.ndarray, layers) -> list:
+    """Как _capture_loop: конвертация один раз, затем encode_layers"""
+    return encode_layers(cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR), layers)
+
+
+def encode_separately(frame: np.ndarray, layers) -> list:
+    """Каждый слой из полного захваченного кадра"""
+    encoded = []
+    for layer in layers:
+        resized = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR), layer.resolution)
+        _, buffer = cv2.imencode('.jpg', resized, [int(cv2.IMWRITE_JPEG_QUALITY), layer.quality])
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+def timed(function, frames: list) -> tuple:
+    start = time.perf_counter()
+    result = None
+    for frame in frames:
+        result = function(frame)
+    return (time.perf_counter() - start) / len(frames) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulcast: кодирование слоев и декодирование у студента")
+    parser.add_argument("--frames", type=int, default=50, help="Кадров на измерение")
+    args = parser.parse_args()
+    
+    layers = make_layers(SIMULCAST_LAYERS)
+    frames = [make_screen(seed) for seed in range(min(args.frames, 10))] * (args.frames // 10 or 1)
+    
+    single_ms, _ = timed(lambda frame: encode_once(frame, layers[:1]), frames)
+    cascade_ms, encoded = timed(lambda frame: encode_once(frame, layers), frames)
+    separate_ms, _ = timed(lambda frame: encode_separately(frame, layers), frames)
+    
+    print(f"Преподаватель, кадр 1920x1080, {len(frames)} кадров:")
+    print(f"  один слой {layers[0].name}:         {single_ms:>6.1f} мс/кадр")
+    print(f"  {len(layers)} слоя за один проход:     {cascade_ms:>6.1f} мс/кадр "
+          f"(+{(cascade_ms / single_ms - 1) * 100:.0f}%)")
+    print(f"  {len(layers)} слоя по отдельности:     {separate_ms:>6.1f} мс/кадр")
+    
+    print("\nСтудент:")
+    print(f"{'Слой':>6} | {'разрешение':>10} | {'качество':>8} | {'кадр, KB':>8} | {'декодирование, мс':>17}")
+    print("-" * 62)
+    for layer, data in zip(layers, encoded):
+        buffer = np.frombuffer(data, np.uint8)
+        decode_ms, _ = timed(lambda _: cv2.imdecode(buffer, cv2.IMREAD_COLOR), frames)
+        print(f"{layer.name:>6} | {layer.resolution[0]:>4}x{layer.resolution[1]:<5} | {layer.quality:>8} | "
+              f"{len(data) / 1024:>8.1f} | {decode_ms:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Бенчмарк пропуска неподвижного экрана: CPU и трафик на неподвижном слайде
+
+Экран 1920x1080 (BGRA, как у mss), трансляция 1280x720 (MEDIUM), --fps
+кадров в секунду, --seconds секунд модельного времени:
+- slide: слайд неподвижен все время
+- typing: на слайде раз в секунду печатается символ
+
+Для каждого экрана - время на кадр и трафик:
+- без проверки: cvtColor, resize и JPEG каждого кадра (как было)
+- ChangeDetector: контрольная сумма строк, кодируются только
+  изменившиеся кадры и обновления по STATIC_REFRESH_INTERVAL; вместо
+  остальных - SCREEN_KEEPALIVE (~40 байт) раз в STATIC_KEEPALIVE_INTERVAL
+
+Время модельное (now = номер кадра / fps).
+
+Запуск:
+    python -m benchmarks.bench_static_screen
+    python -m benchmarks.bench_static_screen --seconds 20 --fps 24
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.streaming.change_detector import ChangeDetector, FRAME, KEEPALIVE
+
+WIDTH, HEIGHT = 1920, 1080
+RESOLUTION = (1280, 720)
+KEEPALIVE_BYTES = 40  # SCREEN_KEEPALIVE {"frame_id": N} с заголовком пакета
+
+
+def make_slide() -> np.ndarray:
+    frame = np.full((HEIGHT, WIDTH, 3), 240, dtype=np.uint8)
+    cv2.rectangle(frame, (0, 0), (WIDTH, 120), (120, 60, 20), -1)
+    cv2.putText(frame, "Lecture 5: sorting algorithms", (60, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+    for line in range(16):
+        cv2.putText(frame, f"- point {line + 1}: merge sort splits the array in halves", (80, 200 + line * 52),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.1, (40, 40, 40), 2)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+
+def screens(name: str, count: int, fps: float):
+    slide = make_slide()
+    for i in range(count):
+        if name == "typing":
+            chars = int(i / fps)
+            frame = slide.copy()
+            cv2.putText(frame, "x" * chars, (80, 1050), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 0, 0, 255), 2)
+            yield frame
+        else:
+            yield slide
+
+
+def encode(raw: np.ndarray, quality: int) -> bytes:
+    frame = cv2.resize(cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR), RESOLUTION, interpolation=cv2.INTER_LINEAR)
+    return cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+
+
+def run(name: str, args) -> dict:
+    count = int(args.seconds * args.fps)
+    frames = list(screens(name, count, args.fps))
+    
+    start = time.perf_counter()
+    full_bytes = sum(len(encode(raw, args.quality)) for raw in frames)
+    full_ms = (time.perf_counter() - start) / count * 1000
+    
+    detector = ChangeDetector()
+    sent_bytes = 0
+    start = time.perf_counter()
+    for i, raw in enumerate(frames):
+        action = detector.check(raw, now=i / args.fps)
+        if action == FRAME:
+            sent_bytes += len(encode(raw, args.quality))
+        elif action == KEEPALIVE:
+            sent_bytes += KEEPALIVE_BYTES
+    static_ms = (time.perf_counter() - start) / count * 1000
+    
+    stats = detector.get_stats()
+    return {
+        "full_ms": full_ms,
+        "static_ms": static_ms,
+        "full_mbps": full_bytes * 8 / args.seconds / 1_000_000,
+        "static_kbps": sent_bytes * 8 / args.seconds / 1000,
+        "encoded": stats["frames"],
+        "frames": count
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Неподвижный экран: CPU и трафик")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Модельное время, сек")
+    parser.add_argument("--fps", type=float, default=24.0, help="Кадров в секунду")
+    parser.add_argument("--quality", type=int, default=70, help="Качество JPEG")
+    args = parser.parse_args()
+    
+    print(f"Захват {WIDTH}x{HEIGHT} -> {RESOLUTION[0]}x{RESOLUTION[1]}, {args.fps:g} к/с, "
+          f"{args.seconds:g} с, JPEG {args.quality}")
+    print(f"{'Экран':>7} | {'мс на кадр':>15} | {'JPEG, Мбит/с':>12} | {'с проверкой, кбит/с':>19} | {'закодировано':>12}")
+    print("-" * 80)
+    for name in ("slide", "typing"):
+        result = run(name, args)
+        print(f"{name:>7} | {result['full_ms']:>6.2f} -> {result['static_ms']:>5.2f} | {result['full_mbps']:>12.2f} | "
+              f"{result['static_kbps']:>19.1f} | {result['encoded']:>5} / {result['frames']:<5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Бенчмарк выбора транспорта трансляции: трафик TCP и пропуски кадров
+
+Класс из --students студентов, кадр --frame-kb уходит --fps раз в
+секунду, урок --duration секунд:
+- --unrouted студентов в подсети, куда multicast не маршрутизируется
+- --lossy студентов за плохой точкой доступа (собирают --lossy-delivery
+  кадров multicast)
+- на --break-at секунде multicast перестает доходить до --broken
+  студентов (например, коммутатор перестал пропускать группу)
+
+Режимы преподавателя:
+- hybrid: каждый кадр в multicast и по TCP всем (как было)
+- auto: multicast всем, по TCP - кроме подтвердивших прием
+  (TransportSelector по отчетам MULTICAST_REPORT)
+
+Время модельное. Выводится средний трафик TCP, доля показанных кадров
+(multicast или TCP, дубли не считаются), худшая пауза без нового кадра
+и число студентов на multicast в конце.
+
+Запуск:
+    python -m benchmarks.bench_stream_transport
+    python -m benchmarks.bench_stream_transport --students 30 --unrouted 5 --broken 3 --break-at 30
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.streaming.screen_capture_optimized import TransportSelector, TRANSPORT_REPORT_INTERVAL
+
+
+def make_students(args) -> list:
+    students = []
+    for i in range(args.students):
+        students.append({
+            'id': f"student-{i:02d}",
+            'routed': i >= args.unrouted,
+            'delivery': args.lossy_delivery if args.unrouted <= i < args.unrouted + args.lossy else 0.995,
+            'broken': args.students - args.broken <= i,
+            'last_frame': -1,
+            'last_shown': 0.0,
+            'shown': 0,
+            'worst_gap': 0.0,
+            # Отчет о приеме multicast, как ScreenReceiverOptimized._count_report
+            'received': 0,
+            'first': -1,
+            'last': -1,
+            'report_start': 0.0
+        })
+    return students
+
+
+def show(student: dict, frame_number: int, now: float):
+    """Кадр новее показанного - показать (дубль из другого транспорта отбрасывается)"""
+    if frame_number <= student['last_frame']:
+        return
+    student['worst_gap'] = max(student['worst_gap'], now - student['last_shown'])
+    student['last_frame'] = frame_number
+    student['last_shown'] = now
+    student['shown'] += 1
+
+
+def run(mode: str, args) -> dict:
+    rng = random.Random(args.seed)
+    students = make_students(args)
+    selector = TransportSelector(args.fps)
+    frame_bytes = args.frame_kb * 1024
+    tcp_bytes = 0
+    frames = int(args.duration * args.fps)
+    
+    for frame_number in range(frames):
+        now = frame_number / args.fps
+        
+        # Multicast: всем, кто в маршрутизируемой подсети
+        for student in students:
+            reachable = student['routed'] and not (student['broken'] and now >= args.break_at)
+            if not reachable or rng.random() >= student['delivery']:
+                continue
+            show(student, frame_number, now)
+            if mode != "auto":
+                continue
+            if student['first'] < 0:
+                student['first'] = frame_number
+            student['received'] += 1
+            student['last'] = frame_number
+            if now - student['report_start'] >= TRANSPORT_REPORT_INTERVAL:
+                selector.report(student['id'], {
+                    'received': student['received'],
+                    'span': student['last'] - student['first'] + 1,
+                    'last_frame': student['last']
+                }, frame_number, now=now)
+                student['received'] = 0
+                student['first'] = -1
+                student['report_start'] = now
+        
+        # TCP: всем (hybrid) или кроме студентов на multicast (auto)
+        if mode == "auto":
+            selector.check(now=now)
+            exclude = set(selector.multicast_students())
+        else:
+            exclude = set()
+        for student in students:
+            if student['id'] not in exclude:
+                tcp_bytes += frame_bytes
+                show(student, frame_number, now)
+    
+    return {
+        'tcp_mbps': tcp_bytes * 8 / args.duration / 1_000_000,
+        'shown': sum(student['shown'] for student in students) / (frames * len(students)),
+        'worst_gap': max(student['worst_gap'] for student in students),
+        'multicast': len(selector.multicast_students()) if mode == "auto" else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Транспорт трансляции: трафик TCP и пропуски кадров")
+    parser.add_argument("--students", type=int, default=30, help="Студентов в классе")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    parser.add_argument("--fps", type=float, default=10.0, help="Кадров в секунду")
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность, сек (модельное время)")
+    parser.add_argument("--unrouted", type=int, default=5, help="Студентов без маршрута multicast")
+    parser.add_argument("--lossy", type=int, default=3, help="Студентов за плохой точкой доступа")
+    parser.add_argument("--lossy-delivery", type=float, default=0.7, help="Доля кадров multicast у них")
+    parser.add_argument("--broken", type=int, default=3, help="Студентов, у которых multicast пропадает")
+    parser.add_argument("--break-at", type=float, default=30.0, help="Когда пропадает, сек")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора потерь")
+    args = parser.parse_args()
+    
+    print(f"Студентов: {args.students} (без маршрута: {args.unrouted}, с потерями: {args.lossy}, "
+          f"пропадает на {args.break_at:g} с: {args.broken}), кадр {args.frame_kb} KB, {args.fps:g} к/с")
+    print(f"{'Режим':>7} | {'TCP, Мбит/с':>11} | {'показано':>8} | {'худшая пауза':>12} | {'на multicast':>12}")
+    print("-" * 64)
+    
+    for mode in ("hybrid", "auto"):
+        result = run(mode, args)
+        print(f"{mode:>7} | {result['tcp_mbps']:>11.1f} | {result['shown'] * 100:>7.1f}% | "
+              f"{result['worst_gap']:>10.1f} с | {result['multicast']:>12}")
+
+
+if __name__ == "__main__":
+    main()
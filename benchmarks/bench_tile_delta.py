@@ -0,0 +1,152 @@
+"""
+Бенчмарк дельта-кодирования экрана по плиткам: трафик на типичном экране
+
+Синтетический экран 1280x720 (как MEDIUM), --fps кадров в секунду:
+- slide: слайд неподвижен, движется только курсор
+- ide: темный редактор кода, набирается текст, мигает курсор, раз в
+  несколько секунд прокрутка на строку
+- video: на слайде окно 640x360 с видео (каждый кадр меняется целиком)
+
+Для каждого экрана: средний размер кадра и трафик - JPEG каждого кадра
+(как было) и TileEncoder (ключевые кадры + дельты плиток), а также
+время кодирования преподавателем и сборки холста студентом.
+
+Время модельное (now = номер кадра / fps), поэтому ключевые кадры по
+интервалу приходятся на те же кадры при любой нагрузке машины.
+
+Запуск:
+    python -m benchmarks.bench_tile_delta
+    python -m benchmarks.bench_tile_delta --frames 480 --fps 24 --quality 70
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.streaming.tile_delta import TileEncoder, TileCanvas
+
+WIDTH, HEIGHT = 1280, 720
+
+
+def make_slide() -> np.ndarray:
+    frame = np.full((HEIGHT, WIDTH, 3), 240, dtype=np.uint8)
+    cv2.rectangle(frame, (0, 0), (WIDTH, 90), (120, 60, 20), -1)
+    cv2.putText(frame, "Lecture 5: sorting algorithms", (40, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (255, 255, 255), 2)
+    for line in range(12):
+        cv2.putText(frame, f"- point {line + 1}: merge sort splits the array in halves", (60, 150 + line * 44),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (40, 40, 40), 2)
+    return frame
+
+
+def slide_frames(count: int):
+    """Неподвижный слайд, курсор ходит по экрану"""
+    slide = make_slide()
+    for i in range(count):
+        frame = slide.copy()
+        x, y = 200 + (i * 7) % 800, 300 + int(100 * np.sin(i / 10))
+        cv2.fillConvexPoly(frame, np.array([[x, y], [x, y + 20], [x + 12, y + 14]]), (0, 0, 0))
+        yield frame
+
+
+def ide_frames(count: int, fps: float):
+    """Редактор: набор текста, мигающий курсор, редкая прокрутка"""
+    rng = np.random.default_rng(1)
+    lines = ["".join(chr(int(c)) for c in rng.integers(97, 123, int(rng.integers(10, 70)))) for _ in range(200)]
+    typed = ""
+    for i in range(count):
+        scroll = int(i / fps / 4)  # Строка прокрутки раз в 4 секунды
+        if i % 3 == 0:
+            typed += chr(97 + i % 26)
+            if len(typed) > 60:
+                typed = ""
+        frame = np.full((HEIGHT, WIDTH, 3), 30, dtype=np.uint8)
+        cv2.rectangle(frame, (0, 0), (50, HEIGHT), (45, 45, 45), -1)
+        for row in range(28):
+            y = 24 + row * 25
+            cv2.putText(frame, str(scroll + row + 1), (6, y), cv2.FONT_HERSHEY_PLAIN, 1.0, (120, 120, 120), 1)
+            text = typed if row == 14 else lines[(scroll + row) % len(lines)]
+            cv2.putText(frame, text, (60, y), cv2.FONT_HERSHEY_PLAIN, 1.2, (200, 220, 170), 1)
+        if (i // int(fps / 2)) % 2 == 0:
+            x = 60 + len(typed) * 11
+            cv2.line(frame, (x, 14 * 25 + 8), (x, 14 * 25 + 28), (255, 255, 255), 2)
+        yield frame
+
+
+def video_frames(count: int):
+    """Слайд с окном видео 640x360"""
+    slide = make_slide()
+    yy, xx = np.mgrid[0:360, 0:640]
+    for i in range(count):
+        frame = slide.copy()
+        red = (128 + 127 * np.sin(xx / 40 + i / 5)).astype(np.uint8)
+        green = (128 + 127 * np.sin(yy / 30 - i / 7)).astype(np.uint8)
+        blue = (128 + 127 * np.sin((xx + yy) / 50 + i / 3)).astype(np.uint8)
+        frame[200:560, 560:1200] = np.dstack([blue, green, red])
+        yield frame
+
+
+def run(frames: list, args) -> dict:
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), args.quality]
+    start = time.perf_counter()
+    full_bytes = sum(len(cv2.imencode('.jpg', frame, params)[1]) for frame in frames)
+    full_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    encoder = TileEncoder(args.quality)
+    start = time.perf_counter()
+    encoded = [encoder.encode(frame, i, now=i / args.fps) for i, frame in enumerate(frames)]
+    delta_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    canvas = TileCanvas()
+    start = time.perf_counter()
+    for i, data in enumerate(encoded):
+        canvas.apply(data, i)
+    apply_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    delta_bytes = sum(len(data) for data in encoded)
+    stats = encoder.get_stats()
+    return {
+        'full_kb': full_bytes / len(frames) / 1024,
+        'delta_kb': delta_bytes / len(frames) / 1024,
+        'full_mbps': full_bytes * 8 * args.fps / len(frames) / 1_000_000,
+        'delta_mbps': delta_bytes * 8 * args.fps / len(frames) / 1_000_000,
+        'keyframes': stats['keyframes'],
+        'full_ms': full_ms,
+        'delta_ms': delta_ms,
+        'apply_ms': apply_ms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дельта плиток: трафик трансляции экрана")
+    parser.add_argument("--frames", type=int, default=240, help="Кадров на экран")
+    parser.add_argument("--fps", type=float, default=24.0, help="Кадров в секунду")
+    parser.add_argument("--quality", type=int, default=70, help="Качество JPEG")
+    args = parser.parse_args()
+    
+    contents = {
+        "slide": list(slide_frames(args.frames)),
+        "ide": list(ide_frames(args.frames, args.fps)),
+        "video": list(video_frames(args.frames)),
+    }
+    
+    print(f"Экран {WIDTH}x{HEIGHT}, {args.frames} кадров, {args.fps:g} к/с, JPEG {args.quality}")
+    print(f"{'Экран':>6} | {'JPEG, KB':>8} | {'дельта, KB':>10} | {'Мбит/с':>13} | {'экономия':>8} | "
+          f"{'ключевых':>8} | {'кодир., мс':>12} | {'холст, мс':>9}")
+    print("-" * 100)
+    for name, frames in contents.items():
+        result = run(frames, args)
+        saved = 1 - result['delta_kb'] / result['full_kb']
+        print(f"{name:>6} | {result['full_kb']:>8.1f} | {result['delta_kb']:>10.1f} | "
+              f"{result['full_mbps']:>5.1f} -> {result['delta_mbps']:>5.1f} | {saved * 100:>7.1f}% | "
+              f"{result['keyframes']:>8} | {result['full_ms']:>5.1f} / {result['delta_ms']:>4.1f} | "
+              f"{result['apply_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Бенчмарк H.264 против MJPEG: трафик и время кодирования экрана
+
+Те же экраны, что в bench_tile_delta (slide, ide, video, 1280x720), или
+записанный урок (--recording: кадры screen/*.jpg записи LessonRecorder).
+
+Для каждого экрана - средний кадр, трафик и время на кадр:
+- MJPEG: JPEG каждого кадра (как было)
+- H.264: H264Encoder (libx264, zerolatency, ключевой кадр раз в --gop) и
+  декодирование H264Decoder студентом
+
+Нужен PyAV (pip install av).
+
+Запуск:
+    python -m benchmarks.bench_video_codec
+    python -m benchmarks.bench_video_codec --frames 480 --gop 48
+    python -m benchmarks.bench_video_codec --recording recordings/lesson_20240101_100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_tile_delta import WIDTH, HEIGHT, slide_frames, ide_frames, video_frames
+from src.streaming.video_codec import AV_AVAILABLE, H264Decoder, H264Encoder, bitrate_for_resolution
+
+
+def recording_frames(path: str, count: int) -> list:
+    """Кадры записанного урока (JPEG в screen/)"""
+    files = sorted(Path(path, "screen").glob("*.jpg"))[:count]
+    return [cv2.imread(str(file)) for file in files]
+
+
+def run(frames: list, args) -> dict:
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), args.quality]
+    start = time.perf_counter()
+    jpeg_bytes = sum(len(cv2.imencode('.jpg', frame, params)[1]) for frame in frames)
+    jpeg_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    height, width = frames[0].shape[:2]
+    bitrate = bitrate_for_resolution((width, height), args.bitrate)
+    encoder = H264Encoder(args.fps, bitrate, args.gop, args.preset)
+    start = time.perf_counter()
+    encoded = [encoder.encode(frame, i) for i, frame in enumerate(frames)]
+    h264_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    decoder = H264Decoder()
+    start = time.perf_counter()
+    for i, data in enumerate(encoded):
+        if data is not None:
+            decoder.decode(data, i)
+    decode_ms = (time.perf_counter() - start) / len(frames) * 1000
+    
+    h264_bytes = sum(len(data) for data in encoded if data is not None)
+    return {
+        'jpeg_kb': jpeg_bytes / len(frames) / 1024,
+        'h264_kb': h264_bytes / len(frames) / 1024,
+        'jpeg_mbps': jpeg_bytes * 8 * args.fps / len(frames) / 1_000_000,
+        'h264_mbps': h264_bytes * 8 * args.fps / len(frames) / 1_000_000,
+        'keyframes': encoder.get_stats()['keyframes'],
+        'jpeg_ms': jpeg_ms,
+        'h264_ms': h264_ms,
+        'decode_ms': decode_ms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="H.264 против MJPEG: трафик трансляции экрана")
+    parser.add_argument("--frames", type=int, default=240, help="Кадров на экран")
+    parser.add_argument("--fps", type=float, default=24.0, help="Кадров в секунду")
+    parser.add_argument("--quality", type=int, default=70, help="Качество JPEG")
+    parser.add_argument("--gop", type=int, default=48, help="Ключевой кадр раз в столько кадров")
+    parser.add_argument("--bitrate", type=int, default=2500, help="Битрейт H.264 на 1280x720, кбит/с")
+    parser.add_argument("--preset", default="veryfast", help="Пресет x264")
+    parser.add_argument("--recording", help="Папка записи урока вместо синтетических экранов")
+    args = parser.parse_args()
+    
+    if not AV_AVAILABLE:
+        print("PyAV не установлен (pip install av)")
+        return
+    
+    if args.recording:
+        contents = {"lesson": recording_frames(args.recording, args.frames)}
+        if not contents["lesson"]:
+            print(f"Нет кадров в {args.recording}/screen")
+            return
+    else:
+        contents = {
+            "slide": list(slide_frames(args.frames)),
+            "ide": list(ide_frames(args.frames, args.fps)),
+            "video": list(video_frames(args.frames)),
+        }
+    
+    print(f"Экран {WIDTH}x{HEIGHT}, {args.frames} кадров, {args.fps:g} к/с, JPEG {args.quality}, "
+          f"H.264 {args.bitrate} кбит/с ({args.preset}, GOP {args.gop})")
+    print(f"{'Экран':>6} | {'JPEG, KB':>8} | {'H.264, KB':>9} | {'Мбит/с':>13} | {'экономия':>8} | "
+          f"{'ключевых':>8} | {'кодир., мс':>12} | {'декод., мс':>10}")
+    print("-" * 100)
+    for name, frames in contents.items():
+        result = run(frames, args)
+        saved = 1 - result['h264_kb'] / result['jpeg_kb']
+        print(f"{name:>6} | {result['jpeg_kb']:>8.1f} | {result['h264_kb']:>9.1f} | "
+              f"{result['jpeg_mbps']:>5.1f} -> {result['h264_mbps']:>5.1f} | {saved * 100:>7.1f}% | "
+              f"{result['keyframes']:>8} | {result['jpeg_ms']:>5.1f} / {result['h264_ms']:>4.1f} | "
+              f"{result['decode_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
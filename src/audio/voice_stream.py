@@ -9,7 +9,7 @@ import time
 import zlib
 import base64
 import queue
-from typing import Optional, Callable, List
+from typing import Optional, Callable, List, Union
 from dataclasses import dataclass
 
 try:
@@ -390,9 +390,12 @@ class VoiceBroadcaster:
         self.capture: Optional[VoiceCapture] = None
         self.active = False
         
-        # Колбэк для отправки голоса
+        # Колбэк для отправки голоса (base64 строка, для JSON)
         self.on_voice_data: Optional[Callable[[str, int], None]] = None
         
+        # Колбэк для отправки сырых байт (бинарное вложение протокола v3)
+        self.on_voice_bytes: Optional[Callable[[bytes, int], None]] = None
+        
         logger.info("VoiceBroadcaster создан")
     
     def start(self) -> bool:
@@ -430,7 +433,10 @@ class VoiceBroadcaster:
     
     def _on_audio_chunk(self, compressed_data: bytes, chunk_id: int):
         """Обработка аудио чанка"""
-        if self.on_voice_data:
+        if self.on_voice_bytes:
+            # Сырые байты - без base64 (сервер сам выберет формат для старых клиентов)
+            self.on_voice_bytes(compressed_data, chunk_id)
+        elif self.on_voice_data:
             # Кодируем в base64 для передачи через JSON
             encoded = base64.b64encode(compressed_data).decode('ascii')
             self.on_voice_data(encoded, chunk_id)
@@ -498,14 +504,17 @@ class VoiceReceiver:
         
         logger.info("Прием голоса остановлен")
     
-    def add_voice_data(self, encoded_data: str, chunk_id: int):
-        """Добавить полученные голосовые данные"""
+    def add_voice_data(self, encoded_data: Union[str, bytes, memoryview], chunk_id: int):
+        """Добавить полученные голосовые данные (base64 строка или сырые байты)"""
         if not self.active or not self.playback:
             return
         
         try:
-            # Декодируем из base64
-            compressed = base64.b64decode(encoded_data)
+            # Декодируем из base64 (старый JSON формат)
+            if isinstance(encoded_data, str):
+                compressed = base64.b64decode(encoded_data)
+            else:
+                compressed = encoded_data
             self.playback.add_audio_chunk(compressed, chunk_id)
             
         except Exception as e:
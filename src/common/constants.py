@@ -14,6 +14,18 @@ BROADCAST_INTERVAL = 5  # секунды
 HEARTBEAT_INTERVAL = 3  # секунды
 CONNECTION_TIMEOUT = 15  # секунды
 
+# Ядро сервера преподавателя (config.ini: [Network] ServerCore)
+class ServerCore:
+    THREADED = "threaded"    # Поток на каждого студента
+    SELECTORS = "selectors"  # Один I/O поток на всех (selectors)
+
+# Кодек трансляции экрана (config.ini: [Streaming] ScreenCodec)
+class ScreenCodec:
+    MJPEG = "mjpeg"        # JPEG каждого кадра (понимают все версии студента)
+    DELTA = "delta"        # Ключевые кадры и дельты изменившихся плиток
+    ADAPTIVE = "adaptive"  # Дельты плиток, текст - без потерь
+    H264 = "h264"          # Межкадровый H.264 (нужен PyAV)
+
 # Типы сообщений (протокол)
 class MessageType:
     # Общие
@@ -32,6 +44,14 @@ class MessageType:
     SCREEN_STREAM_START = "SCREEN_STREAM_START"
     SCREEN_STREAM_STOP = "SCREEN_STREAM_STOP"
     SCREEN_FRAME = "SCREEN_FRAME"
+    MULTICAST_NACK = "MULTICAST_NACK"      # Студент: не хватает фрагментов multicast кадра
+    MULTICAST_REPAIR = "MULTICAST_REPAIR"  # Преподаватель: повтор фрагмента одному студенту по TCP
+    MULTICAST_REPORT = "MULTICAST_REPORT"  # Студент: сколько кадров multicast собрано (выбор транспорта)
+    SCREEN_KEYFRAME_REQUEST = "SCREEN_KEYFRAME_REQUEST"  # Студент: нет основы для дельты кадра
+    SCREEN_KEEPALIVE = "SCREEN_KEEPALIVE"  # Преподаватель: экран не изменился, номер последнего кадра
+    SCREEN_FEEDBACK = "SCREEN_FEEDBACK"  # Студент: прием трансляции (потери, декодирование, трафик)
+    SCREEN_CURSOR = "SCREEN_CURSOR"  # Преподаватель: позиция курсора и ключ формы (курсора нет в кадрах)
+    SCREEN_CURSOR_SHAPE = "SCREEN_CURSOR_SHAPE"  # Форма курсора (PNG); от студента - запрос формы по ключу
     
     # Видео
     VIDEO_STREAM_START = "VIDEO_STREAM_START"
@@ -124,6 +144,219 @@ class MessageType:
     BOARD_CLEAR = "BOARD_CLEAR"
     BOARD_STOP = "BOARD_STOP"
 
+# Сериализатор сообщений (config.ini: [Network] Serializer)
+class Serializer:
+    COMPACT = "compact"  # msgpack, номера типов (протокол v4)
+    JSON = "json"        # Читаемый JSON (старые клиенты, отладка)
+
+# Номера типов сообщений в компактном формате (протокол v4).
+# Номера не меняются и не переиспользуются: новый тип - новый номер.
+# Тип без номера передается строкой.
+MESSAGE_TYPE_IDS = {
+    MessageType.PING: 1,
+    MessageType.PONG: 2,
+    MessageType.DISCONNECT: 3,
+    
+    MessageType.TEACHER_BROADCAST: 10,
+    MessageType.STUDENT_CONNECT: 11,
+    MessageType.STUDENT_INFO: 12,
+    MessageType.CONNECTION_ACCEPTED: 13,
+    MessageType.CONNECTION_REJECTED: 14,
+    
+    MessageType.SCREEN_STREAM_START: 20,
+    MessageType.SCREEN_STREAM_STOP: 21,
+    MessageType.SCREEN_FRAME: 22,
+    MessageType.VIDEO_STREAM_START: 23,
+    MessageType.VIDEO_STREAM_STOP: 24,
+    MessageType.VIDEO_FRAME: 25,
+    MessageType.VIDEO_CONTROL: 26,
+    MessageType.AUDIO_STREAM_START: 27,
+    MessageType.AUDIO_STREAM_STOP: 28,
+    MessageType.AUDIO_FRAME: 29,
+    
+    MessageType.VOICE_START: 30,
+    MessageType.VOICE_STOP: 31,
+    MessageType.VOICE_DATA: 32,
+    MessageType.WEBCAM_START: 33,
+    MessageType.WEBCAM_STOP: 34,
+    MessageType.WEBCAM_FRAME: 35,
+    MessageType.MULTICAST_NACK: 36,
+    MessageType.MULTICAST_REPAIR: 37,
+    MessageType.MULTICAST_REPORT: 38,
+    MessageType.SCREEN_KEYFRAME_REQUEST: 39,
+    
+    MessageType.WHITEBOARD_START: 40,
+    MessageType.WHITEBOARD_STOP: 41,
+    MessageType.WHITEBOARD_COMMAND: 42,
+    MessageType.WHITEBOARD_SYNC: 43,
+    MessageType.BOARD_START: 44,
+    MessageType.BOARD_DRAW: 45,
+    MessageType.BOARD_CLEAR: 46,
+    MessageType.BOARD_STOP: 47,
+    MessageType.SCREEN_KEEPALIVE: 48,
+    MessageType.SCREEN_FEEDBACK: 49,
+    
+    MessageType.CHAT_MESSAGE: 50,
+    MessageType.CHAT_GROUP: 51,
+    
+    MessageType.FILE_SEND: 60,
+    MessageType.FILE_REQUEST: 61,
+    MessageType.FILE_CHUNK: 62,
+    MessageType.FILE_COMPLETE: 63,
+    MessageType.FILE_TRANSFER_START: 64,
+    MessageType.FILE_TRANSFER_DATA: 65,
+    MessageType.FILE_TRANSFER_END: 66,
+    MessageType.FILE_TRANSFER_ACK: 67,
+    MessageType.FILE_COLLECT_REQUEST: 68,
+    MessageType.FILE_COLLECT_RESPONSE: 69,
+    
+    MessageType.LOCK_SCREEN: 70,
+    MessageType.UNLOCK_SCREEN: 71,
+    MessageType.LOCK_INPUT: 72,
+    MessageType.UNLOCK_INPUT: 73,
+    MessageType.BLOCK_APP: 74,
+    MessageType.UNBLOCK_APP: 75,
+    MessageType.REMOTE_COMMAND: 76,
+    MessageType.WEB_CONTROL_SET: 77,
+    MessageType.WEB_CONTROL_STATUS: 78,
+    
+    MessageType.ACTIVITY_REPORT: 80,
+    MessageType.ACTIVITY_REQUEST: 81,
+    MessageType.SCREENSHOT_REQUEST: 82,
+    MessageType.SCREENSHOT_RESPONSE: 83,
+    
+    MessageType.EXAM_START: 90,
+    MessageType.EXAM_ANSWER: 91,
+    MessageType.EXAM_RESULT: 92,
+    MessageType.EXAM_END: 93,
+    MessageType.POLL_START: 94,
+    MessageType.POLL_ANSWER: 95,
+    MessageType.POLL_RESULT: 96,
+    
+    MessageType.GROUP_CREATE: 100,
+    MessageType.GROUP_ASSIGN: 101,
+    MessageType.GROUP_MESSAGE: 102,
+    MessageType.DEMO_START: 103,
+    MessageType.DEMO_STOP: 104,
+    MessageType.DEMO_FRAME: 105,
+    MessageType.SCREEN_CURSOR: 106,
+    MessageType.SCREEN_CURSOR_SHAPE: 107,
+}
+
+# Классы сообщений - приоритет при отправке (меньше = важнее)
+class MessageClass:
+    CONTROL = 0      # Команды управления: обгоняют все остальное
+    INTERACTIVE = 1  # Чат, доска, опросы - небольшие и чувствительные к задержке
+    MEDIA = 2        # Кадры и звук: устаревшие кадры выбрасываются (побеждает последний)
+    BULK = 3         # Файлы и большие ответы: режутся на фрагменты
+
+# Класс по типу сообщения (не указанные - INTERACTIVE)
+MESSAGE_CLASSES = {
+    # Управление
+    MessageType.PING: MessageClass.CONTROL,
+    MessageType.PONG: MessageClass.CONTROL,
+    MessageType.DISCONNECT: MessageClass.CONTROL,
+    MessageType.CONNECTION_ACCEPTED: MessageClass.CONTROL,
+    MessageType.CONNECTION_REJECTED: MessageClass.CONTROL,
+    MessageType.LOCK_SCREEN: MessageClass.CONTROL,
+    MessageType.UNLOCK_SCREEN: MessageClass.CONTROL,
+    MessageType.LOCK_INPUT: MessageClass.CONTROL,
+    MessageType.UNLOCK_INPUT: MessageClass.CONTROL,
+    MessageType.BLOCK_APP: MessageClass.CONTROL,
+    MessageType.UNBLOCK_APP: MessageClass.CONTROL,
+    MessageType.REMOTE_COMMAND: MessageClass.CONTROL,
+    MessageType.WEB_CONTROL_SET: MessageClass.CONTROL,
+    MessageType.EXAM_START: MessageClass.CONTROL,
+    MessageType.EXAM_END: MessageClass.CONTROL,
+    
+    # Медиа (START/STOP в том же классе, чтобы кадр не пришел после STOP)
+    MessageType.SCREEN_STREAM_START: MessageClass.MEDIA,
+    MessageType.SCREEN_STREAM_STOP: MessageClass.MEDIA,
+    MessageType.VIDEO_STREAM_START: MessageClass.MEDIA,
+    MessageType.VIDEO_STREAM_STOP: MessageClass.MEDIA,
+    MessageType.AUDIO_STREAM_START: MessageClass.MEDIA,
+    MessageType.AUDIO_STREAM_STOP: MessageClass.MEDIA,
+    MessageType.VOICE_START: MessageClass.MEDIA,
+    MessageType.VOICE_STOP: MessageClass.MEDIA,
+    MessageType.WEBCAM_START: MessageClass.MEDIA,
+    MessageType.WEBCAM_STOP: MessageClass.MEDIA,
+    MessageType.DEMO_START: MessageClass.MEDIA,
+    MessageType.DEMO_STOP: MessageClass.MEDIA,
+    MessageType.SCREEN_FRAME: MessageClass.MEDIA,
+    MessageType.SCREEN_KEEPALIVE: MessageClass.MEDIA,
+    MessageType.VIDEO_FRAME: MessageClass.MEDIA,
+    MessageType.AUDIO_FRAME: MessageClass.MEDIA,
+    MessageType.VOICE_DATA: MessageClass.MEDIA,
+    MessageType.WEBCAM_FRAME: MessageClass.MEDIA,
+    MessageType.DEMO_FRAME: MessageClass.MEDIA,
+    MessageType.MULTICAST_REPAIR: MessageClass.MEDIA,
+    
+    # Объемные данные (START/END в том же классе, чтобы не обогнать данные)
+    MessageType.FILE_TRANSFER_START: MessageClass.BULK,
+    MessageType.FILE_TRANSFER_DATA: MessageClass.BULK,
+    MessageType.FILE_TRANSFER_END: MessageClass.BULK,
+    MessageType.FILE_SEND: MessageClass.BULK,
+    MessageType.FILE_CHUNK: MessageClass.BULK,
+    MessageType.FILE_COMPLETE: MessageClass.BULK,
+    MessageType.FILE_COLLECT_RESPONSE: MessageClass.BULK,
+    MessageType.SCREENSHOT_RESPONSE: MessageClass.BULK,
+    MessageType.WHITEBOARD_SYNC: MessageClass.BULK,
+}
+
+# Кодеки сжатия payload (согласуются при STUDENT_CONNECT)
+class Codec:
+    NONE = "none"
+    ZLIB = "zlib"  # Понимают все клиенты
+    ZSTD = "zstd"  # Лучшее сжатие (опционально: zstandard)
+    LZ4 = "lz4"    # Самое быстрое (опционально: lz4)
+
+# Кодек по типу сообщения (не указанные - DEFAULT_CODEC).
+# Недоступный у пира кодек заменяется на zlib.
+COMPRESSION_POLICY = {
+    # Уже сжатые JPEG/аудио сырым вложением (v3+) - сжимать бессмысленно;
+    # base64 в JSON (старые пиры) все равно сжимается zlib
+    MessageType.SCREEN_FRAME: Codec.NONE,
+    MessageType.VIDEO_FRAME: Codec.NONE,
+    MessageType.AUDIO_FRAME: Codec.NONE,
+    MessageType.VOICE_DATA: Codec.NONE,
+    MessageType.WEBCAM_FRAME: Codec.NONE,
+    MessageType.DEMO_FRAME: Codec.NONE,
+    MessageType.MULTICAST_REPAIR: Codec.NONE,
+    MessageType.SCREENSHOT_RESPONSE: Codec.NONE,
+    MessageType.SCREEN_CURSOR_SHAPE: Codec.NONE,
+    
+    # Частые интерактивные сообщения - быстро
+    MessageType.WHITEBOARD_COMMAND: Codec.LZ4,
+    MessageType.WHITEBOARD_SYNC: Codec.LZ4,
+    MessageType.BOARD_DRAW: Codec.LZ4,
+    MessageType.ACTIVITY_REPORT: Codec.LZ4,
+    
+    # Экзамены и файлы - максимум экономии трафика
+    MessageType.EXAM_START: Codec.ZSTD,
+    MessageType.EXAM_ANSWER: Codec.ZSTD,
+    MessageType.EXAM_RESULT: Codec.ZSTD,
+    MessageType.FILE_TRANSFER_DATA: Codec.ZSTD,
+    MessageType.FILE_CHUNK: Codec.ZSTD,
+    MessageType.FILE_COLLECT_RESPONSE: Codec.ZSTD,
+}
+DEFAULT_CODEC = Codec.LZ4
+COMPRESSION_MIN_SIZE = 1024  # Меньшие payload не сжимаются
+
+# Медиа сообщения: если студент не успевает, старые кадры выбрасываются
+# (побеждает последний кадр). Остальные сообщения не выбрасываются никогда.
+# SCREEN_CURSOR - в полосе INTERACTIVE (не ждет кадров), но тоже выбрасывается.
+# MULTICAST_REPAIR - в полосе MEDIA, но не выбрасывается: повторы фрагментов
+# одного кадра идут пачкой, выброшенный повтор - кадр, который не собрать.
+MEDIA_MESSAGE_TYPES = frozenset({
+    MessageType.SCREEN_FRAME,
+    MessageType.VIDEO_FRAME,
+    MessageType.AUDIO_FRAME,
+    MessageType.VOICE_DATA,
+    MessageType.WEBCAM_FRAME,
+    MessageType.DEMO_FRAME,
+    MessageType.SCREEN_CURSOR,
+})
+
 # Статусы студента
 class StudentStatus:
     OFFLINE = "offline"
@@ -166,6 +399,14 @@ QUALITY_SETTINGS = {
     }
 }
 
+# Слои simulcast трансляции экрана (от лучшего к худшему): один захват кодируется во все слои,
+# у каждого слоя своя multicast группа и порт. Первый слой - прежние группа и порт.
+SIMULCAST_LAYERS = [
+    {"name": "720p", "resolution": (1280, 720), "quality": 70, "group": "239.255.1.1", "port": 5005},
+    {"name": "480p", "resolution": (854, 480), "quality": 50, "group": "239.255.1.2", "port": 5006},
+    {"name": "360p", "resolution": (640, 360), "quality": 40, "group": "239.255.1.3", "port": 5007},
+]
+
 # Аудио настройки
 AUDIO_SAMPLE_RATE = 44100
 AUDIO_CHANNELS = 2
@@ -175,6 +416,17 @@ AUDIO_CHUNK_SIZE = 1024
 BUFFER_SIZE = 65536
 MAX_PACKET_SIZE = 60000
 
+# Очередь исходящих пакетов каждого студента
+OUTBOUND_MEDIA_LIMIT = 4  # Пакетов каждого медиа типа (лишние старые выбрасываются)
+OUTBOUND_CONTROL_LIMIT = 256  # Невыбрасываемых пакетов в классе (при переполнении отправитель ждет)
+OUTBOUND_BULK_LIMIT = 64  # Объемных пакетов (при переполнении отправитель ждет)
+OUTBOUND_CONTROL_TIMEOUT = CONNECTION_TIMEOUT  # Сколько ждать места в очереди, сек
+BULK_FRAGMENT_SIZE = 16 * 1024  # Объемные пакеты режутся на фрагменты, между ними - управление
+BULK_STARVATION_LIMIT = 8  # Не более стольких пакетов подряд в обход ждущих объемных
+STUDENT_SEND_BUFFER = 256 * 1024  # SO_SNDBUF сокета студента: ограничивает задержку команд
+COALESCE_WINDOW = 0.002  # Сколько мелкие пакеты ждут попутчиков для общей записи, сек
+COALESCE_MAX_BYTES = 16 * 1024  # Предел склеиваемой пачки (0 - склейка выключена)
+
 # Пути к данным
 DATA_DIR = "data"
 USERDATA_DIR = "UserData"
@@ -22,10 +22,15 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
+from src.network.multicast import max_bitrate_from_config
+
 logger = logging.getLogger(__name__)
 
 QualityProfile = Literal["small", "medium", "large", "ultra"]
 
+# Байт на пиксель JPEG экрана при качестве 100 (~0.1-0.2 байт/пиксель)
+JPEG_BYTES_PER_PIXEL = 0.2
+
 
 @dataclass
 class PerformanceProfile:
@@ -135,10 +140,15 @@ class PerformanceManager:
         return cls.PROFILES.get(name, cls.PROFILES["medium"])
     
     @classmethod
-    def calculate_bandwidth(cls, profile: PerformanceProfile, student_count: int) -> dict:
+    def calculate_bandwidth(cls, profile: PerformanceProfile, student_count: int,
+                            max_bitrate_mbps: Optional[float] = None) -> dict:
         """
         Рассчитать требуемую пропускную способность.
         
+        Args:
+            max_bitrate_mbps: Предел скорости multicast (None - из config.ini,
+                              [Network] MulticastMaxBitrateMbps; 0 - без предела)
+        
         Returns:
             dict с оценками трафика
         """
@@ -147,7 +157,7 @@ class PerformanceManager:
         pixels = width * height
         
         # Примерный размер кадра в зависимости от качества
-        bytes_per_pixel = profile.screen_quality / 100 * 0.2  # ~0.1-0.2 байт/пиксель для JPEG
+        bytes_per_pixel = profile.screen_quality / 100 * JPEG_BYTES_PER_PIXEL
         frame_size_kb = (pixels * bytes_per_pixel) / 1024
         
         # Трафик экрана в секунду
@@ -168,6 +178,11 @@ class PerformanceManager:
         else:
             total_for_all = total_upload * student_count
         
+        # Экран сверх предела пейсер не пропустит - кадры будут выбрасываться
+        if max_bitrate_mbps is None:
+            max_bitrate_mbps = max_bitrate_from_config()
+        cap_exceeded = profile.use_multicast and 0 < max_bitrate_mbps < screen_mbps
+        
         return {
             "upload_mbps": round(total_upload, 2),
             "upload_for_all_students_mbps": round(total_for_all, 2),
@@ -175,8 +190,41 @@ class PerformanceManager:
             "student_count": student_count,
             "use_multicast": profile.use_multicast,
             "savings_vs_tcp": f"{student_count}x" if profile.use_multicast else "1x",
+            "screen_mbps": round(screen_mbps, 2),
+            "multicast_cap_mbps": max_bitrate_mbps,
+            "multicast_cap_exceeded": cap_exceeded,
         }
     
+    @classmethod
+    def calculate_frame_budget(cls, profile: PerformanceProfile, resolution: Optional[tuple] = None,
+                               max_bitrate_mbps: Optional[float] = None) -> int:
+        """
+        Бюджет JPEG кадра экрана, байт (JpegBudgetEncoder)
+        
+        Размер кадра по оценке calculate_bandwidth, но с multicast - не
+        больше предела скорости на кадр.
+        
+        Args:
+            resolution: Разрешение трансляции (None - из профиля)
+        """
+        width, height = resolution or profile.screen_resolution
+        budget = width * height * profile.screen_quality / 100 * JPEG_BYTES_PER_PIXEL
+        
+        byte_rate = cls.calculate_max_byte_rate(profile, max_bitrate_mbps)
+        if byte_rate:
+            budget = min(budget, byte_rate / profile.screen_fps)
+        return int(budget)
+    
+    @classmethod
+    def calculate_max_byte_rate(cls, profile: PerformanceProfile,
+                                max_bitrate_mbps: Optional[float] = None) -> float:
+        """Предел скорости трансляции с multicast, байт/с (0 - без предела)"""
+        if max_bitrate_mbps is None:
+            max_bitrate_mbps = max_bitrate_from_config()
+        if profile.use_multicast and max_bitrate_mbps > 0:
+            return max_bitrate_mbps * 1_000_000 / 8
+        return 0
+    
     @classmethod
     def get_system_resources(cls) -> dict:
         """Получить текущие ресурсы системы"""
@@ -227,6 +275,12 @@ class PerformanceManager:
         if bandwidth['upload_for_all_students_mbps'] > 100 and not profile.use_multicast:
             recommendations.append("⚠️ Высокий трафик! Multicast снизит его в {student_count}x раз")
         
+        if bandwidth['multicast_cap_exceeded']:
+            recommendations.append(
+                f"⚠️ Экран (~{bandwidth['screen_mbps']} Мбит/с) выше предела multicast "
+                f"{bandwidth['multicast_cap_mbps']:g} Мбит/с - снизьте качество или FPS"
+            )
+        
         return {
             "profile": profile,
             "bandwidth": bandwidth,
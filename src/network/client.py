@@ -7,13 +7,16 @@ import socket
 import threading
 import logging
 import time
-from typing import Dict, Callable, Optional, List
+from typing import Dict, Callable, Optional, List, Union
 from src.common.constants import (
     DEFAULT_PORT, MULTICAST_GROUP, MULTICAST_PORT,
-    HEARTBEAT_INTERVAL, MessageType, BUFFER_SIZE
+    HEARTBEAT_INTERVAL, OUTBOUND_CONTROL_TIMEOUT, BULK_FRAGMENT_SIZE,
+    MessageType, BUFFER_SIZE
 )
 from src.common.utils import get_machine_id
-from src.network.protocol import Protocol, MessageBuilder, TCPPacketAssembler
+from src.network.protocol import Protocol, MessageBuilder, RingPacketAssembler
+from src.network.send_queue import OutboundQueue, coalescing_from_config, batch_buffers, send_buffers
+from src.network.codecs import LEGACY_CODECS, negotiate_codecs
 from src.common.models import Teacher
 
 
@@ -33,7 +36,12 @@ class StudentClient:
         self.multicast_socket: Optional[socket.socket] = None
         
         # Буферизация TCP
-        self.packet_assembler: Optional[TCPPacketAssembler] = None
+        self.packet_assembler: Optional[RingPacketAssembler] = None
+        self._handshake_leftovers: List[bytes] = []  # Пришли вместе с ответом на подключение
+        
+        # Согласованные версия протокола и кодеки (до подключения - JSON и zlib)
+        self.protocol_version = Protocol.JSON_VERSION
+        self.codecs = LEGACY_CODECS
         
         # Подключение
         self.connected = False
@@ -43,6 +51,11 @@ class StudentClient:
         # Потоки
         self.running = False
         self.threads: List[threading.Thread] = []
+        # Будит поток heartbeat при отключении - не ждать конца интервала
+        self._disconnected = threading.Event()
+        
+        # Очередь исходящих пакетов (приоритетные полосы), создается при подключении
+        self.outbound: Optional[OutboundQueue] = None
         
         # Lock для потокобезопасной отправки
         self._send_lock = threading.Lock()
@@ -59,6 +72,8 @@ class StudentClient:
             'messages_sent': 0,
             'bytes_received': 0,
             'bytes_sent': 0,
+            'send_calls': 0,
+            'packets_written': 0,
             'connection_time': None
         }
         
@@ -96,7 +111,7 @@ class StudentClient:
             self.threads.append(discovery_thread)
             
             return True
-            
+        
         except Exception as e:
             logger.error(f"Ошибка запуска поиска: {e}")
             return False
@@ -111,18 +126,20 @@ class StudentClient:
             logger.info(f"Подключение к {teacher.name} на {teacher.ip_address}:{teacher.port}")
             
             # Создаем сборщик пакетов
-            self.packet_assembler = TCPPacketAssembler()
+            self.packet_assembler = RingPacketAssembler()
             
             # Отправляем запрос на подключение
-            message = MessageBuilder.student_connect(self.student_name, self.machine_id)
+            # Предлагаем максимальную версию (config.ini: [Network] Serializer)
+            local_version = Protocol.local_version()
+            message = MessageBuilder.student_connect(self.student_name, self.machine_id, local_version)
             self._send_raw(message)
             
             # Ждем ответ
             self.tcp_socket.settimeout(5.0)
-            data = self.tcp_socket.recv(BUFFER_SIZE)
+            self.packet_assembler.recv_into(self.tcp_socket)
             
             # Используем сборщик для получения ответа
-            packets = self.packet_assembler.feed(data)
+            packets = self.packet_assembler.read_packets()
             
             if not packets:
                 logger.error("Не получен ответ от сервера")
@@ -132,12 +149,28 @@ class StudentClient:
             
             if response and response.get("type") == MessageType.CONNECTION_ACCEPTED:
                 self.student_id = response["data"]["student_id"]
+                # Старый сервер версию не присылает - остаёмся на JSON
+                self.protocol_version = Protocol.negotiate_version(
+                    response["data"].get("protocol_version"), local_version
+                )
+                self.codecs = negotiate_codecs(response["data"].get("codecs"))
                 self.teacher = teacher
+                coalesce_window, coalesce_bytes = coalescing_from_config()
+                self.outbound = OutboundQueue(
+                    fragment_size=BULK_FRAGMENT_SIZE if self.protocol_version >= Protocol.BINARY_VERSION else 0,
+                    coalesce_window=coalesce_window,
+                    coalesce_bytes=coalesce_bytes
+                )
                 self.connected = True
+                self._disconnected.clear()
                 self.tcp_socket.settimeout(None)
                 self._stats['connection_time'] = time.time()
+                # Сервер мог сразу прислать следующие сообщения - их разберет поток
+                # получения; memoryview на буфер сборщика копируем до его перезаписи
+                self._handshake_leftovers = [bytes(packet) for packet in packets[1:]]
                 
-                logger.info(f"Подключение принято, ID: {self.student_id}")
+                logger.info(f"Подключение принято, ID: {self.student_id}, протокол v{self.protocol_version}, "
+                            f"кодеки {', '.join(self.codecs)}")
                 
                 # Запускаем рабочие потоки
                 self._start_client_threads()
@@ -156,7 +189,7 @@ class StudentClient:
             else:
                 logger.error("Неизвестный ответ от сервера")
                 return False
-                
+        
         except Exception as e:
             logger.error(f"Ошибка подключения: {e}")
             if self.tcp_socket:
@@ -168,13 +201,23 @@ class StudentClient:
         """Отключиться от преподавателя"""
         if not self.connected:
             return
-            
+        
         logger.info("Отключение от преподавателя...")
         
         self.connected = False
+        self._disconnected.set()
+        self.protocol_version = Protocol.JSON_VERSION
+        self.codecs = LEGACY_CODECS
+        
+        if self.outbound is not None:
+            self.outbound.close()
         
-        # Закрываем сокет
+        # Закрываем сокет (shutdown будит поток приема в recv)
         if self.tcp_socket:
+            try:
+                self.tcp_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             try:
                 self.tcp_socket.close()
             except:
@@ -259,7 +302,7 @@ class StudentClient:
                     else:
                         # Обновляем существующего
                         self.available_teachers[teacher_id] = teacher
-                        
+            
             except socket.timeout:
                 continue
             except Exception as e:
@@ -273,6 +316,11 @@ class StudentClient:
         receive_thread.start()
         self.threads.append(receive_thread)
         
+        # Поток отправки (разбирает очередь по приоритетам)
+        writer_thread = threading.Thread(target=self._write_messages, daemon=True)
+        writer_thread.start()
+        self.threads.append(writer_thread)
+        
         # Поток отправки heartbeat
         heartbeat_thread = threading.Thread(target=self._send_heartbeat, daemon=True)
         heartbeat_thread.start()
@@ -285,41 +333,26 @@ class StudentClient:
         """
         logger.info("Запущен поток получения сообщений (с буферизацией)")
         
+        leftovers, self._handshake_leftovers = self._handshake_leftovers, []
+        self._dispatch_packets(leftovers)
+        
         while self.connected:
             try:
                 self.tcp_socket.settimeout(1.0)
-                data = self.tcp_socket.recv(BUFFER_SIZE)
+                received = self.packet_assembler.recv_into(self.tcp_socket)
                 
-                if not data:
-                    logger.warning("Соединение закрыто сервером")
-                    self.disconnect()
+                if not received:
+                    # Не connected - сокет закрыли мы сами (disconnect)
+                    if self.connected:
+                        logger.warning("Соединение закрыто сервером")
+                        self.disconnect()
                     break
                 
-                self._stats['bytes_received'] += len(data)
+                self._stats['bytes_received'] += received
                 
-                # Используем сборщик пакетов
-                packets = self.packet_assembler.feed(data)
-                
-                for packet in packets:
-                    # Распаковываем сообщение
-                    message = Protocol.unpack(packet)
-                    if not message:
-                        continue
-                    
-                    self._stats['messages_received'] += 1
-                    msg_type = message.get("type")
-                    
-                    # Обрабатываем PONG
-                    if msg_type == MessageType.PONG:
-                        continue
-                    
-                    # Другие сообщения передаем в колбэк
-                    if self.on_message_received:
-                        try:
-                            self.on_message_received(message)
-                        except Exception as e:
-                            logger.error(f"Ошибка в обработчике сообщения: {e}")
-                    
+                # Пакеты - memoryview на буфер сборщика (без копирования)
+                self._dispatch_packets(self.packet_assembler.read_packets())
+            
             except socket.timeout:
                 continue
             except ConnectionResetError:
@@ -339,14 +372,47 @@ class StudentClient:
                        f"обработано байт={stats['bytes_processed']}, "
                        f"восстановлений синхронизации={stats['sync_recoveries']}")
     
+    def _dispatch_packets(self, packets):
+        """Распаковать пакеты и передать сообщения в on_message_received"""
+        for packet in packets:
+            # Распаковываем сообщение
+            message = Protocol.unpack(packet)
+            if not message:
+                continue
+            
+            self._stats['messages_received'] += 1
+            msg_type = message.get("type")
+            
+            # Обрабатываем PONG
+            if msg_type == MessageType.PONG:
+                continue
+            
+            # Другие сообщения передаем в колбэк
+            if self.on_message_received:
+                try:
+                    self.on_message_received(message)
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике сообщения: {e}")
+    
+    def _write_messages(self):
+        """Поток отправки: пакеты из очереди, самые важные первыми, мелкие - пачками"""
+        outbound = self.outbound
+        while self.connected:
+            batch = outbound.get_batch(timeout=0.5)
+            if batch and not self._send_buffers(batch_buffers(batch), len(batch)):
+                # Очередь больше никто не разбирает - соединение закрываем
+                self.disconnect()
+                break
+    
     def _send_heartbeat(self):
         """Поток отправки heartbeat"""
         while self.connected:
             try:
                 if not self.send_message(MessageType.PING, {}):
                     break
-                time.sleep(HEARTBEAT_INTERVAL)
-                
+                if self._disconnected.wait(HEARTBEAT_INTERVAL):
+                    break
+            
             except Exception as e:
                 if self.connected:
                     logger.error(f"Ошибка отправки heartbeat: {e}")
@@ -357,36 +423,55 @@ class StudentClient:
         Отправить сырые данные (потокобезопасно)
         Гарантирует отправку всех байт
         """
+        return self._send_buffers([memoryview(data)])
+    
+    def _send_buffers(self, buffers: List[memoryview], packets: int = 1) -> bool:
+        """
+        Отправить буферы пачки пакетов через sendmsg (потокобезопасно)
+        
+        packets - сколько пакетов в буферах (для статистики)
+        """
         if not self.tcp_socket:
             return False
         
         try:
             with self._send_lock:
-                total_sent = 0
-                while total_sent < len(data):
-                    sent = self.tcp_socket.send(data[total_sent:])
-                    if sent == 0:
-                        return False
-                    total_sent += sent
-                self._stats['bytes_sent'] += total_sent
+                self._stats['send_calls'] += send_buffers(self.tcp_socket, buffers)
+                self._stats['bytes_sent'] += sum(len(buffer) for buffer in buffers)
+                self._stats['packets_written'] += packets
             return True
         except Exception as e:
             logger.error(f"Ошибка отправки данных: {e}")
             return False
     
-    def send_message(self, msg_type: str, data: Dict) -> bool:
-        """Отправить сообщение преподавателю"""
-        if not self.connected or not self.tcp_socket:
+    def send_message(self, msg_type: str, data: Dict,
+                     attachment: Optional[Union[bytes, memoryview]] = None,
+                     attachment_field: str = "data") -> bool:
+        """
+        Отправить сообщение преподавателю
+        
+        attachment - бинарные данные (голос, скриншот). При протоколе v3
+        уходят сырыми байтами, со старым сервером - base64 в поле attachment_field.
+        
+        Сообщение ставится в очередь отправки по приоритету своего класса
+        (MessageClass); объемные ждут места в очереди.
+        """
+        outbound = self.outbound
+        if not self.connected or not self.tcp_socket or outbound is None:
             logger.warning("Не подключен к преподавателю")
             return False
         
         try:
-            message = Protocol.pack(msg_type, data)
-            if self._send_raw(message):
+            message = Protocol.pack_parts(
+                self.protocol_version, msg_type, data, attachment, attachment_field,
+                self.codecs
+            )
+            if outbound.put(message, msg_type, timeout=OUTBOUND_CONTROL_TIMEOUT):
                 self._stats['messages_sent'] += 1
                 return True
+            logger.warning(f"Очередь отправки переполнена, {msg_type} не отправлено")
             return False
-            
+        
         except Exception as e:
             logger.error(f"Ошибка отправки сообщения: {e}")
             return False
@@ -400,4 +485,6 @@ class StudentClient:
         stats = self._stats.copy()
         if stats['connection_time']:
             stats['uptime_seconds'] = time.time() - stats['connection_time']
+        if self.outbound is not None:
+            stats['send_queue'] = self.outbound.get_stats()
         return stats
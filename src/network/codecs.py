@@ -0,0 +1,171 @@
+"""
+Кодеки сжатия payload
+Версия 1.0
+
+Реестр кодеков (none/zlib/zstd/lz4) и выбор кодека по типу сообщения
+(COMPRESSION_POLICY). zstd и lz4 - опциональные зависимости: если их нет,
+вместо них используется zlib (быстрый уровень вместо lz4).
+
+Номер кодека пишется в биты FLAGS заголовка пакета. zlib кодируется
+нулем, поэтому старые клиенты (только FLAG_COMPRESSED) понимают его
+как раньше.
+"""
+
+import threading
+import zlib
+import logging
+from typing import Dict, Iterable, Optional, Tuple, Union
+from src.common.constants import Codec, COMPRESSION_POLICY, DEFAULT_CODEC, COMPRESSION_MIN_SIZE
+
+# Опциональные зависимости
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Номер кодека в заголовке (только для сжатых пакетов)
+CODEC_IDS: Dict[str, int] = {
+    Codec.ZLIB: 0,
+    Codec.ZSTD: 1,
+    Codec.LZ4: 2,
+}
+CODEC_NAMES: Dict[int, str] = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+# Что понимает пир, не сообщивший список кодеков
+LEGACY_CODECS: Tuple[str, ...] = (Codec.NONE, Codec.ZLIB)
+
+# Уровни сжатия
+ZLIB_LEVEL = 6
+ZLIB_FAST_LEVEL = 1  # Замена lz4, если его нет
+ZSTD_LEVEL = 3
+
+# Компрессоры zstd не потокобезопасны - по одному на поток
+_local = threading.local()
+
+
+def available_codecs() -> Tuple[str, ...]:
+    """Кодеки, доступные в этой установке"""
+    codecs = [Codec.NONE, Codec.ZLIB]
+    if ZSTD_AVAILABLE:
+        codecs.append(Codec.ZSTD)
+    if LZ4_AVAILABLE:
+        codecs.append(Codec.LZ4)
+    return tuple(codecs)
+
+
+def negotiate_codecs(peer_codecs: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Общие с пиром кодеки (старые пиры список не присылают - только zlib)"""
+    if not peer_codecs:
+        return LEGACY_CODECS
+    
+    peer = set(peer_codecs)
+    common = tuple(codec for codec in available_codecs() if codec in peer)
+    # zlib понимают все версии протокола
+    return common if Codec.ZLIB in common else common + (Codec.ZLIB,)
+
+
+def choose_codec(msg_type: Optional[str], size: int,
+                 codecs: Iterable[str] = LEGACY_CODECS, binary: bool = True) -> str:
+    """
+    Выбрать кодек для payload по политике типа сообщения
+    
+    Args:
+        msg_type: Тип сообщения
+        size: Размер несжатого payload
+        codecs: Кодеки, согласованные с получателем
+        binary: Медиа идет сырым вложением (протокол v3+). Без него
+                (base64 в JSON) несжимаемое медиа сжимается zlib - это
+                возвращает часть раздувания base64
+    """
+    if size < COMPRESSION_MIN_SIZE:
+        return Codec.NONE
+    
+    codec = COMPRESSION_POLICY.get(msg_type, DEFAULT_CODEC)
+    if codec == Codec.NONE and not binary:
+        return Codec.ZLIB
+    if codec == Codec.NONE or codec in codecs:
+        return codec
+    
+    return Codec.ZLIB
+
+
+def compress(codec: str, data: BytesLike, fallback_fast: bool = False) -> bytes:
+    """
+    Сжать данные кодеком
+    
+    Args:
+        codec: Codec.ZLIB / ZSTD / LZ4
+        fallback_fast: Для zlib - быстрый уровень (замена недоступного lz4)
+    """
+    if codec == Codec.ZSTD:
+        compressor = getattr(_local, "zstd_compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            _local.zstd_compressor = compressor
+        return compressor.compress(data)
+    
+    if codec == Codec.LZ4:
+        return lz4.frame.compress(data)
+    
+    if codec == Codec.ZLIB:
+        return zlib.compress(data, level=ZLIB_FAST_LEVEL if fallback_fast else ZLIB_LEVEL)
+    
+    raise ValueError(f"Неизвестный кодек: {codec}")
+
+
+def decompress(codec_id: int, data: BytesLike) -> bytes:
+    """Разжать данные по номеру кодека из заголовка"""
+    codec = CODEC_NAMES.get(codec_id)
+    
+    if codec == Codec.ZLIB:
+        return zlib.decompress(data)
+    
+    if codec == Codec.ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Пакет сжат zstd, но zstandard не установлен")
+        decompressor = getattr(_local, "zstd_decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            _local.zstd_decompressor = decompressor
+        return decompressor.decompress(data)
+    
+    if codec == Codec.LZ4:
+        if not LZ4_AVAILABLE:
+            raise ValueError("Пакет сжат lz4, но lz4 не установлен")
+        return lz4.frame.decompress(data)
+    
+    raise ValueError(f"Неизвестный номер кодека: {codec_id}")
+
+
+def compress_for(msg_type: Optional[str], payload: BytesLike,
+                 codecs: Iterable[str] = LEGACY_CODECS, binary: bool = True) -> Tuple[BytesLike, Optional[int]]:
+    """
+    Сжать payload по политике типа сообщения (binary - как в choose_codec)
+    
+    Returns:
+        (payload, номер кодека) - номер None, если payload не сжат
+        (сжатие не выбрано или не дало выигрыша)
+    """
+    codec = choose_codec(msg_type, len(payload), codecs, binary)
+    if codec == Codec.NONE:
+        return payload, None
+    
+    # lz4 недоступен у нас или у пира - быстрый zlib вместо него
+    wanted = COMPRESSION_POLICY.get(msg_type, DEFAULT_CODEC)
+    compressed = compress(codec, payload, fallback_fast=(wanted == Codec.LZ4))
+    
+    if len(compressed) >= len(payload):
+        return payload, None
+    return compressed, CODEC_IDS[codec]
@@ -0,0 +1,383 @@
+"""
+Серверный модуль (преподаватель) на цикле событий
+Версия 1.0 - ядро на selectors
+
+Вместо потока на каждого студента (TeacherServer) все сокеты студентов
+обслуживает один I/O поток через selectors (epoll/kqueue/select):
+- 100 студентов = 1 поток вместо 100
+- нет опроса со sleep(10 мс) - данные обрабатываются сразу по готовности
+- меньше конкуренции за GIL
+
+Колбэки (on_student_connected, on_message_received, ...) и методы
+send_to_student/broadcast_to_all те же, что у TeacherServer.
+Колбэки вызываются из I/O потока и должны работать быстро.
+
+Выбор ядра: config.ini, [Network] ServerCore = selectors
+"""
+
+import socket
+import selectors
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Set
+from src.common.constants import DEFAULT_PORT, ServerCore
+from src.network.protocol import Protocol
+from src.network.server import TeacherServer, ClientHandler
+from src.network.send_queue import Packet, batch_buffers, advance_buffers, send_some
+
+
+logger = logging.getLogger(__name__)
+
+
+class SelectorClientHandler(ClientHandler):
+    """
+    Обработчик соединения для ядра на selectors
+    
+    Сокет неблокирующий: и чтение, и запись идут только по готовности
+    из I/O потока. send_packet() из любого потока лишь ставит пакет
+    в очередь и просит I/O поток подписаться на готовность к записи.
+    """
+    
+    def __init__(self, client_socket: socket.socket, address: tuple,
+                 on_send_ready: Optional[Callable[['SelectorClientHandler'], None]] = None):
+        super().__init__(client_socket, address)
+        self.accepted_at = time.time()
+        client_socket.setblocking(False)
+        
+        # Колбэк: в очереди появились пакеты (будит I/O поток)
+        self.on_send_ready = on_send_ready
+        
+        # Недописанные буферы текущей пачки (их уже нельзя выбросить)
+        self._partial: List[memoryview] = []
+        
+        # Поток I/O цикла: из него нельзя ждать места в очереди
+        self.io_thread_id: Optional[int] = None
+    
+    def start_writer(self):
+        """Отдельный писатель не нужен - очередь разбирает I/O поток"""
+    
+    def send_packet(self, packet: Packet, msg_type: Optional[str] = None, keyframe: bool = True) -> bool:
+        """Поставить пакет в очередь и разбудить I/O поток"""
+        if threading.get_ident() == self.io_thread_id:
+            # I/O поток сам разбирает очереди - ждать места ему нельзя
+            if not self.connected:
+                return False
+            if not self.outbound.put(packet, msg_type, timeout=0, keyframe=keyframe):
+                logger.warning(f"Очередь отправки {self.address} переполнена, отключаем")
+                self.connected = False
+                return False
+        elif not super().send_packet(packet, msg_type, keyframe):
+            return False
+        
+        if self.on_send_ready:
+            self.on_send_ready(self)
+        return True
+    
+    def flush(self) -> bool:
+        """
+        Отправить из очереди сколько примет сокет (только из I/O потока)
+        
+        Пакеты, уже стоящие в очереди, уходят одним sendmsg; окна ожидания
+        попутчиков здесь нет - I/O поток не может ждать.
+        
+        Returns:
+            True если в очереди еще остались данные
+        """
+        try:
+            while self.connected:
+                if not self._partial:
+                    batch = self.outbound.get_batch(timeout=0, window=0)
+                    if not batch:
+                        return False
+                    self._partial = batch_buffers(batch)
+                    self._stats['packets_written'] += len(batch)
+                    if not self._partial:
+                        continue
+                
+                sent = send_some(self.socket, self._partial)
+                self._stats['send_calls'] += 1
+                if sent == 0:
+                    self.connected = False
+                    return False
+                
+                self._stats['bytes_sent'] += sent
+                self._partial = advance_buffers(self._partial, sent)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка отправки пакета {self.address}: {e}")
+            self.connected = False
+        
+        return False
+    
+    def read_available(self) -> Optional[list]:
+        """
+        Прочитать данные, готовые в сокете
+        
+        Returns:
+            Список готовых пакетов или None, если соединение закрыто
+        """
+        try:
+            if not self.assembler.recv_into(self.socket):
+                self.connected = False
+                return None
+        except (BlockingIOError, InterruptedError):
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка получения от {self.address}: {e}")
+            self.connected = False
+            return None
+        
+        return self.assembler.read_packets()
+
+
+class SelectorTeacherServer(TeacherServer):
+    """
+    Сервер преподавателя: все студенты в одном I/O потоке (selectors)
+    
+    Использование:
+        server = SelectorTeacherServer("Иванов И.И.")
+        server.on_message_received = handle_message
+        server.start()
+    """
+    
+    CORE = ServerCore.SELECTORS
+    
+    # Таймаут ожидания событий (проверка running и закрытых соединений), сек
+    SELECT_TIMEOUT = 0.5
+    
+    # Сколько ждать STUDENT_CONNECT после подключения, сек
+    REGISTRATION_TIMEOUT = 10.0
+    
+    # Как часто проверять закрытые соединения, сек
+    SWEEP_INTERVAL = 0.1
+    
+    def __init__(self, teacher_name: str, channel: int = 1, port: int = DEFAULT_PORT):
+        super().__init__(teacher_name, channel, port)
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._last_sweep = 0.0
+        self._stats['io_wakeups'] = 0
+        
+        # Пробуждение I/O потока, когда в очередях отправки появились пакеты
+        self._wakeup_reader: Optional[socket.socket] = None
+        self._wakeup_writer: Optional[socket.socket] = None
+        self._send_ready: Set[SelectorClientHandler] = set()
+        self._send_ready_lock = threading.Lock()
+    
+    def _start_threads(self):
+        """Запустить рабочие потоки: I/O цикл вместо потока приема подключений"""
+        self._selector = selectors.DefaultSelector()
+        self.tcp_socket.setblocking(False)
+        self._selector.register(self.tcp_socket, selectors.EVENT_READ, None)
+        
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._wakeup_reader)
+        
+        io_thread = threading.Thread(target=self._io_loop, daemon=True)
+        io_thread.start()
+        self.threads.append(io_thread)
+        
+        # Поток широковещания
+        broadcast_thread = threading.Thread(target=self._broadcast_presence, daemon=True)
+        broadcast_thread.start()
+        self.threads.append(broadcast_thread)
+        
+        # Поток проверки heartbeat
+        heartbeat_thread = threading.Thread(target=self._check_heartbeats, daemon=True)
+        heartbeat_thread.start()
+        self.threads.append(heartbeat_thread)
+        
+        logger.info(f"I/O цикл запущен ({type(self._selector).__name__})")
+    
+    def stop(self):
+        """Остановить сервер: I/O поток просыпается сразу, а не через SELECT_TIMEOUT"""
+        self.running = False
+        if self._wakeup_writer:
+            try:
+                self._wakeup_writer.send(b"\0")
+            except OSError:
+                pass
+        super().stop()
+    
+    def _io_loop(self):
+        """Единый цикл ввода-вывода для всех студентов"""
+        logger.info("Ожидание подключений студентов (selectors)...")
+        
+        try:
+            while self.running:
+                try:
+                    events = self._selector.select(timeout=self.SELECT_TIMEOUT)
+                except OSError as e:
+                    if self.running:
+                        logger.error(f"Ошибка select: {e}")
+                    break
+                
+                self._stats['io_wakeups'] += 1
+                
+                for key, mask in events:
+                    if key.data is None:
+                        self._accept_ready()
+                    elif key.data is self._wakeup_reader:
+                        self._drain_wakeups()
+                    else:
+                        if mask & selectors.EVENT_READ:
+                            self._read_ready(key.data)
+                        if mask & selectors.EVENT_WRITE:
+                            self._write_ready(key.data)
+                
+                self._watch_send_ready()
+                
+                if time.time() - self._last_sweep >= self.SWEEP_INTERVAL:
+                    self._sweep_closed()
+        finally:
+            self._close_selector()
+    
+    def _accept_ready(self):
+        """Принять все ожидающие подключения"""
+        while self.running:
+            try:
+                client_socket, address = self.tcp_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.running:
+                    logger.error(f"Ошибка приема подключения: {e}")
+                return
+            
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            logger.info(f"Новое подключение от {address}")
+            self._stats['total_connections'] += 1
+            
+            # Дескриптор мог освободиться только что - убираем старые записи до регистрации
+            self._sweep_closed()
+            
+            handler = SelectorClientHandler(client_socket, address, self._on_send_ready)
+            self._configure_handler(handler)
+            handler.io_thread_id = threading.get_ident()
+            self._selector.register(client_socket, selectors.EVENT_READ, handler)
+    
+    def _read_ready(self, handler: SelectorClientHandler):
+        """Обработать данные, пришедшие от студента"""
+        packets = handler.read_available()
+        
+        if packets is None:
+            self._drop_client(handler)
+            return
+        
+        for packet in packets:
+            message = Protocol.unpack(packet)
+            if not message:
+                continue
+            
+            if not self._dispatch_message(handler, message):
+                # Регистрация не удалась
+                self._drop_client(handler)
+                return
+    
+    def _write_ready(self, handler: SelectorClientHandler):
+        """Сокет студента готов к записи - разбираем его очередь"""
+        if handler.flush():
+            return
+        
+        if not handler.connected:
+            self._drop_client(handler)
+            return
+        
+        # Очередь пуста - снова следим только за чтением
+        self._set_events(handler, selectors.EVENT_READ)
+    
+    def _on_send_ready(self, handler: SelectorClientHandler):
+        """В очереди студента появились пакеты (вызывается из любого потока)"""
+        with self._send_ready_lock:
+            first = not self._send_ready
+            self._send_ready.add(handler)
+        
+        if first and threading.get_ident() != handler.io_thread_id:
+            try:
+                self._wakeup_writer.send(b"\0")
+            except (BlockingIOError, OSError):
+                # Буфер полон (I/O поток и так проснется) или сервер остановлен
+                pass
+    
+    def _drain_wakeups(self):
+        """Вычитать байты пробуждения"""
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+    
+    def _watch_send_ready(self):
+        """Подписаться на готовность к записи для студентов с непустой очередью"""
+        with self._send_ready_lock:
+            if not self._send_ready:
+                return
+            ready = self._send_ready
+            self._send_ready = set()
+        
+        for handler in ready:
+            if handler.connected:
+                self._set_events(handler, selectors.EVENT_READ | selectors.EVENT_WRITE)
+    
+    def _set_events(self, handler: SelectorClientHandler, events: int):
+        """Изменить набор событий, за которыми следит селектор"""
+        try:
+            key = self._selector.get_key(handler.socket)
+        except (KeyError, ValueError):
+            return
+        
+        if key.data is handler and key.events != events:
+            self._selector.modify(handler.socket, events, handler)
+    
+    def _sweep_closed(self):
+        """Убрать из селектора закрытые и не зарегистрировавшиеся соединения"""
+        now = time.time()
+        self._last_sweep = now
+        
+        for key in list(self._selector.get_map().values()):
+            handler = key.data
+            if not isinstance(handler, SelectorClientHandler):
+                continue
+            
+            if not handler.connected:
+                self._drop_client(handler)
+            elif not handler.student_id and now - handler.accepted_at > self.REGISTRATION_TIMEOUT:
+                logger.warning(f"{handler.address} не зарегистрировался за {self.REGISTRATION_TIMEOUT}с, отключаем")
+                self._drop_client(handler)
+    
+    def _drop_client(self, handler: SelectorClientHandler):
+        """Отключить клиента и убрать его из селектора"""
+        try:
+            self._selector.unregister(handler.socket)
+        except (KeyError, ValueError):
+            pass
+        
+        student_id = handler.student_id
+        if student_id:
+            # Соединение могло быть уже заменено новым - не трогаем его
+            with self._students_lock:
+                is_current = self.client_handlers.get(student_id) is handler
+            if is_current:
+                self._unregister_student(student_id)
+        
+        handler.close()
+    
+    def _close_selector(self):
+        """Закрыть селектор и все соединения"""
+        if not self._selector:
+            return
+        
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.data, SelectorClientHandler):
+                key.data.close()
+        
+        self._selector.close()
+        
+        for sock in (self._wakeup_reader, self._wakeup_writer):
+            if sock:
+                sock.close()
+        logger.info("I/O цикл остановлен")
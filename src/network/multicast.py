@@ -1,11 +1,47 @@
 """
 Multicast streaming для эффективной трансляции
-Версия 1.0
+Версия 2.4 - фрагментация по MTU, FEC, повтор по NACK, пейсинг и пакетный прием
 
 Решение проблемы производительности:
 - TCP к каждому студенту = 30 соединений = 300 Mbps
 - Multicast UDP = 1 поток = 10 Mbps
 
+Кадр 1280x720 в JPEG часто больше 64 KB (предел UDP датаграммы) и
+намного больше MTU: одна sendto либо не проходит, либо IP дробит
+датаграмму, и потеря любого IP фрагмента теряет весь кадр. Поэтому
+сообщение режется на фрагменты по MTU, у каждого свой заголовок:
+
+    MAGIC(2) VERSION(1) FLAGS(1) ID(4) INDEX(2) COUNT(2) GROUP(1) TIMESTAMP(8)
+
+Приемник собирает фрагменты в буфере (FrameReassembler): неполные
+кадры выбрасываются по таймауту и как устаревшие, когда уже собран
+более новый кадр. Датаграммы без заголовка (старый отправитель)
+принимаются как есть.
+
+FEC (опционально, config.ini: [Network] MulticastFecRatio): на каждые
+GROUP фрагментов данных отправляется фрагмент четности (XOR группы).
+Потерю одного фрагмента в группе приемник восстанавливает сам, без
+запроса повтора. Избыточность ratio = 1 / GROUP: при потерях Wi-Fi
+1-3% без FEC теряется до половины кадров из 70 фрагментов.
+
+NACK: что не восстановила FEC, студент запрашивает у преподавателя по
+своему TCP соединению (MULTICAST_NACK) - только недостающие фрагменты.
+Отправитель держит последние кадры в кэше повтора; NackAggregator
+копит NACK несколько миллисекунд и отправляет каждый фрагмент один
+раз: в группу, если он нужен нескольким студентам, или одному
+студенту по TCP (MULTICAST_REPAIR).
+
+Пейсинг: кадр из 70 фрагментов, отправленный залпом, переполняет
+очередь дешевой точки доступа и SO_RCVBUF студентов. MulticastPacer
+растягивает отправку кадра на интервал кадра и ограничивает скорость
+token bucket'ом (config.ini: [Network] MulticastMaxBitrateMbps) с
+допустимым всплеском.
+
+Прием: датаграммы читаются recv_into в буферы заранее выделенного пула
+(BufferPool), за одно пробуждение вычитывается все, что есть в сокете,
+и пачка идет в сборку. Фрагмент остается в своем буфере до сборки
+кадра - кадр склеивается одной копией.
+
 Поддержка 50+ студентов одновременно!
 """
 
@@ -14,13 +50,92 @@ import struct
 import logging
 import threading
 import time
+import random
+import select
+import sys
 import zlib
-from typing import Optional, Callable
-from dataclasses import dataclass
+from collections import OrderedDict, deque
+from typing import Optional, Callable, Dict, List, Tuple, Union
+from dataclasses import dataclass, field
+
+from src.common.utils import load_config
+from src.network.send_queue import SENDMSG_AVAILABLE
 
 logger = logging.getLogger(__name__)
 
 
+# Заголовок фрагмента: magic, версия, флаги, id сообщения, номер и число фрагментов данных,
+# размер группы FEC (0 - без FEC), время отправки
+FRAGMENT_HEADER = struct.Struct('!2sBBIHHBd')
+FRAGMENT_MAGIC = b'AM'
+FRAGMENT_VERSION = 2  # 2 - группа FEC в заголовке
+
+# Флаги фрагмента
+FRAGMENT_FLAG_COMPRESSED = 1  # Сообщение целиком сжато zlib
+FRAGMENT_FLAG_PARITY = 2      # Фрагмент четности группы (INDEX = COUNT + номер группы)
+
+# Перед XOR данных в фрагменте четности - XOR длин фрагментов группы
+PARITY_PREFIX = struct.Struct('!H')
+
+# Наибольшая группа FEC (GROUP - один байт)
+FEC_MAX_GROUP = 255
+
+# Полезная нагрузка UDP в кадре Ethernet: 1500 - 20 (IP) - 8 (UDP)
+MULTICAST_MTU = 1472
+
+# Сколько ждать недостающие фрагменты кадра, сек
+REASSEMBLY_TIMEOUT = 0.5
+
+# Сколько незавершенных кадров держать одновременно
+REASSEMBLY_MAX_PENDING = 8
+
+# Сколько последних кадров учитывать в статистике полноты
+COMPLETENESS_WINDOW = 100
+
+# NACK: сколько ждать после последнего фрагмента кадра, прежде чем
+# просить недостающие (плюс случайная добавка, чтобы студенты не слали разом), сек
+NACK_DELAY = 0.02
+NACK_JITTER = 0.01
+
+# Повторный NACK, если повтор тоже потерялся, сек; не больше NACK_MAX_ATTEMPTS раз на кадр
+NACK_RETRY = 0.1
+NACK_MAX_ATTEMPTS = 2
+
+# Сколько последних сообщений отправитель хранит для повтора
+RETRANSMIT_CACHE_FRAMES = 16
+
+# Сколько преподаватель копит NACK перед повтором, сек
+NACK_AGGREGATION_WINDOW = 0.005
+
+# Фрагмент, только что повторенный в группу, повторно не отправляется (NACK разминулись с повтором), сек
+REPAIR_HOLDOFF = 0.05
+
+# Пейсинг: фрагменты кадра уходят за эту долю интервала кадра (запас до следующего кадра)
+PACING_SPREAD = 0.8
+
+# Допустимый всплеск (байт подряд без паузы) - около 10 датаграмм, помещается в очередь точки доступа
+PACING_BURST_BYTES = 16 * 1024
+
+# Сколько кадров может ждать в очереди пейсера; старые сверх этого выбрасываются
+PACING_MAX_BACKLOG = 2
+
+# Сколько секунд истории отправленного битрейта хранить
+BITRATE_HISTORY_SECONDS = 60
+
+# Прием: буферов в пуле (хватает на REASSEMBLY_MAX_PENDING кадров по ~70 фрагментов и пачку)
+RECEIVE_POOL_BUFFERS = 1024
+
+# Сколько датаграмм вычитывать за одно пробуждение
+RECEIVE_BATCH = 64
+
+# Счетчик потерь в очереди сокета (Linux): номер опции и наличие recvmsg
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40 if sys.platform.startswith('linux') else None)
+RECVMSG_AVAILABLE = hasattr(socket.socket, 'recvmsg_into')
+
+# Windows: датаграмма больше буфера recv_into
+WSAEMSGSIZE = 10040
+
+
 @dataclass
 class MulticastConfig:
     """Конфигурация multicast"""
@@ -28,6 +143,577 @@ class MulticastConfig:
     port: int = 5005
     ttl: int = 32  # Time To Live
     buffer_size: int = 65536
+    mtu: int = MULTICAST_MTU  # Максимальный размер датаграммы (с заголовком фрагмента)
+    reassembly_timeout: float = REASSEMBLY_TIMEOUT
+    fec_ratio: float = 0.0  # Избыточность FEC (0.1 - четность на каждые 10 фрагментов, 0 - выключена)
+    retransmit_cache: int = RETRANSMIT_CACHE_FRAMES  # Сообщений в кэше повтора (0 - без повтора)
+    max_bitrate_mbps: float = 0.0  # Предел скорости отправки, Мбит/с (0 - без предела)
+    burst_bytes: int = PACING_BURST_BYTES  # Допустимый всплеск token bucket
+    frame_interval: float = 0.0  # Интервал кадров, сек: фрагменты кадра растягиваются на него (0 - залпом)
+    receive_pool: int = RECEIVE_POOL_BUFFERS  # Буферов приема по mtu + 1 байт
+
+
+def fec_ratio_from_config() -> float:
+    """Избыточность FEC из config.ini ([Network] MulticastFecRatio, 0 - выключена)"""
+    try:
+        return max(0.0, load_config().getfloat("Network", "MulticastFecRatio", fallback=0.0))
+    except ValueError:
+        return 0.0
+
+
+def max_bitrate_from_config() -> float:
+    """Предел скорости multicast из config.ini ([Network] MulticastMaxBitrateMbps, 0 - без предела)"""
+    try:
+        return max(0.0, load_config().getfloat("Network", "MulticastMaxBitrateMbps", fallback=0.0))
+    except ValueError:
+        return 0.0
+
+
+def fec_group_size(ratio: float) -> int:
+    """Фрагментов данных на один фрагмент четности (0 - FEC выключена)"""
+    if ratio <= 0:
+        return 0
+    return min(FEC_MAX_GROUP, max(1, round(1 / ratio)))
+
+
+def xor_parity(chunks: List[Union[bytes, memoryview]]) -> bytes:
+    """Четность группы: XOR длин и XOR данных (короткие дополняются нулями)"""
+    lengths = 0
+    value = 0
+    for chunk in chunks:
+        lengths ^= len(chunk)
+        value ^= int.from_bytes(chunk, 'little')
+    return PARITY_PREFIX.pack(lengths) + value.to_bytes(max(len(chunk) for chunk in chunks), 'little')
+
+
+def recover_fragment(parity: bytes, chunks: List[bytes]) -> bytes:
+    """Восстановить единственный потерянный фрагмент группы по четности и остальным"""
+    length = PARITY_PREFIX.unpack_from(parity)[0]
+    value = int.from_bytes(parity[PARITY_PREFIX.size:], 'little')
+    for chunk in chunks:
+        length ^= len(chunk)
+        value ^= int.from_bytes(chunk, 'little')
+    return value.to_bytes(len(parity) - PARITY_PREFIX.size, 'little')[:length]
+
+
+def split_fragments(message_id: int, data: Union[bytes, memoryview], mtu: int = MULTICAST_MTU,
+                    flags: int = 0, timestamp: Optional[float] = None,
+                    fec_group: int = 0) -> List[Tuple[bytes, Union[bytes, memoryview]]]:
+    """
+    Разрезать сообщение на фрагменты по MTU
+    
+    fec_group - после фрагментов данных добавить по фрагменту четности
+    на каждые fec_group фрагментов (0 - без FEC)
+    
+    Returns:
+        Список (заголовок, кусок данных); кусок данных - memoryview без
+        копирования, четность - bytes
+    """
+    chunk_size = mtu - FRAGMENT_HEADER.size - (PARITY_PREFIX.size if fec_group else 0)
+    if not 0 <= fec_group <= FEC_MAX_GROUP:
+        raise ValueError(f"Группа FEC {fec_group} вне 0..{FEC_MAX_GROUP}")
+    if chunk_size <= 0:
+        raise ValueError(f"MTU {mtu} меньше заголовка фрагмента")
+    
+    view = memoryview(data)
+    count = max(1, -(-len(view) // chunk_size))
+    groups = -(-count // fec_group) if fec_group else 0
+    if count + groups > 0xFFFF:
+        raise ValueError(f"Сообщение {len(view)} байт не помещается в {0xFFFF} фрагментов")
+    
+    if timestamp is None:
+        timestamp = time.time()
+    message_id &= 0xFFFFFFFF
+    
+    fragments = [
+        (FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, FRAGMENT_VERSION, flags, message_id, index, count, fec_group,
+                              timestamp),
+         view[index * chunk_size:(index + 1) * chunk_size])
+        for index in range(count)
+    ]
+    
+    data_fragments = fragments[:count]
+    for group in range(groups):
+        chunks = [chunk for _, chunk in data_fragments[group * fec_group:(group + 1) * fec_group]]
+        header = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, FRAGMENT_VERSION, flags | FRAGMENT_FLAG_PARITY,
+                                      message_id, count + group, count, fec_group, timestamp)
+        fragments.append((header, xor_parity(chunks)))
+    
+    return fragments
+
+
+def is_fragment(datagram: Union[bytes, memoryview]) -> bool:
+    """Датаграмма - фрагмент с заголовком (а не сообщение старого отправителя)"""
+    return (len(datagram) >= FRAGMENT_HEADER.size
+            and datagram[:2] == FRAGMENT_MAGIC
+            and datagram[2] == FRAGMENT_VERSION)
+
+
+def _id_newer(a: int, b: int) -> bool:
+    """id a новее b (с учетом переполнения 32 бит)"""
+    return a != b and ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+
+@dataclass
+class _PendingFrame:
+    """Кадр в сборке"""
+    count: int
+    flags: int
+    group: int
+    timestamp: float
+    first_seen: float
+    fragments: List[Optional[bytes]] = field(default_factory=list)
+    parity: Dict[int, bytes] = field(default_factory=dict)
+    received: int = 0
+    nack_at: float = 0.0  # Когда можно просить недостающие фрагменты
+    nacks: int = 0
+    buffers: list = field(default_factory=list)  # Буферы пула с фрагментами - вернуть после сборки
+
+
+class FrameReassembler:
+    """
+    Сборка сообщений из фрагментов (для приемника)
+    
+    Неполный кадр выбрасывается, если:
+    - его фрагменты не пришли за timeout секунд
+    - уже собран более новый кадр (старый показывать незачем)
+    - незавершенных кадров больше max_pending (выбрасывается самый старый)
+    
+    С FEC потерянный фрагмент восстанавливается, как только в его группе
+    есть четность и все остальные фрагменты.
+    
+    Поздние фрагменты уже собранных или выброшенных кадров игнорируются.
+    
+    collect_nacks() отдает недостающие фрагменты кадров, в которых
+    фрагменты перестали приходить (для NACK преподавателю).
+    
+    С пулом (release) фрагмент, пришедший с buffer, не копируется:
+    сборка держит буфер до сборки или выброса кадра и затем возвращает
+    его через release.
+    """
+    
+    def __init__(self, timeout: float = REASSEMBLY_TIMEOUT, max_pending: int = REASSEMBLY_MAX_PENDING,
+                 nack_delay: float = NACK_DELAY, nack_jitter: float = NACK_JITTER,
+                 release: Optional[Callable[[bytearray], None]] = None):
+        self.timeout = timeout
+        self.release = release
+        self.max_pending = max_pending
+        self.nack_delay = nack_delay
+        self.nack_jitter = nack_jitter
+        
+        self._pending: Dict[int, _PendingFrame] = {}
+        self._last_completed: Optional[int] = None
+        
+        # Полнота последних кадров: доля полученных фрагментов
+        self._completeness: deque = deque(maxlen=COMPLETENESS_WINDOW)
+        
+        self._stats = {
+            'fragments_received': 0,
+            'fragments_duplicate': 0,
+            'fragments_late': 0,
+            'parity_received': 0,
+            'fragments_recovered': 0,
+            'nacks_sent': 0,
+            'fragments_nacked': 0,
+            'frames_completed': 0,
+            'frames_timed_out': 0,
+            'frames_stale': 0,
+            'last_latency_ms': 0.0
+        }
+    
+    def add(self, datagram: Union[bytes, memoryview], now: Optional[float] = None,
+            buffer: Optional[bytearray] = None) -> Optional[bytes]:
+        """
+        Добавить фрагмент
+        
+        Args:
+            buffer: Буфер пула, на который смотрит datagram; вернется в
+                    пул через release (сразу, если фрагмент не нужен)
+        
+        Returns:
+            Данные сообщения, если этот фрагмент его завершил, иначе None
+        """
+        if now is None:
+            now = time.time()
+        self.evict_expired(now)
+        
+        data, stored = self._add(datagram, now, buffer)
+        if buffer is not None and not stored:
+            self.release(buffer)
+        return data
+    
+    def _add(self, datagram: Union[bytes, memoryview], now: float,
+             buffer: Optional[bytearray]) -> Tuple[Optional[bytes], bool]:
+        """add(): данные собранного сообщения и взят ли фрагмент в сборку"""
+        _, _, flags, message_id, index, count, group, timestamp = FRAGMENT_HEADER.unpack_from(datagram)
+        parity = flags & FRAGMENT_FLAG_PARITY
+        if count == 0 or (index >= count and not (parity and group)):
+            return None, False
+        if parity and not 0 <= index - count < -(-count // group):
+            return None, False
+        self._stats['fragments_received'] += 1
+        
+        # Кадр уже собран или новее него уже есть собранный
+        if self._last_completed is not None and not _id_newer(message_id, self._last_completed):
+            self._stats['fragments_late'] += 1
+            return None, False
+        
+        frame = self._pending.get(message_id)
+        if frame is None:
+            frame = _PendingFrame(count=count, flags=flags & ~FRAGMENT_FLAG_PARITY, group=group,
+                                  timestamp=timestamp, first_seen=now, fragments=[None] * count)
+            self._pending[message_id] = frame
+            self._limit_pending()
+        
+        if buffer is None:
+            payload = bytes(datagram[FRAGMENT_HEADER.size:])
+        else:
+            # Без копии: фрагмент остается в буфере пула до сборки кадра
+            payload = memoryview(datagram)[FRAGMENT_HEADER.size:]
+        
+        if parity:
+            group_number = index - count
+            if group_number in frame.parity:
+                self._stats['fragments_duplicate'] += 1
+                return None, False
+            frame.parity[group_number] = payload
+            self._stats['parity_received'] += 1
+            if buffer is not None:
+                frame.buffers.append(buffer)
+        else:
+            if frame.fragments[index] is not None:
+                self._stats['fragments_duplicate'] += 1
+                return None, False
+            frame.fragments[index] = payload
+            frame.received += 1
+            if buffer is not None:
+                frame.buffers.append(buffer)
+            group_number = index // frame.group if frame.group else 0
+        
+        if frame.group:
+            self._recover(frame, group_number)
+        
+        # Фрагменты еще идут - NACK откладывается
+        if frame.nacks == 0:
+            frame.nack_at = now + self.nack_delay + random.uniform(0, self.nack_jitter)
+        
+        if frame.received < frame.count:
+            return None, True
+        
+        return self._complete(message_id, frame, now), True
+    
+    def collect_nacks(self, now: Optional[float] = None) -> List[Tuple[int, List[int]]]:
+        """
+        Недостающие фрагменты кадров, которые пора запросить повторно
+        
+        Кадр попадает сюда, когда его фрагменты nack_delay секунд не
+        приходят, а FEC их не восстановила. Повторный запрос - через
+        NACK_RETRY, не больше NACK_MAX_ATTEMPTS раз на кадр.
+        
+        Returns:
+            Список (id сообщения, номера недостающих фрагментов данных)
+        """
+        if now is None:
+            now = time.time()
+        
+        nacks = []
+        for message_id, frame in self._pending.items():
+            if frame.nacks >= NACK_MAX_ATTEMPTS or now < frame.nack_at:
+                continue
+            missing = [index for index, fragment in enumerate(frame.fragments) if fragment is None]
+            if not missing:
+                continue
+            
+            frame.nacks += 1
+            frame.nack_at = now + NACK_RETRY
+            self._stats['nacks_sent'] += 1
+            self._stats['fragments_nacked'] += len(missing)
+            nacks.append((message_id, missing))
+        return nacks
+    
+    def evict_expired(self, now: Optional[float] = None):
+        """Выбросить кадры, недостающие фрагменты которых не пришли вовремя"""
+        if now is None:
+            now = time.time()
+        
+        for message_id, frame in list(self._pending.items()):
+            if now - frame.first_seen > self.timeout:
+                self._drop(message_id, 'frames_timed_out')
+    
+    def _recover(self, frame: _PendingFrame, group_number: int):
+        """Восстановить фрагмент группы, если потерян ровно один и есть четность"""
+        parity = frame.parity.get(group_number)
+        if parity is None:
+            return
+        
+        start = group_number * frame.group
+        indices = range(start, min(start + frame.group, frame.count))
+        missing = [index for index in indices if frame.fragments[index] is None]
+        if len(missing) != 1:
+            return
+        
+        frame.fragments[missing[0]] = recover_fragment(
+            parity, [frame.fragments[index] for index in indices if index != missing[0]]
+        )
+        frame.received += 1
+        self._stats['fragments_recovered'] += 1
+    
+    def _complete(self, message_id: int, frame: _PendingFrame, now: float) -> Optional[bytes]:
+        """Кадр собран: отдать данные, выбросить более старые незавершенные"""
+        del self._pending[message_id]
+        self._last_completed = message_id
+        self._stats['frames_completed'] += 1
+        self._stats['last_latency_ms'] = max(0.0, (now - frame.timestamp) * 1000)
+        self._completeness.append(1.0)
+        
+        for pending_id in list(self._pending):
+            if not _id_newer(pending_id, message_id):
+                self._drop(pending_id, 'frames_stale')
+        
+        data = b''.join(frame.fragments)
+        self._release(frame)
+        if frame.flags & FRAGMENT_FLAG_COMPRESSED:
+            try:
+                data = zlib.decompress(data)
+            except zlib.error as e:
+                logger.debug(f"Ошибка распаковки multicast сообщения {message_id}: {e}")
+                return None
+        return data
+    
+    def _limit_pending(self):
+        """Не держать больше max_pending незавершенных кадров"""
+        while len(self._pending) > self.max_pending:
+            oldest = min(self._pending, key=lambda message_id: self._pending[message_id].first_seen)
+            self._drop(oldest, 'frames_stale')
+    
+    def _drop(self, message_id: int, reason: str):
+        frame = self._pending.pop(message_id)
+        self._stats[reason] += 1
+        self._completeness.append(frame.received / frame.count)
+        self._release(frame)
+    
+    def _release(self, frame: _PendingFrame):
+        """Вернуть в пул буферы фрагментов кадра"""
+        if frame.buffers:
+            # Фрагменты смотрели в буферы - после возврата буферов они недействительны
+            frame.fragments = []
+            frame.parity = {}
+            for buffer in frame.buffers:
+                self.release(buffer)
+            frame.buffers = []
+    
+    def get_stats(self) -> dict:
+        """Статистика сборки и полноты кадров"""
+        stats = self._stats.copy()
+        stats['pending_frames'] = len(self._pending)
+        recent = list(self._completeness)
+        # Доля полностью собранных кадров и средняя доля полученных фрагментов
+        stats['frames_complete_ratio'] = round(recent.count(1.0) / len(recent), 3) if recent else 1.0
+        stats['completeness'] = round(sum(recent) / len(recent), 3) if recent else 1.0
+        return stats
+
+
+class TokenBucket:
+    """
+    Token bucket: в среднем rate байт/с, подряд - не больше burst байт
+    
+    reserve() списывает токены сразу (баланс может уйти в минус) и
+    возвращает, сколько подождать перед отправкой.
+    """
+    
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+    
+    def reserve(self, size: int, now: Optional[float] = None) -> float:
+        """Списать size байт; вернуть задержку до отправки, сек"""
+        if now is None:
+            now = time.monotonic()
+        
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= size
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+@dataclass
+class _PacedFrame:
+    """Сообщение в очереди пейсера"""
+    message_id: int
+    fragments: List[Tuple[bytes, Union[bytes, memoryview]]]
+    submitted: float
+    urgent: bool = False  # Повтор по NACK - вперед очереди, без растягивания
+    position: int = 0
+    ready_at: Optional[float] = None  # Когда можно отправить fragments[position]
+    bucket: Optional[TokenBucket] = None  # Растягивание кадра на интервал
+
+
+class MulticastPacer:
+    """
+    Пейсер multicast: фрагменты уходят равномерно, а не залпом
+    
+    Два ограничения, действует более строгое:
+    - кадр растягивается на PACING_SPREAD интервала кадра (свой token
+      bucket на кадр со скоростью размер / время)
+    - общий token bucket: не больше max_bitrate_mbps в среднем и не
+      больше burst_bytes подряд
+    
+    Если кадры приходят быстрее, чем позволяет предел, в очереди
+    остается не больше max_backlog кадров: старые выбрасываются
+    (приемник все равно выбросил бы их, собрав более новый).
+    
+    Отправляет собственный поток; pump() можно вызывать и вручную с
+    модельным временем (тесты, бенчмарки).
+    """
+    
+    def __init__(self, send_fragment: Callable[[bytes, Union[bytes, memoryview]], None],
+                 max_bitrate_mbps: float = 0.0, burst_bytes: int = PACING_BURST_BYTES,
+                 frame_interval: float = 0.0, max_backlog: int = PACING_MAX_BACKLOG):
+        self.send_fragment = send_fragment
+        self.burst_bytes = burst_bytes
+        self.frame_interval = frame_interval
+        self.max_backlog = max_backlog
+        self.max_bitrate_mbps = max_bitrate_mbps
+        self.cap: Optional[TokenBucket] = None
+        if max_bitrate_mbps > 0:
+            self.cap = TokenBucket(max_bitrate_mbps * 1_000_000 / 8, burst_bytes)
+        
+        self._frames: deque = deque()
+        self._cond = threading.Condition()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        
+        self._stats = {
+            'frames_paced': 0,
+            'fragments_paced': 0,
+            'frames_dropped': 0,
+            'fragments_dropped': 0,
+            'send_errors': 0,
+            'delay_ms_last': 0.0,
+            'delay_ms_max': 0.0
+        }
+    
+    def start(self):
+        """Запустить поток отправки"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Остановить поток; неотправленное выбрасывается"""
+        with self._cond:
+            self.running = False
+            self._frames.clear()
+            self._cond.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+    
+    def submit(self, message_id: int, fragments: List[Tuple[bytes, Union[bytes, memoryview]]],
+               urgent: bool = False, now: Optional[float] = None):
+        """Поставить фрагменты сообщения в очередь (urgent - повтор, вперед кадров)"""
+        if not fragments:
+            return
+        if now is None:
+            now = time.monotonic()
+        
+        with self._cond:
+            frame = _PacedFrame(message_id=message_id, fragments=fragments, submitted=now, urgent=urgent)
+            if urgent:
+                # Повторы - после уже стоящих повторов, но перед кадрами
+                position = 0
+                while position < len(self._frames) and self._frames[position].urgent:
+                    position += 1
+                self._frames.insert(position, frame)
+            else:
+                self._frames.append(frame)
+                self._limit_backlog()
+            self._cond.notify()
+    
+    def _limit_backlog(self):
+        """Выбросить самые старые кадры сверх max_backlog"""
+        frames = [frame for frame in self._frames if not frame.urgent]
+        for frame in frames[:max(0, len(frames) - self.max_backlog)]:
+            self._frames.remove(frame)
+            self._stats['frames_dropped'] += 1
+            self._stats['fragments_dropped'] += len(frame.fragments) - frame.position
+    
+    def pump(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Отправить все фрагменты, срок которых наступил
+        
+        Returns:
+            Через сколько секунд следующий фрагмент; None - очередь пуста
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        with self._cond:
+            while self._frames:
+                frame = self._frames[0]
+                if frame.ready_at is None:
+                    frame.ready_at = now + self._reserve(frame, now)
+                if frame.ready_at > now:
+                    return frame.ready_at - now
+                
+                header, chunk = frame.fragments[frame.position]
+                frame.position += 1
+                frame.ready_at = None
+                try:
+                    self.send_fragment(header, chunk)
+                except Exception as e:
+                    self._stats['send_errors'] += 1
+                    logger.error(f"Ошибка отправки multicast: {e}")
+                self._stats['fragments_paced'] += 1
+                
+                if frame.position >= len(frame.fragments):
+                    self._frames.popleft()
+                    if not frame.urgent:
+                        delay_ms = (now - frame.submitted) * 1000
+                        self._stats['frames_paced'] += 1
+                        self._stats['delay_ms_last'] = round(delay_ms, 2)
+                        self._stats['delay_ms_max'] = round(max(self._stats['delay_ms_max'], delay_ms), 2)
+        return None
+    
+    def _reserve(self, frame: _PacedFrame, now: float) -> float:
+        """Задержка до отправки очередного фрагмента кадра"""
+        header, chunk = frame.fragments[frame.position]
+        size = len(header) + len(chunk)
+        
+        wait = 0.0
+        if not frame.urgent and self.frame_interval > 0:
+            if frame.bucket is None:
+                # Всплеск уходит сразу, остальное - равномерно до конца окна
+                total = sum(len(h) + len(c) for h, c in frame.fragments)
+                burst = min(self.burst_bytes, total)
+                rate = max(1, total - burst) / (self.frame_interval * PACING_SPREAD)
+                frame.bucket = TokenBucket(rate, burst, now)
+            wait = frame.bucket.reserve(size, now)
+        if self.cap is not None:
+            wait = max(wait, self.cap.reserve(size, now))
+        return wait
+    
+    def _run(self):
+        while self.running:
+            wait = self.pump()
+            with self._cond:
+                if not self.running:
+                    break
+                if wait is None and not self._frames:
+                    self._cond.wait()
+                elif wait:
+                    self._cond.wait(wait)
+    
+    def get_stats(self) -> dict:
+        """Статистика пейсинга"""
+        with self._cond:
+            stats = self._stats.copy()
+            stats['queued_frames'] = len(self._frames)
+        stats['max_bitrate_mbps'] = self.max_bitrate_mbps
+        return stats
 
 
 class MulticastSender:
@@ -52,9 +738,35 @@ class MulticastSender:
         # Статистика
         self.packets_sent = 0
         self.bytes_sent = 0
+        self.fragments_sent = 0
+        self.parity_sent = 0
+        
+        # Фрагментов данных на один фрагмент четности (0 - без FEC)
+        self.fec_group = fec_group_size(self.config.fec_ratio)
+        
+        # id следующего сообщения (для сборки фрагментов у приемника)
+        self._message_id = 0
+        
+        # Кэш повтора: фрагменты последних сообщений по id
+        self._cache: "OrderedDict[int, List[Tuple[bytes, Union[bytes, memoryview]]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.fragments_retransmitted = 0
+        
+        # История отправленного битрейта: Мбит/с за каждую завершенную секунду
+        self.bitrate_history: deque = deque(maxlen=BITRATE_HISTORY_SECONDS)
+        self._bitrate_second = int(time.monotonic())
+        self._bitrate_bytes = 0
+        self._bitrate_lock = threading.Lock()
         
         self._setup_socket()
         
+        # Пейсинг (без предела и интервала кадра - отправка залпом, как раньше)
+        self.pacer: Optional[MulticastPacer] = None
+        if self.config.max_bitrate_mbps > 0 or self.config.frame_interval > 0:
+            self.pacer = MulticastPacer(self._send_fragment, self.config.max_bitrate_mbps,
+                                        self.config.burst_bytes, self.config.frame_interval)
+            self.pacer.start()
+        
         logger.info(f"MulticastSender создан: {self.config.group}:{self.config.port}")
     
     def _setup_socket(self):
@@ -79,18 +791,26 @@ class MulticastSender:
             self.running = True
             
             logger.info("Multicast сокет настроен")
-            
+        
         except Exception as e:
             logger.error(f"Ошибка настройки multicast сокета: {e}")
             raise
     
-    def send(self, data: bytes, compress: bool = True) -> bool:
+    def send(self, data: Union[bytes, memoryview], compress: bool = True) -> bool:
         """
         Отправить данные через multicast.
         
+        Данные режутся на фрагменты по MTU (config.mtu), каждый уходит
+        отдельной датаграммой без копирования данных (sendmsg). С FEC
+        (config.fec_ratio) следом уходят фрагменты четности.
+        
+        С пейсингом фрагменты ставятся в очередь MulticastPacer и
+        уходят равномерно его потоком - send() не ждет отправки.
+        
         Args:
             data: Данные для отправки
-            compress: Сжимать ли данные (экономит ~70% трафика)
+            compress: Сжимать ли данные zlib (для JPEG кадров бессмысленно -
+                      только тратит CPU, передавайте False)
         
         Returns:
             True если отправка успешна
@@ -99,40 +819,340 @@ class MulticastSender:
             return False
         
         try:
+            flags = 0
             # Сжимаем данные
             if compress:
                 data = zlib.compress(data, level=1)  # Быстрое сжатие
+                flags |= FRAGMENT_FLAG_COMPRESSED
+            
+            message_id = self._message_id
+            fragments = split_fragments(message_id, data, self.config.mtu, flags,
+                                        fec_group=self.fec_group)
+            self._message_id = (self._message_id + 1) & 0xFFFFFFFF
+            self._cache_message(message_id, fragments)
             
             # Отправляем в multicast группу
-            self.sock.sendto(data, (self.config.group, self.config.port))
+            if self.pacer is not None:
+                self.pacer.submit(message_id, fragments)
+            else:
+                for header, chunk in fragments:
+                    self._send_fragment(header, chunk)
             
             # Статистика
             self.packets_sent += 1
-            self.bytes_sent += len(data)
+            self.fragments_sent += len(fragments)
+            self.parity_sent += sum(1 for header, _ in fragments if header[3] & FRAGMENT_FLAG_PARITY)
             
             return True
-            
+        
         except Exception as e:
             logger.error(f"Ошибка отправки multicast: {e}")
             return False
     
+    def _send_fragment(self, header: bytes, chunk: Union[bytes, memoryview]):
+        """Одна датаграмма в группу: заголовок и кусок без склейки"""
+        address = (self.config.group, self.config.port)
+        if SENDMSG_AVAILABLE:
+            self.sock.sendmsg([header, chunk], [], 0, address)
+        else:
+            self.sock.sendto(header + chunk, address)
+        self.bytes_sent += len(header) + len(chunk)
+        self._record_bitrate(len(header) + len(chunk))
+    
+    def _record_bitrate(self, size: int):
+        """Учесть отправленные байты в истории битрейта"""
+        second = int(time.monotonic())
+        with self._bitrate_lock:
+            if second != self._bitrate_second:
+                self.bitrate_history.append(round(self._bitrate_bytes * 8 / 1_000_000, 3))
+                # Секунды без отправки
+                idle = min(second - self._bitrate_second - 1, BITRATE_HISTORY_SECONDS)
+                self.bitrate_history.extend([0.0] * max(0, idle))
+                self._bitrate_second = second
+                self._bitrate_bytes = 0
+            self._bitrate_bytes += size
+    
+    def set_frame_interval(self, interval: float):
+        """Новый интервал кадров (смена FPS) для растягивания отправки"""
+        self.config.frame_interval = interval
+        if self.pacer is not None:
+            self.pacer.frame_interval = interval
+    
+    def _cache_message(self, message_id: int, fragments: List[Tuple[bytes, Union[bytes, memoryview]]]):
+        """Запомнить фрагменты сообщения для повтора (старые вытесняются)"""
+        if self.config.retransmit_cache <= 0:
+            return
+        with self._cache_lock:
+            self._cache[message_id] = fragments
+            while len(self._cache) > self.config.retransmit_cache:
+                self._cache.popitem(last=False)
+    
+    def cached_fragments(self, message_id: int, indices: List[int]) -> List[bytes]:
+        """
+        Датаграммы фрагментов данных из кэша повтора (для отправки по TCP)
+        
+        Returns:
+            Найденные датаграммы; пусто, если сообщение уже вытеснено из кэша
+        """
+        with self._cache_lock:
+            fragments = self._cache.get(message_id)
+        if fragments is None:
+            return []
+        count = FRAGMENT_HEADER.unpack_from(fragments[0][0])[5]
+        return [fragments[index][0] + fragments[index][1] for index in indices if 0 <= index < count]
+    
+    def resend(self, message_id: int, indices: List[int]) -> int:
+        """
+        Повторить фрагменты данных сообщения в multicast группу
+        
+        Returns:
+            Сколько фрагментов отправлено (0 - сообщения уже нет в кэше)
+        """
+        if not self.running or not self.sock:
+            return 0
+        
+        with self._cache_lock:
+            fragments = self._cache.get(message_id)
+        if fragments is None:
+            return 0
+        
+        count = FRAGMENT_HEADER.unpack_from(fragments[0][0])[5]
+        repairs = [fragments[index] for index in indices if 0 <= index < count]
+        sent = 0
+        if self.pacer is not None:
+            # Повтор тоже под пределом скорости, но вперед кадров
+            self.pacer.submit(message_id, repairs, urgent=True)
+            sent = len(repairs)
+        else:
+            try:
+                for header, chunk in repairs:
+                    self._send_fragment(header, chunk)
+                    sent += 1
+            except Exception as e:
+                logger.error(f"Ошибка повтора multicast: {e}")
+        
+        self.fragments_retransmitted += sent
+        return sent
+    
     def get_stats(self) -> dict:
         """Получить статистику"""
         return {
             "packets_sent": self.packets_sent,
+            "fragments_sent": self.fragments_sent,
+            "parity_sent": self.parity_sent,
+            "fragments_retransmitted": self.fragments_retransmitted,
             "bytes_sent": self.bytes_sent,
-            "mb_sent": round(self.bytes_sent / 1024 / 1024, 2)
+            "mb_sent": round(self.bytes_sent / 1024 / 1024, 2),
+            "bitrate_history_mbps": list(self.bitrate_history),
+            "pacing": self.pacer.get_stats() if self.pacer is not None else None
         }
     
     def close(self):
         """Закрыть соединение"""
         self.running = False
+        if self.pacer is not None:
+            self.pacer.stop()
         if self.sock:
             self.sock.close()
             self.sock = None
         logger.info("MulticastSender закрыт")
 
 
+class NackAggregator:
+    """
+    Повтор фрагментов по NACK студентов (преподаватель)
+    
+    NACK копятся window секунд, затем каждый запрошенный фрагмент
+    отправляется один раз:
+    - нужен одному студенту - ему по TCP (send_unicast), остальным
+      лишний трафик не идет
+    - нужен нескольким (или send_unicast не задан) - один повтор в группу
+    
+    Фрагмент, повторенный в группу меньше holdoff секунд назад, не
+    повторяется: такие NACK разминулись с повтором. 30 студентов без
+    одного и того же фрагмента дают один повтор.
+    
+    window = 0 - без таймера, flush() вызывает владелец.
+    
+    Использование (преподаватель):
+        aggregator = NackAggregator(sender, send_unicast=lambda sid, datagram: server.send_to_student(
+            sid, MessageType.MULTICAST_REPAIR, {}, attachment=datagram))
+        # MULTICAST_NACK от студента:
+        aggregator.add(student_id, data["id"], data["missing"])
+    """
+    
+    def __init__(self, sender: MulticastSender,
+                 send_unicast: Optional[Callable[[str, bytes], bool]] = None,
+                 window: float = NACK_AGGREGATION_WINDOW, holdoff: float = REPAIR_HOLDOFF):
+        self.sender = sender
+        self.send_unicast = send_unicast
+        self.window = window
+        self.holdoff = holdoff
+        
+        # (id сообщения, номер фрагмента) -> студенты, которые его просят
+        self._requests: Dict[Tuple[int, int], set] = {}
+        # Недавние повторы в группу: (id, номер) -> время
+        self._recent: Dict[Tuple[int, int], float] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        
+        self._stats = {
+            'nacks_received': 0,
+            'fragments_requested': 0,
+            'requests_merged': 0,
+            'requests_suppressed': 0,
+            'multicast_resends': 0,
+            'unicast_resends': 0,
+            'cache_misses': 0
+        }
+        # NACK по студентам (плохая точка доступа видна по росту у ее студентов)
+        self._per_student: Dict[str, Dict[str, int]] = {}
+    
+    def add(self, student_id: str, message_id: int, missing: List[int], now: Optional[float] = None):
+        """Принять NACK студента"""
+        if now is None:
+            now = time.time()
+        
+        try:
+            message_id = int(message_id) & 0xFFFFFFFF
+            indices = sorted({int(index) for index in missing})
+        except (TypeError, ValueError):
+            logger.debug(f"Некорректный NACK от {student_id}: {message_id} {missing}")
+            return
+        
+        with self._lock:
+            self._stats['nacks_received'] += 1
+            self._stats['fragments_requested'] += len(indices)
+            student = self._per_student.setdefault(student_id, {'nacks': 0, 'fragments': 0})
+            student['nacks'] += 1
+            student['fragments'] += len(indices)
+            
+            for index in indices:
+                key = (message_id, index)
+                sent_at = self._recent.get(key)
+                if sent_at is not None and now - sent_at < self.holdoff:
+                    self._stats['requests_suppressed'] += 1
+                    continue
+                
+                students = self._requests.setdefault(key, set())
+                if students:
+                    self._stats['requests_merged'] += 1
+                students.add(student_id)
+            
+            start_timer = self.window > 0 and self._requests and self._timer is None
+            if start_timer:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+    
+    def flush(self, now: Optional[float] = None):
+        """Отправить накопленные повторы"""
+        if now is None:
+            now = time.time()
+        
+        with self._lock:
+            requests = self._requests
+            self._requests = {}
+            self._timer = None
+            # Старые отметки о повторах больше не нужны
+            self._recent = {key: sent_at for key, sent_at in self._recent.items()
+                            if now - sent_at < self.holdoff}
+        
+        multicast: Dict[int, List[int]] = {}
+        unicast: Dict[Tuple[str, int], List[int]] = {}
+        for (message_id, index), students in requests.items():
+            if len(students) > 1 or self.send_unicast is None:
+                multicast.setdefault(message_id, []).append(index)
+            else:
+                unicast.setdefault((next(iter(students)), message_id), []).append(index)
+        
+        for message_id, indices in multicast.items():
+            sent = self.sender.resend(message_id, indices)
+            with self._lock:
+                if sent:
+                    self._stats['multicast_resends'] += sent
+                    for index in indices:
+                        self._recent[(message_id, index)] = now
+                else:
+                    self._stats['cache_misses'] += len(indices)
+        
+        for (student_id, message_id), indices in unicast.items():
+            datagrams = self.sender.cached_fragments(message_id, indices)
+            sent = sum(1 for datagram in datagrams if self.send_unicast(student_id, datagram))
+            with self._lock:
+                self._stats['unicast_resends'] += sent
+                self._stats['cache_misses'] += len(indices) - len(datagrams)
+    
+    def get_stats(self) -> dict:
+        """Статистика NACK и повторов (per_student - по студентам)"""
+        with self._lock:
+            stats = self._stats.copy()
+            stats['per_student'] = {sid: counters.copy() for sid, counters in self._per_student.items()}
+        return stats
+    
+    def close(self):
+        """Отменить отложенный повтор"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+class BufferPool:
+    """
+    Пул буферов приема: датаграмма читается recv_into в готовый буфер
+    
+    Буфер занят, пока его фрагмент лежит в сборке кадра; сборка
+    возвращает его через release(). Если пул пуст (кадров в сборке
+    больше расчетного), выделяется новый буфер (misses) и остается в
+    пуле - пул дорастает до пиковой потребности.
+    
+    Без блокировки: list.pop()/append() атомарны под GIL, буферы берет
+    только поток приема, а возвращать может и поток TCP (add_repair).
+    """
+    
+    def __init__(self, size: int, buffer_size: int):
+        self.size = size
+        self.buffer_size = buffer_size
+        self._free = [bytearray(buffer_size) for _ in range(size)]
+        
+        self.peak_in_use = 0
+        self.misses = 0
+    
+    @property
+    def in_use(self) -> int:
+        """Буферов в сборке кадров"""
+        return self.size + self.misses - len(self._free)
+    
+    def acquire(self) -> bytearray:
+        """Взять буфер"""
+        try:
+            buffer = self._free.pop()
+        except IndexError:
+            self.misses += 1
+            buffer = bytearray(self.buffer_size)
+        in_use = self.size + self.misses - len(self._free)
+        if in_use > self.peak_in_use:
+            self.peak_in_use = in_use
+        return buffer
+    
+    def release(self, buffer: bytearray):
+        """Вернуть буфер"""
+        self._free.append(buffer)
+    
+    def get_stats(self) -> dict:
+        """Заполненность пула"""
+        in_use = self.in_use
+        return {
+            'buffers': self.size,
+            'in_use': in_use,
+            'peak_in_use': self.peak_in_use,
+            'utilization': round(in_use / self.size, 3) if self.size else 0.0,
+            'peak_utilization': round(self.peak_in_use / self.size, 3) if self.size else 0.0,
+            'misses': self.misses
+        }
+
+
 class MulticastReceiver:
     """
     Приёмник multicast пакетов (студент).
@@ -141,6 +1161,15 @@ class MulticastReceiver:
         receiver = MulticastReceiver()
         receiver.on_data = lambda data: print(f"Получено: {len(data)} байт")
         receiver.start()
+    
+    NACK (до start()): receiver.on_nack = lambda message_id, missing: client.send_message(
+        MessageType.MULTICAST_NACK, {"id": message_id, "missing": missing}); фрагменты из
+    MULTICAST_REPAIR передаются в receiver.add_repair().
+    
+    Прием пачками: поток ждет сокет в select() и за одно пробуждение
+    вычитывает до RECEIVE_BATCH датаграмм в буферы пула (recv_into, без
+    выделения памяти на датаграмму). Датаграмма больше mtu отбрасывается -
+    все отправители режут сообщения по MTU.
     """
     
     def __init__(self, config: Optional[MulticastConfig] = None):
@@ -152,10 +1181,31 @@ class MulticastReceiver:
         # Callback для обработки данных
         self.on_data: Optional[Callable[[bytes], None]] = None
         
+        # Callback NACK: (id сообщения, недостающие фрагменты) - отправить преподавателю по TCP
+        self.on_nack: Optional[Callable[[int, List[int]], None]] = None
+        
+        # Буферы приема; сборка возвращает их после сборки кадра
+        self.pool = BufferPool(self.config.receive_pool, self.config.mtu + 1)
+        
+        # Сборка сообщений из фрагментов (из потока приема и из повторов по TCP)
+        self.reassembler = FrameReassembler(self.config.reassembly_timeout, release=self.pool.release)
+        self._lock = threading.Lock()
+        
+        # Счетчик потерь в очереди сокета приходит вместе с датаграммой (Linux)
+        self._ancbufsize = 0
+        self.kernel_drops: Optional[int] = None
+        
         # Статистика
         self.packets_received = 0
         self.bytes_received = 0
         self.errors = 0
+        self.datagrams_received = 0
+        self.datagrams_truncated = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.datagrams_per_sec = 0.0
+        self._rate_start = time.monotonic()
+        self._rate_count = 0
         
         logger.info(f"MulticastReceiver создан: {self.config.group}:{self.config.port}")
     
@@ -195,46 +1245,173 @@ class MulticastReceiver:
             # Увеличиваем буфер приёма
             self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
             
-            # Таймаут для неблокирующего чтения
-            self.sock.settimeout(1.0)
+            # Неблокирующее чтение: ждем в select(), вычитываем пачкой
+            self.sock.setblocking(False)
+            self._enable_kernel_drops()
             
             logger.info("Multicast сокет настроен для приёма")
-            
+        
         except Exception as e:
             logger.error(f"Ошибка настройки multicast приёма: {e}")
             raise
     
+    def _enable_kernel_drops(self):
+        """Включить счетчик потерь в очереди сокета (SO_RXQ_OVFL, только Linux)"""
+        if SO_RXQ_OVFL is None or not RECVMSG_AVAILABLE:
+            return
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self._ancbufsize = socket.CMSG_SPACE(4)
+            self.kernel_drops = 0
+        except (OSError, AttributeError):
+            logger.debug("SO_RXQ_OVFL недоступен - потери в очереди сокета не считаются")
+    
     def _receive_loop(self):
         """Цикл приёма данных"""
         while self.running:
+            self._send_nacks()
             try:
-                # Получаем пакет
-                data, addr = self.sock.recvfrom(self.config.buffer_size)
+                # NACK должен уйти, даже если поток фрагментов остановился
+                timeout = NACK_DELAY / 2 if self.on_nack else 1.0
+                readable, _, _ = select.select([self.sock], [], [], timeout)
+                if not readable:
+                    # Таймаут - это нормально, заодно выбрасываем зависшие кадры
+                    with self._lock:
+                        self.reassembler.evict_expired()
+                    continue
                 
-                if not data:
+                for data in self._receive_batch():
+                    self._deliver(data)
+            
+            except Exception as e:
+                if self.running:
+                    self.errors += 1
+                    logger.debug(f"Ошибка приёма multicast: {e}")
+    
+    def _receive_batch(self) -> List[bytes]:
+        """
+        Вычитать все готовые датаграммы (до RECEIVE_BATCH) и собрать кадры
+        
+        Returns:
+            Собранные сообщения
+        """
+        batch = []
+        while len(batch) < RECEIVE_BATCH:
+            buffer = self.pool.acquire()
+            try:
+                # Счетчик потерь ядра накопительный - читаем его раз за пачку
+                size = self._recv_counted(buffer) if not batch and self._ancbufsize else self._recv_into(buffer)
+            except BlockingIOError:
+                self.pool.release(buffer)
+                break
+            except Exception:
+                self.pool.release(buffer)
+                raise
+            
+            # Буфер на байт больше mtu: заполненный целиком - датаграмма обрезана
+            if size >= len(buffer) or not size:
+                self.datagrams_truncated += size >= len(buffer)
+                self.pool.release(buffer)
+                continue
+            batch.append((buffer, size))
+        
+        if not batch:
+            return []
+        self._count_batch(len(batch))
+        
+        messages = []
+        with self._lock:
+            now = time.time()
+            for buffer, size in batch:
+                datagram = memoryview(buffer)[:size]
+                if is_fragment(datagram):
+                    # Сборка держит буфер до сборки кадра
+                    data = self.reassembler.add(datagram, now, buffer)
+                    if data is not None:
+                        messages.append(data)
                     continue
                 
-                # Распаковываем
+                # Старый отправитель: одна датаграмма, возможно сжатая
+                data = bytes(datagram)
+                datagram.release()
+                self.pool.release(buffer)
                 try:
                     data = zlib.decompress(data)
-                except:
+                except zlib.error:
                     pass  # Если не сжато, используем как есть
-                
-                # Статистика
-                self.packets_received += 1
-                self.bytes_received += len(data)
-                
-                # Отправляем в callback
-                if self.on_data:
-                    self.on_data(data)
-                    
-            except socket.timeout:
-                # Таймаут - это нормально
-                continue
+                messages.append(data)
+        return messages
+    
+    def _recv_into(self, buffer: bytearray) -> int:
+        """Одна датаграмма в буфер: размер (len(buffer) - обрезана)"""
+        try:
+            return self.sock.recv_into(buffer)
+        except OSError as e:
+            if getattr(e, 'winerror', None) == WSAEMSGSIZE:
+                return len(buffer)
+            raise
+    
+    def _recv_counted(self, buffer: bytearray) -> int:
+        """Как _recv_into, заодно обновить счетчик потерь в очереди сокета"""
+        size, ancdata, flags, _ = self.sock.recvmsg_into([buffer], self._ancbufsize)
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(value) >= 4:
+                # Накопительный счетчик датаграмм, потерянных при переполнении очереди
+                self.kernel_drops = struct.unpack('=I', value[:4])[0]
+        return len(buffer) if flags & socket.MSG_TRUNC else size
+    
+    def _count_batch(self, size: int):
+        """Статистика пачки и датаграмм в секунду"""
+        self.datagrams_received += size
+        self.batches += 1
+        self.max_batch = max(self.max_batch, size)
+        
+        self._rate_count += size
+        now = time.monotonic()
+        elapsed = now - self._rate_start
+        if elapsed >= 1.0:
+            self.datagrams_per_sec = round(self._rate_count / elapsed, 1)
+            self._rate_start = now
+            self._rate_count = 0
+    
+    def add_repair(self, datagram: Union[bytes, memoryview]) -> bool:
+        """
+        Фрагмент, повторенный преподавателем по TCP (MULTICAST_REPAIR)
+        
+        Returns:
+            False если это не фрагмент
+        """
+        if not is_fragment(datagram):
+            return False
+        
+        with self._lock:
+            data = self.reassembler.add(datagram)
+        if data is not None:
+            self._deliver(data)
+        return True
+    
+    def _deliver(self, data: bytes):
+        """Собранное сообщение - в callback"""
+        # Статистика
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        
+        # Отправляем в callback
+        if self.on_data:
+            self.on_data(data)
+    
+    def _send_nacks(self):
+        """Запросить у преподавателя фрагменты, которые не восстановила FEC"""
+        if not self.on_nack:
+            return
+        
+        with self._lock:
+            nacks = self.reassembler.collect_nacks()
+        for message_id, missing in nacks:
+            try:
+                self.on_nack(message_id, missing)
             except Exception as e:
-                if self.running:
-                    self.errors += 1
-                    logger.debug(f"Ошибка приёма multicast: {e}")
+                logger.error(f"Ошибка отправки NACK: {e}")
     
     def get_stats(self) -> dict:
         """Получить статистику"""
@@ -242,7 +1419,16 @@ class MulticastReceiver:
             "packets_received": self.packets_received,
             "bytes_received": self.bytes_received,
             "mb_received": round(self.bytes_received / 1024 / 1024, 2),
-            "errors": self.errors
+            "errors": self.errors,
+            "datagrams_received": self.datagrams_received,
+            "datagrams_per_sec": self.datagrams_per_sec,
+            "datagrams_truncated": self.datagrams_truncated,
+            "kernel_drops": self.kernel_drops,  # None - ОС не сообщает
+            "batches": self.batches,
+            "avg_batch": round(self.datagrams_received / self.batches, 1) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "pool": self.pool.get_stats(),
+            "reassembly": self.reassembler.get_stats()
         }
     
     def stop(self):
@@ -1,79 +1,312 @@
 """
 Протокол обмена сообщениями между преподавателем и студентами
-Версия 2.0 - с надежной TCP буферизацией
+Версия 4.0 - с надежной TCP буферизацией, бинарными вложениями
+и компактной сериализацией
+
+Версии формата пакета:
+- 2: JSON сообщение (опционально сжатое: zlib, а с согласованными
+     кодеками - zstd/lz4, номер кодека в битах FLAGS)
+- 3: JSON метаданные + сырое бинарное вложение (кадры, голос) без base64;
+     большие пакеты могут идти фрагментами (FLAG_FRAGMENT), между которыми
+     проходят срочные сообщения
+- 4: как 2/3, но сообщение (и метаданные вложения) сериализовано msgpack
+     с номерами типов вместо строк (src/network/serializer.py); только
+     при установленном msgpack, иначе максимальная версия - 3
 """
 
 import struct
 import zlib
+import base64
 import logging
-from typing import Dict, Any, Optional, List
-from src.common.utils import serialize_message, deserialize_message
+from typing import Dict, Any, Optional, List, Tuple, Union, Iterable
+from src.common.constants import Serializer, Codec
+from src.common.utils import serialize_message, deserialize_message, load_config
+from src.network.codecs import LEGACY_CODECS, choose_codec, compress_for, decompress, available_codecs
+from src.network.serializer import MSGPACK_AVAILABLE, serialize_compact, deserialize_compact
 
 
 logger = logging.getLogger(__name__)
 
+# Бинарные данные, которые можно передать без копирования
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Пакет частями: заголовок, payload/вложение (склеиваются только при отправке)
+PacketParts = Tuple[BytesLike, ...]
+
 
 class Protocol:
     """Класс для работы с протоколом передачи данных"""
     
-    # Заголовок пакета: MAGIC (4 байта) + VERSION (2 байта) + LENGTH (4 байта) + COMPRESSED (1 байт)
+    # Заголовок пакета: MAGIC (4 байта) + VERSION (2 байта) + LENGTH (4 байта) + FLAGS (1 байт)
     MAGIC = b'AFRD'  # Alfarid (было LNGC)
-    VERSION = 2  # Версия 2 с буферизацией
+    JSON_VERSION = 2  # Версия чистого JSON пакета (понимают все клиенты)
+    BINARY_VERSION = 3  # Версия с бинарными вложениями
+    COMPACT_VERSION = 4  # Версия с компактной сериализацией (msgpack)
+    # Максимальная поддерживаемая версия протокола
+    VERSION = COMPACT_VERSION if MSGPACK_AVAILABLE else BINARY_VERSION
+    SUPPORTED_VERSIONS = (1, 2, 3, 4) if MSGPACK_AVAILABLE else (1, 2, 3)
     HEADER_SIZE = 11
     HEADER_FORMAT = '!4sHIB'  # Big-endian: 4 байта, 2 байта, 4 байта, 1 байт
     
+    # Флаги заголовка (для версий 1-2 байт означал только "сжато")
+    FLAG_COMPRESSED = 0x01
+    FLAG_ATTACHMENT = 0x02
+    FLAG_FRAGMENT = 0x04  # Payload - кусок другого полного пакета
+    FLAG_LAST_FRAGMENT = 0x08  # Последний кусок: пакет собран
+    FLAG_CODEC_MASK = 0x30  # Номер кодека сжатого пакета (0 - zlib, как у старых версий)
+    FLAG_CODEC_SHIFT = 4
+    
+    # Бинарный пакет: META_LENGTH (4 байта) + JSON метаданные + вложение
+    META_LENGTH_FORMAT = '!I'
+    META_LENGTH_SIZE = 4
+    
+    # Ключ в data, содержащий имя поля с вложением
+    ATTACHMENT_KEY = "_attachment"
+    
     # Максимальный размер пакета (10 MB)
     MAX_PACKET_SIZE = 10 * 1024 * 1024
     
     @classmethod
-    def pack(cls, msg_type: str, data: Dict[str, Any], compress: bool = True) -> bytes:
+    def pack(cls, msg_type: str, data: Dict[str, Any], compress: bool = True,
+             codecs: Iterable[str] = LEGACY_CODECS, version: int = JSON_VERSION) -> bytes:
         """
         Упаковать сообщение в бинарный формат
         
         Args:
             msg_type: Тип сообщения
             data: Данные сообщения
-            compress: Сжимать ли данные
-            
+            compress: Сжимать ли данные (кодек - по COMPRESSION_POLICY)
+            codecs: Кодеки, согласованные с получателем (по умолчанию только zlib)
+            version: Согласованная версия протокола (>= 4 - компактный формат)
+        
         Returns:
             Упакованные данные
         """
+        return b''.join(cls._message_parts(msg_type, data, compress, codecs, version))
+    
+    @classmethod
+    def _message_parts(cls, msg_type: str, data: Dict[str, Any], compress: bool,
+                       codecs: Iterable[str], version: int) -> PacketParts:
+        """Заголовок и payload сообщения без вложения (пустой кортеж при ошибке)"""
         try:
             # Сериализуем данные
-            payload = serialize_message(msg_type, data)
+            compact = version >= cls.COMPACT_VERSION
+            payload = cls._serialize(compact, msg_type, data)
             
-            # Сжимаем если нужно и размер больше 1KB
-            if compress and len(payload) > 1024:
-                payload = zlib.compress(payload, level=6)
-                compressed_flag = 1
-            else:
-                compressed_flag = 0
+            # Сжимаем, если политика типа сообщения это предписывает
+            flags = 0
+            if compress:
+                # Без вложения медиа (если есть) - base64 в JSON: его сжимаем
+                payload, codec_id = compress_for(msg_type, payload, codecs, binary=False)
+                flags = cls._codec_flags(codec_id)
             
             # Создаем заголовок
             header = struct.pack(
                 cls.HEADER_FORMAT,
                 cls.MAGIC,
-                cls.VERSION,
+                cls.COMPACT_VERSION if compact else cls.JSON_VERSION,
                 len(payload),
-                compressed_flag
+                flags
             )
             
-            return header + payload
-            
+            return (header, payload)
+        
         except Exception as e:
             logger.error(f"Ошибка упаковки сообщения: {e}")
-            return b''
+            return ()
+    
+    @classmethod
+    def _serialize(cls, compact: bool, msg_type: str, data: Dict[str, Any]) -> bytes:
+        """Сериализовать сообщение: msgpack (v4) или JSON"""
+        if compact:
+            return serialize_compact(msg_type, data)
+        return serialize_message(msg_type, data)
+    
+    @classmethod
+    def _deserialize(cls, version: int, payload: BytesLike) -> Optional[Dict[str, Any]]:
+        """Десериализовать сообщение по версии из заголовка пакета"""
+        if version >= cls.COMPACT_VERSION:
+            return deserialize_compact(payload)
+        return deserialize_message(bytes(payload))
+    
+    @classmethod
+    def _codec_flags(cls, codec_id: Optional[int]) -> int:
+        """Флаги заголовка для номера кодека (None - не сжато)"""
+        if codec_id is None:
+            return 0
+        return cls.FLAG_COMPRESSED | (codec_id << cls.FLAG_CODEC_SHIFT)
+    
+    @staticmethod
+    def shared_buffer(buffer: BytesLike) -> BytesLike:
+        """
+        Неизменяемый буфер вложения, который можно отдать в очереди
+        многих студентов (изменяемый копируется один раз)
+        """
+        if isinstance(buffer, bytes):
+            return buffer
+        if isinstance(buffer, memoryview) and isinstance(buffer.obj, bytes) and buffer.format == 'B':
+            return buffer
+        return bytes(buffer)
+    
+    @classmethod
+    def pack_binary(cls, msg_type: str, data: Dict[str, Any], attachment: BytesLike,
+                    attachment_field: str = "data",
+                    codecs: Iterable[str] = LEGACY_CODECS,
+                    version: int = BINARY_VERSION) -> bytes:
+        """
+        Упаковать сообщение с сырым бинарным вложением (без base64)
+        
+        Вложение после распаковки окажется в data[attachment_field]
+        в виде memoryview. Понимают только пиры с версией >= 3.
+        
+        Args:
+            msg_type: Тип сообщения
+            data: Метаданные сообщения (без вложения)
+            attachment: Бинарные данные (bytes/bytearray/memoryview)
+            attachment_field: Имя поля data, в которое попадёт вложение
+            codecs: Кодеки, согласованные с получателем (JPEG/аудио
+                    по COMPRESSION_POLICY не сжимаются)
+            version: Согласованная версия протокола (>= 4 - компактные метаданные)
+        
+        Returns:
+            Упакованные данные
+        """
+        return b''.join(cls._binary_parts(msg_type, data, attachment, attachment_field, codecs, version))
+    
+    @classmethod
+    def _binary_parts(cls, msg_type: str, data: Dict[str, Any], attachment: BytesLike,
+                      attachment_field: str, codecs: Iterable[str], version: int) -> PacketParts:
+        """
+        Части пакета с вложением (пустой кортеж при ошибке)
+        
+        Несжимаемое вложение (кадр, голос) не копируется в пакет:
+        (заголовок + метаданные, вложение).
+        """
+        try:
+            meta_data = dict(data)
+            meta_data[cls.ATTACHMENT_KEY] = attachment_field
+            compact = version >= cls.COMPACT_VERSION
+            meta = cls._serialize(compact, msg_type, meta_data)
+            meta_prefix = struct.pack(cls.META_LENGTH_FORMAT, len(meta)) + meta
+            header_version = cls.COMPACT_VERSION if compact else cls.BINARY_VERSION
+            size = len(meta_prefix) + len(attachment)
+            
+            if choose_codec(msg_type, size, codecs) == Codec.NONE:
+                header = struct.pack(cls.HEADER_FORMAT, cls.MAGIC, header_version, size, cls.FLAG_ATTACHMENT)
+                return (header + meta_prefix, cls.shared_buffer(attachment))
+            
+            payload, codec_id = compress_for(msg_type, b''.join((meta_prefix, attachment)), codecs)
+            flags = cls.FLAG_ATTACHMENT | cls._codec_flags(codec_id)
+            
+            header = struct.pack(
+                cls.HEADER_FORMAT,
+                cls.MAGIC,
+                header_version,
+                len(payload),
+                flags
+            )
+            
+            return (header, payload)
+        
+        except Exception as e:
+            logger.error(f"Ошибка упаковки бинарного сообщения: {e}")
+            return ()
+    
+    @classmethod
+    def pack_for_version(cls, version: int, msg_type: str, data: Dict[str, Any],
+                         attachment: Optional[BytesLike] = None,
+                         attachment_field: str = "data",
+                         codecs: Iterable[str] = LEGACY_CODECS) -> bytes:
+        """
+        Упаковать сообщение в формате, понятном пиру с указанной версией
+        и согласованными кодеками
+        
+        Старые пиры (версия < 3) получают вложение как base64 строку
+        внутри JSON, новые - сырыми байтами. Пиры версии 4 получают
+        сообщение в компактном формате.
+        """
+        return b''.join(cls.pack_parts(version, msg_type, data, attachment, attachment_field, codecs))
+    
+    @classmethod
+    def pack_parts(cls, version: int, msg_type: str, data: Dict[str, Any],
+                   attachment: Optional[BytesLike] = None,
+                   attachment_field: str = "data",
+                   codecs: Iterable[str] = LEGACY_CODECS) -> PacketParts:
+        """
+        То же, что pack_for_version, но пакет остается частями
+        для отправки через sendmsg (scatter-gather)
+        
+        Вложение не склеивается с заголовком, а части неизменяемы:
+        одни и те же части кадра уходят всем студентам без копирования.
+        """
+        if attachment is None:
+            return cls._message_parts(msg_type, data, True, codecs, version)
+        
+        if version >= cls.BINARY_VERSION:
+            return cls._binary_parts(msg_type, data, attachment, attachment_field, codecs, version)
+        
+        legacy_data = dict(data)
+        legacy_data[attachment_field] = base64.b64encode(attachment).decode('ascii')
+        return cls._message_parts(msg_type, legacy_data, True, codecs, version)
+    
+    @classmethod
+    def pack_fragment(cls, chunk: BytesLike, last: bool) -> bytes:
+        """
+        Упаковать фрагмент большого пакета (версия >= 3)
+        
+        Фрагменты одного пакета идут по порядку, но между ними могут быть
+        другие обычные пакеты. Получатель склеивает их в RingPacketAssembler.
+        """
+        flags = cls.FLAG_FRAGMENT | (cls.FLAG_LAST_FRAGMENT if last else 0)
+        header = struct.pack(cls.HEADER_FORMAT, cls.MAGIC, cls.BINARY_VERSION, len(chunk), flags)
+        return b''.join((header, chunk))
+    
+    @classmethod
+    def negotiate_version(cls, peer_version: Optional[int], max_version: Optional[int] = None) -> int:
+        """
+        Выбрать общую версию протокола с пиром (старые пиры версию не сообщают)
+        
+        Args:
+            peer_version: Версия, присланная пиром
+            max_version: Наша максимальная версия (None - Protocol.VERSION)
+        """
+        try:
+            peer_version = int(peer_version) if peer_version is not None else cls.JSON_VERSION
+        except (TypeError, ValueError):
+            peer_version = cls.JSON_VERSION
+        local_version = min(cls.VERSION, max_version or cls.VERSION)
+        return max(cls.JSON_VERSION, min(local_version, peer_version))
+    
+    @classmethod
+    def local_version(cls, serializer: Optional[str] = None) -> int:
+        """
+        Максимальная версия протокола с учетом выбранного сериализатора
+        
+        Args:
+            serializer: Serializer.COMPACT или Serializer.JSON
+                        (None = из config.ini, [Network] Serializer).
+                        JSON ограничивает версию тремя - трафик остается
+                        читаемым для отладки.
+        """
+        if serializer is None:
+            serializer = load_config().get("Network", "Serializer", fallback=Serializer.COMPACT)
+        
+        if serializer.strip().lower() == Serializer.JSON:
+            return min(cls.VERSION, cls.BINARY_VERSION)
+        return cls.VERSION
     
     @classmethod
-    def unpack(cls, data: bytes) -> Optional[Dict[str, Any]]:
+    def unpack(cls, data: BytesLike) -> Optional[Dict[str, Any]]:
         """
         Распаковать сообщение из бинарного формата
         
         Args:
             data: Бинарные данные (полный пакет включая заголовок)
-            
+        
         Returns:
-            Распакованное сообщение или None при ошибке
+            Распакованное сообщение или None при ошибке.
+            Бинарное вложение (версия 3) возвращается как memoryview
+            в поле data[<attachment_field>] без копирования.
         """
         try:
             # Проверяем минимальный размер
@@ -82,33 +315,40 @@ class Protocol:
                 return None
             
             # Распаковываем заголовок
-            header = data[:cls.HEADER_SIZE]
-            magic, version, length, compressed = struct.unpack(cls.HEADER_FORMAT, header)
+            magic, version, length, flags = struct.unpack_from(cls.HEADER_FORMAT, data)
             
             # Проверяем magic number
             if magic != cls.MAGIC:
                 logger.error(f"Неверный magic number: {magic}")
                 return None
             
-            # Проверяем версию (принимаем версию 1 и 2)
-            if version not in (1, 2):
+            # Проверяем версию
+            if version not in cls.SUPPORTED_VERSIONS:
                 logger.warning(f"Несовместимая версия протокола: {version}")
             
-            # Извлекаем payload
-            payload = data[cls.HEADER_SIZE:cls.HEADER_SIZE + length]
+            # Извлекаем payload (memoryview - без копирования)
+            payload = memoryview(data)[cls.HEADER_SIZE:cls.HEADER_SIZE + length]
             
             # Проверяем размер
             if len(payload) != length:
                 logger.error(f"Неполный пакет: ожидалось {length}, получено {len(payload)}")
                 return None
             
+            if flags & cls.FLAG_FRAGMENT:
+                logger.error("Фрагмент пакета нужно сначала собрать (RingPacketAssembler)")
+                return None
+            
             # Разжимаем если нужно
-            if compressed:
-                payload = zlib.decompress(payload)
+            if flags & cls.FLAG_COMPRESSED:
+                codec_id = (flags & cls.FLAG_CODEC_MASK) >> cls.FLAG_CODEC_SHIFT
+                payload = memoryview(decompress(codec_id, payload))
             
-            # Десериализуем
-            return deserialize_message(payload)
+            if flags & cls.FLAG_ATTACHMENT:
+                return cls._unpack_attachment(payload, version)
             
+            # Десериализуем
+            return cls._deserialize(version, payload)
+        
         except zlib.error as e:
             logger.error(f"Ошибка декомпрессии: {e}")
             return None
@@ -116,6 +356,28 @@ class Protocol:
             logger.error(f"Ошибка распаковки сообщения: {e}")
             return None
     
+    @classmethod
+    def _unpack_attachment(cls, payload: memoryview, version: int) -> Optional[Dict[str, Any]]:
+        """Разобрать payload бинарного пакета: метаданные + вложение"""
+        if len(payload) < cls.META_LENGTH_SIZE:
+            logger.error("Бинарный пакет без метаданных")
+            return None
+        
+        (meta_length,) = struct.unpack_from(cls.META_LENGTH_FORMAT, payload)
+        meta_end = cls.META_LENGTH_SIZE + meta_length
+        if meta_end > len(payload):
+            logger.error(f"Неверная длина метаданных: {meta_length}")
+            return None
+        
+        message = cls._deserialize(version, payload[cls.META_LENGTH_SIZE:meta_end])
+        if message is None:
+            return None
+        
+        data = message.setdefault("data", {})
+        attachment_field = data.pop(cls.ATTACHMENT_KEY, "data")
+        data[attachment_field] = payload[meta_end:]
+        return message
+    
     @classmethod
     def get_packet_length(cls, header: bytes) -> Optional[int]:
         """
@@ -123,7 +385,7 @@ class Protocol:
         
         Args:
             header: Первые 11 байт (заголовок)
-            
+        
         Returns:
             Полная длина пакета (заголовок + payload) или None при ошибке
         """
@@ -137,7 +399,7 @@ class Protocol:
                 return None
             
             return cls.HEADER_SIZE + length
-            
+        
         except Exception:
             return None
     
@@ -149,7 +411,7 @@ class Protocol:
         Args:
             frame_data: Данные кадра
             frame_id: ID кадра
-            
+        
         Returns:
             Упакованные данные
         """
@@ -168,7 +430,7 @@ class Protocol:
         
         Args:
             data: Бинарные данные
-            
+        
         Returns:
             (frame_id, frame_data) или None при ошибке
         """
@@ -184,7 +446,7 @@ class Protocol:
                 return None
             
             return (frame_id, frame_data)
-            
+        
         except Exception as e:
             logger.error(f"Ошибка распаковки кадра: {e}")
             return None
@@ -222,7 +484,7 @@ class TCPPacketAssembler:
         
         Args:
             data: Данные полученные из socket.recv()
-            
+        
         Returns:
             Список готовых пакетов (каждый можно передать в Protocol.unpack)
         """
@@ -300,6 +562,246 @@ class TCPPacketAssembler:
         return self._stats.copy()
 
 
+class RingPacketAssembler:
+    """
+    Сборщик TCP пакетов без копирования (zero-copy)
+    
+    В отличие от TCPPacketAssembler не склеивает bytes на каждый recv():
+    данные читаются через socket.recv_into() прямо в растущий bytearray
+    с указателями чтения/записи, а готовые пакеты отдаются как memoryview
+    на этот буфер.
+    
+    Выданные memoryview никогда не перезаписываются: буфер сдвигается
+    к началу (переиспользуется) только когда на него не осталось ссылок,
+    иначе выделяется новый, а в него копируется лишь недочитанный хвост.
+    
+    Фрагменты (FLAG_FRAGMENT) склеиваются здесь же: наружу выходят
+    только полные пакеты.
+    
+    Использование:
+        assembler = RingPacketAssembler()
+        
+        while True:
+            if not assembler.recv_into(sock):
+                break  # соединение закрыто
+            for packet in assembler.read_packets():
+                message = Protocol.unpack(packet)
+                # обработка...
+    """
+    
+    # Начальный размер буфера
+    DEFAULT_CAPACITY = 256 * 1024
+    
+    # Минимум свободного места перед recv_into()
+    MIN_RECV_SPACE = 64 * 1024
+    
+    def __init__(self, max_packet_size: int = Protocol.MAX_PACKET_SIZE,
+                 capacity: int = DEFAULT_CAPACITY):
+        self.max_packet_size = max_packet_size
+        self._capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._read = 0
+        self._write = 0
+        
+        # Длина пакета, который собирается сейчас (0 - неизвестна)
+        self._pending_length = 0
+        
+        # Склеиваемый из фрагментов пакет
+        self._fragments: Optional[bytearray] = None
+        self._skip_fragments = False
+        
+        self._stats = {
+            'packets_assembled': 0,
+            'bytes_processed': 0,
+            'sync_recoveries': 0,
+            'buffer_compactions': 0,
+            'buffer_reallocations': 0,
+            'fragments_received': 0
+        }
+    
+    def recv_into(self, sock: 'socket.socket', max_bytes: int = 0) -> int:
+        """
+        Прочитать данные из сокета прямо в буфер
+        
+        Args:
+            sock: TCP сокет
+            max_bytes: Максимум байт за вызов (0 = всё свободное место)
+        
+        Returns:
+            Количество прочитанных байт (0 - соединение закрыто).
+            Исключения сокета (timeout и т.п.) пробрасываются.
+        """
+        self._ensure_space(self.MIN_RECV_SPACE)
+        
+        free = len(self._buffer) - self._write
+        if max_bytes:
+            free = min(free, max_bytes)
+        
+        with memoryview(self._buffer) as view:
+            received = sock.recv_into(view[self._write:self._write + free], free)
+        
+        self._write += received
+        self._stats['bytes_processed'] += received
+        return received
+    
+    def feed(self, data: BytesLike) -> List[memoryview]:
+        """
+        Добавить уже полученные данные и вернуть готовые пакеты
+        
+        Совместимо с TCPPacketAssembler.feed(), но копирует data в буфер
+        один раз; предпочтительнее recv_into().
+        """
+        if not data:
+            return []
+        
+        size = len(data)
+        self._ensure_space(size)
+        self._buffer[self._write:self._write + size] = data
+        self._write += size
+        self._stats['bytes_processed'] += size
+        
+        return self.read_packets()
+    
+    def read_packets(self) -> List[memoryview]:
+        """
+        Извлечь все готовые пакеты из буфера
+        
+        Returns:
+            Список memoryview (каждый можно передать в Protocol.unpack)
+        """
+        packets = []
+        buffer = self._buffer
+        header_size = Protocol.HEADER_SIZE
+        view = None
+        
+        while self._write - self._read >= header_size:
+            # Проверяем magic number в начале
+            if buffer[self._read:self._read + 4] != Protocol.MAGIC:
+                sync_pos = buffer.find(Protocol.MAGIC, self._read, self._write)
+                if sync_pos == -1:
+                    # Magic не найден, оставляем последние 3 байта (начало magic?)
+                    self._read = max(self._read, self._write - 3)
+                    break
+                
+                logger.warning(f"Синхронизация потеряна, пропускаем {sync_pos - self._read} байт")
+                self._read = sync_pos
+                self._stats['sync_recoveries'] += 1
+                continue
+            
+            _, _, length, flags = struct.unpack_from(Protocol.HEADER_FORMAT, buffer, self._read)
+            packet_length = header_size + length
+            
+            # Проверяем на слишком большой пакет (возможная атака или ошибка)
+            if packet_length > self.max_packet_size:
+                logger.error(f"Слишком большой пакет: {packet_length} байт, пропускаем")
+                self._read += 1
+                continue
+            
+            if self._write - self._read < packet_length:
+                # Ждем больше данных; запоминаем размер, чтобы вместить пакет целиком
+                self._pending_length = packet_length
+                break
+            
+            if flags & Protocol.FLAG_FRAGMENT:
+                packet = self._add_fragment(buffer, self._read + header_size, length, flags)
+                self._read += packet_length
+                self._pending_length = 0
+                if packet is not None:
+                    packets.append(packet)
+                continue
+            
+            if view is None:
+                view = memoryview(buffer)
+            packets.append(view[self._read:self._read + packet_length])
+            self._read += packet_length
+            self._pending_length = 0
+            self._stats['packets_assembled'] += 1
+        
+        if view is not None:
+            view.release()
+        
+        return packets
+    
+    def _add_fragment(self, buffer: bytearray, start: int, length: int,
+                      flags: int) -> Optional[memoryview]:
+        """Добавить фрагмент; вернуть собранный пакет после последнего фрагмента"""
+        self._stats['fragments_received'] += 1
+        last = bool(flags & Protocol.FLAG_LAST_FRAGMENT)
+        
+        if self._skip_fragments:
+            # Остаток слишком большого пакета
+            self._skip_fragments = not last
+            return None
+        
+        if self._fragments is None:
+            self._fragments = bytearray()
+        self._fragments += buffer[start:start + length]
+        
+        if len(self._fragments) > self.max_packet_size:
+            logger.error(f"Слишком большой фрагментированный пакет: {len(self._fragments)} байт, пропускаем")
+            self._fragments = None
+            self._skip_fragments = not last
+            return None
+        
+        if not last:
+            return None
+        
+        packet = memoryview(self._fragments)
+        self._fragments = None
+        self._stats['packets_assembled'] += 1
+        return packet
+    
+    def _ensure_space(self, min_free: int):
+        """Гарантировать min_free байт свободного места в конце буфера"""
+        # Собираемый пакет должен поместиться в буфер целиком (без склейки)
+        fits_pending = self._read + self._pending_length <= len(self._buffer)
+        if len(self._buffer) - self._write >= min_free and fits_pending:
+            return
+        
+        unread = self._write - self._read
+        capacity = max(self._capacity, unread + min_free, self._pending_length + min_free)
+        
+        if capacity <= len(self._buffer) and not self._is_exported():
+            # Никто не держит memoryview - сдвигаем хвост к началу
+            self._buffer[0:unread] = self._buffer[self._read:self._write]
+            self._stats['buffer_compactions'] += 1
+        else:
+            # Выданные пакеты могут быть ещё в работе - старый буфер не трогаем,
+            # он освободится сам, когда исчезнут ссылки на пакеты
+            new_buffer = bytearray(capacity)
+            new_buffer[0:unread] = self._buffer[self._read:self._write]
+            self._buffer = new_buffer
+            self._stats['buffer_reallocations'] += 1
+        
+        self._read = 0
+        self._write = unread
+    
+    def _is_exported(self) -> bool:
+        """Есть ли живые memoryview на текущий буфер"""
+        try:
+            self._buffer.append(0)
+        except BufferError:
+            return True
+        del self._buffer[-1]
+        return False
+    
+    def clear(self):
+        """Очистить буфер"""
+        self._buffer = bytearray(self._capacity)
+        self._read = self._write = 0
+        self._pending_length = 0
+        self._fragments = None
+        self._skip_fragments = False
+    
+    def get_buffer_size(self) -> int:
+        """Получить количество недочитанных байт в буфере"""
+        return self._write - self._read
+    
+    def get_stats(self) -> dict:
+        """Получить статистику"""
+        return self._stats.copy()
+
+
 class TCPSocketWrapper:
     """
     Обертка над TCP сокетом с автоматической сборкой пакетов
@@ -327,7 +829,7 @@ class TCPSocketWrapper:
         
         Args:
             packet: Упакованный пакет (результат Protocol.pack)
-            
+        
         Returns:
             True если успешно
         """
@@ -349,7 +851,7 @@ class TCPSocketWrapper:
         
         Args:
             timeout: Таймаут в секундах (None = без таймаута)
-            
+        
         Returns:
             Список готовых пакетов
         """
@@ -364,7 +866,7 @@ class TCPSocketWrapper:
                 return []
             
             return self.assembler.feed(data)
-            
+        
         except TimeoutError:
             return []
         except Exception as e:
@@ -378,7 +880,7 @@ class TCPSocketWrapper:
         
         Args:
             timeout: Таймаут в секундах
-            
+        
         Returns:
             Список распакованных сообщений
         """
@@ -432,20 +934,26 @@ class MessageBuilder:
         return Protocol.pack(MessageType.TEACHER_BROADCAST, data, compress=False)
     
     @staticmethod
-    def student_connect(student_name: str, machine_id: str) -> bytes:
-        """Создать запрос на подключение студента"""
+    def student_connect(student_name: str, machine_id: str,
+                        protocol_version: int = Protocol.VERSION,
+                        codecs: Optional[Iterable[str]] = None) -> bytes:
+        """Создать запрос на подключение студента (с версией протокола и кодеками)"""
         from src.common.constants import MessageType
         data = {
             "student_name": student_name,
-            "machine_id": machine_id
+            "machine_id": machine_id,
+            "protocol_version": protocol_version,
+            "codecs": list(codecs if codecs is not None else available_codecs())
         }
         return Protocol.pack(MessageType.STUDENT_CONNECT, data, compress=False)
     
     @staticmethod
-    def connection_accepted(student_id: str) -> bytes:
-        """Создать сообщение о принятии подключения"""
+    def connection_accepted(student_id: str, protocol_version: int = Protocol.JSON_VERSION,
+                            codecs: Iterable[str] = LEGACY_CODECS) -> bytes:
+        """Создать сообщение о принятии подключения (с согласованными версией и кодеками)"""
         from src.common.constants import MessageType
-        data = {"student_id": student_id}
+        data = {"student_id": student_id, "protocol_version": protocol_version,
+                "codecs": list(codecs)}
         return Protocol.pack(MessageType.CONNECTION_ACCEPTED, data, compress=False)
     
     @staticmethod
@@ -484,9 +992,8 @@ class MessageBuilder:
     
     @staticmethod
     def screen_frame(frame_data: bytes, frame_id: int, quality: str = "medium") -> bytes:
-        """Создать пакет с кадром экрана"""
+        """Создать пакет с кадром экрана (JSON + base64, для старых клиентов)"""
         from src.common.constants import MessageType
-        import base64
         data = {
             "frame_id": frame_id,
             "frame": base64.b64encode(frame_data).decode('utf-8'),
@@ -494,3 +1001,14 @@ class MessageBuilder:
         }
         # Кадры экрана сжимаем (они большие)
         return Protocol.pack(MessageType.SCREEN_FRAME, data, compress=True)
+    
+    @staticmethod
+    def screen_frame_binary(frame_data: BytesLike, frame_id: int, quality: str = "medium") -> bytes:
+        """Создать пакет с кадром экрана как бинарное вложение (версия 3)"""
+        from src.common.constants import MessageType
+        data = {
+            "frame_id": frame_id,
+            "quality": quality
+        }
+        # JPEG уже сжат - повторное сжатие только тратит CPU
+        return Protocol.pack_binary(MessageType.SCREEN_FRAME, data, frame_data, attachment_field="frame")
@@ -0,0 +1,498 @@
+"""
+Очередь исходящих пакетов
+Версия 2.2 - приоритетные полосы, склейка мелких пакетов, scatter-gather
+
+Каждый студент (и клиент студента) получает свою ограниченную очередь,
+которую разбирает отдельный писатель. Поток захвата экрана только кладет
+кадр в очереди и не ждет медленного студента на плохом Wi-Fi.
+
+Пакеты раскладываются по полосам согласно классу сообщения (MessageClass):
+CONTROL > INTERACTIVE > MEDIA > BULK. Писатель всегда берет пакет из самой
+важной непустой полосы, внутри полосы порядок сохраняется. Объемные пакеты
+режутся на фрагменты по BULK_FRAGMENT_SIZE, поэтому LOCK_SCREEN ждет
+не весь 64 KB чанк файла, а максимум один фрагмент.
+
+Политика переполнения:
+- кадры (MEDIA_MESSAGE_TYPES): побеждает последний кадр - самый старый
+  пакет того же типа выбрасывается
+- остальное (LOCK_SCREEN, EXAM_START, FILE_TRANSFER_*, ...): не выбрасывается
+  никогда, отправитель ждет места в полосе (естественное обратное давление)
+
+Склейка (get_batch): писатель забирает сразу несколько пакетов до
+coalesce_bytes и отправляет их одной записью в сокет. Если в пачке только
+мелкие несрочные пакеты (PONG, чат, доска), писатель ждет попутчиков
+до coalesce_window; управляющий пакет уходит сразу.
+
+Пакет - это bytes или кортеж частей (Protocol.pack_parts: заголовок и
+вложение). Пачка уходит через sendmsg списком буферов, без склейки;
+после частичной записи буферы продвигаются срезами memoryview, так что
+кадр не копируется ни для одного студента.
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from src.common.constants import (
+    MessageClass, MESSAGE_CLASSES, MEDIA_MESSAGE_TYPES,
+    OUTBOUND_MEDIA_LIMIT, OUTBOUND_CONTROL_LIMIT, OUTBOUND_BULK_LIMIT,
+    BULK_STARVATION_LIMIT, COALESCE_WINDOW, COALESCE_MAX_BYTES
+)
+from src.common.utils import load_config
+from src.network.protocol import Protocol
+
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Пакет в очереди: целиком или частями (Protocol.pack_parts)
+Packet = Union[BytesLike, Tuple[BytesLike, ...]]
+
+# Не больше стольких буферов в одном sendmsg (IOV_MAX не меньше 1024)
+SENDMSG_MAX_BUFFERS = 512
+
+# sendmsg нет в Windows - там буферы отправляются по одному
+SENDMSG_AVAILABLE = hasattr(socket.socket, "sendmsg")
+
+# Полосы в порядке приоритета
+LANES = (MessageClass.CONTROL, MessageClass.INTERACTIVE, MessageClass.MEDIA, MessageClass.BULK)
+
+# Имена полос для статистики
+LANE_NAMES = {
+    MessageClass.CONTROL: "control",
+    MessageClass.INTERACTIVE: "interactive",
+    MessageClass.MEDIA: "media",
+    MessageClass.BULK: "bulk",
+}
+
+
+def get_message_class(msg_type: Optional[str]) -> int:
+    """Класс (приоритет) сообщения по его типу"""
+    return MESSAGE_CLASSES.get(msg_type, MessageClass.INTERACTIVE)
+
+
+def coalescing_from_config() -> Tuple[float, int]:
+    """
+    Окно (сек) и лимит (байт) склейки пакетов из config.ini
+    ([Network] CoalesceWindowMs, CoalesceMaxBytes; лимит 0 - склейка выключена)
+    """
+    config = load_config()
+    try:
+        window_ms = config.getfloat("Network", "CoalesceWindowMs", fallback=COALESCE_WINDOW * 1000)
+        max_bytes = config.getint("Network", "CoalesceMaxBytes", fallback=COALESCE_MAX_BYTES)
+    except ValueError:
+        return COALESCE_WINDOW, COALESCE_MAX_BYTES
+    return max(0.0, window_ms / 1000), max(0, max_bytes)
+
+
+def packet_size(packet: Packet) -> int:
+    """Размер пакета в байтах (целого или частями)"""
+    if isinstance(packet, tuple):
+        return sum(len(part) for part in packet)
+    return len(packet)
+
+
+def batch_buffers(batch: List[Packet]) -> List[memoryview]:
+    """Пачка пакетов как список буферов для sendmsg (без копирования)"""
+    buffers = []
+    for packet in batch:
+        parts = packet if isinstance(packet, tuple) else (packet,)
+        buffers.extend(memoryview(part) for part in parts if len(part))
+    return buffers
+
+
+def advance_buffers(buffers: List[memoryview], sent: int) -> List[memoryview]:
+    """Убрать из начала списка sent отправленных байт (срезы memoryview, без копирования)"""
+    index = 0
+    while index < len(buffers) and sent >= len(buffers[index]):
+        sent -= len(buffers[index])
+        index += 1
+    remaining = buffers[index:]
+    if sent and remaining:
+        remaining[0] = remaining[0][sent:]
+    return remaining
+
+
+def send_some(sock: socket.socket, buffers: List[memoryview]) -> int:
+    """Один системный вызов записи: sendmsg всех буферов (или send первого)"""
+    if SENDMSG_AVAILABLE:
+        return sock.sendmsg(buffers[:SENDMSG_MAX_BUFFERS])
+    return sock.send(buffers[0])
+
+
+def send_buffers(sock: socket.socket, buffers: List[memoryview]) -> int:
+    """
+    Записать буферы в сокет (scatter-gather, гарантированно все)
+    
+    Returns:
+        Количество системных вызовов
+    
+    Raises:
+        ConnectionError: Сокет закрыт на той стороне (send вернул 0)
+    """
+    calls = 0
+    while buffers:
+        sent = send_some(sock, buffers)
+        calls += 1
+        if sent == 0:
+            raise ConnectionError("Соединение закрыто")
+        buffers = advance_buffers(buffers, sent)
+    return calls
+
+
+class OutboundQueue:
+    """
+    Ограниченная очередь исходящих пакетов с приоритетными полосами
+    (потокобезопасная)
+    
+    Порядок пакетов внутри полосы сохраняется: кадры выбрасываются
+    из середины, но оставшиеся пакеты уходят в порядке постановки.
+    
+    Кадры с keyframe=False (дельты плиток, P-кадры H.264) ссылаются на
+    предыдущий кадр своего типа. Выброшен кадр - вместе с ним
+    выбрасываются стоящие за ним зависимые кадры до ключевого; если
+    ключевого в очереди нет, новые зависимые кадры этого типа тоже
+    выбрасываются, пока не придет ключевой (TileEncoder и H264Encoder
+    шлют их сами не реже пары секунд). Студент не скачивает кадры,
+    которые не сможет собрать, и не просит ключевой кадр на весь класс.
+    """
+    
+    def __init__(self, media_limit: int = OUTBOUND_MEDIA_LIMIT,
+                 control_limit: int = OUTBOUND_CONTROL_LIMIT,
+                 bulk_limit: int = OUTBOUND_BULK_LIMIT,
+                 fragment_size: int = 0,
+                 coalesce_window: float = COALESCE_WINDOW,
+                 coalesce_bytes: int = COALESCE_MAX_BYTES):
+        self.media_limit = media_limit
+        
+        # Фрагментация объемных пакетов (0 - выключена, пир старой версии)
+        self.fragment_size = fragment_size
+        
+        # Склейка мелких пакетов в одну запись (0 байт - выключена)
+        self.coalesce_window = coalesce_window
+        self.coalesce_bytes = coalesce_bytes
+        
+        # Полоса -> очередь (тип сообщения, пакет, время постановки, ключевой ли кадр)
+        self._lanes: Dict[int, Deque[Tuple[Optional[str], Packet, float, bool]]] = {
+            lane: deque() for lane in LANES
+        }
+        
+        # Лимит невыбрасываемых пакетов в полосе и их текущее количество
+        self._limits = {lane: control_limit for lane in LANES}
+        self._limits[MessageClass.BULK] = bulk_limit
+        self._counts = {lane: 0 for lane in LANES}
+        
+        # Количество кадров каждого медиа типа в очереди
+        self._media_counts: Dict[str, int] = {}
+        # Медиа типы, чья цепочка зависимых кадров прервана (ждут ключевой кадр)
+        self._broken_chains: Set[str] = set()
+        
+        # Объемный пакет, который сейчас уходит фрагментами
+        self._bulk_view: Optional[memoryview] = None
+        self._bulk_offset = 0
+        
+        # Сколько пакетов подряд ушло в обход ждущих объемных
+        self._bulk_skipped = 0
+        
+        self._closed = False
+        self._cond = threading.Condition()
+        
+        self._stats = {
+            'enqueued': 0,
+            'dequeued': 0,
+            'media_dropped': 0,
+            'chain_dropped': 0,
+            'control_waits': 0,
+            'fragments_sent': 0,
+            'batches': 0,
+            'coalesced': 0,
+            'max_depth': 0
+        }
+        
+        # Время ожидания в очереди по полосам, мс: [сумма, количество, максимум]
+        self._wait_ms = {lane: [0.0, 0, 0.0] for lane in LANES}
+    
+    def put(self, packet: Packet, msg_type: Optional[str] = None,
+            timeout: Optional[float] = None, keyframe: bool = True) -> bool:
+        """
+        Поставить пакет в очередь
+        
+        Args:
+            packet: Готовый пакет протокола (bytes или части Protocol.pack_parts)
+            msg_type: Тип сообщения (определяет полосу и политику переполнения)
+            timeout: Сколько ждать места для невыбрасываемого пакета, сек
+                     (0 - не ждать, None - ждать без ограничения)
+            keyframe: False - медиа кадр ссылается на предыдущий кадр своего типа
+        
+        Returns:
+            False если очередь закрыта или пакет не поместился за timeout
+        """
+        lane = get_message_class(msg_type)
+        droppable = msg_type in MEDIA_MESSAGE_TYPES
+        
+        with self._cond:
+            if self._closed:
+                return False
+            
+            if droppable:
+                if self._media_counts.get(msg_type, 0) >= self.media_limit:
+                    self._drop_oldest(msg_type)
+                if keyframe:
+                    self._broken_chains.discard(msg_type)
+                elif msg_type in self._broken_chains:
+                    # Основа выброшена - без ключевого кадра этот кадр не собрать
+                    self._stats['media_dropped'] += 1
+                    self._stats['chain_dropped'] += 1
+                    return True
+                self._media_counts[msg_type] = self._media_counts.get(msg_type, 0) + 1
+            else:
+                if self._counts[lane] >= self._limits[lane]:
+                    self._stats['control_waits'] += 1
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while self._counts[lane] >= self._limits[lane] and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            return False
+                        self._cond.wait(remaining)
+                    if self._closed:
+                        return False
+                self._counts[lane] += 1
+            
+            self._lanes[lane].append((msg_type, packet, time.monotonic(), keyframe))
+            self._stats['enqueued'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._depth())
+            self._cond.notify_all()
+            return True
+    
+    def get(self, timeout: Optional[float] = None) -> Optional[Packet]:
+        """Взять следующий пакет или фрагмент (ждет до timeout, None если пусто или закрыта)"""
+        with self._cond:
+            if not self._has_data() and not self._closed:
+                self._cond.wait(timeout)
+            return self._pop()
+    
+    def get_nowait(self) -> Optional[Packet]:
+        """Взять следующий пакет или фрагмент без ожидания"""
+        with self._cond:
+            return self._pop()
+    
+    def get_batch(self, timeout: Optional[float] = None,
+                  window: Optional[float] = None) -> List[Packet]:
+        """
+        Взять пачку пакетов для одной записи в сокет
+        
+        Пакеты берутся в обычном порядке приоритетов, пока суммарный размер
+        не превысит coalesce_bytes (одиночный большой пакет уходит один).
+        Если очередь опустела, а в пачке только мелкие несрочные пакеты,
+        ждет следующих до window сек (None - coalesce_window).
+        
+        Args:
+            timeout: Сколько ждать первого пакета, сек
+            window: Окно ожидания попутчиков, сек (0 - только уже стоящие в очереди)
+        
+        Returns:
+            Список пакетов (пустой, если очередь пуста или закрыта)
+        """
+        if window is None:
+            window = self.coalesce_window
+        
+        with self._cond:
+            if not self._has_data() and not self._closed:
+                self._cond.wait(timeout)
+            
+            batch: List[Packet] = []
+            size = 0
+            urgent = False
+            deadline = None
+            
+            while not self._closed:
+                lane = self._next_lane()
+                
+                if lane is None:
+                    # Срочное и крупное не ждет попутчиков
+                    if not batch or urgent or window <= 0 or size >= self.coalesce_bytes:
+                        break
+                    if deadline is None:
+                        deadline = time.monotonic() + window
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                
+                if batch and size + self._next_size(lane) > self.coalesce_bytes:
+                    break
+                
+                packet = self._pop_lane(lane)
+                batch.append(packet)
+                size += packet_size(packet)
+                urgent = urgent or lane == MessageClass.CONTROL
+            
+            if batch:
+                self._stats['batches'] += 1
+                self._stats['coalesced'] += len(batch) - 1
+            return batch
+    
+    def _has_data(self) -> bool:
+        """Есть ли что отправлять (под lock)"""
+        return self._bulk_view is not None or any(self._lanes.values())
+    
+    def _depth(self) -> int:
+        """Количество пакетов в очереди (под lock)"""
+        return sum(len(queue) for queue in self._lanes.values())
+    
+    def _bulk_waiting(self) -> bool:
+        """Ждут ли отправки объемные данные (под lock)"""
+        return self._bulk_view is not None or bool(self._lanes[MessageClass.BULK])
+    
+    def _next_lane(self) -> Optional[int]:
+        """Полоса, из которой будет взят следующий пакет (под lock)"""
+        bulk_waiting = self._bulk_waiting()
+        
+        for lane in LANES[:-1]:
+            if not self._lanes[lane]:
+                continue
+            
+            # Управление идет всегда первым, а вот за потоком кадров
+            # объемные данные не должны простаивать вечно
+            if (lane != MessageClass.CONTROL and bulk_waiting
+                    and self._bulk_skipped >= BULK_STARVATION_LIMIT):
+                break
+            return lane
+        
+        return MessageClass.BULK if bulk_waiting else None
+    
+    def _next_size(self, lane: int) -> int:
+        """Размер следующего пакета или фрагмента полосы (под lock)"""
+        if lane == MessageClass.BULK:
+            if self._bulk_view is not None:
+                remaining = len(self._bulk_view) - self._bulk_offset
+                return Protocol.HEADER_SIZE + min(remaining, self.fragment_size)
+            size = packet_size(self._lanes[lane][0][1])
+            if self.fragment_size and size > self.fragment_size:
+                return Protocol.HEADER_SIZE + self.fragment_size
+            return size
+        return packet_size(self._lanes[lane][0][1])
+    
+    def _pop(self) -> Optional[Packet]:
+        """Выбрать пакет из самой важной непустой полосы (под lock)"""
+        if self._closed:
+            return None
+        
+        lane = self._next_lane()
+        if lane is None:
+            return None
+        return self._pop_lane(lane)
+    
+    def _pop_lane(self, lane: int) -> Packet:
+        """Взять пакет из выбранной полосы (под lock)"""
+        if lane == MessageClass.BULK:
+            return self._pop_bulk()
+        
+        msg_type, packet, enqueued_at, _ = self._lanes[lane].popleft()
+        if msg_type in MEDIA_MESSAGE_TYPES:
+            self._media_counts[msg_type] -= 1
+        else:
+            self._release(lane)
+        
+        self._record_wait(lane, enqueued_at)
+        if lane != MessageClass.CONTROL and self._bulk_waiting():
+            self._bulk_skipped += 1
+        self._stats['dequeued'] += 1
+        return packet
+    
+    def _pop_bulk(self) -> Packet:
+        """Следующий объемный пакет или его фрагмент (под lock)"""
+        self._bulk_skipped = 0
+        
+        if self._bulk_view is None:
+            _, packet, enqueued_at, _ = self._lanes[MessageClass.BULK].popleft()
+            self._release(MessageClass.BULK)
+            self._record_wait(MessageClass.BULK, enqueued_at)
+            self._stats['dequeued'] += 1
+            
+            if not self.fragment_size or packet_size(packet) <= self.fragment_size:
+                return packet
+            
+            # Фрагменты режутся из непрерывного буфера (части склеиваются один раз)
+            if isinstance(packet, tuple):
+                packet = b''.join(packet)
+            self._bulk_view = memoryview(packet)
+            self._bulk_offset = 0
+        
+        end = self._bulk_offset + self.fragment_size
+        last = end >= len(self._bulk_view)
+        fragment = Protocol.pack_fragment(self._bulk_view[self._bulk_offset:end], last)
+        self._stats['fragments_sent'] += 1
+        
+        if last:
+            self._bulk_view = None
+        else:
+            self._bulk_offset = end
+        
+        return fragment
+    
+    def _release(self, lane: int):
+        """Освободить место в полосе и разбудить ждущих отправителей (под lock)"""
+        self._counts[lane] -= 1
+        self._cond.notify_all()
+    
+    def _record_wait(self, lane: int, enqueued_at: float):
+        """Учесть время ожидания пакета в очереди (под lock)"""
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        stat = self._wait_ms[lane]
+        stat[0] += wait_ms
+        stat[1] += 1
+        stat[2] = max(stat[2], wait_ms)
+    
+    def _drop_oldest(self, msg_type: str):
+        """Выбросить самый старый кадр указанного типа и зависящие от него (под lock)"""
+        queue = self._lanes[get_message_class(msg_type)]
+        dropped = False
+        index = 0
+        while index < len(queue):
+            queued_type, _, _, keyframe = queue[index]
+            if queued_type != msg_type:
+                index += 1
+                continue
+            if dropped and keyframe:
+                # Дальше цепочка начинается заново
+                return
+            del queue[index]
+            self._media_counts[msg_type] -= 1
+            self._stats['media_dropped'] += 1
+            if dropped:
+                self._stats['chain_dropped'] += 1
+            dropped = True
+        
+        if dropped:
+            self._broken_chains.add(msg_type)
+    
+    def close(self):
+        """Закрыть очередь и разбудить всех ждущих"""
+        with self._cond:
+            self._closed = True
+            for queue in self._lanes.values():
+                queue.clear()
+            self._counts = {lane: 0 for lane in LANES}
+            self._media_counts.clear()
+            self._broken_chains.clear()
+            self._bulk_view = None
+            self._cond.notify_all()
+    
+    def __len__(self) -> int:
+        with self._cond:
+            return self._depth()
+    
+    def get_stats(self) -> dict:
+        """Получить статистику очереди"""
+        with self._cond:
+            stats = self._stats.copy()
+            stats['depth'] = self._depth()
+            for lane in LANES:
+                name = LANE_NAMES[lane]
+                total, count, max_wait = self._wait_ms[lane]
+                stats[f'{name}_depth'] = len(self._lanes[lane])
+                stats[f'{name}_wait_avg_ms'] = total / count if count else 0.0
+                stats[f'{name}_wait_max_ms'] = max_wait
+        return stats
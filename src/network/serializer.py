@@ -0,0 +1,67 @@
+"""
+Компактный бинарный сериализатор сообщений
+Версия 1.0
+
+Протокол v4 вместо JSON сообщения
+    {"type": "WHITEBOARD_COMMAND", "timestamp": "2024-01-01 12:00:00", "data": {...}}
+передает msgpack массив [номер типа, метка времени, data]:
+- номер типа из MESSAGE_TYPE_IDS (тип без номера - строкой)
+- метка времени - целое число миллисекунд монотонных часов отправителя
+  (для замера интервалов, а не для показа пользователю)
+
+msgpack - опциональная зависимость: без него протокол v4 не
+предлагается и пиры согласуют JSON (v2/v3).
+"""
+
+import time
+import logging
+from typing import Any, Dict, Optional, Union
+from src.common.constants import MESSAGE_TYPE_IDS
+
+# Опциональная зависимость
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Номер типа -> строковый тип
+MESSAGE_TYPE_NAMES: Dict[int, str] = {type_id: name for name, type_id in MESSAGE_TYPE_IDS.items()}
+
+
+def monotonic_timestamp() -> int:
+    """Метка времени для компактного формата: миллисекунды монотонных часов"""
+    return time.monotonic_ns() // 1_000_000
+
+
+def serialize_compact(msg_type: str, data: Dict[str, Any]) -> bytes:
+    """Сериализовать сообщение в msgpack [номер типа, метка времени, data]"""
+    type_id = MESSAGE_TYPE_IDS.get(msg_type, msg_type)
+    return msgpack.packb((type_id, monotonic_timestamp(), data), use_bin_type=True)
+
+
+def deserialize_compact(payload: BytesLike) -> Optional[Dict[str, Any]]:
+    """
+    Десериализовать сообщение компактного формата
+    
+    Returns:
+        Сообщение в том же виде, что и deserialize_message
+        ({"type", "timestamp", "data"}), или None при ошибке
+    """
+    try:
+        # Ключи data - не только строки (в JSON они стали бы строками)
+        type_id, timestamp, data = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    except Exception as e:
+        logger.error(f"Ошибка десериализации компактного сообщения: {e}")
+        return None
+    
+    return {
+        "type": MESSAGE_TYPE_NAMES.get(type_id, type_id),
+        "timestamp": timestamp,
+        "data": data
+    }
@@ -7,14 +7,19 @@ import socket
 import threading
 import logging
 import time
-from typing import Dict, Callable, Optional, List
+from typing import Dict, Callable, Optional, List, Union
 from src.common.constants import (
     DEFAULT_PORT, MULTICAST_GROUP, MULTICAST_PORT,
     BROADCAST_INTERVAL, HEARTBEAT_INTERVAL, CONNECTION_TIMEOUT,
-    MessageType, BUFFER_SIZE
+    OUTBOUND_CONTROL_TIMEOUT, BULK_FRAGMENT_SIZE, STUDENT_SEND_BUFFER,
+    MessageType, ServerCore
 )
-from src.common.utils import get_local_ip
-from src.network.protocol import Protocol, MessageBuilder, TCPPacketAssembler
+from src.common.utils import get_local_ip, load_config
+from src.network.protocol import Protocol, MessageBuilder, RingPacketAssembler
+from src.network.send_queue import (
+    OutboundQueue, Packet, coalescing_from_config, batch_buffers, send_buffers
+)
+from src.network.codecs import LEGACY_CODECS, negotiate_codecs
 from src.common.models import Student
 
 
@@ -24,45 +29,106 @@ logger = logging.getLogger(__name__)
 class ClientHandler:
     """Обработчик соединения с одним клиентом (студентом)"""
     
+    # Сколько ждать места в очереди для управляющего пакета, сек
+    CONTROL_TIMEOUT = OUTBOUND_CONTROL_TIMEOUT
+    
     def __init__(self, client_socket: socket.socket, address: tuple):
         self.socket = client_socket
         self.address = address
         self.student_id: Optional[str] = None
         self.student: Optional[Student] = None
-        self.assembler = TCPPacketAssembler()
+        self.assembler = RingPacketAssembler()
         self.connected = True
         
+        # Согласованные версия протокола и кодеки (до регистрации - JSON и zlib)
+        self.protocol_version = Protocol.JSON_VERSION
+        self.codecs = LEGACY_CODECS
+        
+        # Очередь исходящих пакетов (приоритетные полосы) и ее писатель
+        self.outbound = OutboundQueue()
+        self._writer_thread: Optional[threading.Thread] = None
+        
+        # Небольшой буфер ядра: срочная команда не ждет за мегабайтами файла,
+        # уже переданными в сокет (задержка <= (буфер + фрагмент) / пропускная способность)
+        try:
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STUDENT_SEND_BUFFER)
+        except OSError:
+            pass
+        
         # Lock для потокобезопасной отправки
         self._send_lock = threading.Lock()
+        
+        # Счетчики записи: системные вызовы send() и ушедшие в них пакеты
+        self._stats = {
+            'send_calls': 0,
+            'packets_written': 0,
+            'bytes_sent': 0
+        }
+    
+    def start_writer(self):
+        """Запустить поток-писатель, разбирающий очередь исходящих пакетов"""
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+    
+    def _writer_loop(self):
+        """Поток-писатель: отправляет пакеты из очереди, мелкие - пачками"""
+        while self.connected:
+            batch = self.outbound.get_batch(timeout=0.5)
+            if batch and not self._write(batch_buffers(batch), len(batch)):
+                break
+    
+    def send_packet(self, packet: Packet, msg_type: Optional[str] = None, keyframe: bool = True) -> bool:
+        """
+        Поставить пакет в очередь отправки (потокобезопасно, не ждет сеть)
+        
+        packet - bytes или части Protocol.pack_parts (уходят без склейки).
+        
+        msg_type определяет приоритет (MessageClass) и политику переполнения:
+        кадры выбрасываются, остальное ждет места. Если студент не разбирает
+        очередь дольше CONTROL_TIMEOUT, соединение закрывается. keyframe=False -
+        кадр ссылается на предыдущий (OutboundQueue.put).
+        """
+        if not self.connected:
+            return False
+        
+        if self.outbound.put(packet, msg_type, timeout=self.CONTROL_TIMEOUT, keyframe=keyframe):
+            return True
+        
+        if self.connected:
+            logger.warning(f"Очередь отправки {self.address} переполнена, отключаем")
+            self.close()
+        return False
     
-    def send_packet(self, packet: bytes) -> bool:
-        """Отправить пакет (потокобезопасно, гарантированно весь)"""
+    def _write(self, buffers: List[memoryview], packets: int = 1) -> bool:
+        """
+        Записать буферы в сокет (блокирующе, гарантированно все)
+        
+        Args:
+            buffers: Буферы пачки пакетов (batch_buffers) - уходят через
+                     sendmsg без склейки и без копий при частичной записи
+            packets: Сколько пакетов в буферах (для статистики)
+        """
         if not self.connected:
             return False
         
         try:
             with self._send_lock:
-                total_sent = 0
-                while total_sent < len(packet):
-                    sent = self.socket.send(packet[total_sent:])
-                    if sent == 0:
-                        self.connected = False
-                        return False
-                    total_sent += sent
+                self._stats['send_calls'] += send_buffers(self.socket, buffers)
+                self._stats['packets_written'] += packets
+                self._stats['bytes_sent'] += sum(len(buffer) for buffer in buffers)
             return True
         except Exception as e:
             logger.error(f"Ошибка отправки пакету {self.address}: {e}")
             self.connected = False
             return False
     
-    def receive_packets(self) -> List[bytes]:
-        """Получить готовые пакеты"""
+    def receive_packets(self) -> List[memoryview]:
+        """Получить готовые пакеты (recv_into в буфер сборщика, без копирования)"""
         try:
-            data = self.socket.recv(BUFFER_SIZE)
-            if not data:
+            if not self.assembler.recv_into(self.socket):
                 self.connected = False
                 return []
-            return self.assembler.feed(data)
+            return self.assembler.read_packets()
         except socket.timeout:
             return []
         except Exception as e:
@@ -70,9 +136,22 @@ class ClientHandler:
             self.connected = False
             return []
     
+    def get_stats(self) -> dict:
+        """Статистика соединения: записи в сокет и очередь отправки"""
+        stats = self._stats.copy()
+        stats['packets_per_send'] = stats['packets_written'] / stats['send_calls'] if stats['send_calls'] else 0.0
+        stats['send_queue'] = self.outbound.get_stats()
+        return stats
+    
     def close(self):
         """Закрыть соединение"""
         self.connected = False
+        self.outbound.close()
+        try:
+            # shutdown будит поток приема в recv
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         try:
             self.socket.close()
         except:
@@ -82,12 +161,21 @@ class ClientHandler:
 class TeacherServer:
     """Сервер преподавателя с надежной TCP буферизацией"""
     
+    # Ядро сервера (для статистики и сравнения в нагрузочных тестах)
+    CORE = ServerCore.THREADED
+    
     def __init__(self, teacher_name: str, channel: int = 1, port: int = DEFAULT_PORT):
         self.teacher_name = teacher_name
         self.channel = channel
         self.port = port
         self.ip_address = get_local_ip()
         
+        # Максимальная версия протокола (config.ini: [Network] Serializer)
+        self.max_protocol_version = Protocol.local_version()
+        
+        # Склейка мелких пакетов (config.ini: [Network] CoalesceWindowMs, CoalesceMaxBytes)
+        self.coalesce_window, self.coalesce_bytes = coalescing_from_config()
+        
         # Сокеты
         self.tcp_socket: Optional[socket.socket] = None
         self.multicast_socket: Optional[socket.socket] = None
@@ -99,6 +187,8 @@ class TeacherServer:
         # Потоки
         self.running = False
         self.threads: List[threading.Thread] = []
+        # Будит фоновые потоки при stop() - не ждать конца их интервала
+        self._stop_event = threading.Event()
         
         # Locks
         self._students_lock = threading.Lock()
@@ -137,13 +227,14 @@ class TeacherServer:
             logger.info(f"Multicast сокет создан для {MULTICAST_GROUP}:{MULTICAST_PORT} (broadcast включен)")
             
             self.running = True
+            self._stop_event.clear()
             self._stats['start_time'] = time.time()
             
             # Запускаем потоки
             self._start_threads()
             
             return True
-            
+        
         except Exception as e:
             logger.error(f"Ошибка запуска сервера: {e}")
             self.stop()
@@ -153,6 +244,7 @@ class TeacherServer:
         """Остановить сервер"""
         logger.info("Остановка сервера...")
         self.running = False
+        self._stop_event.set()
         
         # Закрываем соединения со студентами
         with self._students_lock:
@@ -161,8 +253,12 @@ class TeacherServer:
             self.client_handlers.clear()
             self.students.clear()
         
-        # Закрываем серверные сокеты
+        # Закрываем серверные сокеты (shutdown будит поток в accept)
         if self.tcp_socket:
+            try:
+                self.tcp_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             try:
                 self.tcp_socket.close()
             except:
@@ -222,20 +318,26 @@ class TeacherServer:
                 )
                 client_thread.start()
                 self.threads.append(client_thread)
-                
+            
             except socket.timeout:
                 continue
             except Exception as e:
                 if self.running:
                     logger.error(f"Ошибка приема подключения: {e}")
     
+    def _configure_handler(self, handler: ClientHandler):
+        """Применить настройки сервера к новому соединению"""
+        handler.outbound.coalesce_window = self.coalesce_window
+        handler.outbound.coalesce_bytes = self.coalesce_bytes
+    
     def _handle_client(self, client_socket: socket.socket, address: tuple):
         """
         Обработка клиента (студента)
         ИСПРАВЛЕНО: Теперь использует TCPPacketAssembler
         """
         handler = ClientHandler(client_socket, address)
-        student_id = None
+        self._configure_handler(handler)
+        handler.start_writer()
         
         try:
             # Таймаут для первого сообщения (регистрации)
@@ -251,53 +353,68 @@ class TeacherServer:
                     if not message:
                         continue
                     
-                    msg_type = message.get("type")
-                    msg_data = message.get("data", {})
-                    
-                    self._stats['messages_received'] += 1
+                    was_registered = handler.student_id is not None
                     
-                    # Обрабатываем тип сообщения
-                    if msg_type == MessageType.STUDENT_CONNECT:
-                        # Новый студент подключается
-                        student_id = self._register_student(msg_data, address, handler)
-                        if student_id:
-                            # После регистрации убираем таймаут
-                            client_socket.settimeout(None)
-                        else:
-                            # Регистрация не удалась
-                            handler.close()
-                            return
-                        
-                    elif msg_type == MessageType.PING:
-                        # Heartbeat от студента
-                        if student_id:
-                            with self._students_lock:
-                                if student_id in self.students:
-                                    self.students[student_id].last_seen = time.time()
-                            # Отправляем PONG
-                            handler.send_packet(MessageBuilder.pong())
+                    if not self._dispatch_message(handler, message):
+                        # Регистрация не удалась
+                        handler.close()
+                        return
                     
-                    else:
-                        # Другие сообщения
-                        if self.on_message_received and student_id:
-                            try:
-                                self.on_message_received(student_id, message)
-                            except Exception as e:
-                                logger.error(f"Ошибка в обработчике сообщения: {e}")
+                    if not was_registered and handler.student_id:
+                        # После регистрации убираем таймаут
+                        client_socket.settimeout(None)
                 
                 # Небольшая пауза если нет пакетов
                 if not packets:
                     time.sleep(0.01)
-                        
+        
         except Exception as e:
             if self.running:
                 logger.error(f"Ошибка обработки клиента {address}: {e}")
         finally:
             # Отключение студента
-            if student_id:
-                self._unregister_student(student_id)
+            if handler.student_id:
+                self._unregister_student(handler.student_id)
             handler.close()
     
+    def _dispatch_message(self, handler: ClientHandler, message: Dict) -> bool:
+        """
+        Обработать сообщение от клиента (общая логика для всех ядер сервера)
+        
+        Returns:
+            False если соединение нужно закрыть (регистрация не удалась)
+        """
+        msg_type = message.get("type")
+        msg_data = message.get("data", {})
+        student_id = handler.student_id
+        
+        self._stats['messages_received'] += 1
+        
+        # Обрабатываем тип сообщения
+        if msg_type == MessageType.STUDENT_CONNECT:
+            # Новый студент подключается
+            return self._register_student(msg_data, handler.address, handler) is not None
+        
+        elif msg_type == MessageType.PING:
+            # Heartbeat от студента
+            if student_id:
+                with self._students_lock:
+                    if student_id in self.students:
+                        self.students[student_id].last_seen = time.time()
+                # Отправляем PONG
+                handler.send_packet(Protocol.pack_for_version(handler.protocol_version,
+                                                              MessageType.PONG, {}))
+        
+        else:
+            # Другие сообщения
+            if self.on_message_received and student_id:
+                try:
+                    self.on_message_received(student_id, message)
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике сообщения: {e}")
+        
+        return True
+    
     def _register_student(self, data: Dict, address: tuple, handler: ClientHandler) -> Optional[str]:
         """Зарегистрировать студента"""
         try:
@@ -316,6 +433,14 @@ class TeacherServer:
                     if old_handler:
                         old_handler.close()
             
+            # Согласуем версию протокола (старые клиенты версию не присылают)
+            handler.protocol_version = Protocol.negotiate_version(data.get("protocol_version"),
+                                                                self.max_protocol_version)
+            if handler.protocol_version >= Protocol.BINARY_VERSION:
+                # Клиент умеет собирать фрагменты - режем объемные пакеты
+                handler.outbound.fragment_size = BULK_FRAGMENT_SIZE
+            handler.codecs = negotiate_codecs(data.get("codecs"))
+            
             # Создаем объект студента
             student = Student(
                 id=student_id,
@@ -334,7 +459,8 @@ class TeacherServer:
             handler.student = student
             
             # Отправляем подтверждение
-            response = MessageBuilder.connection_accepted(student_id)
+            response = MessageBuilder.connection_accepted(student_id, handler.protocol_version,
+                                                          handler.codecs)
             if not handler.send_packet(response):
                 logger.error(f"Не удалось отправить подтверждение студенту {student_name}")
                 return None
@@ -348,9 +474,10 @@ class TeacherServer:
                 except Exception as e:
                     logger.error(f"Ошибка в колбэке on_student_connected: {e}")
             
-            logger.info(f"Студент зарегистрирован: {student_name} ({student_id})")
+            logger.info(f"Студент зарегистрирован: {student_name} ({student_id}), "
+                        f"протокол v{handler.protocol_version}, кодеки {', '.join(handler.codecs)}")
             return student_id
-            
+        
         except Exception as e:
             logger.error(f"Ошибка регистрации студента: {e}")
             return None
@@ -391,19 +518,19 @@ class TeacherServer:
                     self.multicast_socket.sendto(message, (MULTICAST_GROUP, MULTICAST_PORT))
                 except Exception as me:
                     logger.debug(f"Multicast недоступен: {me}")
-
+                
                 # Фолбэк: broadcast для сетей без multicast
                 try:
                     self.multicast_socket.sendto(message, ("255.255.255.255", MULTICAST_PORT))
                 except Exception as be:
                     logger.debug(f"Broadcast недоступен: {be}")
                 
-                time.sleep(BROADCAST_INTERVAL)
-                
+                self._stop_event.wait(BROADCAST_INTERVAL)
+            
             except Exception as e:
                 if self.running:
                     logger.error(f"Ошибка широковещания: {e}")
-                time.sleep(BROADCAST_INTERVAL)
+                self._stop_event.wait(BROADCAST_INTERVAL)
     
     def _check_heartbeats(self):
         """Поток проверки heartbeat от студентов"""
@@ -429,15 +556,22 @@ class TeacherServer:
                         handler.close()
                     self._unregister_student(student_id)
                 
-                time.sleep(HEARTBEAT_INTERVAL)
-                
+                self._stop_event.wait(HEARTBEAT_INTERVAL)
+            
             except Exception as e:
                 if self.running:
                     logger.error(f"Ошибка проверки heartbeat: {e}")
-                time.sleep(HEARTBEAT_INTERVAL)
+                self._stop_event.wait(HEARTBEAT_INTERVAL)
     
-    def send_to_student(self, student_id: str, msg_type: str, data: Dict) -> bool:
-        """Отправить сообщение студенту"""
+    def send_to_student(self, student_id: str, msg_type: str, data: Dict,
+                        attachment: Optional[Union[bytes, memoryview]] = None,
+                        attachment_field: str = "data", keyframe: bool = True) -> bool:
+        """
+        Отправить сообщение студенту
+        
+        attachment - бинарные данные (кадр, голос). Клиентам с протоколом v3
+        уходят сырыми байтами, старым - base64 в поле attachment_field.
+        """
         try:
             with self._students_lock:
                 if student_id not in self.client_handlers:
@@ -446,22 +580,38 @@ class TeacherServer:
                 
                 handler = self.client_handlers[student_id]
             
-            message = Protocol.pack(msg_type, data)
-            success = handler.send_packet(message)
+            message = Protocol.pack_parts(
+                handler.protocol_version, msg_type, data, attachment, attachment_field,
+                handler.codecs
+            )
+            success = handler.send_packet(message, msg_type, keyframe)
             
             if success:
                 self._stats['messages_sent'] += 1
             
             return success
-            
+        
         except Exception as e:
             logger.error(f"Ошибка отправки студенту {student_id}: {e}")
             return False
     
-    def broadcast_to_all(self, msg_type: str, data: Dict, exclude: Optional[List[str]] = None):
-        """Отправить сообщение всем студентам"""
+    def broadcast_to_all(self, msg_type: str, data: Dict, exclude: Optional[List[str]] = None,
+                         attachment: Optional[Union[bytes, memoryview]] = None,
+                         attachment_field: str = "data", keyframe: bool = True):
+        """
+        Отправить сообщение всем студентам
+        
+        attachment - бинарные данные (кадр, голос). Пакет упаковывается один раз
+        на каждое сочетание версии протокола и кодеков среди получателей;
+        вложение остается одним неизменяемым буфером, общим для всех очередей,
+        и уходит через sendmsg без копирования для каждого студента.
+        
+        Пакет только ставится в очереди студентов: медленный студент
+        не задерживает кадр для остального класса. keyframe=False - кадр
+        ссылается на предыдущий (дельта, P-кадр; screen_capture.is_keyframe):
+        если очередь студента выбросила его основу, он не отправляется.
+        """
         exclude = exclude or []
-        message = Protocol.pack(msg_type, data)
         
         with self._students_lock:
             handlers_to_send = [
@@ -470,8 +620,26 @@ class TeacherServer:
                 if sid not in exclude
             ]
         
+        # Один неизменяемый буфер кадра на всех (изменяемый копируется один раз)
+        if attachment is not None:
+            attachment = Protocol.shared_buffer(attachment)
+        
+        # Кэш упакованных пакетов по (версии протокола, кодекам)
+        packed: Dict[tuple, Packet] = {}
+        
         for student_id, handler in handlers_to_send:
-            if handler.send_packet(message):
+            # Без вложения v2 и v3 получают один и тот же JSON пакет
+            version = handler.protocol_version
+            if attachment is None and version < Protocol.COMPACT_VERSION:
+                version = Protocol.JSON_VERSION
+            key = (version, handler.codecs)
+            message = packed.get(key)
+            if message is None:
+                message = Protocol.pack_parts(version, msg_type, data, attachment,
+                                              attachment_field, handler.codecs)
+                packed[key] = message
+            
+            if handler.send_packet(message, msg_type, keyframe):
                 self._stats['messages_sent'] += 1
     
     def get_students(self) -> List[Student]:
@@ -490,9 +658,45 @@ class TeacherServer:
         if stats['start_time']:
             stats['uptime_seconds'] = time.time() - stats['start_time']
         stats['active_students'] = self.get_student_count()
+        stats['core'] = self.CORE
+        
+        # Соединения и очереди отправки по студентам
+        with self._students_lock:
+            handlers = list(self.client_handlers.items())
+        connections = {sid: handler.get_stats() for sid, handler in handlers}
+        queues = {sid: connection['send_queue'] for sid, connection in connections.items()}
+        stats['connections'] = connections
+        stats['send_queues'] = queues
+        stats['send_calls'] = sum(c['send_calls'] for c in connections.values())
+        stats['packets_written'] = sum(c['packets_written'] for c in connections.values())
+        stats['queue_depth'] = sum(q['depth'] for q in queues.values())
+        stats['queue_depth_max'] = max((q['depth'] for q in queues.values()), default=0)
+        stats['media_dropped'] = sum(q['media_dropped'] for q in queues.values())
         return stats
 
 
+def create_teacher_server(teacher_name: str, channel: int = 1, port: int = DEFAULT_PORT,
+                          core: Optional[str] = None) -> TeacherServer:
+    """
+    Создать сервер преподавателя с выбранным ядром
+    
+    Args:
+        core: ServerCore.THREADED или ServerCore.SELECTORS
+              (None = из config.ini, [Network] ServerCore)
+    """
+    if core is None:
+        core = load_config().get("Network", "ServerCore", fallback=ServerCore.THREADED).strip().lower()
+    
+    if core == ServerCore.SELECTORS:
+        from src.network.event_server import SelectorTeacherServer
+        return SelectorTeacherServer(teacher_name, channel, port)
+    
+    if core != ServerCore.THREADED:
+        logger.warning(f"Неизвестное ядро сервера '{core}', используем {ServerCore.THREADED}")
+    
+    return TeacherServer(teacher_name, channel, port)
+
+
 # Для обратной совместимости
 def get_student_socket(server: TeacherServer, student_id: str) -> Optional[socket.socket]:
     """Получить сокет студента (для обратной совместимости)"""
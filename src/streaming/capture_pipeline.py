@@ -0,0 +1,250 @@
+"""
+Конвейер трансляции экрана: захват -> конвертация -> кодирование -> отправка
+
+Раньше захват, np.array, cvtColor, resize, imencode и рассылка шли
+подряд в одном потоке: на 1080p30 один imencode не укладывается в
+интервал кадра, и dropped_frames растет. Здесь стадии идут в своих
+потоках, между ними - очереди ограниченной длины:
+
+- захват (поток ScreenCapture) только снимает экран и кладет кадр в
+  очередь конвертации; очередь полна - выбрасывается самый старый кадр,
+  захват никогда не ждет сеть
+- конвертация (свой поток): цвет и размер, номер кадра
+- кодирование - пул из ENCODE_WORKERS потоков (cv2 отпускает GIL)
+- отправка (свой поток) забирает результаты строго в порядке номеров
+  кадров, даже если кодировщики закончили не по порядку
+
+Медленная сеть тормозит отправку, очередь кодирования заполняется,
+конвертация ждет, а захват выбрасывает старые кадры - на экране
+студента всегда свежий кадр, а не очередь из прошлого.
+
+Модуль без cv2/numpy: стадии - колбэки ScreenCapture.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Кадров между захватом и конвертацией (больше - только задержка)
+CAPTURE_QUEUE_SIZE = 2
+# Потоков кодирования JPEG
+ENCODE_WORKERS = max(1, min(3, (os.cpu_count() or 2) - 1))
+# Кадров в кодировании и ожидании отправки - на поток кодирования
+ENCODE_QUEUE_PER_WORKER = 2
+# Сглаживание задержек стадий
+STAGE_EWMA_ALPHA = 0.1
+
+STAGES = ("capture", "convert", "encode", "send", "total")
+
+
+class StageTimer:
+    """Задержка стадии: сглаженная и максимальная, мс"""
+    
+    def __init__(self):
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+        self.count = 0
+        self._lock = threading.Lock()  # Кодирование пишет из нескольких потоков
+    
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            if self.count == 0:
+                self.avg_ms = ms
+            else:
+                self.avg_ms += STAGE_EWMA_ALPHA * (ms - self.avg_ms)
+            self.max_ms = max(self.max_ms, ms)
+            self.count += 1
+    
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"avg_ms": round(self.avg_ms, 2), "max_ms": round(self.max_ms, 2), "count": self.count}
+
+
+class CapturePipeline:
+    """
+    Стадии конвертации, кодирования и отправки захваченных кадров
+    
+    Использование:
+        pipeline = CapturePipeline(convert, encode, send)
+        pipeline.start()
+        pipeline.submit(raw, grab_seconds)   # из потока захвата, не блокирует
+        pipeline.stop()
+    
+    convert(raw) -> кадр или None (кадр не нужен: экран не изменился);
+    encode(frame, frame_id) -> bytes или None (ошибка кодирования);
+    send(data, frame_id) - рассылка.
+    
+    Кодировщик с состоянием (дельты плиток ссылаются на предыдущий кадр)
+    требует workers=1 - кадры кодируются по одному и по порядку.
+    """
+    
+    def __init__(self, convert: Callable[[Any], Any], encode: Callable[[Any, int], Optional[bytes]],
+                 send: Callable[[bytes, int], None], workers: int = ENCODE_WORKERS,
+                 queue_size: int = CAPTURE_QUEUE_SIZE):
+        self.convert = convert
+        self.encode = encode
+        self.send = send
+        self.workers = max(1, workers)
+        
+        self._captured: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        # Futures в порядке номеров кадров: отправка ждет их по очереди
+        self._encoding: queue.Queue = queue.Queue(maxsize=self.workers * ENCODE_QUEUE_PER_WORKER)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._threads = []
+        self._running = False
+        self._next_id = 0
+        
+        self.timers = {stage: StageTimer() for stage in STAGES}
+        
+        # Статистика
+        self.frames_sent = 0
+        self.stale_frames = 0  # Выброшены захватом: конвертация не успевала
+        self.skipped_frames = 0  # Не нужны (convert вернул None)
+        self.encode_errors = 0
+        self.send_errors = 0
+    
+    def start(self):
+        """Запустить потоки стадий"""
+        if self._running:
+            return
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="screen-encode")
+        self._threads = [
+            threading.Thread(target=self._convert_loop, name="screen-convert", daemon=True),
+            threading.Thread(target=self._send_loop, name="screen-send", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Конвейер захвата запущен, потоков кодирования: {self.workers}")
+    
+    def stop(self, timeout: float = 2.0):
+        """Остановить стадии; кадры в очередях не отправляются"""
+        if not self._running:
+            return
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+    
+    def submit(self, raw: Any, grab_seconds: float = 0.0, captured_at: Optional[float] = None) -> bool:
+        """
+        Захваченный кадр в конвейер (из потока захвата)
+        
+        Никогда не ждет: очередь полна - выбрасывается самый старый кадр.
+        
+        Returns:
+            False если пришлось выбросить кадр
+        """
+        if captured_at is None:
+            captured_at = time.perf_counter() - grab_seconds
+        self.timers["capture"].record(grab_seconds)
+        item = (raw, captured_at)
+        try:
+            self._captured.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self._captured.get_nowait()
+        except queue.Empty:
+            pass
+        self.stale_frames += 1
+        self._captured.put_nowait(item)  # Кладет только поток захвата - место есть
+        return False
+    
+    def _convert_loop(self):
+        while self._running:
+            try:
+                raw, captured_at = self._captured.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            
+            try:
+                start = time.perf_counter()
+                frame = self.convert(raw)
+                self.timers["convert"].record(time.perf_counter() - start)
+            except Exception as e:
+                logger.error(f"Ошибка конвертации кадра: {e}")
+                continue
+            if frame is None:
+                self.skipped_frames += 1
+                continue
+            
+            frame_id = self._next_id
+            self._next_id += 1
+            try:
+                future = self._executor.submit(self._encode, frame, frame_id)
+            except RuntimeError:
+                return  # Пул уже остановлен
+            
+            # Отправка не успевает - ждем здесь, а не в захвате
+            while self._running:
+                try:
+                    self._encoding.put((future, frame_id, captured_at), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    
+    def _encode(self, frame: Any, frame_id: int) -> Optional[bytes]:
+        start = time.perf_counter()
+        data = self.encode(frame, frame_id)
+        self.timers["encode"].record(time.perf_counter() - start)
+        return data
+    
+    def _send_loop(self):
+        while self._running:
+            try:
+                future, frame_id, captured_at = self._encoding.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            
+            data = self._result(future)
+            if data is None:
+                self.encode_errors += 1
+                continue
+            
+            try:
+                start = time.perf_counter()
+                self.send(data, frame_id)
+                now = time.perf_counter()
+                self.timers["send"].record(now - start)
+                self.timers["total"].record(now - captured_at)
+                self.frames_sent += 1
+            except Exception as e:
+                self.send_errors += 1
+                logger.error(f"Ошибка отправки кадра: {e}")
+    
+    def _result(self, future: Future) -> Optional[bytes]:
+        """Результат кодирования (ждем, пока конвейер работает)"""
+        while self._running:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeout:
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка кодирования кадра: {e}")
+                return None
+        return None
+    
+    def get_stats(self) -> dict:
+        """Задержки стадий и потери"""
+        return {
+            "workers": self.workers,
+            "frames_sent": self.frames_sent,
+            "stale_frames": self.stale_frames,
+            "skipped_frames": self.skipped_frames,
+            "encode_errors": self.encode_errors,
+            "send_errors": self.send_errors,
+            "queued": self._captured.qsize() + self._encoding.qsize(),
+            "stages": {stage: timer.get_stats() for stage, timer in self.timers.items()}
+        }
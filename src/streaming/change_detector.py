@@ -0,0 +1,125 @@
+"""
+Обнаружение неподвижного экрана
+
+Пока на экране слайд, ScreenCapture 24 раза в секунду конвертирует,
+уменьшает и кодирует один и тот же кадр. ChangeDetector считает
+контрольную сумму каждой STATIC_SAMPLE_STRIDE-й строки захваченного
+кадра (BGRA, до cvtColor/resize) - около 1 мс на 1080p против десятков
+мс конвертации и JPEG. Сумма не изменилась - кадр не кодируется и не
+отправляется.
+
+Вместо кадров раз в STATIC_KEEPALIVE_INTERVAL уходит SCREEN_KEEPALIVE с
+номером последнего кадра: студент видит, что трансляция жива, и по
+номеру замечает, что последний кадр до него не дошел. Раз в
+STATIC_REFRESH_INTERVAL кадр отправляется все равно - подключившиеся
+студенты и изменения тоньше шага строк.
+"""
+
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+
+# Шаг строк контрольной суммы (буква текста выше 4 пикселей)
+STATIC_SAMPLE_STRIDE = 4
+# Пока экран не меняется - SCREEN_KEEPALIVE не реже, сек
+STATIC_KEEPALIVE_INTERVAL = 1.0
+# Неподвижный экран все равно отправляется не реже, сек
+STATIC_REFRESH_INTERVAL = 5.0
+
+# Решения check()
+FRAME = "frame"          # Кодировать и отправить
+KEEPALIVE = "keepalive"  # Не изменился, пора сообщить, что трансляция жива
+SKIP = "skip"            # Не изменился
+
+
+class ChangeDetector:
+    """
+    Изменился ли захваченный кадр
+    
+    Использование:
+        detector = ChangeDetector()
+        action = detector.check(screenshot)  # FRAME, KEEPALIVE или SKIP
+    
+    enabled=False - каждый кадр FRAME (запись урока хранит все кадры).
+    """
+    
+    def __init__(self, stride: int = STATIC_SAMPLE_STRIDE,
+                 keepalive_interval: float = STATIC_KEEPALIVE_INTERVAL,
+                 refresh_interval: float = STATIC_REFRESH_INTERVAL):
+        self.stride = max(1, stride)
+        self.keepalive_interval = keepalive_interval
+        self.refresh_interval = refresh_interval
+        self.enabled = True
+        
+        self._digest: Optional[tuple] = None
+        self._last_frame = float('-inf')
+        self._last_keepalive = float('-inf')
+        self._refresh_requested = False
+        
+        # Статистика
+        self._stats = {
+            'frames': 0,
+            'unchanged': 0,
+            'keepalives': 0,
+            'refreshes': 0  # Неподвижный кадр отправлен по интервалу или запросу
+        }
+    
+    def request_refresh(self):
+        """Следующий кадр отправить, даже если экран не изменился"""
+        self._refresh_requested = True
+    
+    def check(self, frame, now: Optional[float] = None) -> str:
+        """
+        Решить, что делать с захваченным кадром
+        
+        Args:
+            frame: Захваченный кадр (mss ScreenShot или массив высота x ширина x каналы)
+        
+        Returns:
+            FRAME, KEEPALIVE или SKIP
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        if not self.enabled:
+            self._digest = None
+            return self._frame(now)
+        
+        digest = self._checksum(frame)
+        changed = digest != self._digest
+        self._digest = digest
+        if changed:
+            return self._frame(now)
+        
+        if self._refresh_requested or now - self._last_frame >= self.refresh_interval:
+            self._stats['refreshes'] += 1
+            return self._frame(now)
+        
+        self._stats['unchanged'] += 1
+        if now - self._last_keepalive >= self.keepalive_interval:
+            self._last_keepalive = now
+            self._stats['keepalives'] += 1
+            return KEEPALIVE
+        return SKIP
+    
+    def _frame(self, now: float) -> str:
+        self._last_frame = now
+        self._last_keepalive = now  # Кадр тоже говорит, что трансляция жива
+        self._refresh_requested = False
+        self._stats['frames'] += 1
+        return FRAME
+    
+    def _checksum(self, frame) -> tuple:
+        """CRC32 каждой stride-й строки (без копии всего кадра) и размер"""
+        pixels = np.asarray(frame)
+        sample = np.ascontiguousarray(pixels[::self.stride])
+        return pixels.shape, zlib.crc32(sample)
+    
+    def get_stats(self) -> dict:
+        """Статистика: сколько кадров не пришлось кодировать"""
+        stats = self._stats.copy()
+        total = stats['frames'] + stats['unchanged']
+        stats['unchanged_ratio'] = round(stats['unchanged'] / total, 3) if total else 0.0
+        return stats
@@ -0,0 +1,370 @@
+"""
+Курсор преподавателя отдельным каналом
+
+Преподаватель водит мышью по слайду - а меняется только курсор. Если
+рисовать его в кадре, каждый кадр кодируется и уходит заново. mss
+снимает экран без курсора, а курсор идет отдельно:
+- SCREEN_CURSOR - позиция (доли кадра 0..CURSOR_SCALE, не зависят от
+  разрешения трансляции) и ключ формы, до CURSOR_RATE раз в секунду,
+  только когда что-то изменилось (и раз в CURSOR_KEEPALIVE - для
+  подключившихся); несколько десятков байт
+- SCREEN_CURSOR_SHAPE - форма: PNG с прозрачностью и точка касания,
+  ключ - хэш изображения. Преподаватель рассылает новую форму один раз,
+  студент хранит формы по ключу и просит незнакомую тем же сообщением
+
+Студент рисует курсор сам поверх кадра (CursorReceiver.place()).
+
+Позиция и форма системного курсора - только Windows (GetCursorInfo,
+DrawIconEx); без формы - стрелка arrow_shape().
+"""
+
+import logging
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Флаг доступности
+CURSOR_CAPTURE_AVAILABLE = False
+
+try:
+    import sys
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+        CURSOR_CAPTURE_AVAILABLE = True
+except ImportError:
+    pass
+
+# Опрос курсора, раз в секунду
+CURSOR_RATE = 60
+# Позиция повторяется не реже, сек (подключившиеся, выброшенные очередью)
+CURSOR_KEEPALIVE = 1.0
+# Координаты - доли кадра, умноженные на это число
+CURSOR_SCALE = 65535
+# Ключ формы "курсор скрыт или вне транслируемого экрана"
+CURSOR_HIDDEN = 0
+# Форм в кэше, не больше
+CURSOR_SHAPE_CACHE = 64
+# Студент повторяет запрос формы не чаще, сек
+CURSOR_SHAPE_REQUEST_HOLD = 1.0
+
+
+@dataclass
+class CursorShape:
+    """Форма курсора: BGRA и точка касания"""
+    image: np.ndarray  # (высота, ширина, 4)
+    hotspot: Tuple[int, int]
+    
+    @property
+    def key(self) -> int:
+        """Хэш изображения и точки касания (не CURSOR_HIDDEN)"""
+        digest = zlib.crc32(struct.pack('!HHHH', *self.hotspot, *self.image.shape[:2]))
+        return zlib.crc32(self.image.tobytes(), digest) or 1
+    
+    def to_message(self) -> Tuple[Dict, bytes]:
+        """Данные SCREEN_CURSOR_SHAPE и вложение (PNG)"""
+        _, buffer = cv2.imencode('.png', self.image)
+        return {"shape": self.key, "hotspot": list(self.hotspot)}, buffer.tobytes()
+    
+    @classmethod
+    def from_message(cls, data: Dict, image: bytes) -> Optional['CursorShape']:
+        decoded = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_UNCHANGED)
+        if decoded is None or decoded.ndim != 3 or decoded.shape[2] != 4:
+            return None
+        hotspot = data.get("hotspot") or (0, 0)
+        return cls(decoded, (int(hotspot[0]), int(hotspot[1])))
+
+
+def arrow_shape() -> CursorShape:
+    """Стрелка: черная с белой обводкой (форма системного курсора недоступна)"""
+    image = np.zeros((22, 14, 4), dtype=np.uint8)
+    outline = np.array([[1, 1], [1, 17], [5, 13], [8, 20], [10, 19], [7, 12], [12, 12]], dtype=np.int32)
+    cv2.fillPoly(image, [outline], (0, 0, 0, 255))
+    cv2.polylines(image, [outline], True, (255, 255, 255, 255), 1)
+    return CursorShape(image, (1, 1))
+
+
+def read_system_cursor() -> Optional[Tuple[int, int, bool, int]]:
+    """Системный курсор (Windows): x, y на экране, виден ли, дескриптор формы"""
+    if not CURSOR_CAPTURE_AVAILABLE:
+        return None
+    
+    try:
+        class CURSORINFO(ctypes.Structure):
+            _fields_ = [
+                ('cbSize', wintypes.DWORD),
+                ('flags', wintypes.DWORD),
+                ('hCursor', wintypes.HANDLE),
+                ('ptScreenPos', wintypes.POINT)
+            ]
+        
+        info = CURSORINFO()
+        info.cbSize = ctypes.sizeof(CURSORINFO)
+        if not ctypes.windll.user32.GetCursorInfo(ctypes.byref(info)):
+            return None
+        showing = bool(info.flags & 0x1)  # CURSOR_SHOWING
+        return info.ptScreenPos.x, info.ptScreenPos.y, showing, info.hCursor or 0
+    except Exception as e:
+        logger.debug(f"Ошибка чтения курсора: {e}")
+        return None
+
+
+def read_cursor_shape(handle: int) -> Optional[CursorShape]:
+    """
+    Форма системного курсора (Windows) по дескриптору
+    
+    Курсор рисуется (DrawIconEx) на черном и на белом фоне: по разнице -
+    прозрачность, по черному фону - цвет. Инвертирующие курсоры (I-beam)
+    получаются черными.
+    """
+    if not CURSOR_CAPTURE_AVAILABLE or not handle:
+        return None
+    
+    class ICONINFO(ctypes.Structure):
+        _fields_ = [
+            ('fIcon', wintypes.BOOL),
+            ('xHotspot', wintypes.DWORD),
+            ('yHotspot', wintypes.DWORD),
+            ('hbmMask', wintypes.HBITMAP),
+            ('hbmColor', wintypes.HBITMAP)
+        ]
+    
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [
+            ('biSize', wintypes.DWORD),
+            ('biWidth', wintypes.LONG),
+            ('biHeight', wintypes.LONG),
+            ('biPlanes', wintypes.WORD),
+            ('biBitCount', wintypes.WORD),
+            ('biCompression', wintypes.DWORD),
+            ('biSizeImage', wintypes.DWORD),
+            ('biXPelsPerMeter', wintypes.LONG),
+            ('biYPelsPerMeter', wintypes.LONG),
+            ('biClrUsed', wintypes.DWORD),
+            ('biClrImportant', wintypes.DWORD)
+        ]
+    
+    user32 = ctypes.windll.user32
+    gdi32 = ctypes.windll.gdi32
+    gdi32.CreateCompatibleDC.restype = wintypes.HDC
+    gdi32.CreateDIBSection.restype = wintypes.HBITMAP
+    gdi32.SelectObject.restype = wintypes.HGDIOBJ
+    gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+    gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+    gdi32.DeleteDC.argtypes = [wintypes.HDC]
+    user32.GetIconInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p]
+    user32.DrawIconEx.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.HANDLE,
+                                  ctypes.c_int, ctypes.c_int, wintypes.UINT, wintypes.HANDLE, wintypes.UINT]
+    
+    info = ICONINFO()
+    if not user32.GetIconInfo(handle, ctypes.byref(info)):
+        return None
+    for bitmap in (info.hbmMask, info.hbmColor):
+        if bitmap:
+            gdi32.DeleteObject(bitmap)
+    
+    size = user32.GetSystemMetrics(13) or 32  # SM_CXCURSOR
+    header = BITMAPINFOHEADER()
+    header.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+    header.biWidth = size
+    header.biHeight = -size  # Сверху вниз
+    header.biPlanes = 1
+    header.biBitCount = 32
+    
+    hdc = gdi32.CreateCompatibleDC(None)
+    bits = ctypes.c_void_p()
+    bitmap = gdi32.CreateDIBSection(hdc, ctypes.byref(header), 0, ctypes.byref(bits), None, 0)
+    if not bitmap or not bits.value:
+        gdi32.DeleteDC(hdc)
+        return None
+    previous = gdi32.SelectObject(hdc, bitmap)
+    
+    def render(background: int) -> np.ndarray:
+        ctypes.memset(bits, background, size * size * 4)
+        user32.DrawIconEx(hdc, 0, 0, handle, size, size, 0, None, 0x3)  # DI_NORMAL
+        buffer = (ctypes.c_ubyte * (size * size * 4)).from_address(bits.value)
+        return np.frombuffer(buffer, np.uint8).reshape(size, size, 4)[:, :, :3].astype(np.int16)
+    
+    try:
+        on_black = render(0)
+        on_white = render(255)
+    finally:
+        gdi32.SelectObject(hdc, previous)
+        gdi32.DeleteObject(bitmap)
+        gdi32.DeleteDC(hdc)
+    
+    alpha = np.clip(255 - (on_white - on_black).max(axis=2), 0, 255)
+    color = np.where(alpha[:, :, None] > 0, on_black * 255 // np.maximum(alpha, 1)[:, :, None], 0)
+    image = np.dstack([np.clip(color, 0, 255), alpha]).astype(np.uint8)
+    
+    # Пустые поля справа и снизу не нужны
+    rows, cols = np.nonzero(alpha)
+    if not len(rows):
+        return None
+    image = image[:rows.max() + 1, :cols.max() + 1]
+    return CursorShape(np.ascontiguousarray(image), (info.xHotspot, info.yHotspot))
+
+
+class CursorTracker:
+    """
+    Курсор преподавателя: что отправить студентам
+        
+        tracker = CursorTracker()
+        update, shape = tracker.poll(monitor)  # monitor - область mss
+        if shape: ...     # SCREEN_CURSOR_SHAPE всем (shape.to_message())
+        if update: ...    # SCREEN_CURSOR всем
+    
+    source() - (x, y, виден, дескриптор формы) или None (по умолчанию
+    read_system_cursor); shape_reader(дескриптор) - CursorShape или None
+    (по умолчанию read_cursor_shape, без формы - стрелка).
+    """
+    
+    def __init__(self, source: Optional[Callable[[], Optional[tuple]]] = None,
+                 shape_reader: Optional[Callable[[int], Optional[CursorShape]]] = None):
+        self.source = source or read_system_cursor
+        self.shape_reader = shape_reader or read_cursor_shape
+        
+        self.shapes: Dict[int, CursorShape] = {}  # Ключ -> форма (ответы на запросы)
+        self._keys: Dict[int, int] = {}  # Дескриптор -> ключ
+        self._last: Optional[tuple] = None
+        self._last_sent = float('-inf')
+        
+        self._stats = {
+            'polls': 0,
+            'updates': 0,
+            'shapes': 0
+        }
+    
+    def poll(self, monitor: Dict, now: Optional[float] = None) -> Tuple[Optional[Dict], Optional[CursorShape]]:
+        """
+        Опросить курсор
+        
+        Args:
+            monitor: Транслируемая область экрана (left, top, width, height)
+        
+        Returns:
+            (данные SCREEN_CURSOR или None - не изменился, новая форма или None)
+        """
+        if now is None:
+            now = time.monotonic()
+        self._stats['polls'] += 1
+        
+        state = self.source()
+        shape = None
+        key = CURSOR_HIDDEN
+        x = y = 0
+        if state:
+            screen_x, screen_y, visible, handle = state
+            left, top = screen_x - monitor['left'], screen_y - monitor['top']
+            if visible and 0 <= left < monitor['width'] and 0 <= top < monitor['height']:
+                key, shape = self._shape_key(handle)
+                x = left * CURSOR_SCALE // max(1, monitor['width'] - 1)
+                y = top * CURSOR_SCALE // max(1, monitor['height'] - 1)
+        
+        current = (x, y, key)
+        if current == self._last and now - self._last_sent < CURSOR_KEEPALIVE:
+            return None, shape
+        self._last = current
+        self._last_sent = now
+        self._stats['updates'] += 1
+        return {"x": x, "y": y, "shape": key}, shape
+    
+    def _shape_key(self, handle: int) -> Tuple[int, Optional[CursorShape]]:
+        """Ключ формы дескриптора; форма - если встретилась впервые"""
+        key = self._keys.get(handle)
+        if key is not None:
+            return key, None
+        
+        shape = self.shape_reader(handle) or arrow_shape()
+        key = shape.key
+        self._keys[handle] = key
+        if key in self.shapes:
+            return key, None
+        
+        self.shapes[key] = shape
+        if len(self.shapes) > CURSOR_SHAPE_CACHE:
+            evicted = next(iter(self.shapes))
+            del self.shapes[evicted]
+            # Дескрипторы выброшенной формы - снова через shape_reader (и рассылку формы)
+            self._keys = {known: value for known, value in self._keys.items() if value != evicted}
+        self._stats['shapes'] += 1
+        return key, shape
+    
+    def get_stats(self) -> dict:
+        """Статистика опроса"""
+        stats = self._stats.copy()
+        stats['cached_shapes'] = len(self.shapes)
+        return stats
+
+
+class CursorReceiver:
+    """
+    Курсор преподавателя у студента
+    
+    process() - SCREEN_CURSOR, process_shape() - SCREEN_CURSOR_SHAPE.
+    Незнакомая форма - on_shape_needed(ключ), например
+    lambda key: client.send_message(MessageType.SCREEN_CURSOR_SHAPE, {"shape": key})
+    """
+    
+    def __init__(self):
+        self.shapes: Dict[int, CursorShape] = {}
+        self.position: Optional[Tuple[float, float]] = None  # Доли кадра; None - скрыт
+        self.shape_key = CURSOR_HIDDEN
+        self.on_shape_needed: Optional[Callable[[int], None]] = None
+        self._requested: Dict[int, float] = {}
+        
+        self.updates_received = 0
+    
+    @property
+    def shape(self) -> Optional[CursorShape]:
+        """Текущая форма (None - скрыт или форма еще не пришла)"""
+        return self.shapes.get(self.shape_key)
+    
+    def process(self, data: Dict, now: Optional[float] = None):
+        """SCREEN_CURSOR: позиция и ключ формы"""
+        self.updates_received += 1
+        self.shape_key = int(data.get("shape", CURSOR_HIDDEN))
+        if self.shape_key == CURSOR_HIDDEN:
+            self.position = None
+            return
+        self.position = (data.get("x", 0) / CURSOR_SCALE, data.get("y", 0) / CURSOR_SCALE)
+        
+        if self.shape_key not in self.shapes and self.on_shape_needed:
+            if now is None:
+                now = time.monotonic()
+            if now - self._requested.get(self.shape_key, float('-inf')) >= CURSOR_SHAPE_REQUEST_HOLD:
+                self._requested[self.shape_key] = now
+                self.on_shape_needed(self.shape_key)
+    
+    def process_shape(self, data: Dict, image: bytes) -> Optional[CursorShape]:
+        """SCREEN_CURSOR_SHAPE: форма в кэш"""
+        shape = CursorShape.from_message(data, image)
+        if shape is None:
+            logger.warning("Не удалось декодировать форму курсора")
+            return None
+        self.shapes[shape.key] = shape
+        self._requested.pop(shape.key, None)
+        if len(self.shapes) > CURSOR_SHAPE_CACHE:
+            del self.shapes[next(iter(self.shapes))]
+        return shape
+    
+    def place(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """Левый верхний угол формы на кадре width x height (None - не рисовать)"""
+        shape = self.shape
+        if self.position is None or shape is None:
+            return None
+        x = round(self.position[0] * (width - 1)) - shape.hotspot[0]
+        y = round(self.position[1] * (height - 1)) - shape.hotspot[1]
+        return x, y
+    
+    def clear(self):
+        """Трансляция остановлена - курсор скрыт (формы остаются в кэше)"""
+        self.position = None
+        self.shape_key = CURSOR_HIDDEN
@@ -0,0 +1,167 @@
+"""
+JPEG кадра в пределах бюджета байт
+
+С постоянным качеством кадр со слайдом - 40 KB, а с видео в браузере -
+300 KB: пейсер multicast не успевает, кадр режется на сотни фрагментов,
+медиа очередь TCP переполняется. JpegBudgetEncoder выбирает качество
+каждого кадра так, чтобы JPEG уложился в бюджет (не выше max_quality).
+
+Предсказание качества - без пробных кодирований:
+- сложность кадра - средний градиент уменьшенного серого кадра
+- размер при качестве прошлого кадра ~ размер прошлого * отношение сложностей
+- размер от качества ~ exp(slope * quality); slope уточняется по парам
+  кодирований одного кадра
+
+Промахнулись (больше бюджета на BUDGET_TOLERANCE или намного меньше при
+запасе качества) - одно перекодирование с поправкой, не больше.
+"""
+
+import logging
+import math
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Качество не ниже (текст еще читается)
+BUDGET_MIN_QUALITY = 30
+# Целимся в эту долю бюджета - небольшая ошибка предсказания не выходит за бюджет
+BUDGET_AIM = 0.85
+# Перекодировать, если больше бюджета в столько раз...
+BUDGET_TOLERANCE = 1.1
+# ...или меньше этой доли бюджета, а качество можно поднять
+BUDGET_UNDERSHOOT = 0.5
+# Наклон ln(размер) по качеству: начальный и пределы
+BUDGET_SLOPE = 0.025
+BUDGET_SLOPE_RANGE = (0.005, 0.08)
+# Сложность кадра считается на кадре, уменьшенном во столько раз
+BUDGET_COMPLEXITY_SCALE = 4
+
+
+def frame_complexity(frame: np.ndarray) -> float:
+    """Средний градиент яркости уменьшенного кадра (~0.5 мс на 1280x720)"""
+    height, width = frame.shape[:2]
+    small = cv2.resize(frame, (max(1, width // BUDGET_COMPLEXITY_SCALE), max(1, height // BUDGET_COMPLEXITY_SCALE)),
+                       interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    dx = cv2.absdiff(gray[:, 1:], gray[:, :-1])
+    dy = cv2.absdiff(gray[1:, :], gray[:-1, :])
+    return float(cv2.mean(dx)[0] + cv2.mean(dy)[0]) + 1.0  # +1: однотонный кадр не делит на ноль
+
+
+class JpegBudgetEncoder:
+    """
+    JPEG с качеством под бюджет кадра
+        
+        encoder = JpegBudgetEncoder(budget=60_000, max_quality=70)
+        data = encoder.encode(frame)  # frame - BGR
+    
+    Потокобезопасен: кадры кодируются параллельно (CapturePipeline), общая
+    только модель размера.
+    """
+    
+    def __init__(self, budget: int, max_quality: int, min_quality: int = BUDGET_MIN_QUALITY):
+        self.budget = budget
+        self.max_quality = max_quality
+        self.min_quality = min(min_quality, max_quality)
+        
+        # Модель: прошлый кадр (качество, размер, сложность) и наклон кривой
+        self._lock = threading.Lock()
+        self._last: Optional[tuple] = None
+        self.slope = BUDGET_SLOPE
+        
+        self._stats = {
+            'frames': 0,
+            'reencodes': 0,
+            'over_budget': 0,  # Не уложились и после перекодирования
+            'bytes': 0,
+            'quality_sum': 0,
+            'max_bytes': 0
+        }
+    
+    def _clamp(self, quality: float) -> int:
+        return int(min(self.max_quality, max(self.min_quality, round(quality))))
+    
+    def predict(self, complexity: float) -> int:
+        """Качество, при котором кадр такой сложности уложится в бюджет"""
+        with self._lock:
+            if self._last is None:
+                return self.max_quality
+            quality, size, last_complexity = self._last
+            slope = self.slope
+        expected = size * complexity / last_complexity
+        return self._clamp(quality + math.log(self.budget * BUDGET_AIM / expected) / slope)
+    
+    def encode(self, frame: np.ndarray, frame_id: int = 0) -> bytes:
+        """
+        Закодировать кадр (frame_id - для общего интерфейса кодировщиков)
+        
+        Returns:
+            JPEG; больше бюджета, только если не помогло и min_quality
+        """
+        complexity = frame_complexity(frame)
+        quality = self.predict(complexity)
+        data = self._jpeg(frame, quality)
+        
+        size = len(data)
+        retry = None
+        if size > self.budget * BUDGET_TOLERANCE and quality > self.min_quality:
+            retry = self._correct(quality, size, down=True)
+        elif size < self.budget * BUDGET_UNDERSHOOT and quality < self.max_quality:
+            retry = self._correct(quality, size, down=False)
+        
+        reencoded = retry is not None and retry != quality
+        if reencoded:
+            second = self._jpeg(frame, retry)
+            self._learn_slope(quality, size, retry, len(second))
+            # Вверх - только если второй вариант уложился в бюджет
+            if retry < quality or len(second) <= self.budget:
+                data, quality = second, retry
+        
+        with self._lock:
+            self._last = (quality, len(data), complexity)
+            self._stats['frames'] += 1
+            self._stats['reencodes'] += int(reencoded)
+            self._stats['bytes'] += len(data)
+            self._stats['quality_sum'] += quality
+            self._stats['max_bytes'] = max(self._stats['max_bytes'], len(data))
+            if len(data) > self.budget * BUDGET_TOLERANCE:
+                self._stats['over_budget'] += 1
+        return data
+    
+    def _correct(self, quality: int, size: int, down: bool) -> int:
+        """Качество второй попытки по размеру первой"""
+        corrected = self._clamp(quality + math.log(self.budget * BUDGET_AIM / size) / self.slope)
+        if down and corrected >= quality:
+            corrected = quality - 1
+        return self._clamp(corrected)
+    
+    def _learn_slope(self, quality: int, size: int, other_quality: int, other_size: int):
+        """Наклон кривой по двум кодированиям одного кадра"""
+        if quality == other_quality or size <= 0 or other_size <= 0:
+            return
+        observed = math.log(size / other_size) / (quality - other_quality)
+        low, high = BUDGET_SLOPE_RANGE
+        with self._lock:
+            self.slope = min(high, max(low, self.slope + 0.5 * (observed - self.slope)))
+    
+    @staticmethod
+    def _jpeg(frame: np.ndarray, quality: int) -> bytes:
+        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return buffer.tobytes()
+    
+    def get_stats(self) -> dict:
+        """Статистика: средние размер и качество, доля перекодирований"""
+        stats = self._stats.copy()
+        frames = stats.pop('frames')
+        quality_sum = stats.pop('quality_sum')
+        stats['frames'] = frames
+        stats['budget'] = self.budget
+        stats['avg_bytes'] = stats['bytes'] // frames if frames else 0
+        stats['avg_quality'] = round(quality_sum / frames, 1) if frames else 0.0
+        stats['reencode_ratio'] = round(stats['reencodes'] / frames, 3) if frames else 0.0
+        stats['slope'] = round(self.slope, 4)
+        return stats
@@ -0,0 +1,291 @@
+"""
+Адаптация трансляции экрана по обратной связи студентов
+
+PerformanceManager выбирает профиль один раз - по числу студентов. Сеть
+и машины студентов во время урока меняются: кто-то качает обновления,
+на старом нетбуке не успевает декодирование. RateController держит
+профиль как потолок и во время трансляции двигается по лестнице
+уровней (качество JPEG, частота кадров, разрешение) вниз и обратно.
+
+Сигналы:
+- студенты раз в FEEDBACK_INTERVAL шлют SCREEN_FEEDBACK (ScreenReceiver.
+  get_feedback()): время декодирования, потери кадров, принятый трафик
+- очередь медиа TCP у преподавателя по каждому студенту (update_queues) -
+  кадры в ней ждут отправки, это задержка
+- отправленный трафик трансляции против целевого битрейта
+
+Гистерезис: вниз - только если перегрузка держится RATE_DOWN_CONFIRM
+проверок подряд; вверх - после RATE_UP_HOLD секунд без перегрузки.
+Неудачная попытка вверх (сразу пришлось обратно) удваивает ожидание до
+RATE_UP_HOLD_MAX - качество не "дребезжит". Все решения - в лог и в
+get_stats()["decisions"].
+"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.core.performance_manager import PerformanceProfile
+from src.network.multicast import max_bitrate_from_config
+
+logger = logging.getLogger(__name__)
+
+# Студент сообщает о приеме трансляции раз в столько секунд
+FEEDBACK_INTERVAL = 2.0
+# Отчет старше - студент не учитывается (отключился или завис)
+FEEDBACK_TIMEOUT = 3 * FEEDBACK_INTERVAL
+
+# Ступени лестницы: частота кадров (доли потолка), качество JPEG, разрешения
+RATE_FPS_STEPS = (1.0, 0.75, 0.5)
+RATE_MIN_FPS = 5
+RATE_QUALITY_STEP = 10
+RATE_MIN_QUALITY = 40
+RATE_RESOLUTIONS = [(1920, 1080), (1280, 720), (854, 480), (640, 360)]
+
+# Студент перегружен: потеряно больше этой доли кадров, задержка больше,
+# мс, или декодирование дольше этой доли интервала кадра
+RATE_MAX_LOSS = 0.05
+RATE_TARGET_LATENCY_MS = 200
+RATE_DECODE_BUDGET = 0.5
+# Вниз, если перегружено не меньше этой доли студентов (один слабый
+# нетбук не портит картинку всему классу - для него simulcast и TCP)
+RATE_CONGESTED_SHARE = 0.25
+# Вниз - после стольких проверок подряд с перегрузкой, не чаще раза в RATE_DOWN_HOLD сек
+RATE_DOWN_CONFIRM = 2
+RATE_DOWN_HOLD = 2.0
+# Вверх - после стольких секунд без перегрузки; после неудачной попытки - вдвое дольше
+RATE_UP_HOLD = 10.0
+RATE_UP_HOLD_MAX = 120.0
+# Сглаживание измеренного трафика
+RATE_EWMA_ALPHA = 0.3
+# Последних решений в статистике
+RATE_HISTORY = 20
+
+
+@dataclass
+class RateLevel:
+    """Ступень лестницы: параметры кодирования трансляции"""
+    quality: int
+    fps: int
+    resolution: tuple  # (width, height)
+    
+    @property
+    def cost(self) -> float:
+        """Относительный трафик (модель PerformanceManager.calculate_bandwidth)"""
+        return self.resolution[0] * self.resolution[1] * self.quality * self.fps
+    
+    def __str__(self) -> str:
+        return f"{self.resolution[0]}x{self.resolution[1]}@{self.fps} q{self.quality}"
+
+
+def build_ladder(quality: int, fps: int, resolution: tuple) -> List[RateLevel]:
+    """
+    Лестница от потолка вниз
+    
+    Сначала снижается частота кадров (экранный контент почти неподвижен),
+    потом качество JPEG (артефакты на тексте), последним - разрешение.
+    """
+    ladder = [RateLevel(quality, fps, tuple(resolution))]
+    for share in RATE_FPS_STEPS[1:]:
+        step_fps = max(RATE_MIN_FPS, round(fps * share))
+        if step_fps < ladder[-1].fps:
+            ladder.append(RateLevel(quality, step_fps, ladder[-1].resolution))
+    
+    step_quality = quality - RATE_QUALITY_STEP
+    while step_quality >= RATE_MIN_QUALITY:
+        ladder.append(RateLevel(step_quality, ladder[-1].fps, ladder[-1].resolution))
+        step_quality -= RATE_QUALITY_STEP
+    
+    pixels = resolution[0] * resolution[1]
+    for step_resolution in RATE_RESOLUTIONS:
+        if step_resolution[0] * step_resolution[1] < pixels:
+            ladder.append(RateLevel(ladder[-1].quality, ladder[-1].fps, step_resolution))
+    return ladder
+
+
+class RateController:
+    """
+    Замкнутый контур качества трансляции
+        
+        controller = RateController(capture, PerformanceManager.get_profile_for_students(n))
+        controller.report(student_id, data)     # SCREEN_FEEDBACK
+        controller.update_queues(media_depths)  # очереди TCP, раз в секунду
+        controller.tick()                       # раз в секунду: решение
+    
+    capture - ScreenCapture или ScreenCaptureOptimized (set_encoding(),
+    bytes_sent). Потолок - профиль, но не выше настроек захвата.
+    
+    enabled=False - уровень не меняется (запись урока: кадры без меток
+    времени и одного размера).
+    """
+    
+    def __init__(self, capture, profile: PerformanceProfile, target_mbps: Optional[float] = None,
+                 now: Optional[float] = None):
+        """
+        Args:
+            target_mbps: Целевой трафик трансляции (None - предел multicast
+                         из config.ini; 0 - без предела, только по студентам)
+        """
+        self.capture = capture
+        self.enabled = True
+        if target_mbps is None:
+            target_mbps = max_bitrate_from_config()
+        self.target_bps = target_mbps * 1_000_000
+        
+        quality = min(profile.screen_quality, capture.jpeg_quality)
+        fps = min(profile.screen_fps, capture.target_fps)
+        resolution = min(profile.screen_resolution, tuple(capture.target_resolution),
+                         key=lambda size: size[0] * size[1])
+        self.ladder = build_ladder(quality, fps, resolution)
+        self.level = 0
+        
+        self._reports: Dict[str, dict] = {}
+        self._queues: Dict[str, int] = {}
+        
+        if now is None:
+            now = time.monotonic()
+        self.bitrate = 0.0  # Измеренный трафик трансляции, бит/с
+        self._bytes = capture.bytes_sent
+        self._last_tick = now
+        self._changed_at = now
+        self._calm_since = now  # Без перегрузки с этого момента
+        self._congested_ticks = 0
+        self.up_hold = RATE_UP_HOLD
+        self._probe_at: Optional[float] = None  # Время последнего шага вверх
+        
+        self.decisions = deque(maxlen=RATE_HISTORY)
+        self._apply()
+    
+    def report(self, student_id: str, data: Dict, now: Optional[float] = None):
+        """SCREEN_FEEDBACK от студента"""
+        report = dict(data)
+        report["time"] = time.monotonic() if now is None else now
+        self._reports[student_id] = report
+    
+    def update_queues(self, depths: Dict[str, int]):
+        """Кадров в очереди медиа TCP по студентам (TeacherServer.get_stats()["send_queues"])"""
+        self._queues = dict(depths)
+    
+    def remove_student(self, student_id: str):
+        """Студент отключился"""
+        self._reports.pop(student_id, None)
+        self._queues.pop(student_id, None)
+    
+    @property
+    def current(self) -> RateLevel:
+        return self.ladder[self.level]
+    
+    def _student_congested(self, student_id: str, report: dict) -> Optional[str]:
+        """Причина перегрузки студента или None"""
+        frame_ms = 1000 / self.current.fps
+        latency = self._queues.get(student_id, 0) * frame_ms + report.get("decode_ms", 0.0)
+        if report.get("loss", 0.0) > RATE_MAX_LOSS:
+            return f"потери {report['loss']:.0%}"
+        if latency > RATE_TARGET_LATENCY_MS:
+            return f"задержка {latency:.0f} мс"
+        if report.get("decode_ms", 0.0) > RATE_DECODE_BUDGET * frame_ms:
+            return f"декодирование {report['decode_ms']:.0f} мс"
+        return None
+    
+    def tick(self, now: Optional[float] = None) -> Optional[RateLevel]:
+        """
+        Оценить обратную связь и при необходимости сменить уровень
+        
+        Returns:
+            Новый уровень или None (без изменений)
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        # Трафик трансляции с прошлой проверки
+        elapsed = now - self._last_tick
+        if elapsed > 0:
+            sent = self.capture.bytes_sent
+            rate = (sent - self._bytes) * 8 / elapsed
+            self.bitrate += RATE_EWMA_ALPHA * (rate - self.bitrate)
+            self._bytes = sent
+            self._last_tick = now
+        
+        reports = {sid: report for sid, report in self._reports.items()
+                   if now - report["time"] <= FEEDBACK_TIMEOUT}
+        congested = {}
+        for student_id, report in reports.items():
+            reason = self._student_congested(student_id, report)
+            if reason:
+                congested[student_id] = reason
+        
+        reason = None
+        if reports and len(congested) >= RATE_CONGESTED_SHARE * len(reports):
+            student_id, why = next(iter(congested.items()))
+            reason = f"перегружено {len(congested)}/{len(reports)} студентов ({student_id}: {why})"
+        elif self.target_bps and self.bitrate > self.target_bps:
+            reason = f"трафик {self.bitrate / 1e6:.1f} > {self.target_bps / 1e6:.1f} Мбит/с"
+        
+        if reason:
+            self._calm_since = now
+            self._congested_ticks += 1
+        else:
+            self._congested_ticks = 0
+        
+        if not self.enabled:
+            return None
+        
+        # Шаг вверх продержался - следующая попытка без задержки сверх обычной
+        if self._probe_at is not None and now - self._probe_at >= self.up_hold:
+            self._probe_at = None
+            self.up_hold = RATE_UP_HOLD
+        
+        if reason:
+            if (self._congested_ticks >= RATE_DOWN_CONFIRM and now - self._changed_at >= RATE_DOWN_HOLD
+                    and self.level < len(self.ladder) - 1):
+                if self._probe_at is not None:
+                    # Попытка вверх не удалась - следующая нескоро
+                    self.up_hold = min(self.up_hold * 2, RATE_UP_HOLD_MAX)
+                    self._probe_at = None
+                return self._change(self.level + 1, reason, now)
+            return None
+        
+        if self.level == 0 or now - self._calm_since < self.up_hold or now - self._changed_at < self.up_hold:
+            return None
+        upper = self.ladder[self.level - 1]
+        if self.target_bps and self.bitrate * upper.cost / self.current.cost > self.target_bps:
+            return None
+        self._probe_at = now
+        return self._change(self.level - 1, f"{self.up_hold:.0f} с без перегрузки", now)
+    
+    def _change(self, level: int, reason: str, now: float) -> RateLevel:
+        previous = self.current
+        direction = "вниз" if level > self.level else "вверх"
+        self.level = level
+        self._changed_at = now
+        self._congested_ticks = 0
+        self._apply()
+        logger.info(f"Трансляция {direction}: {previous} -> {self.current} ({reason})")
+        self.decisions.append({
+            "time": now,
+            "level": level,
+            "from": str(previous),
+            "to": str(self.current),
+            "reason": reason
+        })
+        return self.current
+    
+    def _apply(self):
+        level = self.current
+        self.capture.set_encoding(level.quality, level.fps, level.resolution)
+    
+    def get_stats(self) -> dict:
+        """Статистика контура"""
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "levels": len(self.ladder),
+            "current": str(self.current),
+            "bitrate_mbps": round(self.bitrate / 1e6, 2),
+            "target_mbps": self.target_bps / 1e6,
+            "students": len(self._reports),
+            "up_hold": self.up_hold,
+            "decisions": list(self.decisions)
+        }
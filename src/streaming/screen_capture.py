@@ -1,5 +1,29 @@
 """
 Модуль захвата и трансляции экрана
+
+Захват, конвертация, кодирование (пул потоков) и отправка идут в
+разных потоках (CapturePipeline) - тик захвата не ждет сеть.
+
+Неподвижный экран (ChangeDetector) не кодируется и не отправляется:
+вместо кадров - редкий on_keepalive с номером последнего кадра.
+
+delta=True: вместо JPEG каждого кадра - ключевые кадры и дельты
+изменившихся плиток (tile_delta); ScreenReceiver собирает их в холст.
+adaptive=True: то же, но плитки текста - WebP без потерь (мелкий шрифт
+не размывается), фото и видео - JPEG.
+
+codec=CODEC_H264: межкадровый H.264 (video_codec, нужен PyAV); без
+PyAV - MJPEG, как раньше.
+
+frame_budget: качество JPEG каждого кадра подбирается под бюджет байт
+(jpeg_budget) - кадр с видео не раздувается в разы против слайда.
+
+create_screen_capture() выбирает кодек из config.ini ([Streaming]
+ScreenCodec: mjpeg, delta, adaptive или h264).
+
+Курсора в кадрах нет (mss снимает экран без него): его позиция и форма
+уходят отдельным каналом (cursor_channel), движение мыши не заставляет
+кодировать кадры.
 """
 
 import cv2
@@ -8,17 +32,63 @@ import mss
 import logging
 import threading
 import time
-from typing import Optional, Callable, Tuple
-from src.common.constants import StreamQuality, QUALITY_SETTINGS
+from typing import Optional, Callable, Tuple, Union
+from src.common.constants import StreamQuality, QUALITY_SETTINGS, ScreenCodec
+from src.common.utils import load_config
+from src.streaming.capture_pipeline import CapturePipeline, ENCODE_WORKERS
+from src.streaming.change_detector import ChangeDetector, FRAME, KEEPALIVE
+from src.streaming.cursor_channel import CURSOR_CAPTURE_AVAILABLE, CURSOR_RATE, CursorShape, CursorTracker
+from src.streaming.jpeg_budget import JpegBudgetEncoder
+from src.streaming.tile_delta import TileEncoder, TileCanvas, TILE_KEYFRAME_REQUEST_HOLD, is_tile_keyframe
+from src.streaming.video_codec import (AV_AVAILABLE, CODEC_H264, CODEC_MJPEG, H264_GOP, H264Encoder,
+                                       bitrate_for_resolution, is_video_frame, is_video_keyframe)
 
 
 logger = logging.getLogger(__name__)
 
 
 class ScreenCapture:
-    """Класс для захвата экрана"""
+    """
+    Класс для захвата экрана
+    
+    delta=True: кадры - ключевые JPEG и дельты плиток; запрос ключевого
+    кадра от студента (SCREEN_KEYFRAME_REQUEST) - в request_keyframe().
+    adaptive=True (включает delta): плитки текста и интерфейса без потерь,
+    jpeg_quality - только для плиток фото и видео.
+    
+    codec=CODEC_H264: кадры H.264 с ключевым кадром раз в gop кадров и
+    по request_keyframe() (SCREEN_KEYFRAME_REQUEST или подключение
+    студента); delta тогда не нужна.
+    
+    set_plain_jpeg(True) (запись урока хранит кадры как .jpg): на это
+    время - JPEG каждого кадра, дельты и H.264 на паузе; после - снова
+    с ключевого кадра.
     
-    def __init__(self, quality: str = StreamQuality.MEDIUM, fps: int = 24):
+    workers - потоков кодирования JPEG; дельты плиток ссылаются на
+    предыдущий кадр и кодируются в одном потоке.
+    
+    frame_budget (байт, например PerformanceManager.calculate_frame_budget):
+    JPEG кадра - в бюджете, jpeg_quality - верхний предел качества.
+    Только для MJPEG: у дельт и H.264 свой контроль размера. set_encoding
+    пересчитывает бюджет по числу пикселей, а предел скорости multicast
+    (max_byte_rate в set_frame_budget) - по частоте кадров.
+    
+    skip_static=True: кадр, не изменившийся с предыдущего, не
+    кодируется; раз в STATIC_KEEPALIVE_INTERVAL вызывается
+    on_keepalive(номер последнего кадра), например
+    lambda frame_id: server.broadcast_to_all(
+        MessageType.SCREEN_KEEPALIVE, {"frame_id": frame_id})
+    
+    cursor=True (Windows): свой поток опрашивает курсор CURSOR_RATE раз в
+    секунду; изменения - в on_cursor(данные SCREEN_CURSOR), новая форма -
+    в on_cursor_shape(CursorShape) до первой позиции с ней. Форму по
+    запросу студента дает cursor_shape(ключ).
+    """
+    
+    def __init__(self, quality: str = StreamQuality.MEDIUM, fps: int = 24, delta: bool = False,
+                 workers: int = ENCODE_WORKERS, skip_static: bool = True, codec: str = CODEC_MJPEG,
+                 gop: Optional[int] = None, frame_budget: Optional[int] = None, adaptive: bool = False,
+                 cursor: bool = True):
         self.quality = quality
         self.fps = fps
         self.capturing = False
@@ -30,12 +100,46 @@ class ScreenCapture:
         self.target_fps = self.settings.get("fps", fps)
         self.jpeg_quality = self.settings["quality"]
         
-        # Колбэк для обработки кадров
+        # Кодировщик с состоянием: H.264 или дельты плиток (None - JPEG каждого кадра)
+        if codec == CODEC_H264 and not AV_AVAILABLE:
+            logger.warning("PyAV не установлен - трансляция в MJPEG вместо H.264")
+            codec = CODEC_MJPEG
+        self.codec = codec
+        self.gop = gop or H264_GOP
+        self.delta = delta or adaptive
+        self.adaptive = adaptive
+        self.frame_encoder = self._create_frame_encoder()
+        self.plain_jpeg = False
+        # Кадры кодировщика с состоянием ссылаются на предыдущий - один поток
+        self.workers = 1 if self.frame_encoder else workers
+        
+        # JPEG под бюджет кадра
+        self.budget_encoder: Optional[JpegBudgetEncoder] = None
+        self.frame_budget: Optional[int] = None
+        self.max_byte_rate = 0.0
+        self._budget_pixels = 1
+        self.set_frame_budget(frame_budget)
+        self.pipeline: Optional[CapturePipeline] = None
+        
+        # Неподвижный экран - без кодирования и отправки
+        self.change_detector = ChangeDetector() if skip_static else None
+        
+        # Курсор - отдельным каналом (область экрана известна после старта захвата)
+        self.cursor_tracker = CursorTracker() if cursor and CURSOR_CAPTURE_AVAILABLE else None
+        self.cursor_thread: Optional[threading.Thread] = None
+        self.monitor: Optional[dict] = None
+        
+        # Колбэки для обработки кадров
         self.on_frame: Optional[Callable[[bytes, int], None]] = None
+        self.on_keepalive: Optional[Callable[[int], None]] = None  # Экран не изменился
+        self.on_cursor: Optional[Callable[[dict], None]] = None
+        self.on_cursor_shape: Optional[Callable[[CursorShape], None]] = None
         
         # Статистика
         self.frame_count = 0
         self.dropped_frames = 0
+        self.last_frame_id = -1
+        self.bytes_sent = 0
         
         logger.info(f"ScreenCapture создан: качество={quality}, fps={self.target_fps}")
     
@@ -49,17 +153,29 @@ class ScreenCapture:
             self.capturing = True
             self.frame_count = 0
             self.dropped_frames = 0
+            self.last_frame_id = -1
+            if self.change_detector:
+                self.change_detector.request_refresh()
+            
+            # Стадии конвертации, кодирования и отправки
+            self.pipeline = CapturePipeline(self._convert, self._encode, self._send, workers=self.workers)
+            self.pipeline.start()
             
             # Запускаем поток захвата
             self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
             self.capture_thread.start()
+            if self.cursor_tracker:
+                self.cursor_thread = threading.Thread(target=self._cursor_loop, daemon=True)
+                self.cursor_thread.start()
             
             logger.info("Захват экрана запущен")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Ошибка запуска захвата: {e}")
             self.capturing = False
+            if self.pipeline:
+                self.pipeline.stop()
             return False
     
     def stop(self):
@@ -72,49 +188,33 @@ class ScreenCapture:
         
         if self.capture_thread:
             self.capture_thread.join(timeout=2)
+        if self.cursor_thread:
+            self.cursor_thread.join(timeout=2)
+        if self.pipeline:
+            self.pipeline.stop()
         
         logger.info(f"Захват остановлен. Кадров: {self.frame_count}, пропущено: {self.dropped_frames}")
     
     def _capture_loop(self):
-        """Основной цикл захвата"""
-        frame_interval = 1.0 / self.target_fps
-        
+        """Цикл захвата: только снимок экрана, остальное - в конвейере"""
         with mss.mss() as sct:
             # Получаем информацию о мониторе
             monitor = sct.monitors[1]  # Главный монитор
+            self.monitor = monitor
             
             logger.info(f"Монитор: {monitor['width']}x{monitor['height']}")
             
             while self.capturing:
                 start_time = time.time()
+                frame_interval = 1.0 / self.target_fps  # Меняется на лету (set_encoding)
                 
                 try:
-                    # Захватываем экран
+                    # Захватываем экран; конвертация, кодирование и отправка - в других потоках
+                    grab_start = time.perf_counter()
                     screenshot = sct.grab(monitor)
-                    
-                    # Конвертируем в numpy array
-                    frame = np.array(screenshot)
-                    
-                    # Конвертируем BGRA -> BGR
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-                    
-                    # Изменяем размер если нужно
-                    if frame.shape[1] != self.target_resolution[0] or frame.shape[0] != self.target_resolution[1]:
-                        frame = cv2.resize(frame, self.target_resolution, interpolation=cv2.INTER_LINEAR)
-                    
-                    # Сжимаем в JPEG
-                    encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
-                    success, encoded = cv2.imencode('.jpg', frame, encode_params)
-                    
-                    if success:
-                        # Отправляем кадр через колбэк
-                        if self.on_frame:
-                            self.on_frame(encoded.tobytes(), self.frame_count)
-                        
-                        self.frame_count += 1
-                    else:
+                    if not self.pipeline.submit(screenshot, time.perf_counter() - grab_start):
+                        # Конвейер не успевает - выброшен самый старый кадр
                         self.dropped_frames += 1
-                        logger.warning("Ошибка кодирования кадра")
                     
                     # Контроль частоты кадров
                     elapsed = time.time() - start_time
@@ -123,15 +223,91 @@ class ScreenCapture:
                     if sleep_time > 0:
                         time.sleep(sleep_time)
                     else:
-                        # Кадр обрабатывался дольше интервала
+                        # Захват дольше интервала
                         self.dropped_frames += 1
-                        
+                
                 except Exception as e:
                     logger.error(f"Ошибка захвата кадра: {e}")
                     time.sleep(0.1)
         
         logger.info("Цикл захвата завершен")
     
+    def _cursor_loop(self):
+        """Опрос курсора: позиция и форма - отдельно от кадров, CURSOR_RATE раз в секунду"""
+        interval = 1.0 / CURSOR_RATE
+        while self.capturing:
+            start_time = time.monotonic()
+            try:
+                if self.monitor:
+                    update, shape = self.cursor_tracker.poll(self.monitor, start_time)
+                    # Форма - раньше первой позиции с ней
+                    if shape and self.on_cursor_shape:
+                        self.on_cursor_shape(shape)
+                    if update and self.on_cursor:
+                        self.on_cursor(update)
+            except Exception as e:
+                logger.error(f"Ошибка опроса курсора: {e}")
+            
+            sleep_time = interval - (time.monotonic() - start_time)
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+    
+    def cursor_shape(self, key: int) -> Optional[CursorShape]:
+        """Форма курсора по ключу (запрос SCREEN_CURSOR_SHAPE студента)"""
+        if not self.cursor_tracker:
+            return None
+        return self.cursor_tracker.shapes.get(key)
+    
+    def _convert(self, screenshot) -> Optional[np.ndarray]:
+        """Стадия конвертации: BGRA -> BGR и размер трансляции; None - экран не изменился"""
+        if self.change_detector:
+            action = self.change_detector.check(screenshot)
+            if action == KEEPALIVE and self.on_keepalive and self.last_frame_id >= 0:
+                self.on_keepalive(self.last_frame_id)
+            if action != FRAME:
+                return None
+        
+        frame = np.array(screenshot)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        
+        # Изменяем размер если нужно
+        if frame.shape[1] != self.target_resolution[0] or frame.shape[0] != self.target_resolution[1]:
+            frame = cv2.resize(frame, self.target_resolution, interpolation=cv2.INTER_LINEAR)
+        return frame
+    
+    def _create_frame_encoder(self) -> Optional[Union[H264Encoder, TileEncoder]]:
+        """Кодировщик с состоянием под текущие качество и частоту (None - MJPEG)"""
+        if self.codec == CODEC_H264:
+            bitrate = bitrate_for_resolution(self.target_resolution) * self.jpeg_quality // self.settings["quality"]
+            return H264Encoder(self.target_fps, bitrate, self.gop)
+        if self.delta:
+            return TileEncoder(self.jpeg_quality, adaptive=self.adaptive)
+        return None
+    
+    def _encode(self, frame: np.ndarray, frame_id: int) -> Optional[bytes]:
+        """Стадия кодирования (пул потоков): JPEG, дельта плиток или H.264"""
+        frame_encoder = None if self.plain_jpeg else self.frame_encoder
+        if frame_encoder:
+            return frame_encoder.encode(frame, frame_id)
+        budget_encoder = self.budget_encoder
+        if budget_encoder:
+            return budget_encoder.encode(frame, frame_id)
+        
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        success, encoded = cv2.imencode('.jpg', frame, encode_params)
+        if not success:
+            logger.warning("Ошибка кодирования кадра")
+            return None
+        return encoded.tobytes()
+    
+    def _send(self, encoded: bytes, frame_id: int):
+        """Стадия отправки: кадры приходят по порядку номеров"""
+        if self.on_frame:
+            self.on_frame(encoded, frame_id)
+        self.last_frame_id = frame_id
+        self.frame_count += 1
+        self.bytes_sent += len(encoded)
+    
     def capture_single_frame(self) -> Optional[bytes]:
         """Захватить один кадр (для скриншотов)"""
         try:
@@ -148,54 +324,250 @@ class ScreenCapture:
                 if success:
                     return encoded.tobytes()
                 return None
-                
+        
         except Exception as e:
             logger.error(f"Ошибка захвата одиночного кадра: {e}")
             return None
     
+    def request_keyframe(self) -> bool:
+        """
+        Студент потерял основу для дельт или последний кадр - следующий
+        кадр отправляется (и в дельтах - ключевой), даже если экран не изменился
+        """
+        if self.change_detector:
+            self.change_detector.request_refresh()
+        if not self.frame_encoder:
+            return self.change_detector is not None
+        return self.frame_encoder.request_keyframe()
+    
+    def set_encoding(self, quality: int, fps: int, resolution: tuple):
+        """
+        Качество JPEG, частота кадров и разрешение на лету (RateController)
+        
+        H.264: качество масштабирует битрейт относительно настроек профиля
+        качества; кодировщик перезапускается с ключевого кадра.
+        """
+        self.jpeg_quality = quality
+        self.target_fps = fps
+        self.target_resolution = tuple(resolution)
+        if isinstance(self.frame_encoder, TileEncoder):
+            self.frame_encoder.quality = quality
+        elif self.frame_encoder:
+            bitrate = bitrate_for_resolution(resolution) * quality // self.settings["quality"]
+            self.frame_encoder.set_rate(fps, bitrate)
+        if self.budget_encoder:
+            self.budget_encoder.max_quality = quality
+        self._apply_frame_budget()
+    
+    def set_frame_budget(self, budget: Optional[int], max_byte_rate: float = 0):
+        """
+        Бюджет JPEG кадра, байт (None - постоянное качество jpeg_quality)
+        
+        budget - для текущего разрешения, без предела скорости;
+        max_byte_rate (байт/с, PerformanceManager.calculate_max_byte_rate)
+        ограничивает кадр величиной max_byte_rate / target_fps.
+        """
+        self.frame_budget = budget
+        self.max_byte_rate = max_byte_rate
+        width, height = self.target_resolution
+        self._budget_pixels = width * height
+        self._apply_frame_budget()
+    
+    def _apply_frame_budget(self):
+        """Бюджет кодировщику - под текущие разрешение и частоту кадров"""
+        if not self.frame_budget or self.frame_encoder:
+            self.budget_encoder = None
+            return
+        width, height = self.target_resolution
+        budget = self.frame_budget * width * height // self._budget_pixels
+        if self.max_byte_rate:
+            budget = min(budget, int(self.max_byte_rate / self.target_fps))
+        if self.budget_encoder:
+            self.budget_encoder.budget = budget
+        else:
+            self.budget_encoder = JpegBudgetEncoder(budget, self.jpeg_quality)
+    
+    def set_plain_jpeg(self, enabled: bool):
+        """JPEG каждого кадра вместо дельт и H.264 (на время записи урока)"""
+        if enabled == self.plain_jpeg or not self.frame_encoder:
+            return
+        if not enabled:
+            # Студенты видели JPEG - старые основы дельт и P-кадров не годятся
+            self.frame_encoder = self._create_frame_encoder()
+        self.plain_jpeg = enabled
+    
+    def set_skip_static(self, enabled: bool):
+        """Пропуск неподвижного экрана (выключается на время записи урока - ей нужны все кадры)"""
+        if self.change_detector:
+            self.change_detector.enabled = enabled
+    
     def get_stats(self) -> dict:
         """Получить статистику"""
-        return {
+        stats = {
             "frame_count": self.frame_count,
             "dropped_frames": self.dropped_frames,
             "fps": self.target_fps,
             "quality": self.quality,
             "resolution": self.target_resolution
         }
+        if self.pipeline:
+            stats["pipeline"] = self.pipeline.get_stats()
+        if self.change_detector:
+            stats["static"] = self.change_detector.get_stats()
+        if self.frame_encoder:
+            stats["codec"] = self.codec
+            stats["video" if self.codec == CODEC_H264 else "delta"] = self.frame_encoder.get_stats()
+        if self.budget_encoder:
+            stats["budget"] = self.budget_encoder.get_stats()
+        if self.cursor_tracker:
+            stats["cursor"] = self.cursor_tracker.get_stats()
+        return stats
+
+
+def is_keyframe(frame_data: Union[bytes, memoryview]) -> bool:
+    """
+    Кадр собирается без предыдущих (JPEG, ключевой кадр плиток или H.264)
+    
+    Для очереди отправки (broadcast_to_all(..., keyframe=...)): дельта
+    после выброшенного кадра студенту уже не нужна.
+    """
+    if is_video_frame(frame_data):
+        return is_video_keyframe(frame_data)
+    return is_tile_keyframe(frame_data)
+
+
+def create_screen_capture(codec: Optional[str] = None, **kwargs) -> ScreenCapture:
+    """
+    Создать захват экрана с выбранным кодеком
+    
+    Args:
+        codec: ScreenCodec.MJPEG, DELTA, ADAPTIVE или H264
+               (None = из config.ini, [Streaming] ScreenCodec)
+        kwargs: Остальные параметры ScreenCapture
+    """
+    if codec is None:
+        codec = load_config().get("Streaming", "ScreenCodec", fallback=ScreenCodec.MJPEG).strip().lower()
+    
+    if codec == ScreenCodec.H264:
+        return ScreenCapture(codec=CODEC_H264, **kwargs)
+    if codec in (ScreenCodec.DELTA, ScreenCodec.ADAPTIVE):
+        return ScreenCapture(delta=True, adaptive=codec == ScreenCodec.ADAPTIVE, **kwargs)
+    
+    if codec != ScreenCodec.MJPEG:
+        logger.warning(f"Неизвестный кодек экрана '{codec}', используем {ScreenCodec.MJPEG}")
+    return ScreenCapture(**kwargs)
 
 
 class ScreenReceiver:
-    """Класс для приема и отображения экрана"""
+    """
+    Класс для приема и отображения экрана
+    
+    Кадры - JPEG, дельты плиток (ScreenCapture(delta=True)) или H.264; дельты
+    вклеиваются в холст. Дельта (и P-кадр H.264) без основы пропускается, а
+    on_keyframe_needed просит ключевой кадр (не чаще
+    TILE_KEYFRAME_REQUEST_HOLD), например lambda: client.send_message(
+        MessageType.SCREEN_KEYFRAME_REQUEST, {})
+    
+    SCREEN_KEEPALIVE (экран не изменился) - в process_keepalive(); если
+    последний кадр до студента не дошел, тоже просим кадр.
+    
+    get_feedback() - прием с прошлого вызова для SCREEN_FEEDBACK
+    (RateController преподавателя): кадры, потери по пропускам номеров,
+    время декодирования, трафик.
+    """
     
     def __init__(self):
         self.receiving = False
         self.current_frame: Optional[np.ndarray] = None
         self.frame_lock = threading.Lock()
+        self.canvas = TileCanvas()
+        self.on_keyframe_needed: Optional[Callable[[], None]] = None
+        self._last_keyframe_request = 0.0
         
         # Статистика
         self.frames_received = 0
         self.last_frame_time = 0
+        self.keepalives_received = 0
+        self.last_keepalive_time = 0
+        
+        # Обратная связь преподавателю (с прошлого get_feedback)
+        self.decode_ms = 0.0  # Сглаженное время декодирования
+        self._last_id: Optional[int] = None
+        self._feedback_start = time.monotonic()
+        self._feedback_frames = 0
+        self._feedback_lost = 0
+        self._feedback_bytes = 0
         
         logger.info("ScreenReceiver создан")
     
-    def process_frame(self, frame_data: bytes, frame_id: int):
-        """Обработать полученный кадр"""
+    def process_frame(self, frame_data: Union[bytes, memoryview], frame_id: int):
+        """Обработать полученный кадр (bytes или memoryview без копирования)"""
         try:
-            # Декодируем JPEG
-            nparr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            self._count_frame(frame_data, frame_id)
             
-            if frame is not None:
-                with self.frame_lock:
+            # Декодируем JPEG или вклеиваем плитки в холст
+            start = time.perf_counter()
+            with self.frame_lock:
+                frame = self.canvas.apply(frame_data, frame_id)
+                if frame is not None:
                     self.current_frame = frame
                     self.frames_received += 1
                     self.last_frame_time = time.time()
-            else:
-                logger.warning(f"Не удалось декодировать кадр {frame_id}")
-                
+            self.decode_ms += 0.2 * ((time.perf_counter() - start) * 1000 - self.decode_ms)
+            
+            if frame is None:
+                if self.canvas.needs_keyframe:
+                    self._request_keyframe()
+                else:
+                    logger.warning(f"Не удалось декодировать кадр {frame_id}")
+        
         except Exception as e:
             logger.error(f"Ошибка обработки кадра: {e}")
     
+    def _count_frame(self, frame_data: Union[bytes, memoryview], frame_id: int):
+        """Учесть кадр для обратной связи: номера идут подряд, пропуск - потеря"""
+        self._feedback_frames += 1
+        self._feedback_bytes += len(frame_data)
+        if self._last_id is not None and frame_id > self._last_id + 1:
+            self._feedback_lost += frame_id - self._last_id - 1
+        # Меньший номер - трансляция перезапущена
+        self._last_id = frame_id
+    
+    def get_feedback(self, now: Optional[float] = None) -> dict:
+        """Прием с прошлого вызова (SCREEN_FEEDBACK); счетчики обнуляются"""
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self._feedback_start, 1e-3)
+        expected = self._feedback_frames + self._feedback_lost
+        feedback = {
+            "fps": round(self._feedback_frames / elapsed, 1),
+            "loss": round(self._feedback_lost / expected, 3) if expected else 0.0,
+            "decode_ms": round(self.decode_ms, 2),
+            "kbps": round(self._feedback_bytes * 8 / elapsed / 1000, 1)
+        }
+        self._feedback_start = now
+        self._feedback_frames = 0
+        self._feedback_lost = 0
+        self._feedback_bytes = 0
+        return feedback
+    
+    def process_keepalive(self, frame_id: int):
+        """Экран преподавателя не изменился; frame_id - его последний кадр"""
+        self.keepalives_received += 1
+        self.last_keepalive_time = time.time()
+        shown = self.canvas.frame_id
+        if shown is None or shown < frame_id:
+            # Последний кадр потерян (медиа очередь выбросила) - экран не обновится сам
+            self._request_keyframe()
+    
+    def _request_keyframe(self):
+        """Попросить ключевой кадр, не чаще TILE_KEYFRAME_REQUEST_HOLD"""
+        now = time.monotonic()
+        if not self.on_keyframe_needed or now - self._last_keyframe_request < TILE_KEYFRAME_REQUEST_HOLD:
+            return
+        self._last_keyframe_request = now
+        self.on_keyframe_needed()
+    
     def get_current_frame(self) -> Optional[np.ndarray]:
         """Получить текущий кадр"""
         with self.frame_lock:
@@ -220,7 +592,7 @@ class ScreenReceiver:
             pixmap = QPixmap.fromImage(q_image)
             
             return pixmap
-            
+        
         except Exception as e:
             logger.error(f"Ошибка конвертации кадра в QPixmap: {e}")
             return None
@@ -229,10 +601,14 @@ class ScreenReceiver:
         """Получить статистику"""
         current_time = time.time()
         time_since_last = current_time - self.last_frame_time if self.last_frame_time > 0 else 0
+        last_alive = max(self.last_frame_time, self.last_keepalive_time)
         
         return {
             "frames_received": self.frames_received,
             "time_since_last_frame": time_since_last,
-            "has_frame": self.current_frame is not None
+            "time_since_alive": current_time - last_alive if last_alive > 0 else 0,
+            "keepalives_received": self.keepalives_received,
+            "has_frame": self.current_frame is not None,
+            "canvas": self.canvas.get_stats()
         }
 
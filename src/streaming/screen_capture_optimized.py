@@ -1,10 +1,27 @@
 """
 Оптимизированный захват экрана с Multicast
-Версия 2.0 - для 30+ студентов одновременно
+Версия 2.2 - транспорт по студентам: multicast или TCP
 
 Производительность:
 - TCP: 30 студентов = 300 Mbps, 80% CPU
 - Multicast: 30 студентов = 10 Mbps, 20% CPU (30x экономия!)
+
+Simulcast: старый нетбук тратит весь CPU на декодирование 1280x720.
+Преподаватель кодирует каждый захваченный кадр в несколько слоев
+(SIMULCAST_LAYERS, например 1280x720@70 и 854x480@50), каждый слой
+уходит в свою multicast группу. Студент подписан на один слой и сам
+переключается по времени декодирования и потерям (LayerSelector).
+
+Режим auto: multicast маршрутизируется не во все подсети, а hybrid шлет
+каждый кадр дважды. В auto кадр уходит в multicast, а по TCP - только
+студентам, не подтвердившим прием multicast (TransportSelector).
+
+codec=CODEC_H264: слои кодируются в H.264 (video_codec) вместо JPEG.
+
+frame_budget: JPEG слоя - в бюджете байт (jpeg_budget), тяжелый кадр не
+раздувает число фрагментов multicast.
+
+adaptive=True: дельты плиток, текст - WebP без потерь, фото - JPEG слоя.
 """
 
 import cv2
@@ -14,13 +31,305 @@ import logging
 import threading
 import time
 import base64
-from typing import Optional, Callable, Literal
-from src.common.constants import StreamQuality, QUALITY_SETTINGS
-from src.network.multicast import MulticastSender, MulticastConfig
+from dataclasses import dataclass
+from typing import Optional, Callable, Literal, Dict, List
+from src.common.constants import StreamQuality, QUALITY_SETTINGS, MessageType
+from src.network.multicast import (MulticastSender, MulticastConfig, NackAggregator, fec_ratio_from_config,
+                                   max_bitrate_from_config)
+from src.streaming.tile_delta import TileEncoder, TileCanvas, TILE_KEYFRAME_REQUEST_HOLD
+from src.streaming.jpeg_budget import JpegBudgetEncoder
+from src.streaming.video_codec import (AV_AVAILABLE, CODEC_H264, CODEC_MJPEG, H264_GOP, H264Encoder,
+                                       bitrate_for_resolution)
 
 logger = logging.getLogger(__name__)
 
-StreamMode = Literal["tcp", "multicast", "hybrid"]
+StreamMode = Literal["tcp", "multicast", "hybrid", "auto"]
+
+# Группа и порт трансляции без simulcast (первый слой SIMULCAST_LAYERS)
+DEFAULT_GROUP = "239.255.1.1"
+DEFAULT_PORT = 5005
+
+# Выбор слоя приемником: вниз, если декодирование дольше этой доли интервала кадра
+LAYER_DECODE_BUDGET = 0.5
+# Вверх, если декодирование следующего слоя (по числу пикселей) уложится в эту долю
+LAYER_DECODE_HEADROOM = 0.25
+# Вниз, если полностью собрано меньше этой доли кадров; вверх - только от этой доли
+LAYER_MIN_COMPLETE = 0.9
+LAYER_UPGRADE_COMPLETE = 0.98
+# Кадров на слое, прежде чем решать (оценки после переключения еще не установились)
+LAYER_MIN_SAMPLES = 10
+# Пауза между переключениями и перед повышением, сек
+LAYER_HOLD = 2.0
+LAYER_UPGRADE_HOLD = 10.0
+# Сглаживание оценок времени декодирования и интервала кадров
+LAYER_EWMA_ALPHA = 0.2
+
+# Выбор транспорта (режим auto): студент сообщает о приеме multicast раз в столько секунд
+TRANSPORT_REPORT_INTERVAL = 2.0
+# Нет отчетов дольше - multicast до студента не доходит, обратно на TCP
+TRANSPORT_REPORT_TIMEOUT = 3 * TRANSPORT_REPORT_INTERVAL
+# На multicast - если столько отчетов подряд собрано не меньше этой доли кадров
+TRANSPORT_PROMOTE_DELIVERY = 0.95
+TRANSPORT_PROMOTE_REPORTS = 2
+# Обратно на TCP - если собрано меньше этой доли или последний кадр отстает больше, сек
+TRANSPORT_FALLBACK_DELIVERY = 0.8
+TRANSPORT_MAX_LAG = 1.0
+
+
+@dataclass
+class SimulcastLayer:
+    """Слой simulcast: разрешение, качество JPEG и своя multicast группа"""
+    name: str
+    resolution: tuple  # (width, height)
+    quality: int  # JPEG quality 1-100
+    group: str = DEFAULT_GROUP
+    port: int = DEFAULT_PORT
+    
+    @property
+    def pixels(self) -> int:
+        return self.resolution[0] * self.resolution[1]
+
+
+def make_layers(layers: Optional[List[Dict]], resolution: Optional[tuple] = None,
+                quality: Optional[int] = None) -> List[SimulcastLayer]:
+    """
+    Слои из настроек (как SIMULCAST_LAYERS), от большего к меньшему
+    
+    Без layers - один слой resolution/quality в прежней группе (без simulcast).
+    """
+    if not layers:
+        return [SimulcastLayer("main", tuple(resolution), quality)]
+    result = [SimulcastLayer(**layer) for layer in layers]
+    return sorted(result, key=lambda layer: -layer.pixels)
+
+
+def encode_layers(frame: np.ndarray, layers: List[SimulcastLayer],
+                  encoders: Optional[List[TileEncoder]] = None, frame_id: int = 0) -> List[Optional[bytes]]:
+    """
+    Закодировать захваченный кадр во все слои (JPEG)
+    
+    Захват и конвертация цвета - одни на все слои; каждый слой
+    уменьшается из предыдущего, уже уменьшенного, а не из полного кадра.
+    Слои должны идти от большего к меньшему (make_layers).
+    
+    encoders - кодировщик каждого слоя: TileEncoder (ключевые кадры и
+    дельты плиток), H264Encoder или JpegBudgetEncoder. None вместо данных
+    слоя - кодировщик не выдал кадр (слой этот кадр пропускает).
+    """
+    encoded = []
+    source = frame
+    for index, layer in enumerate(layers):
+        if (source.shape[1], source.shape[0]) != layer.resolution:
+            source = cv2.resize(source, layer.resolution)
+        if encoders:
+            encoded.append(encoders[index].encode(source, frame_id))
+            continue
+        _, buffer = cv2.imencode('.jpg', source, [int(cv2.IMWRITE_JPEG_QUALITY), layer.quality])
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+class LayerSelector:
+    """
+    Выбор слоя simulcast приемником
+    
+    Вниз (меньше разрешение), если за последние кадры:
+    - декодирование в среднем дольше LAYER_DECODE_BUDGET интервала
+      кадра - CPU не успевает, экран отстает
+    - или полностью собрано меньше LAYER_MIN_COMPLETE кадров - в
+      меньшем слое меньше фрагментов на кадр, меньше теряется
+    
+    Вверх - если на слое LAYER_UPGRADE_HOLD секунд все хорошо и
+    декодирование следующего слоя (оценка по числу пикселей) уложится
+    в LAYER_DECODE_HEADROOM интервала. Между переключениями - не
+    меньше LAYER_HOLD секунд.
+    """
+    
+    def __init__(self, layers: List[SimulcastLayer], layer: int = 0, now: Optional[float] = None):
+        self.layers = layers
+        self.layer = layer
+        self._reset(time.monotonic() if now is None else now)
+    
+    def _reset(self, now: float):
+        """Новый слой - оценки заново"""
+        self.decode_time = 0.0
+        self.frame_interval = 0.0
+        self.samples = 0
+        self._last_frame: Optional[float] = None
+        self._switched_at = now
+    
+    def record_frame(self, decode_seconds: float, now: Optional[float] = None):
+        """Учесть декодированный кадр текущего слоя"""
+        if now is None:
+            now = time.monotonic()
+        
+        if self.samples == 0:
+            self.decode_time = decode_seconds
+        else:
+            self.decode_time += LAYER_EWMA_ALPHA * (decode_seconds - self.decode_time)
+        
+        if self._last_frame is not None:
+            interval = now - self._last_frame
+            if self.frame_interval == 0.0:
+                self.frame_interval = interval
+            else:
+                self.frame_interval += LAYER_EWMA_ALPHA * (interval - self.frame_interval)
+        self._last_frame = now
+        self.samples += 1
+    
+    def choose(self, complete_ratio: float = 1.0, now: Optional[float] = None) -> int:
+        """
+        Слой, на который пора перейти (или текущий)
+        
+        Args:
+            complete_ratio: Доля полностью собранных кадров (FrameReassembler)
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        held = now - self._switched_at
+        if self.samples < LAYER_MIN_SAMPLES or self.frame_interval <= 0 or held < LAYER_HOLD:
+            return self.layer
+        
+        load = self.decode_time / self.frame_interval
+        lower = self.layer + 1
+        higher = self.layer - 1
+        
+        if lower < len(self.layers) and (load > LAYER_DECODE_BUDGET or complete_ratio < LAYER_MIN_COMPLETE):
+            return self._switch(lower, now)
+        
+        if higher >= 0 and held >= LAYER_UPGRADE_HOLD and complete_ratio >= LAYER_UPGRADE_COMPLETE:
+            scale = self.layers[higher].pixels / self.layers[self.layer].pixels
+            if load * scale < LAYER_DECODE_HEADROOM:
+                return self._switch(higher, now)
+        
+        return self.layer
+    
+    def _switch(self, layer: int, now: float) -> int:
+        logger.info(f"Слой simulcast: {self.layers[self.layer].name} -> {self.layers[layer].name} "
+                    f"(декодирование {self.decode_time * 1000:.1f} мс, интервал {self.frame_interval * 1000:.0f} мс)")
+        self.layer = layer
+        self._reset(now)
+        return layer
+
+
+class TransportSelector:
+    """
+    Транспорт трансляции каждого студента (режим auto)
+    
+    Студент начинает на TCP, но подписан и на multicast и раз в
+    TRANSPORT_REPORT_INTERVAL сообщает (MULTICAST_REPORT), сколько
+    кадров multicast собрал. TRANSPORT_PROMOTE_REPORTS хороших отчетов
+    подряд - студенту только multicast, TCP кадры ему больше не идут.
+    Обратно на TCP - если собрано меньше TRANSPORT_FALLBACK_DELIVERY,
+    последний кадр отстает или отчетов нет дольше
+    TRANSPORT_REPORT_TIMEOUT (multicast не доходит до его подсети).
+    
+    Студенты без отчетов сюда не попадают - они на TCP.
+    """
+    
+    def __init__(self, fps: float):
+        self.max_lag_frames = max(1, int(TRANSPORT_MAX_LAG * fps))
+        self._students: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.switches = 0
+    
+    def report(self, student_id: str, data: Dict, frame_number: int, now: Optional[float] = None) -> str:
+        """
+        Учесть отчет студента
+        
+        Args:
+            data: {"received": кадров multicast, "span": номеров кадров за период, "last_frame": последний}
+            frame_number: Номер кадра, который сейчас отправляет преподаватель
+        
+        Returns:
+            Транспорт студента: "multicast" или "tcp"
+        """
+        if now is None:
+            now = time.monotonic()
+        try:
+            received = int(data.get("received", 0))
+            span = int(data.get("span", 0))
+            last_frame = int(data.get("last_frame", -1))
+        except (TypeError, ValueError):
+            return self.transport(student_id)
+        
+        delivery = min(1.0, received / span) if span > 0 else 0.0
+        lagging = frame_number - last_frame > self.max_lag_frames
+        
+        with self._lock:
+            state = self._students.get(student_id)
+            if state is None:
+                state = {"transport": "tcp", "since": now, "good_reports": 0}
+                self._students[student_id] = state
+            state["last_report"] = now
+            state["delivery"] = delivery
+            
+            if delivery >= TRANSPORT_PROMOTE_DELIVERY and not lagging:
+                state["good_reports"] += 1
+            else:
+                state["good_reports"] = 0
+            
+            if state["transport"] == "tcp":
+                if state["good_reports"] >= TRANSPORT_PROMOTE_REPORTS:
+                    self._switch(student_id, state, "multicast", now, f"собрано {delivery:.0%}")
+            elif lagging:
+                self._switch(student_id, state, "tcp", now, f"отставание {frame_number - last_frame} кадров")
+            elif delivery < TRANSPORT_FALLBACK_DELIVERY:
+                self._switch(student_id, state, "tcp", now, f"собрано {delivery:.0%}")
+            return state["transport"]
+    
+    def check(self, now: Optional[float] = None):
+        """Студентов на multicast без свежих отчетов - обратно на TCP"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            for student_id, state in self._students.items():
+                if state["transport"] == "multicast" and now - state["last_report"] > TRANSPORT_REPORT_TIMEOUT:
+                    state["good_reports"] = 0
+                    self._switch(student_id, state, "tcp", now, "нет отчетов о приеме")
+    
+    def _switch(self, student_id: str, state: dict, transport: str, now: float, reason: str):
+        logger.info(f"Студент {student_id}: {state['transport']} -> {transport} ({reason})")
+        state["transport"] = transport
+        state["since"] = now
+        self.switches += 1
+    
+    def transport(self, student_id: str) -> str:
+        """Транспорт студента"""
+        with self._lock:
+            state = self._students.get(student_id)
+            return state["transport"] if state else "tcp"
+    
+    def multicast_students(self) -> List[str]:
+        """Студенты, которым кадры идут только через multicast"""
+        with self._lock:
+            return [sid for sid, state in self._students.items() if state["transport"] == "multicast"]
+    
+    def remove(self, student_id: str):
+        """Студент отключился"""
+        with self._lock:
+            self._students.pop(student_id, None)
+    
+    def get_stats(self, now: Optional[float] = None) -> dict:
+        """Транспорт каждого студента"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            students = {
+                sid: {
+                    "transport": state["transport"],
+                    "delivery": round(state["delivery"], 3),
+                    "seconds": round(now - state["since"], 1)  # Сколько на этом транспорте
+                }
+                for sid, state in self._students.items()
+            }
+        return {
+            "students": students,
+            "multicast": sum(1 for state in students.values() if state["transport"] == "multicast"),
+            "tcp": sum(1 for state in students.values() if state["transport"] == "tcp"),
+            "switches": self.switches
+        }
 
 
 class ScreenCaptureOptimized:
@@ -31,13 +340,49 @@ class ScreenCaptureOptimized:
     - tcp: Старый режим (для совместимости)
     - multicast: Только UDP multicast (для 30+ студентов)
     - hybrid: TCP + Multicast (максимальная совместимость)
+    - auto: Multicast всем, TCP - только студентам, до которых multicast
+      не доходит (TransportSelector); кадр по TCP уходит через
+      on_tcp_frame(data, frame_id, exclude), например
+      lambda data, frame_id, exclude: server.broadcast_to_all(
+          MessageType.SCREEN_FRAME, {"frame_id": frame_id}, exclude=exclude,
+          attachment=data, attachment_field="payload");
+      MULTICAST_REPORT студентов передаются в handle_report(), отключение -
+      в remove_student()
+    
+    Повтор потерянных фрагментов: MULTICAST_NACK студентов передаются
+    в handle_nack(); on_repair отправляет фрагмент одному студенту по TCP,
+    например lambda sid, datagram, layer: server.send_to_student(
+        sid, MessageType.MULTICAST_REPAIR, {"layer": layer}, attachment=datagram)
+    
+    Simulcast: layers=SIMULCAST_LAYERS - кадр кодируется во все слои,
+    у каждого слоя свой MulticastSender. TCP (on_frame) получает
+    первый, лучший слой. Без layers - один слой из настроек quality.
+    
+    delta=True: ключевые кадры и дельты плиток (свой TileEncoder на
+    слой); SCREEN_KEYFRAME_REQUEST студентов - в handle_keyframe_request().
+    adaptive=True (включает delta): плитки текста - WebP без потерь,
+    остальные - JPEG качества слоя.
+    
+    codec=CODEC_H264: H.264 (свой H264Encoder на слой, битрейт по числу
+    пикселей слоя); подключение студента - в add_student(), чтобы он не
+    ждал ключевого кадра до конца GOP. Без PyAV - MJPEG.
+    
+    frame_budget: бюджет JPEG кадра первого слоя, байт; остальным -
+    пропорционально числу пикселей (и при смене разрешения в set_encoding).
+    Только для MJPEG.
     """
     
     def __init__(
         self,
         quality: str = StreamQuality.MEDIUM,
         fps: int = 24,
-        mode: StreamMode = "multicast"
+        mode: StreamMode = "multicast",
+        layers: Optional[List[Dict]] = None,
+        delta: bool = False,
+        codec: str = CODEC_MJPEG,
+        gop: int = H264_GOP,
+        frame_budget: Optional[int] = None,
+        adaptive: bool = False
     ):
         self.quality = quality
         self.fps = fps
@@ -51,36 +396,95 @@ class ScreenCaptureOptimized:
         self.target_fps = self.settings.get("fps", fps)
         self.jpeg_quality = self.settings["quality"]
         
+        # Слои simulcast (от лучшего к худшему)
+        self.layers = make_layers(layers, self.target_resolution, self.jpeg_quality)
+        self.target_resolution = self.layers[0].resolution
+        self.jpeg_quality = self.layers[0].quality
+        self._layer_qualities = [layer.quality for layer in self.layers]  # Исходные (set_encoding)
+        
+        # Кодировщик с состоянием на слой: H.264 или дельты плиток (None - JPEG каждого кадра)
+        if codec == CODEC_H264 and not AV_AVAILABLE:
+            logger.warning("PyAV не установлен - трансляция в MJPEG вместо H.264")
+            codec = CODEC_MJPEG
+        self.codec = codec
+        if codec == CODEC_H264:
+            self.frame_encoders = [H264Encoder(self.target_fps, bitrate_for_resolution(layer.resolution), gop)
+                                   for layer in self.layers]
+        elif delta or adaptive:
+            self.frame_encoders = [TileEncoder(layer.quality, adaptive=adaptive) for layer in self.layers]
+        else:
+            self.frame_encoders = None
+        
+        # JPEG слоев под бюджет кадра
+        self.budget_encoders: Optional[List[JpegBudgetEncoder]] = None
+        self._budget_per_pixel = frame_budget / self.layers[0].pixels if frame_budget else 0.0
+        if frame_budget and not self.frame_encoders:
+            top = self.layers[0].pixels
+            self.budget_encoders = [JpegBudgetEncoder(frame_budget * layer.pixels // top, layer.quality)
+                                    for layer in self.layers]
+        
         # Колбэки
         self.on_frame: Optional[Callable[[bytes, int], None]] = None  # Для TCP
+        self.on_tcp_frame: Optional[Callable[[bytes, int, List[str]], None]] = None  # auto: TCP всем, кроме exclude
+        self.on_repair: Optional[Callable[[str, bytes, int], bool]] = None  # Повтор фрагмента студенту по TCP
         
-        # Multicast sender
+        # Multicast sender на каждый слой (multicast_sender - первый слой)
+        self.multicast_senders: List[MulticastSender] = []
+        self.nack_aggregators: List[NackAggregator] = []
         self.multicast_sender: Optional[MulticastSender] = None
-        if mode in ("multicast", "hybrid"):
+        self.nack_aggregator: Optional[NackAggregator] = None
+        if mode in ("multicast", "hybrid", "auto"):
             self._init_multicast()
         
+        # Транспорт каждого студента (auto)
+        self.transports = TransportSelector(self.target_fps)
+        
         # Статистика
         self.frame_count = 0
         self.dropped_frames = 0
         self.multicast_frames = 0
         self.tcp_frames = 0
+        self.bytes_sent = 0  # Все слои
+        self.tcp_bytes_saved = 0  # Не отправлено по TCP студентам на multicast (auto)
+        self.saved_mbps = 0.0
+        self._saved_window = 0
+        self._saved_start = time.monotonic()
         
         logger.info(f"ScreenCaptureOptimized создан: качество={quality}, fps={self.target_fps}, режим={mode}")
     
     def _init_multicast(self):
-        """Инициализация multicast sender"""
+        """Инициализация multicast sender (по одному на слой)"""
         try:
-            config = MulticastConfig(
-                group="239.255.1.1",  # Multicast группа для видео
-                port=5005,
-                ttl=32
-            )
-            self.multicast_sender = MulticastSender(config)
-            logger.info("Multicast sender инициализирован")
+            # Предел скорости общий на точку доступа - делится между слоями по числу пикселей
+            max_bitrate = max_bitrate_from_config()  # config.ini: [Network] MulticastMaxBitrateMbps
+            total_pixels = sum(layer.pixels for layer in self.layers)
+            
+            for index, layer in enumerate(self.layers):
+                config = MulticastConfig(
+                    group=layer.group,  # Multicast группа слоя
+                    port=layer.port,
+                    ttl=32,
+                    fec_ratio=fec_ratio_from_config(),  # config.ini: [Network] MulticastFecRatio
+                    max_bitrate_mbps=max_bitrate * layer.pixels / total_pixels,
+                    frame_interval=1.0 / self.target_fps  # Кадр уходит равномерно за интервал, а не залпом
+                )
+                sender = MulticastSender(config)
+                self.multicast_senders.append(sender)
+                self.nack_aggregators.append(NackAggregator(
+                    sender, lambda sid, datagram, layer=index: self._send_repair(sid, datagram, layer)))
+            
+            self.multicast_sender = self.multicast_senders[0]
+            self.nack_aggregator = self.nack_aggregators[0]
+            logger.info(f"Multicast sender инициализирован, слоев: {len(self.layers)}")
         except Exception as e:
             logger.error(f"Ошибка инициализации multicast: {e}")
-            # Fallback на TCP
-            self.mode = "tcp"
+            for sender in self.multicast_senders:
+                sender.close()
+            self.multicast_senders = []
+            self.nack_aggregators = []
+            # Fallback на TCP (в auto без multicast никто не подтвердит прием - все на TCP)
+            if self.mode != "auto":
+                self.mode = "tcp"
     
     def start(self) -> bool:
         """Начать захват экрана"""
@@ -98,7 +502,7 @@ class ScreenCaptureOptimized:
             
             logger.info("Захват экрана запущен")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Ошибка запуска захвата: {e}")
             self.capturing = False
@@ -113,17 +517,17 @@ class ScreenCaptureOptimized:
             self.capture_thread.join(timeout=2)
             self.capture_thread = None
         
-        if self.multicast_sender:
-            self.multicast_sender.close()
+        for aggregator in self.nack_aggregators:
+            aggregator.close()
+        for sender in self.multicast_senders:
+            sender.close()
         
         logger.info(f"Захват остановлен. Кадров: {self.frame_count}, пропущено: {self.dropped_frames}")
-        if self.mode in ("multicast", "hybrid"):
+        if self.mode in ("multicast", "hybrid", "auto"):
             logger.info(f"Multicast кадров: {self.multicast_frames}, TCP кадров: {self.tcp_frames}")
     
     def _capture_loop(self):
         """Основной цикл захвата"""
-        frame_time = 1.0 / self.target_fps
-        
         with mss.mss() as sct:
             # Получаем основной монитор
             monitor = sct.monitors[1] if len(sct.monitors) > 1 else sct.monitors[0]
@@ -133,6 +537,7 @@ class ScreenCaptureOptimized:
             
             while self.capturing:
                 loop_start = time.time()
+                frame_time = 1.0 / self.target_fps  # Меняется на лету (set_encoding)
                 
                 try:
                     # Захват экрана
@@ -142,19 +547,15 @@ class ScreenCaptureOptimized:
                     frame = np.array(screenshot)
                     frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
                     
-                    # Изменяем размер если нужно
-                    if (frame.shape[1], frame.shape[0]) != self.target_resolution:
-                        frame = cv2.resize(frame, self.target_resolution)
-                    
-                    # Кодируем в JPEG
-                    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
-                    _, buffer = cv2.imencode('.jpg', frame, encode_param)
-                    frame_data = buffer.tobytes()
+                    # Изменяем размер и кодируем в JPEG - во все слои за один проход
+                    layers_data = encode_layers(frame, self.layers, self.frame_encoders or self.budget_encoders,
+                                                self.frame_count)
                     
                     # Отправляем через выбранный режим
-                    self._send_frame(frame_data)
+                    self._send_frame(layers_data)
                     
                     self.frame_count += 1
+                    self.bytes_sent += sum(len(data) for data in layers_data if data is not None)
                     
                     # Контроль FPS
                     elapsed = time.time() - loop_start
@@ -163,38 +564,133 @@ class ScreenCaptureOptimized:
                         time.sleep(sleep_time)
                     else:
                         self.dropped_frames += 1
-                    
+                
                 except Exception as e:
                     logger.error(f"Ошибка захвата кадра: {e}")
                     self.dropped_frames += 1
     
-    def _send_frame(self, frame_data: bytes):
-        """Отправить кадр через выбранный транспорт"""
+    def _send_frame(self, layers_data: List[Optional[bytes]]):
+        """Отправить кадр через выбранный транспорт (layers_data - кадр каждого слоя или None)"""
+        frame_data = layers_data[0]
         if self.mode == "tcp":
             # Только TCP (старый режим)
-            if self.on_frame:
+            if self.on_frame and frame_data is not None:
                 self.on_frame(frame_data, self.frame_count)
                 self.tcp_frames += 1
         
         elif self.mode == "multicast":
             # Только Multicast (оптимизированный режим)
-            if self.multicast_sender:
-                # Создаём пакет с номером кадра
-                frame_packet = self.frame_count.to_bytes(4, 'big') + frame_data
-                self.multicast_sender.send(frame_packet, compress=True)
-                self.multicast_frames += 1
+            self._send_multicast(layers_data)
         
         elif self.mode == "hybrid":
             # Оба (максимальная совместимость)
             # TCP для гарантированной доставки, multicast для скорости
-            if self.on_frame:
+            if self.on_frame and frame_data is not None:
                 self.on_frame(frame_data, self.frame_count)
                 self.tcp_frames += 1
             
-            if self.multicast_sender:
-                frame_packet = self.frame_count.to_bytes(4, 'big') + frame_data
-                self.multicast_sender.send(frame_packet, compress=True)
-                self.multicast_frames += 1
+            self._send_multicast(layers_data)
+        
+        elif self.mode == "auto":
+            # Multicast всем; по TCP - только тем, кто не подтвердил прием multicast
+            self._send_multicast(layers_data)
+            self.transports.check()
+            exclude = self.transports.multicast_students()
+            if frame_data is None:
+                return
+            if self.on_tcp_frame:
+                self.on_tcp_frame(frame_data, self.frame_count, exclude)
+                self.tcp_frames += 1
+            self._count_saved(len(frame_data) * len(exclude))
+    
+    def _count_saved(self, size: int):
+        """Сэкономленный TCP трафик и его скорость за последнюю секунду"""
+        self.tcp_bytes_saved += size
+        self._saved_window += size
+        now = time.monotonic()
+        elapsed = now - self._saved_start
+        if elapsed >= 1.0:
+            self.saved_mbps = round(self._saved_window * 8 / elapsed / 1_000_000, 2)
+            self._saved_window = 0
+            self._saved_start = now
+    
+    def _send_multicast(self, layers_data: List[Optional[bytes]]):
+        """Каждый слой - в свою группу (None - слой пропускает кадр)"""
+        if not self.multicast_senders:
+            return
+        # Номер кадра общий для всех слоев - студент переключает слой без скачка назад
+        frame_number = self.frame_count.to_bytes(4, 'big')
+        for sender, frame_data in zip(self.multicast_senders, layers_data):
+            if frame_data is None:
+                continue
+            # Создаём пакет с номером кадра
+            sender.send(frame_number + frame_data, compress=False)  # JPEG уже сжат
+        self.multicast_frames += 1
+    
+    def handle_nack(self, student_id: str, data: Dict):
+        """MULTICAST_NACK от студента: повторить недостающие фрагменты его слоя"""
+        try:
+            layer = int(data.get("layer", 0))
+        except (TypeError, ValueError):
+            return
+        if 0 <= layer < len(self.nack_aggregators):
+            self.nack_aggregators[layer].add(student_id, data.get("id"), data.get("missing", []))
+    
+    def handle_keyframe_request(self, student_id: str, data: Dict) -> bool:
+        """SCREEN_KEYFRAME_REQUEST от студента: следующий кадр его слоя - ключевой"""
+        if not self.frame_encoders:
+            return False
+        try:
+            layer = int(data.get("layer", 0))
+        except (TypeError, ValueError):
+            return False
+        if not 0 <= layer < len(self.frame_encoders):
+            return False
+        return self.frame_encoders[layer].request_keyframe()
+    
+    def set_encoding(self, quality: int, fps: int, resolution: tuple):
+        """
+        Качество, частота кадров и разрешение на лету (RateController)
+        
+        Качество слоев меняется в той же пропорции, что у первого слоя.
+        Разрешение - только без simulcast: у слоев свои multicast группы,
+        а меньший слой студент выбирает сам (LayerSelector).
+        """
+        self.target_fps = fps
+        if len(self.layers) == 1:
+            self.layers[0].resolution = tuple(resolution)
+            self.target_resolution = tuple(resolution)
+        for index, layer in enumerate(self.layers):
+            layer.quality = max(1, self._layer_qualities[index] * quality // self._layer_qualities[0])
+            encoder = self.frame_encoders[index] if self.frame_encoders else None
+            if isinstance(encoder, TileEncoder):
+                encoder.quality = layer.quality
+            elif encoder:
+                bitrate = bitrate_for_resolution(layer.resolution) * quality // self._layer_qualities[0]
+                encoder.set_rate(fps, bitrate)
+            if self.budget_encoders:
+                self.budget_encoders[index].max_quality = layer.quality
+                self.budget_encoders[index].budget = int(self._budget_per_pixel * layer.pixels)
+        self.jpeg_quality = self.layers[0].quality
+    
+    def add_student(self, student_id: str):
+        """Студент подключился: ключевой кадр на всех слоях (его слой пока неизвестен)"""
+        for encoder in self.frame_encoders or []:
+            encoder.request_keyframe()
+    
+    def handle_report(self, student_id: str, data: Dict) -> str:
+        """MULTICAST_REPORT от студента: выбрать его транспорт (auto)"""
+        return self.transports.report(student_id, data, self.frame_count)
+    
+    def remove_student(self, student_id: str):
+        """Студент отключился"""
+        self.transports.remove(student_id)
+    
+    def _send_repair(self, student_id: str, datagram: bytes, layer: int = 0) -> bool:
+        """Фрагмент слоя одному студенту по TCP"""
+        if not self.on_repair:
+            return False
+        return self.on_repair(student_id, datagram, layer)
     
     def get_stats(self) -> dict:
         """Получить статистику"""
@@ -206,6 +702,29 @@ class ScreenCaptureOptimized:
         
         if self.multicast_sender:
             stats["multicast_stats"] = self.multicast_sender.get_stats()
+        if self.nack_aggregator:
+            stats["nack_stats"] = self.nack_aggregator.get_stats()
+        if self.frame_encoders:
+            stats["codec"] = self.codec
+            stats["video" if self.codec == CODEC_H264 else "delta"] = [
+                encoder.get_stats() for encoder in self.frame_encoders]
+        if self.budget_encoders:
+            stats["budget"] = [encoder.get_stats() for encoder in self.budget_encoders]
+        if self.mode == "auto":
+            stats["transports"] = self.transports.get_stats()
+            stats["tcp_bytes_saved"] = self.tcp_bytes_saved
+            stats["saved_mbps"] = self.saved_mbps
+        if len(self.multicast_senders) > 1:
+            stats["layers"] = [
+                {
+                    "name": layer.name,
+                    "resolution": layer.resolution,
+                    "quality": layer.quality,
+                    "multicast_stats": sender.get_stats(),
+                    "nack_stats": aggregator.get_stats()
+                }
+                for layer, sender, aggregator in zip(self.layers, self.multicast_senders, self.nack_aggregators)
+            ]
         
         return stats
 
@@ -215,87 +734,276 @@ class ScreenReceiverOptimized:
     Приёмник экрана с поддержкой Multicast.
     
     Автоматически переключается между TCP и Multicast.
+    
+    Недостающие фрагменты запрашиваются у преподавателя через
+    send_message (например, client.send_message); MULTICAST_REPAIR
+    от преподавателя передаются в handle_repair().
+    
+    Simulcast (layers=SIMULCAST_LAYERS): приемник подписан на один слой
+    и по времени декодирования и потерям переходит на другой
+    (LayerSelector); auto_layer=False - слой только через set_layer().
+    
+    auto: кадры приходят и по multicast, и по TCP (decode_frame с
+    frame_id), дубль по номеру кадра отбрасывается. Раз в
+    TRANSPORT_REPORT_INTERVAL преподавателю уходит MULTICAST_REPORT -
+    по нему он перестает слать кадры по TCP или возобновляет.
+    
+    Дельты плиток вклеиваются в холст (TileCanvas); без основы -
+    SCREEN_KEYFRAME_REQUEST преподавателю.
     """
     
-    def __init__(self, mode: StreamMode = "multicast"):
+    def __init__(self, mode: StreamMode = "multicast",
+                 send_message: Optional[Callable[[str, Dict], bool]] = None,
+                 layers: Optional[List[Dict]] = None, layer: int = 0, auto_layer: bool = True):
         self.mode = mode
         self.last_frame: Optional[np.ndarray] = None
         self.last_frame_number = -1
+        self.last_transport: Optional[str] = None  # Откуда пришел последний показанный кадр
+        self._frame_lock = threading.Lock()  # Кадры приходят из потоков multicast и TCP
+        self.canvas = TileCanvas()
+        self._last_keyframe_request = 0.0
+        
+        # Отчет о приеме multicast (auto): кадров за период и их номера
+        self._report_received = 0
+        self._report_first = -1
+        self._report_last = -1
+        self._report_start = time.monotonic()
+        self.reports_sent = 0
+        
+        # Отправка NACK и отчетов преподавателю по TCP
+        self.send_message = send_message
+        
+        # Слои simulcast; без layers - один слой в прежней группе
+        self.layers = make_layers(layers, QUALITY_SETTINGS[StreamQuality.MEDIUM]["resolution"],
+                                  QUALITY_SETTINGS[StreamQuality.MEDIUM]["quality"])
+        self.layer = max(0, min(layer, len(self.layers) - 1))
+        self.auto_layer = auto_layer and len(self.layers) > 1
+        self.selector = LayerSelector(self.layers, self.layer)
+        self._switch_lock = threading.Lock()
+        self._switching = False
+        self.layer_switches = 0
         
         # Multicast receiver
         self.multicast_receiver = None
-        if mode in ("multicast", "hybrid"):
+        if mode in ("multicast", "hybrid", "auto"):
             self._init_multicast()
         
         # Статистика
         self.frames_received_tcp = 0
         self.frames_received_multicast = 0
+        self.duplicate_frames = 0
         
-        logger.info(f"ScreenReceiverOptimized создан, режим={mode}")
+        logger.info(f"ScreenReceiverOptimized создан, режим={mode}, слой={self.layers[self.layer].name}")
     
     def _init_multicast(self):
         """Инициализация multicast receiver"""
         try:
-            from src.network.multicast import MulticastReceiver, MulticastConfig
-            
-            config = MulticastConfig(
-                group="239.255.1.1",
-                port=5005
-            )
-            
-            self.multicast_receiver = MulticastReceiver(config)
-            self.multicast_receiver.on_data = self._on_multicast_data
-            self.multicast_receiver.start()
-            
+            self.multicast_receiver = self._start_receiver(self.layer)
             logger.info("Multicast receiver запущен")
         except Exception as e:
             logger.error(f"Ошибка инициализации multicast receiver: {e}")
             self.mode = "tcp"  # Fallback
     
-    def _on_multicast_data(self, data: bytes):
+    def _start_receiver(self, index: int):
+        """Подписаться на группу слоя"""
+        from src.network.multicast import MulticastReceiver, MulticastConfig
+        
+        layer = self.layers[index]
+        config = MulticastConfig(
+            group=layer.group,
+            port=layer.port
+        )
+        
+        receiver = MulticastReceiver(config)
+        receiver.on_data = lambda data: self._on_multicast_data(data, index)
+        if self.send_message:
+            receiver.on_nack = lambda message_id, missing: self._send_nack(message_id, missing, index)
+        receiver.start()
+        return receiver
+    
+    def set_layer(self, index: int) -> bool:
+        """
+        Перейти на слой index: подписка на новую группу, затем отписка от старой
+        
+        Returns:
+            False если слоя нет или подписаться не удалось
+        """
+        if not 0 <= index < len(self.layers):
+            return False
+        if index == self.layer:
+            return True
+        
+        with self._switch_lock:
+            old = self.multicast_receiver
+            try:
+                receiver = self._start_receiver(index) if old is not None else None
+            except Exception as e:
+                logger.error(f"Ошибка перехода на слой {self.layers[index].name}: {e}")
+                return False
+            self.multicast_receiver = receiver
+            self.layer = index
+            self.layer_switches += 1
+            # Дельты нового слоя - в другом разрешении, холст заново с ключевого кадра
+            self.canvas = TileCanvas()
+            if self.selector.layer != index:
+                self.selector = LayerSelector(self.layers, index)
+        
+        if old is not None:
+            old.stop()
+        logger.info(f"Приём переключен на слой {self.layers[index].name}")
+        return True
+    
+    def _switch_in_background(self, index: int):
+        """Переключить слой не из потока приема (stop() ждет этот поток)"""
+        def switch():
+            try:
+                self.set_layer(index)
+            finally:
+                self._switching = False
+        
+        self._switching = True
+        threading.Thread(target=switch, daemon=True).start()
+    
+    def _on_multicast_data(self, data: bytes, layer: int = 0):
         """Обработка multicast данных"""
         try:
             # Извлекаем номер кадра
             if len(data) < 4:
                 return
             
+            # Хвост прежнего слоя во время переключения
+            if layer != self.layer:
+                return
+            
             frame_number = int.from_bytes(data[:4], 'big')
             frame_data = data[4:]
             
-            # Пропускаем старые кадры
+            # Кадр собран - в отчет, даже если тот же кадр уже пришел по TCP
+            if self.mode == "auto":
+                self._count_report(frame_number)
+            
+            # Пропускаем старые кадры (и уже показанные из TCP)
             if frame_number <= self.last_frame_number:
+                self.duplicate_frames += 1
                 return
             
-            # Декодируем JPEG
-            nparr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Декодируем JPEG или дельту плиток
+            decode_start = time.perf_counter()
+            frame = self._decode(frame_data, frame_number)
+            decode_time = time.perf_counter() - decode_start
             
-            if frame is not None:
-                self.last_frame = frame
-                self.last_frame_number = frame_number
+            if frame is not None and self._show(frame, frame_number, "multicast"):
                 self.frames_received_multicast += 1
-            
+                self._check_layer(decode_time)
+        
         except Exception as e:
             logger.debug(f"Ошибка обработки multicast кадра: {e}")
     
-    def decode_frame(self, frame_bytes: bytes) -> Optional[np.ndarray]:
-        """Декодировать кадр из TCP (для совместимости)"""
+    def _decode(self, frame_data: bytes, frame_number: Optional[int]) -> Optional[np.ndarray]:
+        """Кадр из холста (копия); дельта без основы - запросить ключевой кадр"""
+        with self._frame_lock:
+            frame = self.canvas.apply(frame_data, frame_number)
+            if frame is not None:
+                return frame.copy()
+        
+        if not self.canvas.needs_keyframe or not self.send_message:
+            return None
+        now = time.monotonic()
+        if now - self._last_keyframe_request >= TILE_KEYFRAME_REQUEST_HOLD:
+            self._last_keyframe_request = now
+            self.send_message(MessageType.SCREEN_KEYFRAME_REQUEST, {"layer": self.layer})
+        return None
+    
+    def _show(self, frame: np.ndarray, frame_number: Optional[int], transport: str) -> bool:
+        """Показать кадр, если он новее показанного (False - дубль из другого транспорта)"""
+        with self._frame_lock:
+            if frame_number is not None:
+                if frame_number <= self.last_frame_number:
+                    self.duplicate_frames += 1
+                    return False
+                self.last_frame_number = frame_number
+            self.last_frame = frame
+            self.last_transport = transport
+            return True
+    
+    def _count_report(self, frame_number: int):
+        """Учесть кадр multicast; раз в TRANSPORT_REPORT_INTERVAL - отчет преподавателю"""
+        if self._report_first < 0:
+            self._report_first = frame_number
+        self._report_received += 1
+        self._report_last = max(self._report_last, frame_number)
+        
+        now = time.monotonic()
+        if now - self._report_start < TRANSPORT_REPORT_INTERVAL:
+            return
+        
+        if self.send_message:
+            self.send_message(MessageType.MULTICAST_REPORT, {
+                "received": self._report_received,
+                "span": self._report_last - self._report_first + 1,
+                "last_frame": self._report_last,
+                "layer": self.layer
+            })
+            self.reports_sent += 1
+        self._report_received = 0
+        self._report_first = -1
+        self._report_start = now
+    
+    def _check_layer(self, decode_time: float):
+        """Не пора ли сменить слой"""
+        self.selector.record_frame(decode_time)
+        if not self.auto_layer or self._switching:
+            return
+        
+        receiver = self.multicast_receiver
+        complete_ratio = receiver.reassembler.get_stats()["frames_complete_ratio"] if receiver else 1.0
+        target = self.selector.choose(complete_ratio)
+        if target != self.layer:
+            self._switch_in_background(target)
+    
+    def _send_nack(self, message_id: int, missing: List[int], layer: int = 0):
+        """Запросить недостающие фрагменты у преподавателя"""
+        self.send_message(MessageType.MULTICAST_NACK, {"id": message_id, "missing": missing, "layer": layer})
+    
+    def handle_repair(self, message: Dict):
+        """MULTICAST_REPAIR от преподавателя: фрагмент в сборку кадра"""
+        data = message.get("data", {})
+        # Повтор для слоя, с которого уже ушли, - в чужую сборку не подмешиваем
+        if data.get("layer", 0) != self.layer:
+            return
+        datagram = data.get("data")
+        if isinstance(datagram, str):
+            # Протокол v2: вложение в base64
+            datagram = base64.b64decode(datagram)
+        if self.multicast_receiver and datagram is not None:
+            self.multicast_receiver.add_repair(datagram)
+    
+    def decode_frame(self, frame_bytes: bytes, frame_id: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Декодировать кадр из TCP
+        
+        Args:
+            frame_id: Номер кадра (SCREEN_FRAME); с ним кадр, уже
+                      пришедший по multicast, не декодируется (None)
+        """
         try:
+            if frame_id is not None and frame_id <= self.last_frame_number:
+                self.duplicate_frames += 1
+                return None
+            
             # Декодируем base64 если нужно
             if isinstance(frame_bytes, str):
                 import base64
                 frame_bytes = base64.b64decode(frame_bytes)
             
-            # Декодируем JPEG
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if frame is not None:
-                self.last_frame = frame
-                self.frames_received_tcp += 1
+            # Декодируем JPEG или дельту плиток
+            frame = self._decode(frame_bytes, frame_id)
             
+            if frame is None or not self._show(frame, frame_id, "tcp"):
+                return None
+            self.frames_received_tcp += 1
             return frame
-            
+        
         except Exception as e:
             logger.error(f"Ошибка декодирования кадра: {e}")
             return None
@@ -316,11 +1024,19 @@ class ScreenReceiverOptimized:
         stats = {
             "tcp_frames": self.frames_received_tcp,
             "multicast_frames": self.frames_received_multicast,
-            "mode": self.mode
+            "duplicate_frames": self.duplicate_frames,
+            "transport": self.last_transport,
+            "mode": self.mode,
+            "layer": self.layers[self.layer].name,
+            "layer_switches": self.layer_switches,
+            "decode_ms": round(self.selector.decode_time * 1000, 2),
+            "canvas": self.canvas.get_stats()
         }
         
         if self.multicast_receiver:
             stats["multicast_stats"] = self.multicast_receiver.get_stats()
+            # Доля кадров, собранных из всех фрагментов
+            stats["frame_completeness"] = stats["multicast_stats"]["reassembly"]["frames_complete_ratio"]
         
         return stats
 
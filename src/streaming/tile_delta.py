@@ -0,0 +1,482 @@
+"""
+Дельта-кодирование экрана по плиткам
+
+Пока преподаватель читает слайд, на экране меняется только курсор, а
+кадр целиком кодируется и отправляется 24 раза в секунду. Здесь кадр
+делится на плитки TILE_SIZE x TILE_SIZE, изменившиеся плитки находятся
+сравнением с предыдущим кадром (NumPy, без цикла по плиткам) и уходят
+одной JPEG мозаикой; студент вклеивает их в свой холст (TileCanvas).
+
+Формат:
+- ключевой кадр - обычный JPEG (его понимают и старые клиенты); уходит
+  раз в TILE_KEYFRAME_INTERVAL, по запросу или когда изменилась большая
+  часть экрана
+- дельта - TILE_HEADER, номера плиток (uint16) и JPEG мозаика плиток
+  (нет, если ничего не изменилось)
+
+Дельта применяется только поверх кадра base_id: медиа очередь TCP
+выбрасывает старые кадры, multicast их теряет. Если основы нет,
+приемник ждет ключевой кадр и просит его (SCREEN_KEYFRAME_REQUEST).
+
+Плитка кратна 16 - блоки JPEG (MCU при 4:2:0) не пересекают границы
+плиток, соседние плитки мозаики не "протекают" друг в друга.
+
+Кадры H.264 (video_codec) холст передает H264Decoder - приемникам
+не нужно различать кодек трансляции.
+
+adaptive=True (версия TILE_VERSION_ADAPTIVE): мелкий шрифт редактора и
+слайдов JPEG размывает уже при качестве 50-70. Плитки делятся по
+содержимому: текст и интерфейс (мало цветов, резкие края - большая
+часть пикселей равна соседу слева) уходят мозаикой WebP без потерь
+(палитра и кэш цветов - экран кода в 5 раз меньше PNG и в 2 раза меньше
+JPEG 60), фото и видео - JPEG мозаикой. Ключевой кадр - все плитки так же, с
+base_id = TILE_NO_BASE (основа не нужна); старые клиенты его не поймут.
+"""
+
+import logging
+import math
+import struct
+import time
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from src.streaming.video_codec import AV_AVAILABLE, H264Decoder, is_video_frame
+
+logger = logging.getLogger(__name__)
+
+# Сторона плитки, пикселей (кратна 16)
+TILE_SIZE = 64
+# Ключевой кадр не реже, сек - подключившиеся студенты и потерянные дельты
+TILE_KEYFRAME_INTERVAL = 2.0
+# Изменилось больше этой доли плиток - ключевой кадр (целый JPEG не больше мозаики)
+TILE_KEYFRAME_RATIO = 0.5
+# Ключевые кадры по запросу - не чаще, сек (запрашивают сразу многие студенты)
+TILE_KEYFRAME_MIN_INTERVAL = 0.5
+# Приемник повторяет запрос ключевого кадра не чаще, сек
+TILE_KEYFRAME_REQUEST_HOLD = 1.0
+
+# Заголовок дельты: магия, версия, номер кадра-основы, ширина, высота, плитка, плиток
+TILE_MAGIC = b'TD'
+TILE_VERSION = 1
+TILE_HEADER = struct.Struct('!2sBIHHHH')
+
+# adaptive: после номеров плиток - плиток без потерь (они первые) и длина их мозаики
+TILE_VERSION_ADAPTIVE = 2
+TILE_LOSSLESS_HEADER = struct.Struct('!HI')
+# base_id ключевого кадра adaptive: все плитки, основа не нужна
+TILE_NO_BASE = 0xFFFFFFFF
+# Плитка - текст (без потерь), если столько пикселей равны соседу слева;
+# у текста и интерфейса 0.6-1.0, у фото и видео с шумом - почти 0
+TILE_LOSSLESS_FLAT = 0.5
+# Мозаика без потерь: WebP lossless; без WebP в сборке OpenCV - PNG
+# (приемник различает их по сигнатуре)
+if cv2.haveImageWriter('.webp'):
+    TILE_LOSSLESS_FORMAT, TILE_LOSSLESS_PARAMS = '.webp', [int(cv2.IMWRITE_WEBP_QUALITY), 101]
+else:
+    TILE_LOSSLESS_FORMAT, TILE_LOSSLESS_PARAMS = '.png', [int(cv2.IMWRITE_PNG_COMPRESSION), 1]
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+def is_tile_delta(data: BytesLike) -> bool:
+    """Дельта плиток (а не JPEG ключевого кадра)"""
+    return len(data) >= TILE_HEADER.size and bytes(data[:2]) == TILE_MAGIC
+
+
+def is_tile_keyframe(data: BytesLike) -> bool:
+    """Кадр собирается без предыдущих: JPEG или плитки без основы (TILE_NO_BASE)"""
+    if not is_tile_delta(data):
+        return True
+    return TILE_HEADER.unpack_from(data)[2] == TILE_NO_BASE
+
+
+def _grid(image: np.ndarray, tile: int) -> np.ndarray:
+    """Вид (строк, tile, столбцов, tile, 3) на изображение, кратное плитке"""
+    rows, cols = image.shape[0] // tile, image.shape[1] // tile
+    return image.reshape(rows, tile, cols, tile, image.shape[2])
+
+
+def _mosaic_shape(count: int) -> tuple:
+    """Почти квадратная мозаика на count плиток: (строк, столбцов)"""
+    cols = math.ceil(math.sqrt(count))
+    return math.ceil(count / cols), cols
+
+
+def _mosaic(tiles: np.ndarray) -> np.ndarray:
+    """Плитки (count, tile, tile, 3) -> одно изображение почти квадратной мозаикой"""
+    count, tile = len(tiles), tiles.shape[1]
+    mosaic_rows, mosaic_cols = _mosaic_shape(count)
+    mosaic = np.zeros((mosaic_rows * mosaic_cols, tile, tile, 3), dtype=np.uint8)
+    mosaic[:count] = tiles
+    mosaic = mosaic.reshape(mosaic_rows, mosaic_cols, tile, tile, 3).swapaxes(1, 2)
+    return mosaic.reshape(mosaic_rows * tile, mosaic_cols * tile, 3)
+
+
+def _unmosaic(mosaic: Optional[np.ndarray], count: int, tile: int) -> Optional[np.ndarray]:
+    """Мозаика -> плитки (count, tile, tile, 3); None, если размер не тот"""
+    mosaic_rows, mosaic_cols = _mosaic_shape(count)
+    if mosaic is None or mosaic.shape[:2] != (mosaic_rows * tile, mosaic_cols * tile):
+        return None
+    tiles = mosaic.reshape(mosaic_rows, tile, mosaic_cols, tile, 3).swapaxes(1, 2)
+    return tiles.reshape(-1, tile, tile, 3)[:count]
+
+
+def lossless_tiles(tiles: np.ndarray) -> np.ndarray:
+    """
+    Какие плитки (count, tile, tile, 3) - текст и интерфейс (кодировать без потерь)
+    
+    Доля пикселей, равных соседу слева (побайтно - в 10 раз быстрее, чем
+    попиксельно): однотонный фон между буквами дает длинные серии, шум
+    фото и видео - почти ни одной.
+    """
+    count, tile = len(tiles), tiles.shape[1]
+    rows = tiles.reshape(count, tile, -1)
+    equal = np.count_nonzero(rows[:, :, 3:] == rows[:, :, :-3], axis=(1, 2))
+    return equal >= TILE_LOSSLESS_FLAT * tile * (rows.shape[2] - 3)
+
+
+class TileEncoder:
+    """
+    Кодирование кадров: ключевой JPEG или дельта изменившихся плиток
+    
+    Использование:
+        encoder = TileEncoder(quality=70)
+        data = encoder.encode(frame, frame_id)  # frame - BGR
+    
+    adaptive=True: плитки текста - без потерь (TILE_LOSSLESS_FORMAT),
+    остальные - JPEG quality. Текст, меняющийся кадр за кадром (прокрутка,
+    край окна видео), все равно не прочесть - он уходит JPEG, а как только
+    плитка остановится, она один раз досылается без потерь.
+    """
+    
+    def __init__(self, quality: int, tile_size: int = TILE_SIZE,
+                 keyframe_interval: float = TILE_KEYFRAME_INTERVAL,
+                 keyframe_ratio: float = TILE_KEYFRAME_RATIO, adaptive: bool = False):
+        if tile_size % 16:
+            raise ValueError(f"Плитка {tile_size} не кратна 16")
+        self.quality = quality
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ratio = keyframe_ratio
+        self.adaptive = adaptive
+        
+        # Текущий и предыдущий кадр, дополненные до целых плиток (меняются местами)
+        self._current: Optional[np.ndarray] = None
+        self._previous: Optional[np.ndarray] = None
+        self._size: Optional[tuple] = None
+        self._last_id: Optional[int] = None
+        self._last_keyframe = 0.0
+        self._keyframe_requested = False
+        self._last_requested_keyframe = float('-inf')
+        # adaptive: плитки, изменившиеся в прошлом кадре, и текст, ушедший JPEG (дослать)
+        self._dirty_before: Optional[np.ndarray] = None
+        self._refine: Optional[np.ndarray] = None
+        
+        # Статистика
+        self._stats = {
+            'frames': 0,
+            'keyframes': 0,
+            'deltas': 0,
+            'empty_deltas': 0,
+            'tiles_sent': 0,
+            'lossless_tiles': 0,  # adaptive: из них без потерь (текст)
+            'refined_tiles': 0,  # adaptive: текст, досланный без потерь после движения
+            'bytes_sent': 0,
+            'bytes_saved': 0,  # Оценка: размер последнего ключевого кадра минус дельта
+            'keyframe_requests': 0,
+            'last_keyframe_bytes': 0,
+            'dirty_ratio': 0.0  # Доля изменившихся плиток, сглаженная
+        }
+    
+    def request_keyframe(self, now: Optional[float] = None) -> bool:
+        """
+        Запросить ключевой кадр (студент потерял основу или подключился)
+        
+        Returns:
+            False если ключевой кадр по запросу был только что
+        """
+        if now is None:
+            now = time.monotonic()
+        self._stats['keyframe_requests'] += 1
+        if now - self._last_requested_keyframe < TILE_KEYFRAME_MIN_INTERVAL:
+            return False
+        self._last_requested_keyframe = now
+        self._keyframe_requested = True
+        return True
+    
+    def encode(self, frame: np.ndarray, frame_id: int, now: Optional[float] = None) -> bytes:
+        """
+        Закодировать кадр
+        
+        Args:
+            frame: Кадр BGR
+            frame_id: Номер кадра; дельта следующего кадра ссылается на него
+        
+        Returns:
+            JPEG (ключевой кадр) или дельта плиток
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        height, width = frame.shape[:2]
+        if self._size != (width, height):
+            self._allocate(width, height)
+        tile = self.tile_size
+        self._current[:height, :width] = frame
+        
+        # Изменившиеся плитки: любое отличие пикселя внутри плитки
+        rows, cols = self._current.shape[0] // tile, self._current.shape[1] // tile
+        changed = np.not_equal(self._current, self._previous)
+        dirty = changed.reshape(rows, tile, cols, tile * 3).any(axis=(1, 3))
+        dirty_ratio = float(dirty.mean())
+        self._stats['dirty_ratio'] += 0.1 * (dirty_ratio - self._stats['dirty_ratio'])
+        
+        keyframe = (
+            self._last_id is None
+            or self._keyframe_requested
+            or dirty_ratio > self.keyframe_ratio
+            or now - self._last_keyframe >= self.keyframe_interval
+        )
+        moving = dirty & self._dirty_before
+        self._dirty_before = dirty
+        if keyframe:
+            data = self._encode_keyframe(frame, np.ones_like(dirty), moving, width, height, now)
+        else:
+            data = self._encode_delta(dirty, moving, width, height)
+        
+        self._current, self._previous = self._previous, self._current
+        self._last_id = frame_id
+        self._stats['frames'] += 1
+        self._stats['bytes_sent'] += len(data)
+        return data
+    
+    def _allocate(self, width: int, height: int):
+        """Буферы под новый размер кадра; первый кадр - ключевой"""
+        tile = self.tile_size
+        shape = (math.ceil(height / tile) * tile, math.ceil(width / tile) * tile, 3)
+        self._current = np.zeros(shape, dtype=np.uint8)
+        self._previous = np.zeros(shape, dtype=np.uint8)
+        grid = (shape[0] // tile, shape[1] // tile)
+        self._dirty_before = np.zeros(grid, dtype=bool)
+        self._refine = np.zeros(grid, dtype=bool)
+        self._size = (width, height)
+        self._last_id = None
+    
+    def _encode_keyframe(self, frame: np.ndarray, tiles: np.ndarray, moving: np.ndarray,
+                         width: int, height: int, now: float) -> bytes:
+        if self.adaptive:
+            data = self._encode_tiles(tiles, moving, width, height, TILE_NO_BASE)
+        else:
+            _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+            data = buffer.tobytes()
+        self._last_keyframe = now
+        self._keyframe_requested = False
+        self._stats['keyframes'] += 1
+        self._stats['last_keyframe_bytes'] = len(data)
+        return data
+    
+    def _encode_delta(self, dirty: np.ndarray, moving: np.ndarray, width: int, height: int) -> bytes:
+        self._stats['deltas'] += 1
+        if self.adaptive:
+            # Остановившийся текст, ушедший JPEG, - досылается без потерь
+            self._stats['refined_tiles'] += int(np.count_nonzero(self._refine & ~dirty))
+            dirty = dirty | self._refine
+        data = self._encode_tiles(dirty, moving, width, height, self._last_id)
+        if not dirty.any():
+            self._stats['empty_deltas'] += 1
+        self._stats['bytes_saved'] += max(0, self._stats['last_keyframe_bytes'] - len(data))
+        return data
+    
+    def _encode_tiles(self, dirty: np.ndarray, moving: np.ndarray, width: int, height: int,
+                      base_id: int) -> bytes:
+        """Заголовок, номера плиток dirty и их мозаики"""
+        tile = self.tile_size
+        rows, cols = np.nonzero(dirty)
+        count = len(rows)
+        version = TILE_VERSION_ADAPTIVE if self.adaptive else TILE_VERSION
+        header = TILE_HEADER.pack(TILE_MAGIC, version, base_id, width, height, tile, count)
+        if count == 0:
+            return header
+        
+        tiles = _grid(self._current, tile)[rows, :, cols]
+        jpeg_params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        self._stats['tiles_sent'] += count
+        if not self.adaptive:
+            _, buffer = cv2.imencode('.jpg', _mosaic(tiles), jpeg_params)
+            indices = (rows * dirty.shape[1] + cols).astype('>u2').tobytes()
+            return header + indices + buffer.tobytes()
+        
+        # Плитки текста - первыми, одной мозаикой без потерь; остальные - JPEG мозаикой
+        text = lossless_tiles(tiles)
+        self._refine[rows, cols] = text & moving[rows, cols]
+        text &= ~moving[rows, cols]
+        order = np.argsort(~text, kind='stable')
+        rows, cols, tiles = rows[order], cols[order], tiles[order]
+        lossless = int(np.count_nonzero(text))
+        exact = jpeg = b''
+        if lossless:
+            _, buffer = cv2.imencode(TILE_LOSSLESS_FORMAT, _mosaic(tiles[:lossless]), TILE_LOSSLESS_PARAMS)
+            exact = buffer.tobytes()
+        if lossless < count:
+            _, buffer = cv2.imencode('.jpg', _mosaic(tiles[lossless:]), jpeg_params)
+            jpeg = buffer.tobytes()
+        self._stats['lossless_tiles'] += lossless
+        
+        indices = (rows * dirty.shape[1] + cols).astype('>u2').tobytes()
+        return header + indices + TILE_LOSSLESS_HEADER.pack(lossless, len(exact)) + exact + jpeg
+    
+    def get_stats(self) -> dict:
+        """Статистика кодирования"""
+        stats = self._stats.copy()
+        stats['dirty_ratio'] = round(stats['dirty_ratio'], 3)
+        return stats
+
+
+class TileCanvas:
+    """
+    Холст студента: ключевые кадры заменяют его, дельты вклеивают плитки
+    
+    apply() возвращает холст (вид, не копию) или None, если кадр не
+    применить - дельта без своей основы; тогда needs_keyframe = True.
+    
+    Кадры H.264 декодирует H264Decoder (создается с первым таким кадром);
+    P-кадр без основы - тоже needs_keyframe.
+    
+    Плитки adaptive (мозаики без потерь и JPEG) с base_id = TILE_NO_BASE -
+    ключевой кадр: применяются без основы.
+    """
+    
+    def __init__(self):
+        self._canvas: Optional[np.ndarray] = None  # Дополнен до целых плиток
+        self._size: Optional[tuple] = None
+        self._video: Optional[H264Decoder] = None
+        self.frame_id: Optional[int] = None
+        self.needs_keyframe = False
+        
+        self._stats = {
+            'keyframes': 0,
+            'deltas': 0,
+            'tiles_applied': 0,
+            'deltas_skipped': 0,  # Без основы - ждем ключевой кадр
+            'video_unsupported': 0  # Кадры H.264 без PyAV
+        }
+    
+    def apply(self, data: BytesLike, frame_id: int) -> Optional[np.ndarray]:
+        """
+        Применить кадр
+        
+        Returns:
+            Кадр для показа или None (не декодирован или нет основы)
+        """
+        if is_video_frame(data):
+            return self._apply_video(data, frame_id)
+        if not is_tile_delta(data):
+            return self._apply_keyframe(data, frame_id)
+        
+        magic, version, base_id, width, height, tile, count = TILE_HEADER.unpack_from(data)
+        keyframe = version == TILE_VERSION_ADAPTIVE and base_id == TILE_NO_BASE
+        if keyframe and tile:
+            if self._size != (width, height):
+                self._canvas = None
+            self._size = (width, height)
+        elif (version not in (TILE_VERSION, TILE_VERSION_ADAPTIVE) or self._canvas is None
+                or self._size != (width, height) or base_id != self.frame_id or not tile):
+            self._stats['deltas_skipped'] += 1
+            self.needs_keyframe = True
+            return None
+        self._pad(tile)
+        
+        if count:
+            offset = TILE_HEADER.size + count * 2
+            indices = np.frombuffer(data, dtype='>u2', count=count, offset=TILE_HEADER.size)
+            tiles = self._decode_tiles(data, version, offset, count, tile)
+            if tiles is None:
+                self._stats['deltas_skipped'] += 1
+                self.needs_keyframe = True
+                return None
+            
+            grid = _grid(self._canvas, tile)
+            grid_cols = grid.shape[2]
+            grid[indices // grid_cols, :, indices % grid_cols] = tiles
+            self._stats['tiles_applied'] += count
+        
+        self.frame_id = frame_id
+        if keyframe:
+            self.needs_keyframe = False
+            self._stats['keyframes'] += 1
+        else:
+            self._stats['deltas'] += 1
+        return self._canvas[:height, :width]
+    
+    @staticmethod
+    def _decode_tiles(data: BytesLike, version: int, offset: int, count: int, tile: int) -> Optional[np.ndarray]:
+        """Плитки (count, tile, tile, 3) из мозаик после номеров; None - повреждены"""
+        if version == TILE_VERSION:
+            mosaic = cv2.imdecode(np.frombuffer(data, np.uint8, offset=offset), cv2.IMREAD_COLOR)
+            return _unmosaic(mosaic, count, tile)
+        
+        lossless, exact_size = TILE_LOSSLESS_HEADER.unpack_from(data, offset)
+        offset += TILE_LOSSLESS_HEADER.size
+        parts = []
+        if lossless:
+            exact = np.frombuffer(data, np.uint8, count=exact_size, offset=offset)
+            parts.append(_unmosaic(cv2.imdecode(exact, cv2.IMREAD_COLOR), lossless, tile))
+        if lossless < count:
+            jpeg = np.frombuffer(data, np.uint8, offset=offset + exact_size)
+            parts.append(_unmosaic(cv2.imdecode(jpeg, cv2.IMREAD_COLOR), count - lossless, tile))
+        if any(part is None for part in parts):
+            return None
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+    
+    def _apply_video(self, data: BytesLike, frame_id: int) -> Optional[np.ndarray]:
+        if self._video is None:
+            if not AV_AVAILABLE:
+                # Просить ключевые кадры бесполезно - их тоже не декодировать
+                if self._stats['video_unsupported'] == 0:
+                    logger.error("Трансляция в H.264, а PyAV не установлен (pip install av)")
+                self._stats['video_unsupported'] += 1
+                return None
+            self._video = H264Decoder()
+        
+        frame = self._video.decode(data, frame_id)
+        self.needs_keyframe = self._video.needs_keyframe
+        if frame is None:
+            return None
+        self.frame_id = frame_id
+        return frame
+    
+    def _apply_keyframe(self, data: BytesLike, frame_id: int) -> Optional[np.ndarray]:
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        
+        height, width = frame.shape[:2]
+        if self._size != (width, height):
+            self._canvas = None
+        self._size = (width, height)
+        self._pad(TILE_SIZE)
+        self._canvas[:height, :width] = frame
+        self.frame_id = frame_id
+        self.needs_keyframe = False
+        self._stats['keyframes'] += 1
+        return self._canvas[:height, :width]
+    
+    def _pad(self, tile: int):
+        """Холст, дополненный до целых плиток tile (плитку выбирает преподаватель)"""
+        width, height = self._size
+        shape = (math.ceil(height / tile) * tile, math.ceil(width / tile) * tile, 3)
+        if self._canvas is not None and self._canvas.shape == shape:
+            return
+        canvas = np.zeros(shape, dtype=np.uint8)
+        if self._canvas is not None:
+            canvas[:height, :width] = self._canvas[:height, :width]
+        self._canvas = canvas
+    
+    def get_stats(self) -> dict:
+        """Статистика холста"""
+        stats = self._stats.copy()
+        if self._video is not None:
+            stats['video'] = self._video.get_stats()
+        return stats
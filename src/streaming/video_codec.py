@@ -0,0 +1,273 @@
+"""
+Межкадровое кодирование трансляции (H.264)
+
+JPEG каждого кадра (MJPEG) на экранном контенте обходится в 5-10 раз
+дороже межкадрового кодека: H.264 передает только отличие от
+предыдущего кадра. Кодировщик - libx264 через PyAV (опциональная
+зависимость av); без PyAV трансляция остается на MJPEG.
+
+Низкая задержка: tune=zerolatency (без B-кадров и lookahead) - каждый
+кадр выходит из кодировщика сразу, одним пакетом.
+
+Формат кадра: VIDEO_HEADER (магия, версия, флаги, номер предыдущего
+кадра, ширина, высота) и access unit H.264 (Annex B). SPS/PPS повторяются
+в каждом ключевом кадре - студент начинает с любого из них.
+
+Ключевой кадр - раз в gop кадров, по запросу (подключился студент,
+SCREEN_KEYFRAME_REQUEST) и при смене размера. P-кадр применяется только
+поверх кадра base_id: медиа очередь TCP выбрасывает старые кадры,
+multicast их теряет; без основы приемник ждет ключевой кадр
+(needs_keyframe), как TileCanvas с дельтами плиток.
+"""
+
+import logging
+import struct
+import time
+from fractions import Fraction
+from typing import Optional, Union
+
+import numpy as np
+
+# Опциональная зависимость
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Кодеки трансляции
+CODEC_MJPEG = "mjpeg"
+CODEC_H264 = "h264"
+
+# Ключевой кадр не реже, кадров (2 сек при 24 к/с)
+H264_GOP = 48
+# Битрейт по умолчанию на 1280x720, кбит/с (масштабируется по числу пикселей)
+H264_BITRATE_KBPS = 2500
+# Пресет x264: ultrafast/superfast/veryfast - быстрее, больше трафик
+H264_PRESET = "veryfast"
+# Буфер VBV, секунд битрейта (меньше - ровнее трафик, хуже ключевые кадры)
+H264_VBV_SECONDS = 0.5
+# Ключевые кадры по запросу - не чаще, сек (при подключении класса запрашивают все сразу)
+H264_KEYFRAME_MIN_INTERVAL = 0.5
+
+# Заголовок кадра: магия, версия, флаги, номер предыдущего кадра, ширина, высота
+VIDEO_MAGIC = b'HV'
+VIDEO_VERSION = 1
+VIDEO_FLAG_KEYFRAME = 0x01
+VIDEO_HEADER = struct.Struct('!2sBBIHH')
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+def is_video_frame(data: BytesLike) -> bool:
+    """Кадр H.264 (а не JPEG или дельта плиток)"""
+    return len(data) >= VIDEO_HEADER.size and bytes(data[:2]) == VIDEO_MAGIC
+
+
+def is_video_keyframe(data: BytesLike) -> bool:
+    """Ключевой кадр H.264 (декодируется без предыдущих)"""
+    return is_video_frame(data) and bool(VIDEO_HEADER.unpack_from(data)[2] & VIDEO_FLAG_KEYFRAME)
+
+
+def bitrate_for_resolution(resolution: tuple, base_kbps: int = H264_BITRATE_KBPS) -> int:
+    """Битрейт, бит/с: base_kbps на 1280x720, пропорционально числу пикселей"""
+    width, height = resolution
+    return int(base_kbps * 1000 * width * height / (1280 * 720))
+
+
+class H264Encoder:
+    """
+    Кодирование кадров в H.264 (PyAV, libx264)
+    
+    Интерфейс как у TileEncoder - подставляется вместо него:
+        encoder = H264Encoder(fps=24)
+        data = encoder.encode(frame, frame_id)  # frame - BGR
+        encoder.request_keyframe()               # студент подключился
+    """
+    
+    def __init__(self, fps: float = 24, bitrate: Optional[int] = None, gop: int = H264_GOP,
+                 preset: str = H264_PRESET):
+        if not AV_AVAILABLE:
+            raise RuntimeError("PyAV не установлен (pip install av) - H.264 недоступен")
+        self.fps = fps
+        self.bitrate = bitrate  # бит/с; None - по разрешению (bitrate_for_resolution)
+        self.gop = max(1, gop)
+        self.preset = preset
+        
+        self._context = None
+        self._size: Optional[tuple] = None
+        self._pts = 0
+        self._last_id: Optional[int] = None
+        self._keyframe_requested = False
+        self._last_requested_keyframe = float('-inf')
+        
+        # Статистика
+        self._stats = {
+            'frames': 0,
+            'keyframes': 0,
+            'keyframe_requests': 0,
+            'bytes_sent': 0,
+            'last_keyframe_bytes': 0,
+            'encode_ms': 0.0  # Сглаженное время кодирования
+        }
+    
+    def _open(self, width: int, height: int):
+        """Кодировщик под размер кадра (новый размер - новый поток с ключевого кадра)"""
+        bitrate = self.bitrate or bitrate_for_resolution((width, height))
+        context = av.CodecContext.create('libx264', 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = Fraction(1, int(round(self.fps)))
+        context.framerate = Fraction(int(round(self.fps)))
+        context.gop_size = self.gop
+        context.bit_rate = bitrate
+        vbv = int(bitrate * H264_VBV_SECONDS / 1000)
+        context.options = {
+            'preset': self.preset,
+            'tune': 'zerolatency',
+            # SPS/PPS в каждом ключевом кадре; VBV - без всплесков трафика
+            'x264-params': f'repeat-headers=1:vbv-maxrate={bitrate // 1000}:vbv-bufsize={vbv}'
+        }
+        context.open()
+        self._context = context
+        self._size = (width, height)
+        self._last_id = None
+        logger.info(f"H.264 кодировщик {width}x{height}, {bitrate // 1000} кбит/с, GOP {self.gop}")
+    
+    def set_rate(self, fps: float, bitrate: Optional[int] = None):
+        """Новые частота кадров и битрейт: кодировщик откроется заново с ключевого кадра"""
+        if fps == self.fps and bitrate == self.bitrate:
+            return
+        self.fps = fps
+        self.bitrate = bitrate
+        self._size = None
+    
+    def request_keyframe(self, now: Optional[float] = None) -> bool:
+        """
+        Запросить ключевой кадр (студент подключился или потерял кадр)
+        
+        Returns:
+            False если ключевой кадр по запросу был только что
+        """
+        if now is None:
+            now = time.monotonic()
+        self._stats['keyframe_requests'] += 1
+        if now - self._last_requested_keyframe < H264_KEYFRAME_MIN_INTERVAL:
+            return False
+        self._last_requested_keyframe = now
+        self._keyframe_requested = True
+        return True
+    
+    def encode(self, frame: np.ndarray, frame_id: int) -> Optional[bytes]:
+        """
+        Закодировать кадр
+        
+        Args:
+            frame: Кадр BGR (нечетные размеры обрезаются до четных - yuv420p)
+            frame_id: Номер кадра; следующий P-кадр ссылается на него
+        
+        Returns:
+            Кадр с VIDEO_HEADER или None (кодировщик не выдал пакет)
+        """
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+        width, height = width & ~1, height & ~1
+        if self._size != (width, height):
+            self._open(width, height)
+        
+        video_frame = av.VideoFrame.from_ndarray(np.ascontiguousarray(frame[:height, :width]), format='bgr24')
+        video_frame.pts = self._pts
+        self._pts += 1
+        if self._keyframe_requested or self._last_id is None:
+            video_frame.pict_type = av.video.frame.PictureType.I
+            self._keyframe_requested = False
+        
+        packets = self._context.encode(video_frame)
+        if not packets:
+            return None
+        payload = b''.join(bytes(packet) for packet in packets)
+        keyframe = any(packet.is_keyframe for packet in packets)
+        
+        flags = VIDEO_FLAG_KEYFRAME if keyframe else 0
+        base_id = self._last_id if self._last_id is not None else 0
+        data = VIDEO_HEADER.pack(VIDEO_MAGIC, VIDEO_VERSION, flags, base_id, width, height) + payload
+        self._last_id = frame_id
+        
+        self._stats['frames'] += 1
+        self._stats['bytes_sent'] += len(data)
+        if keyframe:
+            self._stats['keyframes'] += 1
+            self._stats['last_keyframe_bytes'] = len(data)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._stats['encode_ms'] += 0.1 * (elapsed_ms - self._stats['encode_ms'])
+        return data
+    
+    def get_stats(self) -> dict:
+        """Статистика кодирования"""
+        stats = self._stats.copy()
+        stats['encode_ms'] = round(stats['encode_ms'], 2)
+        stats['avg_frame_bytes'] = stats['bytes_sent'] // stats['frames'] if stats['frames'] else 0
+        return stats
+
+
+class H264Decoder:
+    """
+    Декодирование кадров H.264 у студента
+    
+    decode() возвращает кадр BGR или None - P-кадр без своей основы или
+    ошибка декодера; тогда needs_keyframe = True до ключевого кадра.
+    """
+    
+    def __init__(self):
+        if not AV_AVAILABLE:
+            raise RuntimeError("PyAV не установлен (pip install av) - H.264 недоступен")
+        self._context = av.CodecContext.create('h264', 'r')
+        self.frame_id: Optional[int] = None
+        self.needs_keyframe = True
+        
+        self._stats = {
+            'keyframes': 0,
+            'frames': 0,
+            'frames_skipped': 0  # Без основы - ждем ключевой кадр
+        }
+    
+    def decode(self, data: BytesLike, frame_id: int) -> Optional[np.ndarray]:
+        """
+        Декодировать кадр
+        
+        Returns:
+            Кадр BGR или None
+        """
+        magic, version, flags, base_id, width, height = VIDEO_HEADER.unpack_from(data)
+        keyframe = bool(flags & VIDEO_FLAG_KEYFRAME)
+        if version != VIDEO_VERSION or (not keyframe and (self.needs_keyframe or base_id != self.frame_id)):
+            self._skip()
+            return None
+        
+        try:
+            frames = self._context.decode(av.Packet(bytes(data[VIDEO_HEADER.size:])))
+        except Exception as e:  # av.error.FFmpegError и наследники
+            logger.debug(f"Ошибка декодирования H.264: {e}")
+            self._skip()
+            return None
+        if not frames:
+            self._skip()
+            return None
+        
+        self.frame_id = frame_id
+        self.needs_keyframe = False
+        self._stats['frames'] += 1
+        if keyframe:
+            self._stats['keyframes'] += 1
+        return frames[-1].to_ndarray(format='bgr24')
+    
+    def _skip(self):
+        self._stats['frames_skipped'] += 1
+        self.needs_keyframe = True
+    
+    def get_stats(self) -> dict:
+        """Статистика декодирования"""
+        return self._stats.copy()
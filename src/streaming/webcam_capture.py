@@ -8,7 +8,7 @@ import threading
 import time
 import base64
 import zlib
-from typing import Optional, Callable, List, Tuple
+from typing import Optional, Callable, List, Tuple, Union
 from dataclasses import dataclass
 
 try:
@@ -265,8 +265,8 @@ class WebcamReceiver:
         
         logger.info("WebcamReceiver создан")
     
-    def process_frame(self, frame_bytes: bytes, frame_id: int):
-        """Обработать полученный кадр"""
+    def process_frame(self, frame_bytes: Union[bytes, memoryview], frame_id: int):
+        """Обработать полученный кадр (bytes или memoryview без копирования)"""
         try:
             # Декодируем JPEG
             nparr = np.frombuffer(frame_bytes, np.uint8)
@@ -349,9 +349,12 @@ class WebcamBroadcaster:
         self.capture: Optional[WebcamCapture] = None
         self.active = False
         
-        # Колбэк для отправки
+        # Колбэк для отправки (base64 строка, для JSON)
         self.on_frame_data: Optional[Callable[[str, int], None]] = None
         
+        # Колбэк для отправки сырых JPEG байт (бинарное вложение протокола v3)
+        self.on_frame_bytes: Optional[Callable[[bytes, int], None]] = None
+        
         logger.info("WebcamBroadcaster создан")
     
     @staticmethod
@@ -395,7 +398,10 @@ class WebcamBroadcaster:
     
     def _on_frame(self, frame_bytes: bytes, frame_id: int):
         """Обработка кадра для отправки"""
-        if self.on_frame_data:
+        if self.on_frame_bytes:
+            # Сырые байты - без base64
+            self.on_frame_bytes(frame_bytes, frame_id)
+        elif self.on_frame_data:
             # Кодируем в base64 для JSON
             encoded = base64.b64encode(frame_bytes).decode('ascii')
             self.on_frame_data(encoded, frame_id)
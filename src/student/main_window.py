@@ -13,13 +13,15 @@ from PyQt5.QtWidgets import (
     QSpinBox, QInputDialog, QSizePolicy, QApplication, QShortcut
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QSize
-from PyQt5.QtGui import QIcon, QFont, QPixmap, QKeySequence
+from PyQt5.QtGui import QIcon, QFont, QImage, QPixmap, QKeySequence
 from typing import List, Optional
 from src.common.utils import validate_ip, get_app_dir
 from src.common.models import Teacher
 from src.network.client import StudentClient
 from src.common.constants import MessageType
 from src.streaming.screen_capture import ScreenReceiver
+from src.streaming.rate_controller import FEEDBACK_INTERVAL
+from src.streaming.cursor_channel import CursorReceiver
 from src.audio.voice_stream import VoiceReceiver, VoiceBroadcaster, AUDIO_AVAILABLE
 from src.streaming.webcam_capture import WebcamReceiver, CV2_AVAILABLE
 from src.student.whiteboard_window import StudentWhiteboardWindow
@@ -32,12 +34,50 @@ from src.control.activity_monitor import ActivityMonitor, ScreenshotCapture, ACT
 logger = logging.getLogger(__name__)
 
 
+class CursorOverlay(QLabel):
+    """Курсор преподавателя поверх кадра (SCREEN_CURSOR - не в самом кадре)"""
+    
+    def __init__(self, frame_label: QLabel, receiver: Optional[CursorReceiver] = None):
+        super().__init__(frame_label)
+        self.receiver = receiver
+        self._shape_key = None
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background: transparent; border: none;")
+        self.hide()
+    
+    def refresh(self):
+        """Поставить курсор на показанный кадр (после кадра, позиции или размера окна)"""
+        frame_label = self.parentWidget()
+        frame = frame_label.pixmap()
+        place = None
+        if self.receiver and frame and not frame.isNull():
+            place = self.receiver.place(frame.width(), frame.height())
+        if place is None:
+            self.hide()
+            return
+        
+        shape = self.receiver.shape
+        if self.receiver.shape_key != self._shape_key:
+            height, width = shape.image.shape[:2]
+            image = QImage(shape.image.data, width, height, width * 4, QImage.Format_ARGB32)
+            self.setPixmap(QPixmap.fromImage(image))
+            self.resize(width, height)
+            self._shape_key = self.receiver.shape_key
+        
+        # Кадр по центру метки (AlignCenter)
+        left = (frame_label.width() - frame.width()) // 2
+        top = (frame_label.height() - frame.height()) // 2
+        self.move(left + place[0], top + place[1])
+        self.show()
+        self.raise_()
+
+
 class FullscreenStreamWindow(QWidget):
     """Полноэкранное окно для просмотра трансляции"""
     
     closed = pyqtSignal()
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, cursor: Optional[CursorReceiver] = None):
         super().__init__(parent)
         self.setWindowTitle("Трансляция экрана")
         self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint)
@@ -55,6 +95,7 @@ class FullscreenStreamWindow(QWidget):
         self.stream_label.setStyleSheet("background-color: #000000;")
         self.stream_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         layout.addWidget(self.stream_label)
+        self.cursor_overlay = CursorOverlay(self.stream_label, cursor)
         
         # Подсказка внизу
         self.hint_label = QLabel("Нажмите ESC или двойной клик для выхода")
@@ -86,6 +127,7 @@ class FullscreenStreamWindow(QWidget):
                 Qt.SmoothTransformation
             )
             self.stream_label.setPixmap(scaled)
+            self.cursor_overlay.refresh()
     
     def keyPressEvent(self, event):
         """Обработка нажатий клавиш"""
@@ -111,7 +153,7 @@ class StreamWidget(QFrame):
     
     fullscreen_requested = pyqtSignal()
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, cursor: Optional[CursorReceiver] = None):
         super().__init__(parent)
         self.setFrameStyle(QFrame.Box | QFrame.Sunken)
         self.setStyleSheet("""
@@ -143,6 +185,7 @@ class StreamWidget(QFrame):
         """)
         self.frame_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         layout.addWidget(self.frame_label)
+        self.cursor_overlay = CursorOverlay(self.frame_label, cursor)
         
         # Панель управления (внизу)
         control_panel = QWidget()
@@ -211,6 +254,7 @@ class StreamWidget(QFrame):
                 Qt.SmoothTransformation
             )
             self.frame_label.setPixmap(scaled)
+            self.cursor_overlay.refresh()
     
     def resizeEvent(self, event):
         """При изменении размера окна — перемасштабировать кадр"""
@@ -230,6 +274,7 @@ class StreamWidget(QFrame):
     def clear(self):
         """Очистить область"""
         self._current_pixmap = None
+        self.cursor_overlay.hide()
         self.frame_label.clear()
         self.frame_label.setText("Трансляция остановлена")
         self.set_status("⚫ Остановлено", "#888")
@@ -253,6 +298,9 @@ class StudentMainWindow(QMainWindow):
         super().__init__()
         self.student_name = student_name
         self.screen_receiver = ScreenReceiver()
+        self.screen_receiver.on_keyframe_needed = self._request_keyframe
+        self.cursor_receiver = CursorReceiver()
+        self.cursor_receiver.on_shape_needed = self._request_cursor_shape
         self.stream_active = False
         self.lock_overlay = None
         
@@ -314,6 +362,11 @@ class StudentMainWindow(QMainWindow):
         self.fps_timer = QTimer()
         self.fps_timer.timeout.connect(self._update_fps)
         self.fps_timer.start(1000)
+        
+        # Обратная связь о приеме трансляции (качество подстраивает преподаватель)
+        self.feedback_timer = QTimer()
+        self.feedback_timer.timeout.connect(self._send_screen_feedback)
+        self.feedback_timer.start(int(FEEDBACK_INTERVAL * 1000))
     
     def _init_ui(self):
         """Инициализация UI"""
@@ -348,7 +401,7 @@ class StudentMainWindow(QMainWindow):
         layout.addLayout(header_layout)
 
         # Область трансляции экрана (адаптивная!)
-        self.stream_widget = StreamWidget()
+        self.stream_widget = StreamWidget(cursor=self.cursor_receiver)
         self.stream_widget.fullscreen_requested.connect(self._toggle_fullscreen)
         layout.addWidget(self.stream_widget, stretch=3)  # Занимает больше места
         
@@ -632,7 +685,7 @@ class StudentMainWindow(QMainWindow):
     def _enter_fullscreen(self):
         """Войти в полноэкранный режим"""
         if not self.fullscreen_window:
-            self.fullscreen_window = FullscreenStreamWindow()
+            self.fullscreen_window = FullscreenStreamWindow(cursor=self.cursor_receiver)
             self.fullscreen_window.closed.connect(self._on_fullscreen_closed)
         
         # Копируем текущий кадр
@@ -783,6 +836,7 @@ class StudentMainWindow(QMainWindow):
         
         # Очищаем область трансляции
         self.stream_active = False
+        self.cursor_receiver.clear()
         self.stream_widget.clear()
         
         # Закрываем полноэкранное окно
@@ -793,6 +847,28 @@ class StudentMainWindow(QMainWindow):
         
         self._add_message("Отключено от преподавателя")
     
+    def _request_keyframe(self):
+        """Дельта кадра экрана без основы - попросить ключевой кадр"""
+        if self.client and self.client.connected:
+            self.client.send_message(MessageType.SCREEN_KEYFRAME_REQUEST, {})
+    
+    def _request_cursor_shape(self, key: int):
+        """Незнакомая форма курсора преподавателя - попросить ее"""
+        if self.client and self.client.connected:
+            self.client.send_message(MessageType.SCREEN_CURSOR_SHAPE, {"shape": key})
+    
+    def _update_cursor(self):
+        """Перерисовать курсор преподавателя в виджете и полноэкранном окне"""
+        self.stream_widget.cursor_overlay.refresh()
+        if self.fullscreen_window and self.fullscreen_window.isVisible():
+            self.fullscreen_window.cursor_overlay.refresh()
+    
+    def _send_screen_feedback(self):
+        """SCREEN_FEEDBACK: потери, декодирование и трафик с прошлого отчета"""
+        feedback = self.screen_receiver.get_feedback()
+        if self.stream_active and self.client and self.client.connected:
+            self.client.send_message(MessageType.SCREEN_FEEDBACK, feedback)
+    
     def _on_message_received(self, message: dict):
         """Обработка полученного сообщения"""
         msg_type = message.get("type")
@@ -816,7 +892,11 @@ class StudentMainWindow(QMainWindow):
             payload = msg_data.get("payload")
             if payload:
                 try:
-                    frame_bytes = base64.b64decode(payload)
+                    # v3: memoryview бинарного вложения, старый сервер: base64 строка
+                    if isinstance(payload, str):
+                        frame_bytes = base64.b64decode(payload)
+                    else:
+                        frame_bytes = payload
                     frame_id = msg_data.get("frame_id", 0)
                     self.screen_receiver.process_frame(frame_bytes, frame_id)
                     pixmap = self.screen_receiver.get_current_frame_as_pixmap()
@@ -832,8 +912,30 @@ class StudentMainWindow(QMainWindow):
                 except Exception as e:
                     logger.error(f"Ошибка обработки кадра: {e}")
         
+        elif msg_type == MessageType.SCREEN_KEEPALIVE:
+            # Экран преподавателя не изменился - кадр остается прежним
+            if self.stream_active:
+                self.screen_receiver.process_keepalive(msg_data.get("frame_id", 0))
+                self.stream_widget.set_status("🟢 Трансляция", "#4ade80")
+        
+        elif msg_type == MessageType.SCREEN_CURSOR:
+            # Курсор преподавателя отдельно от кадров - кадр не перерисовывается
+            if self.stream_active:
+                self.cursor_receiver.process(msg_data)
+                self._update_cursor()
+        
+        elif msg_type == MessageType.SCREEN_CURSOR_SHAPE:
+            image = msg_data.get("image")
+            if image:
+                # v3: memoryview бинарного вложения, старый сервер: base64 строка
+                if isinstance(image, str):
+                    image = base64.b64decode(image)
+                self.cursor_receiver.process_shape(msg_data, image)
+                self._update_cursor()
+        
         elif msg_type == MessageType.SCREEN_STREAM_STOP:
             self.stream_active = False
+            self.cursor_receiver.clear()
             self.stream_widget.clear()
             self._exit_fullscreen()
 
@@ -950,7 +1052,11 @@ class StudentMainWindow(QMainWindow):
                 frame_id = msg_data.get("frame_id", 0)
                 if encoded_data:
                     try:
-                        frame_bytes = base64.b64decode(encoded_data)
+                        # v3: memoryview бинарного вложения, старый сервер: base64 строка
+                        if isinstance(encoded_data, str):
+                            frame_bytes = base64.b64decode(encoded_data)
+                        else:
+                            frame_bytes = encoded_data
                         self.webcam_receiver.process_frame(frame_bytes, frame_id)
                         
                         # Обновляем виджет камеры
@@ -1098,17 +1204,16 @@ class StudentMainWindow(QMainWindow):
         try:
             self.voice_broadcaster = VoiceBroadcaster()
             
-            def on_voice_data(encoded_data: str, chunk_id: int):
+            def on_voice_bytes(voice_bytes: bytes, chunk_id: int):
                 """Отправка голоса преподавателю"""
                 if self.client and self.client.connected:
                     self.client.send_message(MessageType.VOICE_DATA, {
-                        "data": encoded_data,
                         "chunk_id": chunk_id,
                         "from_student": True,
                         "student_name": self.student_name
-                    })
+                    }, attachment=voice_bytes, attachment_field="data")
             
-            self.voice_broadcaster.on_voice_data = on_voice_data
+            self.voice_broadcaster.on_voice_bytes = on_voice_bytes
             
             if self.voice_broadcaster.start():
                 self.speaking = True
@@ -4,7 +4,6 @@
 
 import sys
 import logging
-import base64
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
@@ -17,8 +16,10 @@ from typing import Dict
 from src.common.models import Student
 from src.common.constants import StudentStatus, MessageType
 from src.common.utils import get_app_dir
-from src.network.server import TeacherServer
-from src.streaming.screen_capture import ScreenCapture
+from src.network.server import TeacherServer, create_teacher_server
+from src.streaming.screen_capture import ScreenCapture, create_screen_capture, is_keyframe
+from src.streaming.rate_controller import RateController
+from src.core.performance_manager import PerformanceManager
 from src.control.classroom_control import ClassroomControl
 from src.audio.voice_stream import VoiceBroadcaster, VoiceReceiver, AUDIO_AVAILABLE
 from src.streaming.webcam_capture import WebcamBroadcaster, CV2_AVAILABLE
@@ -126,6 +127,7 @@ class TeacherMainWindow(QMainWindow):
 
         # Трансляция экрана
         self.screen_capture: ScreenCapture = None
+        self.rate_controller: RateController = None  # Качество по обратной связи студентов
         self.streaming = False
         
         # Голосовая связь (преподаватель → студенты)
@@ -496,7 +498,7 @@ class TeacherMainWindow(QMainWindow):
     def _init_server(self):
         """Инициализировать сервер"""
         try:
-            self.server = TeacherServer(self.teacher_name, self.channel)
+            self.server = create_teacher_server(self.teacher_name, self.channel)
             
             # Подключаем колбэки
             self.server.on_student_connected = self._on_student_connected
@@ -538,6 +540,10 @@ class TeacherMainWindow(QMainWindow):
         self.student_cards[student.id] = card
         self._update_student_count()
         
+        # Новому студенту нужен ключевой кадр, а не дельта (до конца GOP)
+        if self.screen_capture:
+            self.screen_capture.request_keyframe()
+        
         # Событие
         self._add_event(f"{student.name} подключился")
     
@@ -554,6 +560,9 @@ class TeacherMainWindow(QMainWindow):
             
             self._update_student_count()
             self._reorganize_cards()
+        
+        if self.rate_controller:
+            self.rate_controller.remove_student(student_id)
     
     def _on_message_received(self, student_id: str, message: Dict):
         """Обработка сообщения от студента"""
@@ -598,6 +607,24 @@ class TeacherMainWindow(QMainWindow):
                 self._add_event(f"🎤 {student_name} закончил говорить")
                 self._stop_student_voice_receiver()
         
+        # Студент потерял основу для дельт кадров экрана
+        if msg_type == MessageType.SCREEN_KEYFRAME_REQUEST:
+            if self.screen_capture:
+                self.screen_capture.request_keyframe()
+        
+        # Студент не знает форму курсора (подключился после ее рассылки)
+        if msg_type == MessageType.SCREEN_CURSOR_SHAPE:
+            shape = self.screen_capture.cursor_shape(data.get("shape")) if self.screen_capture else None
+            if shape:
+                shape_data, image = shape.to_message()
+                self.server.send_to_student(student_id, MessageType.SCREEN_CURSOR_SHAPE, shape_data,
+                                            attachment=image, attachment_field="image")
+        
+        # Прием трансляции студентом - для подстройки качества
+        if msg_type == MessageType.SCREEN_FEEDBACK:
+            if self.rate_controller:
+                self.rate_controller.report(student_id, data)
+        
         # Мониторинг активности
         if msg_type == MessageType.ACTIVITY_REPORT:
             self.activity_tracker.update_report(student_id, data)
@@ -659,6 +686,12 @@ class TeacherMainWindow(QMainWindow):
         """Обновление статуса (вызывается таймером)"""
         from datetime import datetime
         self.time_label.setText(f"Время: {datetime.now().strftime('%H:%M:%S')}")
+        
+        # Качество трансляции: очереди кадров по студентам и решение контура
+        if self.rate_controller and self.server:
+            queues = self.server.get_stats().get("send_queues", {})
+            self.rate_controller.update_queues({sid: queue.get("media_depth", 0) for sid, queue in queues.items()})
+            self.rate_controller.tick()
     
     def _add_event(self, event_text: str):
         """Добавить событие"""
@@ -771,6 +804,7 @@ class TeacherMainWindow(QMainWindow):
             if self.screen_capture:
                 self.screen_capture.stop()
                 self.screen_capture = None
+            self.rate_controller = None
             self.streaming = False
             self.server.broadcast_to_all(
                 MessageType.SCREEN_STREAM_STOP,
@@ -779,38 +813,71 @@ class TeacherMainWindow(QMainWindow):
             self._add_event("Трансляция остановлена")
             return
 
-        # Запустить
-        self.screen_capture = ScreenCapture()
+        # Запустить (кодек - config.ini, [Streaming] ScreenCodec)
+        self.screen_capture = create_screen_capture()
 
         def on_frame(frame_bytes: bytes, frame_id: int):
             try:
-                payload = base64.b64encode(frame_bytes).decode("ascii")
+                # Кадр уходит бинарным вложением; старым клиентам сервер отдаст base64.
+                # Дельту без основы (выброшена очередью студента) очередь не отправит
                 self.server.broadcast_to_all(
                     MessageType.SCREEN_FRAME,
-                    {"frame_id": frame_id, "payload": payload}
+                    {"frame_id": frame_id},
+                    attachment=frame_bytes,
+                    attachment_field="payload",
+                    keyframe=is_keyframe(frame_bytes)
                 )
                 
-                # Записываем кадр если запись активна
-                if self.recording_active:
+                # Записываем кадр если запись активна (только JPEG: дельты и H.264,
+                # закодированные до начала записи, без основы не покажешь)
+                if self.recording_active and frame_bytes[:2] == b'\xff\xd8':
                     self.lesson_recorder.add_screen_frame(frame_bytes)
                 
             except Exception as e:
                 logging.error(f"Ошибка отправки кадра: {e}")
 
+        def on_keepalive(frame_id: int):
+            # Экран не изменился: вместо кадра - номер последнего кадра
+            self.server.broadcast_to_all(MessageType.SCREEN_KEEPALIVE, {"frame_id": frame_id})
+
+        def on_cursor(data: Dict):
+            # Курсор не в кадрах: движение мыши - несколько десятков байт, а не новый кадр
+            self.server.broadcast_to_all(MessageType.SCREEN_CURSOR, data)
+        
+        def on_cursor_shape(shape):
+            data, image = shape.to_message()
+            self.server.broadcast_to_all(MessageType.SCREEN_CURSOR_SHAPE, data,
+                                         attachment=image, attachment_field="image")
+        
         self.screen_capture.on_frame = on_frame
+        self.screen_capture.on_keepalive = on_keepalive
+        self.screen_capture.on_cursor = on_cursor
+        self.screen_capture.on_cursor_shape = on_cursor_shape
+        # Запись урока хранит кадры без меток времени - ей нужен каждый кадр, и в JPEG
+        self.screen_capture.set_skip_static(not self.recording_active)
+        self.screen_capture.set_plain_jpeg(self.recording_active)
+        # Потолок качества - профиль по числу студентов, ниже - по их обратной связи
+        profile = PerformanceManager.get_profile_for_students(self.server.get_student_count())
+        self.rate_controller = RateController(self.screen_capture, profile)
+        self.rate_controller.enabled = not self.recording_active
+        # Кадр с видео - в бюджете профиля, а не в разы больше слайда
+        self.screen_capture.set_frame_budget(
+            PerformanceManager.calculate_frame_budget(profile, self.screen_capture.target_resolution,
+                                                      max_bitrate_mbps=0),
+            PerformanceManager.calculate_max_byte_rate(profile))
         started = self.screen_capture.start()
         if not started:
+            self.rate_controller = None
             QMessageBox.warning(self, "Трансляция", "Не удалось запустить захват экрана")
             return
 
         self.streaming = True
-        settings = self.screen_capture.settings
         self.server.broadcast_to_all(
             MessageType.SCREEN_STREAM_START,
             {
-                "resolution": settings["resolution"],
-                "fps": settings.get("fps"),
-                "quality": settings.get("quality")
+                "resolution": self.screen_capture.target_resolution,
+                "fps": self.screen_capture.target_fps,
+                "quality": self.screen_capture.jpeg_quality
             }
         )
         self._add_event("Трансляция экрана запущена")
@@ -867,17 +934,19 @@ class TeacherMainWindow(QMainWindow):
         try:
             self.voice_broadcaster = VoiceBroadcaster()
             
-            def on_voice_data(encoded_data: str, chunk_id: int):
+            def on_voice_bytes(voice_bytes: bytes, chunk_id: int):
                 """Отправка голосовых данных всем студентам"""
                 try:
                     self.server.broadcast_to_all(
                         MessageType.VOICE_DATA,
-                        {"data": encoded_data, "chunk_id": chunk_id}
+                        {"chunk_id": chunk_id},
+                        attachment=voice_bytes,
+                        attachment_field="data"
                     )
                 except Exception as e:
                     logger.error(f"Ошибка отправки голоса: {e}")
             
-            self.voice_broadcaster.on_voice_data = on_voice_data
+            self.voice_broadcaster.on_voice_bytes = on_voice_bytes
             
             if self.voice_broadcaster.start():
                 self.voice_active = True
@@ -967,17 +1036,19 @@ class TeacherMainWindow(QMainWindow):
             
             self.webcam_broadcaster = WebcamBroadcaster()
             
-            def on_webcam_frame(encoded_data: str, frame_id: int):
+            def on_webcam_frame(frame_bytes: bytes, frame_id: int):
                 """Отправка кадров камеры всем студентам"""
                 try:
                     self.server.broadcast_to_all(
                         MessageType.WEBCAM_FRAME,
-                        {"data": encoded_data, "frame_id": frame_id}
+                        {"frame_id": frame_id},
+                        attachment=frame_bytes,
+                        attachment_field="data"
                     )
                 except Exception as e:
                     logger.error(f"Ошибка отправки кадра камеры: {e}")
             
-            self.webcam_broadcaster.on_frame_data = on_webcam_frame
+            self.webcam_broadcaster.on_frame_bytes = on_webcam_frame
             
             if self.webcam_broadcaster.start(camera_index=cameras[0]):
                 self.webcam_active = True
@@ -1178,6 +1249,11 @@ class TeacherMainWindow(QMainWindow):
                 )
                 
                 self.recording_active = True
+                if self.screen_capture:
+                    self.screen_capture.set_skip_static(False)
+                    self.screen_capture.set_plain_jpeg(True)
+                if self.rate_controller:
+                    self.rate_controller.enabled = False
                 self.record_action.setText("⏹️ Стоп")
                 self._add_event(f"🔴 Запись начата: {lesson_name}")
                 
@@ -1193,6 +1269,11 @@ class TeacherMainWindow(QMainWindow):
                 path = self.lesson_recorder.stop_recording()
                 
                 self.recording_active = False
+                if self.screen_capture:
+                    self.screen_capture.set_skip_static(True)
+                    self.screen_capture.set_plain_jpeg(False)
+                if self.rate_controller:
+                    self.rate_controller.enabled = True
                 self.record_action.setText("🔴 Запись")
                 self.record_action.setChecked(False)
                 self._add_event(f"⏹️ Запись остановлена")
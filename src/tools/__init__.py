@@ -0,0 +1 @@
+"""Служебные инструменты (нагрузочное тестирование)"""
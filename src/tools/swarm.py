@@ -0,0 +1,495 @@
+"""
+Нагрузочный рой студентов (без GUI)
+
+Запускает в одном процессе N симулированных студентов (настоящие
+StudentClient) против локального TeacherServer и ищет предел сервера
+без 50-100 реальных ПК:
+- студенты регистрируются, шлют heartbeat, отчеты активности и
+  скриншоты по расписанию
+- преподаватель (отдельный процесс, чтобы мерить его CPU) рассылает
+  SCREEN_FRAME и VOICE_DATA с меткой времени отправки
+- для каждого N выводятся задержка доставки (по студентам), пропускная
+  способность, память роя и CPU/память преподавателя
+
+Работает без дисплея, камеры и микрофона: Qt, OpenCV и sounddevice
+не импортируются, кадры и голос - случайные байты нужного размера.
+Задержка считается по time.time() - процессы на одной машине.
+
+Запуск:
+    python -m src.tools.swarm
+    python -m src.tools.swarm --counts 10,50,100,200 --seconds 15 --core selectors
+    python -m src.tools.swarm --counts 20 --fps 15 --frame-kb 150 --no-voice
+"""
+
+import argparse
+import base64
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Опциональная зависимость (без нее память читается из /proc)
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+from src.common.constants import MessageType, ServerCore
+from src.common.models import Teacher
+from src.control.activity_monitor import ActivityReport
+from src.network.client import StudentClient
+from src.network.server import create_teacher_server
+
+
+logger = logging.getLogger(__name__)
+
+
+# Уровни нагрузки по умолчанию (количество студентов)
+DEFAULT_COUNTS = (10, 50, 100, 200)
+
+# Голос как у VoiceSettings: 16 кГц, моно, 16 бит, чанк 50 мс
+VOICE_CHUNK_INTERVAL = 0.05
+VOICE_CHUNK_BYTES = 1600
+
+# Сколько ждать подключения студентов к уровню нагрузки, сек
+CONNECT_TIMEOUT = 30.0
+
+
+def memory_mb() -> float:
+    """Текущая память процесса (RSS), МБ; 0 если узнать нельзя"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль (fraction от 0 до 1) без numpy"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SwarmStudent:
+    """Симулированный студент: StudentClient без окна, камеры и микрофона"""
+    
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.client = StudentClient(f"Бот {index:03d}")
+        # Все боты в одном процессе - machine_id у каждого свой
+        self.client.machine_id = f"swarm-{index:04d}"
+        self.client.on_message_received = self._on_message
+        
+        # Метрики текущего уровня нагрузки
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.frames = 0
+        self.voice_chunks = 0
+        self.bytes_received = 0
+    
+    def connect(self) -> bool:
+        """Подключиться к преподавателю напрямую (без поиска по multicast)"""
+        teacher = Teacher(
+            id=f"127.0.0.1:{self.port}",
+            name="Рой",
+            ip_address="127.0.0.1",
+            channel=1,
+            port=self.port
+        )
+        return self.client.connect_to_teacher(teacher)
+    
+    def reset(self):
+        """Сбросить метрики перед новым уровнем нагрузки"""
+        with self._lock:
+            self.latencies = []
+            self.frames = 0
+            self.voice_chunks = 0
+            self.bytes_received = 0
+    
+    def snapshot(self) -> dict:
+        """Метрики студента за уровень"""
+        with self._lock:
+            return {
+                'latencies': list(self.latencies),
+                'frames': self.frames,
+                'voice_chunks': self.voice_chunks,
+                'bytes_received': self.bytes_received
+            }
+    
+    def send_activity_report(self):
+        """Отчет активности, как у ActivityMonitor"""
+        report = ActivityReport(
+            active_window=f"Упражнение {self.index % 12 + 1} - Lingua Classroom",
+            active_process="python.exe",
+            idle_time=float(self.index % 30),
+            open_windows=[f"Окно {i}" for i in range(5)]
+        )
+        self.client.send_message(MessageType.ACTIVITY_REPORT, report.to_dict())
+    
+    def send_screenshot(self, screenshot: str):
+        """Скриншот в формате ScreenshotCapture (base64 JPEG)"""
+        self.client.send_message(MessageType.SCREENSHOT_RESPONSE, {'data': screenshot})
+    
+    def stop(self):
+        self.client.stop()
+    
+    def _on_message(self, message: Dict):
+        """Потребить медиа от преподавателя и замерить задержку"""
+        msg_type = message.get("type")
+        if msg_type == MessageType.SCREEN_FRAME:
+            field_name = "payload"
+        elif msg_type == MessageType.VOICE_DATA:
+            field_name = "data"
+        else:
+            return
+        
+        data = message.get("data", {})
+        received_at = time.time()
+        payload = data.get(field_name) or b""
+        
+        with self._lock:
+            sent_at = data.get("sent_at")
+            if sent_at:
+                self.latencies.append(received_at - sent_at)
+            self.bytes_received += len(payload)
+            if msg_type == MessageType.SCREEN_FRAME:
+                self.frames += 1
+            else:
+                self.voice_chunks += 1
+
+
+class StudentScheduler:
+    """Один поток расписания для всех студентов: отчеты активности и скриншоты"""
+    
+    def __init__(self, activity_interval: float, screenshot_interval: float, screenshot_kb: int):
+        self.activity_interval = activity_interval
+        self.screenshot_interval = screenshot_interval
+        self.screenshot = base64.b64encode(os.urandom(screenshot_kb * 1024)).decode('ascii')
+        
+        self.students: List[SwarmStudent] = []
+        self._next_report: Dict[int, float] = {}
+        self._next_screenshot: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+    
+    def add(self, student: SwarmStudent):
+        """Добавить студента (сроки разнесены, чтобы отчеты не шли залпом)"""
+        now = time.time()
+        offset = (student.index % 100) / 100
+        with self._lock:
+            self.students.append(student)
+            self._next_report[student.index] = now + self.activity_interval * offset
+            self._next_screenshot[student.index] = now + self.screenshot_interval * offset
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+    
+    def _run(self):
+        while self.running:
+            now = time.time()
+            with self._lock:
+                students = list(self.students)
+            
+            for student in students:
+                if not student.client.connected:
+                    continue
+                if self.activity_interval > 0 and now >= self._next_report[student.index]:
+                    self._next_report[student.index] = now + self.activity_interval
+                    student.send_activity_report()
+                if self.screenshot_interval > 0 and now >= self._next_screenshot[student.index]:
+                    self._next_screenshot[student.index] = now + self.screenshot_interval
+                    student.send_screenshot(self.screenshot)
+            
+            time.sleep(0.05)
+
+
+def teacher_process(conn, port: int, core: str, fps: float, frame_kb: int, voice: bool):
+    """
+    Процесс преподавателя: сервер и рассылка кадров/голоса по командам
+    
+    Команды через conn:
+        ("run", students, seconds) - дождаться студентов, транслировать
+                                     seconds секунд, вернуть метрики
+        ("stop",)                  - остановить сервер
+    """
+    logging.basicConfig(level=logging.WARNING)
+    
+    server = create_teacher_server("Рой", port=port, core=core)
+    received: Dict[str, int] = {}
+    
+    def on_message(student_id: str, message: Dict):
+        msg_type = message.get("type")
+        received[msg_type] = received.get(msg_type, 0) + 1
+    
+    server.on_message_received = on_message
+    if not server.start():
+        conn.send(None)
+        return
+    conn.send(True)
+    
+    # Случайные байты не сжимаются - как JPEG и сжатый голос
+    frame = os.urandom(frame_kb * 1024)
+    voice_chunk = os.urandom(VOICE_CHUNK_BYTES)
+    
+    try:
+        while True:
+            command = conn.recv()
+            if command[0] != "run":
+                break
+            _, students, seconds = command
+            conn.send(_teacher_level(server, students, seconds, fps, frame, voice_chunk if voice else None,
+                                     received))
+    finally:
+        server.stop()
+
+
+def _teacher_level(server, students: int, seconds: float, fps: float, frame: bytes,
+                   voice_chunk: Optional[bytes], received: Dict[str, int]) -> dict:
+    """Один уровень нагрузки на стороне преподавателя"""
+    deadline = time.time() + CONNECT_TIMEOUT
+    while server.get_student_count() < students and time.time() < deadline:
+        time.sleep(0.05)
+    
+    before = server.get_stats()
+    received_before = dict(received)
+    cpu_start = time.process_time()
+    start = time.time()
+    
+    frame_interval = 1.0 / fps if fps > 0 else 0.0
+    next_frame = start
+    next_voice = start
+    next_sample = start
+    frames_sent = 0
+    voice_sent = 0
+    queue_depth_max = 0
+    
+    while time.time() - start < seconds:
+        now = time.time()
+        if frame_interval and now >= next_frame:
+            server.broadcast_to_all(MessageType.SCREEN_FRAME, {"frame_id": frames_sent, "sent_at": time.time()},
+                                    attachment=frame, attachment_field="payload")
+            frames_sent += 1
+            next_frame += frame_interval
+        if voice_chunk is not None and now >= next_voice:
+            server.broadcast_to_all(MessageType.VOICE_DATA, {"chunk_id": voice_sent, "sent_at": time.time()},
+                                    attachment=voice_chunk, attachment_field="data")
+            voice_sent += 1
+            next_voice += VOICE_CHUNK_INTERVAL
+        if now >= next_sample:
+            queue_depth_max = max(queue_depth_max, server.get_stats()['queue_depth_max'])
+            next_sample += 0.5
+        
+        upcoming = [next_sample]
+        if frame_interval:
+            upcoming.append(next_frame)
+        if voice_chunk is not None:
+            upcoming.append(next_voice)
+        time.sleep(max(0.0, min(upcoming) - time.time()))
+    
+    wall = time.time() - start
+    cpu = time.process_time() - cpu_start
+    after = server.get_stats()
+    
+    return {
+        'students': server.get_student_count(),
+        'frames_sent': frames_sent,
+        'voice_sent': voice_sent,
+        'cpu_percent': cpu / wall * 100 if wall else 0.0,
+        'memory_mb': memory_mb(),
+        'queue_depth_max': queue_depth_max,
+        'media_dropped': after['media_dropped'] - before['media_dropped'],
+        'reports': received.get(MessageType.ACTIVITY_REPORT, 0)
+                   - received_before.get(MessageType.ACTIVITY_REPORT, 0),
+        'screenshots': received.get(MessageType.SCREENSHOT_RESPONSE, 0)
+                       - received_before.get(MessageType.SCREENSHOT_RESPONSE, 0)
+    }
+
+
+class Swarm:
+    """Рой студентов и процесс преподавателя"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.port = args.port or self._free_port()
+        self.students: List[SwarmStudent] = []
+        self.scheduler = StudentScheduler(args.activity_interval, args.screenshot_interval, args.screenshot_kb)
+        self._conn = None
+        self._teacher: Optional[multiprocessing.Process] = None
+    
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            return probe.getsockname()[1]
+    
+    def start(self) -> bool:
+        """Запустить процесс преподавателя и расписание студентов"""
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._teacher = multiprocessing.Process(
+            target=teacher_process,
+            args=(child_conn, self.port, self.args.core, self.args.fps, self.args.frame_kb, self.args.voice),
+            daemon=True
+        )
+        self._teacher.start()
+        
+        if not self._conn.poll(CONNECT_TIMEOUT) or not self._conn.recv():
+            logger.error("Сервер преподавателя не запустился")
+            return False
+        
+        self.scheduler.start()
+        return True
+    
+    def grow(self, count: int) -> int:
+        """Довести число подключенных студентов до count"""
+        while len(self.students) < count:
+            student = SwarmStudent(len(self.students), self.port)
+            if not student.connect():
+                logger.error(f"Студент {student.index} не подключился")
+                break
+            self.students.append(student)
+            self.scheduler.add(student)
+        return len(self.students)
+    
+    def run_level(self, count: int) -> dict:
+        """Прогнать один уровень нагрузки"""
+        connected = self.grow(count)
+        for student in self.students:
+            student.reset()
+        
+        self._conn.send(("run", connected, self.args.seconds))
+        teacher = self._conn.recv()
+        # Хвост рассылки еще в пути
+        time.sleep(0.2)
+        
+        snapshots = [student.snapshot() for student in self.students]
+        latencies = [latency for snapshot in snapshots for latency in snapshot['latencies']]
+        worst_p95 = max((percentile(s['latencies'], 0.95) for s in snapshots), default=0.0)
+        received_bytes = sum(s['bytes_received'] for s in snapshots)
+        frames_expected = teacher['frames_sent'] * connected
+        
+        return {
+            'students': connected,
+            'teacher': teacher,
+            'latency_p50': percentile(latencies, 0.50),
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_max': max(latencies, default=0.0),
+            'worst_p95': worst_p95,
+            'delivered': sum(s['frames'] for s in snapshots) / frames_expected if frames_expected else 0.0,
+            'throughput_mb': received_bytes / 1024 / 1024 / self.args.seconds,
+            'memory_mb': memory_mb()
+        }
+    
+    def stop(self):
+        """Остановить преподавателя и отключить студентов"""
+        self.scheduler.stop()
+        
+        # Разрыв со стороны сервера здесь ожидаем - не засоряем вывод
+        if not self.args.verbose:
+            logging.disable(logging.WARNING)
+        
+        try:
+            # Сначала сервер: иначе он пишет в лог ошибку на каждое закрытое соединение
+            if self._conn is not None:
+                try:
+                    self._conn.send(("stop",))
+                except (OSError, ValueError):
+                    pass
+            if self._teacher is not None:
+                self._teacher.join(timeout=10)
+                if self._teacher.is_alive():
+                    self._teacher.terminate()
+            
+            for student in self.students:
+                student.stop()
+        finally:
+            logging.disable(logging.NOTSET)
+
+
+def print_header():
+    print(f"{'N':>4} | {'доставлено':>10} | {'p50, мс':>7} | {'p95, мс':>7} | {'max, мс':>7} | "
+          f"{'худший p95':>10} | {'МБ/с':>6} | {'МБ/с/студ':>9} | {'рой, МБ':>7} | "
+          f"{'CPU преп.':>9} | {'преп., МБ':>9} | {'сброшено':>8}")
+    print("-" * 130)
+
+
+def print_level(result: dict):
+    teacher = result['teacher']
+    students = result['students']
+    print(f"{students:>4} | {result['delivered'] * 100:>9.1f}% | {result['latency_p50'] * 1000:>7.1f} | "
+          f"{result['latency_p95'] * 1000:>7.1f} | {result['latency_max'] * 1000:>7.1f} | "
+          f"{result['worst_p95'] * 1000:>10.1f} | {result['throughput_mb']:>6.1f} | "
+          f"{result['throughput_mb'] / students if students else 0.0:>9.2f} | {result['memory_mb']:>7.0f} | "
+          f"{teacher['cpu_percent']:>8.0f}% | {teacher['memory_mb']:>9.0f} | {teacher['media_dropped']:>8}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Нагрузочный рой студентов против локального сервера")
+    parser.add_argument("--counts", default=",".join(str(c) for c in DEFAULT_COUNTS),
+                        help="Уровни нагрузки через запятую (студентов)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Длительность уровня, сек")
+    parser.add_argument("--fps", type=float, default=10.0, help="Кадров экрана в секунду (0 - без кадров)")
+    parser.add_argument("--frame-kb", type=int, default=100, help="Размер кадра, KB")
+    parser.add_argument("--no-voice", dest="voice", action="store_false", help="Без голоса преподавателя")
+    parser.add_argument("--activity-interval", type=float, default=10.0,
+                        help="Интервал отчетов активности студента, сек (0 - не слать)")
+    parser.add_argument("--screenshot-interval", type=float, default=30.0,
+                        help="Интервал скриншотов студента, сек (0 - не слать)")
+    parser.add_argument("--screenshot-kb", type=int, default=60, help="Размер скриншота, KB")
+    parser.add_argument("--core", choices=[ServerCore.THREADED, ServerCore.SELECTORS],
+                        default=ServerCore.THREADED, help="Ядро сервера")
+    parser.add_argument("--port", type=int, default=0, help="Порт сервера (0 - свободный)")
+    parser.add_argument("--verbose", action="store_true", help="Подробный лог")
+    args = parser.parse_args(argv)
+    args.counts = sorted(int(c) for c in args.counts.split(",") if c.strip())
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> List[dict]:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    
+    print(f"Кадры: {args.fps:g}/с по {args.frame_kb} KB, голос: {'да' if args.voice else 'нет'}, "
+          f"ядро: {args.core}, уровень: {args.seconds:g} с")
+    print_header()
+    
+    swarm = Swarm(args)
+    results = []
+    try:
+        if not swarm.start():
+            return results
+        for count in args.counts:
+            result = swarm.run_level(count)
+            results.append(result)
+            print_level(result)
+            if result['students'] < count:
+                print(f"Подключилось только {result['students']} из {count} студентов - дальше не идем")
+                break
+    except KeyboardInterrupt:
+        print("Прервано")
+    finally:
+        swarm.stop()
+    
+    return results
+
+
+if __name__ == "__main__":
+    main()
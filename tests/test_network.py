@@ -6,13 +6,25 @@ import unittest
 import sys
 import os
 import time
+import socket
+import struct
 import threading
+import random
+import select
+import base64
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.network.protocol import Protocol, TCPPacketAssembler, MessageBuilder
-from src.common.constants import MessageType
+from src.network.protocol import Protocol, TCPPacketAssembler, RingPacketAssembler, MessageBuilder
+from src.network.send_queue import OutboundQueue, batch_buffers, advance_buffers, send_buffers
+from src.network import codecs
+from src.network.multicast import (MulticastConfig, MulticastSender, MulticastReceiver,
+                                   FrameReassembler, NackAggregator, MulticastPacer, TokenBucket, BufferPool,
+                                   split_fragments, MULTICAST_MTU, PACING_BURST_BYTES, PACING_SPREAD)
+from src.network.serializer import MSGPACK_AVAILABLE
+from src.network.codecs import LEGACY_CODECS, available_codecs, choose_codec, negotiate_codecs
+from src.common.constants import MessageType, Codec
 
 
 class TestProtocol(unittest.TestCase):
@@ -208,6 +220,1217 @@ class TestTCPPacketAssembler(unittest.TestCase):
         self.assertEqual(stats['bytes_processed'], len(packet1) + len(packet2))
 
 
+class TestRingPacketAssembler(unittest.TestCase):
+    """Тесты zero-copy сборщика TCP пакетов"""
+    
+    def test_fragmented_and_combined(self):
+        """Фрагменты и склеенные пакеты собираются как в TCPPacketAssembler"""
+        assembler = RingPacketAssembler(capacity=1024)
+        
+        packets_in = [Protocol.pack("TEST", {"i": i, "pad": "x" * (i * 300)}) for i in range(10)]
+        stream = b''.join(packets_in)
+        
+        packets_out = []
+        for i in range(0, len(stream), 700):
+            packets_out.extend(bytes(p) for p in assembler.feed(stream[i:i + 700]))
+        
+        self.assertEqual(packets_out, packets_in)
+        self.assertEqual(assembler.get_buffer_size(), 0)
+        self.assertEqual(assembler.get_stats()['packets_assembled'], 10)
+    
+    def test_views_not_overwritten(self):
+        """Выданные memoryview остаются валидными после новых данных"""
+        assembler = RingPacketAssembler(capacity=512)
+        
+        first = Protocol.pack("TEST", {"data": "a" * 300})
+        held = assembler.feed(first)
+        self.assertIsInstance(held[0], memoryview)
+        
+        # Данных больше, чем вмещает буфер - сборщик должен выделить новый
+        for i in range(20):
+            assembler.feed(Protocol.pack("TEST", {"data": "b" * 300}))
+        
+        self.assertEqual(bytes(held[0]), first)
+        self.assertGreater(assembler.get_stats()['buffer_reallocations'], 0)
+    
+    def test_compaction_when_views_released(self):
+        """Без живых ссылок буфер переиспользуется, а не выделяется заново"""
+        assembler = RingPacketAssembler(capacity=4096)
+        
+        for i in range(50):
+            packets = assembler.feed(Protocol.pack("TEST", {"data": "c" * 500}))
+            self.assertEqual(len(packets), 1)
+            del packets
+        
+        stats = assembler.get_stats()
+        self.assertGreater(stats['buffer_compactions'], 0)
+        self.assertEqual(stats['buffer_reallocations'], 0)
+    
+    def test_large_packet_grows_buffer(self):
+        """Пакет больше начального буфера собирается целиком"""
+        assembler = RingPacketAssembler(capacity=1024)
+        payload = os.urandom(300000)
+        packed = Protocol.pack_binary(MessageType.SCREEN_FRAME, {"frame_id": 1}, payload)
+        
+        result = []
+        for i in range(0, len(packed), 4096):
+            result.extend(assembler.feed(packed[i:i + 4096]))
+        
+        self.assertEqual(len(result), 1)
+        self.assertEqual(bytes(Protocol.unpack(result[0])["data"]["data"]), payload)
+    
+    def test_sync_recovery(self):
+        """Восстановление синхронизации после мусора"""
+        assembler = RingPacketAssembler()
+        packets = assembler.feed(b'garbage before magic' + Protocol.pack(MessageType.PING, {}))
+        
+        self.assertEqual(len(packets), 1)
+        self.assertEqual(assembler.get_stats()['sync_recoveries'], 1)
+    
+    def test_recv_into_socket(self):
+        """recv_into читает прямо из сокета"""
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        
+        packed = Protocol.pack_binary(MessageType.VOICE_DATA, {"chunk_id": 3}, os.urandom(200000))
+        sender = threading.Thread(target=left.sendall, args=(packed,))
+        sender.start()
+        
+        assembler = RingPacketAssembler()
+        packets = []
+        while not packets:
+            self.assertGreater(assembler.recv_into(right), 0)
+            packets = assembler.read_packets()
+        sender.join()
+        
+        self.assertEqual(packets[0], packed)
+        
+        left.close()
+        self.assertEqual(assembler.recv_into(right), 0)
+
+
+class TestBinaryAttachment(unittest.TestCase):
+    """Тесты бинарных вложений (протокол v3)"""
+    
+    def test_pack_unpack_binary(self):
+        """Вложение передается сырыми байтами и возвращается как memoryview"""
+        frame = bytes(range(256)) * 100
+        packed = Protocol.pack_binary(MessageType.SCREEN_FRAME, {"frame_id": 7}, frame, attachment_field="payload")
+        
+        # Без base64: пакет лишь немного больше самого кадра
+        self.assertLess(len(packed), len(frame) + 200)
+        
+        unpacked = Protocol.unpack(packed)
+        self.assertIsNotNone(unpacked)
+        self.assertEqual(unpacked["type"], MessageType.SCREEN_FRAME)
+        self.assertEqual(unpacked["data"]["frame_id"], 7)
+        self.assertIsInstance(unpacked["data"]["payload"], memoryview)
+        self.assertEqual(bytes(unpacked["data"]["payload"]), frame)
+        self.assertNotIn(Protocol.ATTACHMENT_KEY, unpacked["data"])
+    
+    def test_binary_through_assembler(self):
+        """Бинарный пакет собирается из фрагментов"""
+        assembler = TCPPacketAssembler()
+        packed = Protocol.pack_binary(MessageType.VOICE_DATA, {"chunk_id": 1}, b"\x00\x01" * 5000)
+        
+        packets = []
+        for i in range(0, len(packed), 1000):
+            packets.extend(assembler.feed(packed[i:i + 1000]))
+        
+        self.assertEqual(len(packets), 1)
+        unpacked = Protocol.unpack(packets[0])
+        self.assertEqual(bytes(unpacked["data"]["data"]), b"\x00\x01" * 5000)
+    
+    def test_pack_for_legacy_version(self):
+        """Старые пиры получают вложение как base64 в JSON"""
+        import base64
+        
+        packed = Protocol.pack_for_version(2, MessageType.WEBCAM_FRAME, {"frame_id": 1}, b"jpeg-bytes")
+        
+        _, version, _, _ = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertEqual(version, Protocol.JSON_VERSION)
+        
+        unpacked = Protocol.unpack(packed)
+        self.assertEqual(base64.b64decode(unpacked["data"]["data"]), b"jpeg-bytes")
+    
+    def test_pack_parts_shares_frame(self):
+        """pack_parts не копирует несжимаемое вложение: кадр - последняя часть пакета"""
+        frame = os.urandom(64 * 1024)
+        parts = Protocol.pack_parts(Protocol.BINARY_VERSION, MessageType.SCREEN_FRAME,
+                                    {"frame_id": 3}, frame, "payload")
+        
+        self.assertIs(parts[-1], frame)
+        self.assertEqual(b''.join(parts),
+                         Protocol.pack_for_version(Protocol.BINARY_VERSION, MessageType.SCREEN_FRAME,
+                                                   {"frame_id": 3}, frame, "payload"))
+        
+        # Изменяемый буфер копируется один раз - рассылка не должна видеть его правки
+        shared = Protocol.shared_buffer(bytearray(frame))
+        self.assertIsInstance(shared, bytes)
+    
+    def test_negotiate_version(self):
+        """Согласование версии протокола"""
+        self.assertEqual(Protocol.negotiate_version(None), Protocol.JSON_VERSION)
+        self.assertEqual(Protocol.negotiate_version(2), 2)
+        self.assertEqual(Protocol.negotiate_version(Protocol.VERSION), Protocol.VERSION)
+        self.assertEqual(Protocol.negotiate_version(Protocol.VERSION + 5), Protocol.VERSION)
+        self.assertEqual(Protocol.negotiate_version("garbage"), Protocol.JSON_VERSION)
+
+
+class TestCodecs(unittest.TestCase):
+    """Тесты кодеков сжатия и политики по типу сообщения"""
+    
+    def test_media_not_compressed(self):
+        """JPEG кадры вложением не сжимаются повторно"""
+        frame = os.urandom(50000)
+        packed = Protocol.pack_for_version(Protocol.BINARY_VERSION, MessageType.SCREEN_FRAME, {"frame_id": 1},
+                                           attachment=frame, attachment_field="payload")
+        _, _, _, flags = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertFalse(flags & Protocol.FLAG_COMPRESSED)
+    
+    def test_legacy_media_compressed(self):
+        """Старому пиру кадр уходит base64 в JSON - сжатым zlib, как раньше"""
+        frame = os.urandom(50000)
+        packed = Protocol.pack_for_version(Protocol.JSON_VERSION, MessageType.SCREEN_FRAME, {"frame_id": 1},
+                                           attachment=frame, attachment_field="payload")
+        _, _, _, flags = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertEqual(flags, Protocol.FLAG_COMPRESSED)
+        self.assertLess(len(packed), len(base64.b64encode(frame)) * 0.8)
+        self.assertEqual(base64.b64decode(Protocol.unpack(packed)["data"]["payload"]), frame)
+    
+    def test_zlib_legacy_compatible(self):
+        """zlib помечается только FLAG_COMPRESSED - как у старых клиентов"""
+        packed = Protocol.pack(MessageType.FILE_TRANSFER_DATA, {"data": "абв" * 5000})
+        _, _, _, flags = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertEqual(flags, Protocol.FLAG_COMPRESSED)
+        self.assertEqual(Protocol.unpack(packed)["data"]["data"], "абв" * 5000)
+    
+    def test_policy_falls_back_to_zlib(self):
+        """Кодек, не согласованный с пиром, заменяется на zlib"""
+        self.assertEqual(choose_codec(MessageType.FILE_TRANSFER_DATA, 5000, LEGACY_CODECS), Codec.ZLIB)
+        self.assertEqual(choose_codec(MessageType.WHITEBOARD_COMMAND, 5000, LEGACY_CODECS), Codec.ZLIB)
+        self.assertEqual(choose_codec(MessageType.FILE_TRANSFER_DATA, 100, LEGACY_CODECS), Codec.NONE)
+    
+    def test_negotiate_codecs(self):
+        """Старый пир без списка кодеков - только zlib"""
+        self.assertEqual(negotiate_codecs(None), LEGACY_CODECS)
+        self.assertEqual(negotiate_codecs([Codec.NONE, "brotli"]), (Codec.NONE, Codec.ZLIB))
+        self.assertEqual(negotiate_codecs(available_codecs()), available_codecs())
+    
+    @unittest.skipUnless(codecs.ZSTD_AVAILABLE, "zstandard не установлен")
+    def test_zstd_round_trip(self):
+        data = {"data": "абв" * 5000}
+        packed = Protocol.pack(MessageType.FILE_TRANSFER_DATA, data, codecs=available_codecs())
+        self.assertEqual(Protocol.unpack(packed)["data"], data)
+    
+    @unittest.skipUnless(codecs.LZ4_AVAILABLE, "lz4 не установлен")
+    def test_lz4_round_trip(self):
+        data = {"points": [(i, i) for i in range(1000)]}
+        packed = Protocol.pack(MessageType.WHITEBOARD_COMMAND, data, codecs=available_codecs())
+        self.assertEqual(len(Protocol.unpack(packed)["data"]["points"]), 1000)
+    
+    def test_unknown_codec_rejected(self):
+        """Пакет с неизвестным кодеком отбрасывается"""
+        packed = bytearray(Protocol.pack(MessageType.FILE_TRANSFER_DATA, {"data": "абв" * 5000}))
+        packed[Protocol.HEADER_SIZE - 1] |= 3 << Protocol.FLAG_CODEC_SHIFT
+        self.assertIsNone(Protocol.unpack(bytes(packed)))
+
+
+class TestCompactSerializer(unittest.TestCase):
+    """Тесты компактного формата (протокол v4)"""
+    
+    def test_json_serializer_caps_version(self):
+        """Сериализатор json ограничивает версию протокола тремя"""
+        from src.common.constants import Serializer
+        
+        self.assertEqual(Protocol.local_version(Serializer.JSON), min(Protocol.VERSION, Protocol.BINARY_VERSION))
+        self.assertEqual(Protocol.local_version(Serializer.COMPACT), Protocol.VERSION)
+        self.assertEqual(Protocol.negotiate_version(Protocol.VERSION, Protocol.BINARY_VERSION),
+                         min(Protocol.VERSION, Protocol.BINARY_VERSION))
+    
+    def test_json_by_default(self):
+        """Без согласованной версии пакеты остаются JSON"""
+        packed = Protocol.pack(MessageType.PING, {})
+        _, version, _, _ = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertEqual(version, Protocol.JSON_VERSION)
+    
+    @unittest.skipUnless(MSGPACK_AVAILABLE, "msgpack не установлен")
+    def test_compact_round_trip(self):
+        """Номер типа и целая метка времени, данные те же"""
+        data = {"tool": "pen", "points": [[1, 2], [3, 4]], "имя": "Иванов", 5: "ключ-число"}
+        packed = Protocol.pack_for_version(Protocol.COMPACT_VERSION, MessageType.WHITEBOARD_COMMAND, data)
+        
+        _, version, _, _ = struct.unpack(Protocol.HEADER_FORMAT, packed[:Protocol.HEADER_SIZE])
+        self.assertEqual(version, Protocol.COMPACT_VERSION)
+        self.assertLess(len(packed), len(Protocol.pack(MessageType.WHITEBOARD_COMMAND, data, compress=False)))
+        
+        unpacked = Protocol.unpack(packed)
+        self.assertEqual(unpacked["type"], MessageType.WHITEBOARD_COMMAND)
+        self.assertIsInstance(unpacked["timestamp"], int)
+        self.assertEqual(unpacked["data"], data)
+    
+    @unittest.skipUnless(MSGPACK_AVAILABLE, "msgpack не установлен")
+    def test_compact_attachment_and_unknown_type(self):
+        """Вложение в компактном формате, тип без номера - строкой"""
+        packed = Protocol.pack_for_version(Protocol.COMPACT_VERSION, "CUSTOM_TYPE", {"n": 1},
+                                           attachment=b"voice", attachment_field="audio")
+        unpacked = Protocol.unpack(packed)
+        self.assertEqual(unpacked["type"], "CUSTOM_TYPE")
+        self.assertEqual(bytes(unpacked["data"]["audio"]), b"voice")
+
+
+def _free_port() -> int:
+    """Найти свободный TCP порт на localhost"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestMulticastFragmentation(unittest.TestCase):
+    """Тесты фрагментации multicast сообщений по MTU"""
+    
+    def test_split_and_reassemble(self):
+        """Фрагменты в любом порядке и с дублями собираются в исходный кадр"""
+        frame = os.urandom(200 * 1024)
+        fragments = split_fragments(7, frame, mtu=1472)
+        
+        self.assertGreater(len(fragments), 100)
+        for header, chunk in fragments:
+            self.assertLessEqual(len(header) + len(chunk), 1472)
+        
+        datagrams = [header + bytes(chunk) for header, chunk in fragments]
+        datagrams.reverse()
+        datagrams.insert(5, datagrams[0])
+        
+        reassembler = FrameReassembler()
+        results = [reassembler.add(datagram) for datagram in datagrams]
+        complete = [result for result in results if result is not None]
+        
+        self.assertEqual(complete, [frame])
+        stats = reassembler.get_stats()
+        self.assertEqual(stats['frames_completed'], 1)
+        self.assertEqual(stats['fragments_duplicate'], 1)
+        self.assertEqual(stats['pending_frames'], 0)
+    
+    def test_lost_fragment_times_out(self):
+        """Кадр без одного фрагмента выбрасывается по таймауту, полнота учитывается"""
+        fragments = split_fragments(1, os.urandom(10 * 1472), mtu=1472)
+        reassembler = FrameReassembler(timeout=0.5)
+        
+        for header, chunk in fragments[1:]:
+            self.assertIsNone(reassembler.add(header + bytes(chunk), now=100.0))
+        reassembler.evict_expired(now=101.0)
+        
+        stats = reassembler.get_stats()
+        self.assertEqual(stats['frames_timed_out'], 1)
+        self.assertEqual(stats['pending_frames'], 0)
+        self.assertEqual(stats['frames_complete_ratio'], 0.0)
+        self.assertAlmostEqual(stats['completeness'], (len(fragments) - 1) / len(fragments), places=3)
+        
+        # Поздний фрагмент выброшенного кадра не начинает сборку заново
+        header, chunk = fragments[0]
+        self.assertIsNone(reassembler.add(header + bytes(chunk), now=101.1))
+    
+    def test_stale_frame_evicted(self):
+        """Собран более новый кадр - неполный старый выбрасывается, его хвост опаздывает"""
+        old = split_fragments(1, b"a" * 3000, mtu=1472)
+        new = split_fragments(2, b"b" * 100, mtu=1472)
+        reassembler = FrameReassembler()
+        
+        reassembler.add(old[0][0] + bytes(old[0][1]))
+        self.assertEqual(reassembler.add(new[0][0] + bytes(new[0][1])), b"b" * 100)
+        self.assertIsNone(reassembler.add(old[1][0] + bytes(old[1][1])))
+        
+        stats = reassembler.get_stats()
+        self.assertEqual(stats['frames_stale'], 1)
+        self.assertEqual(stats['fragments_late'], 1)
+    
+    def test_large_frame_over_multicast(self):
+        """Кадр больше 64 KB проходит через multicast сокет"""
+        config = MulticastConfig(port=5015)
+        received = []
+        receiver = MulticastReceiver(config)
+        receiver.on_data = received.append
+        try:
+            receiver.start()
+        except OSError as e:
+            self.skipTest(f"multicast недоступен: {e}")
+        
+        sender = MulticastSender(config)
+        frame = (1234).to_bytes(4, 'big') + os.urandom(150 * 1024)
+        try:
+            time.sleep(0.1)
+            self.assertTrue(sender.send(frame, compress=False))
+            self.assertTrue(sender.send(b"small", compress=True))
+            
+            deadline = time.time() + 2.0
+            while len(received) < 2 and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            sender.close()
+            receiver.stop()
+        
+        self.assertEqual(received, [frame, b"small"])
+        self.assertGreater(sender.get_stats()['fragments_sent'], 100)
+
+
+class LossySocket:
+    """Прокладка вместо UDP сокета: теряет датаграммы с заданной вероятностью"""
+    
+    def __init__(self, loss: float, deliver, seed: int = 1):
+        self.loss = loss
+        self.deliver = deliver
+        self.random = random.Random(seed)
+    
+    def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+        return self.sendto(b''.join(buffers), address)
+    
+    def sendto(self, data, address):
+        if self.random.random() >= self.loss:
+            self.deliver(data)
+        return len(data)
+    
+    def close(self):
+        pass
+
+
+class TestMulticastFec(unittest.TestCase):
+    """FEC multicast: восстановление потерянных фрагментов без повтора"""
+    
+    FRAMES = 150
+    FRAME_SIZE = 100 * 1024  # ~70 фрагментов
+    
+    def delivery_rate(self, loss: float, fec_ratio: float) -> float:
+        """Доля кадров, собранных приемником при случайных потерях"""
+        reassembler = FrameReassembler()
+        delivered = []
+        
+        def deliver(datagram):
+            if reassembler.add(datagram) is not None:
+                delivered.append(True)
+        
+        sender = MulticastSender(MulticastConfig(port=5016, fec_ratio=fec_ratio))
+        sender.sock.close()
+        sender.sock = LossySocket(loss, deliver, seed=int(loss * 1000))
+        
+        frame = os.urandom(self.FRAME_SIZE)
+        for _ in range(self.FRAMES):
+            sender.send(frame, compress=False)
+        sender.close()
+        return len(delivered) / self.FRAMES
+    
+    def test_recover_any_single_loss(self):
+        """Потеря любого одного фрагмента группы восстанавливается"""
+        frame = os.urandom(10 * 1024 + 17)
+        fragments = split_fragments(5, frame, fec_group=4)
+        datagrams = [header + bytes(chunk) for header, chunk in fragments]
+        
+        for lost in range(len(datagrams)):
+            reassembler = FrameReassembler()
+            results = [reassembler.add(d) for i, d in enumerate(datagrams) if i != lost]
+            self.assertEqual([r for r in results if r is not None], [frame], f"потерян фрагмент {lost}")
+    
+    def test_delivery_rate_vs_overhead(self):
+        """Доля доставленных кадров при потерях 0.5/1/5% и избыточности 0/10/25%"""
+        ratios = (0.0, 0.1, 0.25)
+        table = {loss: [self.delivery_rate(loss, ratio) for ratio in ratios] for loss in (0.005, 0.01, 0.05)}
+        report = "\n".join(
+            f"потери {loss * 100:.1f}%: " + ", ".join(f"FEC {ratio:.0%} -> {rate:.0%}" for ratio, rate in zip(ratios, rates))
+            for loss, rates in table.items()
+        )
+        
+        for loss, (plain, fec_10, fec_25) in table.items():
+            self.assertGreaterEqual(fec_10, plain, report)
+            self.assertGreaterEqual(fec_25, fec_10, report)
+        
+        # 1% потерь: без FEC теряется около половины кадров, с 10% избыточности - единицы
+        self.assertLess(table[0.01][0], 0.7, report)
+        self.assertGreater(table[0.01][1], 0.9, report)
+        # 5% потерь: 25% избыточности спасает большинство кадров
+        self.assertGreater(table[0.05][2], 0.5, report)
+        self.assertLess(table[0.05][0], 0.1, report)
+
+
+class TestMulticastNack(unittest.TestCase):
+    """NACK: повтор фрагментов, которые не восстановила FEC"""
+    
+    def make_sender(self, **config) -> tuple:
+        sent = []
+        sender = MulticastSender(MulticastConfig(port=5017, **config))
+        sender.sock.close()
+        sender.sock = LossySocket(0.0, sent.append)
+        return sender, sent
+    
+    def test_nack_unrecoverable_fragments(self):
+        """Две потери в группе FEC - NACK с обоими номерами, повтор завершает кадр"""
+        frame = os.urandom(12 * 1024)
+        fragments = split_fragments(9, frame, fec_group=4)
+        datagrams = [header + bytes(chunk) for header, chunk in fragments]
+        reassembler = FrameReassembler(nack_jitter=0)
+        
+        for index, datagram in enumerate(datagrams):
+            if index not in (1, 2):
+                self.assertIsNone(reassembler.add(datagram, now=10.0))
+        
+        self.assertEqual(reassembler.collect_nacks(now=10.001), [])
+        self.assertEqual(reassembler.collect_nacks(now=10.1), [(9, [1, 2])])
+        # Повторный NACK - только после NACK_RETRY
+        self.assertEqual(reassembler.collect_nacks(now=10.11), [])
+        
+        # Одного повтора хватает: второй фрагмент группы восстанавливает четность
+        self.assertEqual(reassembler.add(datagrams[1], now=10.12), frame)
+        self.assertEqual(reassembler.get_stats()['fragments_recovered'], 1)
+    
+    def test_repair_completes_frame(self):
+        """Фрагмент из кэша отправителя завершает сборку у приемника"""
+        sender, sent = self.make_sender()
+        frame = os.urandom(5000)
+        sender.send(frame, compress=False)
+        
+        reassembler = FrameReassembler()
+        for datagram in sent[1:]:
+            reassembler.add(datagram)
+        
+        repair = sender.cached_fragments(0, [0])
+        self.assertEqual(repair, [sent[0]])
+        self.assertEqual(reassembler.add(repair[0]), frame)
+    
+    def test_aggregation_one_resend(self):
+        """30 студентов без одного фрагмента - один повтор в группу"""
+        sender, sent = self.make_sender()
+        sender.send(os.urandom(20 * 1024), compress=False)
+        original = list(sent)
+        sent.clear()
+        
+        unicast = []
+        aggregator = NackAggregator(sender, lambda sid, datagram: unicast.append((sid, datagram)) or True,
+                                    window=0)
+        for i in range(30):
+            aggregator.add(f"student-{i}", 0, [3], now=1.0)
+        aggregator.add("student-7", 0, [5], now=1.0)
+        aggregator.flush(now=1.0)
+        
+        self.assertEqual(sent, [original[3]])
+        self.assertEqual(unicast, [("student-7", original[5])])
+        
+        # NACK, разминувшийся с повтором, не вызывает еще один
+        aggregator.add("student-40", 0, [3], now=1.01)
+        aggregator.flush(now=1.01)
+        self.assertEqual(len(sent), 1)
+        
+        stats = aggregator.get_stats()
+        self.assertEqual(stats['multicast_resends'], 1)
+        self.assertEqual(stats['unicast_resends'], 1)
+        self.assertEqual(stats['requests_merged'], 29)
+        self.assertEqual(stats['requests_suppressed'], 1)
+        self.assertEqual(stats['per_student']['student-7'], {'nacks': 2, 'fragments': 2})
+    
+    def test_unicast_repairs_not_dropped(self):
+        """Повторы по TCP через настоящую очередь: больше OUTBOUND_MEDIA_LIMIT - ни один не выброшен"""
+        sender, sent = self.make_sender()
+        sender.send(os.urandom(20 * 1024), compress=False)
+        missing = list(range(10))
+        
+        queue = OutboundQueue()
+        def send_unicast(sid, datagram):
+            packet = Protocol.pack_binary(MessageType.MULTICAST_REPAIR, {}, datagram)
+            return queue.put(packet, MessageType.MULTICAST_REPAIR, timeout=0)
+        
+        aggregator = NackAggregator(sender, send_unicast, window=0)
+        aggregator.add("student-1", 0, missing, now=1.0)
+        aggregator.flush(now=1.0)
+        
+        repairs = [bytes(Protocol.unpack(queue.get_nowait())["data"]["data"]) for _ in range(len(queue))]
+        self.assertEqual(repairs, [sent[index] for index in missing])
+        self.assertEqual(aggregator.get_stats()['unicast_resends'], len(missing))
+        self.assertEqual(queue.get_stats()['media_dropped'], 0)
+    
+    def test_retransmit_cache_bounded(self):
+        """Кэш повтора хранит только последние сообщения"""
+        sender, sent = self.make_sender(retransmit_cache=2)
+        for _ in range(3):
+            sender.send(b"x" * 3000, compress=False)
+        
+        self.assertEqual(sender.resend(0, [0]), 0)
+        self.assertEqual(sender.resend(2, [0, 1]), 2)
+        self.assertEqual(sender.get_stats()['fragments_retransmitted'], 2)
+
+
+class TestMulticastPacing(unittest.TestCase):
+    """Пейсинг multicast: token bucket и растягивание кадра на интервал"""
+    
+    def test_token_bucket(self):
+        """Всплеск до burst без задержки, дальше - со скоростью rate"""
+        bucket = TokenBucket(rate=1000, burst=3000, now=0.0)
+        self.assertEqual([bucket.reserve(1000, now=0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(1000, now=0.0), 1.0)
+        # Через 2 секунды долг погашен, накоплена еще 1000
+        self.assertEqual(bucket.reserve(1000, now=2.0), 0.0)
+        self.assertAlmostEqual(bucket.reserve(2000, now=2.0), 2.0)
+    
+    def test_frame_spread_over_interval(self):
+        """Кадр уходит за PACING_SPREAD интервала, всплеск не больше burst"""
+        sent = []
+        now = [0.0]
+        pacer = MulticastPacer(lambda header, chunk: sent.append((now[0], len(header) + len(chunk))),
+                               frame_interval=0.1)
+        fragments = split_fragments(1, os.urandom(100 * 1024))
+        pacer.submit(1, fragments, now=0.0)
+        
+        while True:
+            wait = pacer.pump(now[0])
+            if wait is None:
+                break
+            now[0] += wait
+        
+        self.assertEqual(len(sent), len(fragments))
+        self.assertAlmostEqual(sent[-1][0], 0.1 * PACING_SPREAD, delta=0.01)
+        burst = sum(size for at, size in sent if at == 0.0)
+        self.assertLessEqual(burst, PACING_BURST_BYTES)
+        self.assertEqual(pacer.get_stats()['frames_paced'], 1)
+    
+    def test_bitrate_cap(self):
+        """Предел скорости держится и для кадров, пришедших разом"""
+        sent = []
+        now = [0.0]
+        pacer = MulticastPacer(lambda header, chunk: sent.append((now[0], len(header) + len(chunk))),
+                               max_bitrate_mbps=8.0, max_backlog=10)  # 1 MB/s
+        for message_id in range(3):
+            pacer.submit(message_id, split_fragments(message_id, os.urandom(100 * 1024)), now=0.0)
+        
+        while True:
+            wait = pacer.pump(now[0])
+            if wait is None:
+                break
+            now[0] += wait
+        
+        total = sum(size for _, size in sent)
+        self.assertAlmostEqual(sent[-1][0], (total - PACING_BURST_BYTES) / 1_000_000, delta=0.01)
+        # В любые 100 мс - не больше 100 KB и всплеска
+        for start, _ in sent:
+            window = sum(size for at, size in sent if start <= at < start + 0.1)
+            self.assertLessEqual(window, 100_000 + PACING_BURST_BYTES + MULTICAST_MTU)
+    
+    def test_backlog_drops_old_frames(self):
+        """Кадры сверх очереди выбрасываются, повторы - нет"""
+        pacer = MulticastPacer(lambda header, chunk: None, max_bitrate_mbps=1.0, max_backlog=2)
+        for message_id in range(4):
+            pacer.submit(message_id, split_fragments(message_id, b"x" * 3000), now=0.0)
+        pacer.submit(0, split_fragments(0, b"x" * 3000)[:1], urgent=True, now=0.0)
+        
+        stats = pacer.get_stats()
+        self.assertEqual(stats['frames_dropped'], 2)
+        self.assertEqual(stats['queued_frames'], 3)
+        self.assertEqual([frame.message_id for frame in pacer._frames], [0, 2, 3])
+    
+    def test_paced_sender_delivers(self):
+        """MulticastSender с пейсингом отправляет кадр своим потоком"""
+        reassembler = FrameReassembler()
+        delivered = []
+        done = threading.Event()
+        
+        def deliver(datagram):
+            data = reassembler.add(datagram)
+            if data is not None:
+                delivered.append(data)
+                done.set()
+        
+        sender = MulticastSender(MulticastConfig(port=5018, max_bitrate_mbps=50.0, frame_interval=0.05))
+        sender.sock.close()
+        sender.sock = LossySocket(0.0, deliver)
+        try:
+            frame = os.urandom(50 * 1024)
+            self.assertTrue(sender.send(frame, compress=False))
+            self.assertTrue(done.wait(2.0))
+            self.assertEqual(delivered, [frame])
+            self.assertEqual(sender.get_stats()['pacing']['frames_paced'], 1)
+        finally:
+            sender.close()
+
+
+class TestMulticastBatchReceive(unittest.TestCase):
+    """Прием multicast пачками в буферы пула"""
+    
+    def test_pool_reuses_buffers(self):
+        """Буферы возвращаются в пул; сверх пула - новые, они остаются в пуле"""
+        pool = BufferPool(2, 1472)
+        first, second = pool.acquire(), pool.acquire()
+        extra = pool.acquire()
+        self.assertEqual(pool.get_stats()['misses'], 1)
+        self.assertEqual(pool.get_stats()['peak_utilization'], 1.5)
+        
+        for buffer in (first, second, extra):
+            pool.release(buffer)
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+        self.assertIs(pool.acquire(), extra)
+        pool.acquire(), pool.acquire()
+        self.assertEqual(pool.get_stats()['misses'], 1)
+    
+    def test_reassembly_holds_pool_buffers(self):
+        """Сборка держит буферы фрагментов до сборки или выброса кадра"""
+        pool = BufferPool(256, 1472)
+        reassembler = FrameReassembler(timeout=0.5, release=pool.release)
+        
+        def feed(datagram: bytes, now: float):
+            buffer = pool.acquire()
+            buffer[:len(datagram)] = datagram
+            return reassembler.add(memoryview(buffer)[:len(datagram)], now, buffer)
+        
+        frame = os.urandom(20 * 1024)
+        fragments = split_fragments(1, frame, fec_group=4)
+        datagrams = [header + bytes(chunk) for header, chunk in fragments]
+        count = len(frame) // len(fragments[0][1]) + 1
+        for datagram in datagrams[:count - 1]:
+            self.assertIsNone(feed(datagram, now=1.0))
+        self.assertEqual(pool.get_stats()['in_use'], count - 1)
+        
+        # Последний фрагмент данных завершает кадр; четность после сборки - опоздавшая
+        self.assertEqual(feed(datagrams[count - 1], now=1.0), frame)
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+        self.assertIsNone(feed(datagrams[-1], now=1.0))
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+        
+        # Неполный кадр выброшен по таймауту - его буферы тоже вернулись
+        partial = [header + bytes(chunk) for header, chunk in split_fragments(2, frame)]
+        for datagram in partial[1:]:
+            feed(datagram, now=2.0)
+        reassembler.evict_expired(now=3.0)
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+    
+    def test_receive_batch(self):
+        """Все готовые датаграммы вычитываются за одно пробуждение"""
+        receiver = MulticastReceiver(MulticastConfig(port=5019))
+        receiver.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.sock.bind(('127.0.0.1', 0))
+        receiver.sock.setblocking(False)
+        receiver._enable_kernel_drops()
+        address = receiver.sock.getsockname()
+        
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            frames = [os.urandom(30 * 1024) for _ in range(2)]
+            count = 0
+            for message_id, frame in enumerate(frames):
+                for header, chunk in split_fragments(message_id, frame):
+                    sender.sendto(header + bytes(chunk), address)
+                    count += 1
+            # Датаграмма больше буфера пула (mtu) не помещается - отбрасывается
+            sender.sendto(b"x" * 3000, address)
+            sender.sendto(b"legacy", address)
+            time.sleep(0.1)
+            
+            messages = []
+            while receiver.datagrams_received + receiver.datagrams_truncated < count + 2:
+                batch = receiver._receive_batch()
+                if not batch and not select_readable(receiver.sock):
+                    break
+                messages.extend(batch)
+            
+            self.assertEqual(messages, frames + [b"legacy"])
+            stats = receiver.get_stats()
+            self.assertEqual(stats['datagrams_received'], count + 1)
+            self.assertEqual(stats['datagrams_truncated'], 1)
+            self.assertLess(stats['batches'], count)
+            self.assertEqual(stats['pool']['in_use'], 0)
+            if stats['kernel_drops'] is not None:
+                self.assertEqual(stats['kernel_drops'], 0)
+        finally:
+            sender.close()
+            receiver.sock.close()
+
+
+def select_readable(sock: socket.socket) -> bool:
+    """Есть ли что читать в сокете"""
+    return bool(select.select([sock], [], [], 0.1)[0])
+
+
+class TestOutboundQueue(unittest.TestCase):
+    """Тесты очереди исходящих пакетов студента"""
+    
+    def test_media_drop_oldest(self):
+        """Медиа: при переполнении выбрасывается самый старый кадр"""
+        queue = OutboundQueue(media_limit=2)
+        for frame in (b"f1", b"f2", b"f3"):
+            self.assertTrue(queue.put(frame, MessageType.SCREEN_FRAME))
+        
+        self.assertEqual(queue.get_nowait(), b"f2")
+        self.assertEqual(queue.get_nowait(), b"f3")
+        self.assertIsNone(queue.get_nowait())
+        self.assertEqual(queue.get_stats()['media_dropped'], 1)
+    
+    def test_media_limit_per_type(self):
+        """Лимит считается отдельно для каждого медиа типа, порядок сохраняется"""
+        queue = OutboundQueue(media_limit=1)
+        queue.put(b"voice1", MessageType.VOICE_DATA)
+        queue.put(b"lock", MessageType.LOCK_SCREEN)
+        queue.put(b"frame1", MessageType.SCREEN_FRAME)
+        queue.put(b"voice2", MessageType.VOICE_DATA)
+        
+        order = [queue.get_nowait() for _ in range(len(queue))]
+        self.assertEqual(order, [b"lock", b"frame1", b"voice2"])
+    
+    def test_delta_chain_dropped_with_base(self):
+        """Выброшен кадр - выбрасываются и зависящие от него дельты, до ключевого кадра"""
+        queue = OutboundQueue(media_limit=3)
+        for packet, keyframe in ((b"k0", True), (b"d1", False), (b"k2", True), (b"d3", False)):
+            queue.put(packet, MessageType.SCREEN_FRAME, keyframe=keyframe)
+        self.assertEqual([queue.get_nowait() for _ in range(len(queue))], [b"k2", b"d3"])
+        self.assertEqual(queue.get_stats()['chain_dropped'], 1)
+        
+        # Ключевого в очереди нет - новые дельты не ставятся, пока он не придет
+        queue = OutboundQueue(media_limit=2)
+        for packet, keyframe in ((b"k0", True), (b"d1", False), (b"d2", False), (b"d3", False),
+                                 (b"k4", True), (b"d5", False)):
+            self.assertTrue(queue.put(packet, MessageType.SCREEN_FRAME, keyframe=keyframe))
+        self.assertEqual([queue.get_nowait() for _ in range(len(queue))], [b"k4", b"d5"])
+        stats = queue.get_stats()
+        self.assertEqual((stats['media_dropped'], stats['chain_dropped']), (4, 3))
+    
+    def test_cursor_drop_keeps_priority(self):
+        """Курсор: обгоняет кадры, но при переполнении старые позиции выбрасываются"""
+        queue = OutboundQueue(media_limit=2)
+        queue.put(b"frame", MessageType.SCREEN_FRAME)
+        for position in (b"c1", b"c2", b"c3"):
+            self.assertTrue(queue.put(position, MessageType.SCREEN_CURSOR))
+        
+        order = [queue.get_nowait() for _ in range(len(queue))]
+        self.assertEqual(order, [b"c2", b"c3", b"frame"])
+        self.assertEqual(queue.get_stats()['media_dropped'], 1)
+    
+    def test_batch_coalesces_small(self):
+        """Мелкие пакеты уходят одной пачкой, большой - отдельно"""
+        queue = OutboundQueue(coalesce_bytes=1000)
+        queue.put(b"pong", MessageType.PONG)
+        queue.put(b"chat", MessageType.CHAT_MESSAGE)
+        queue.put(b"x" * 2000, MessageType.WHITEBOARD_SYNC)
+        
+        self.assertEqual(queue.get_batch(window=0), [b"pong", b"chat"])
+        self.assertEqual(queue.get_batch(window=0), [b"x" * 2000])
+        stats = queue.get_stats()
+        self.assertEqual((stats['batches'], stats['coalesced']), (2, 1))
+    
+    def test_batch_window(self):
+        """Несрочная пачка ждет попутчиков, управление уходит сразу"""
+        queue = OutboundQueue()
+        queue.put(b"draw1", MessageType.WHITEBOARD_COMMAND)
+        threading.Timer(0.05, queue.put, args=(b"draw2", MessageType.WHITEBOARD_COMMAND)).start()
+        self.assertEqual(queue.get_batch(window=0.5), [b"draw1", b"draw2"])
+        
+        queue.put(b"lock", MessageType.LOCK_SCREEN)
+        start = time.time()
+        self.assertEqual(queue.get_batch(window=0.5), [b"lock"])
+        self.assertLess(time.time() - start, 0.1)
+    
+    def test_batch_disabled(self):
+        """coalesce_bytes = 0 - по одному пакету"""
+        queue = OutboundQueue(coalesce_bytes=0)
+        queue.put(b"a", MessageType.PONG)
+        queue.put(b"b", MessageType.PONG)
+        self.assertEqual(queue.get_batch(window=0.5), [b"a"])
+    
+    def test_advance_buffers(self):
+        """Частичная запись: отправленные буферы выбрасываются, текущий обрезается"""
+        buffers = batch_buffers([b"abc", (b"de", b"fgh")])
+        self.assertEqual(len(buffers), 3)
+        
+        rest = advance_buffers(buffers, 4)
+        self.assertEqual([bytes(b) for b in rest], [b"e", b"fgh"])
+        self.assertEqual(advance_buffers(rest, 4), [])
+    
+    def test_send_buffers_partial_writes(self):
+        """send_buffers дописывает все части, даже если ядро принимает по кускам"""
+        sender, receiver = socket.socketpair()
+        sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16 * 1024)
+        sender.settimeout(5.0)
+        receiver.settimeout(5.0)
+        
+        frame = os.urandom(2 * 1024 * 1024)
+        packets = [b"head", (b"meta", frame), b"tail"]
+        expected = b"head" + b"meta" + frame + b"tail"
+        
+        received = bytearray()
+        
+        def read_all():
+            while len(received) < len(expected):
+                chunk = receiver.recv(65536)
+                if not chunk:
+                    break
+                received.extend(chunk)
+        
+        reader = threading.Thread(target=read_all)
+        reader.start()
+        try:
+            calls = send_buffers(sender, batch_buffers(packets))
+            reader.join(timeout=5.0)
+        finally:
+            sender.close()
+            receiver.close()
+        
+        self.assertGreater(calls, 1)
+        self.assertEqual(bytes(received), expected)
+    
+    def test_control_never_dropped(self):
+        """Управление не выбрасывается: при переполнении put ждет и сообщает о неудаче"""
+        queue = OutboundQueue(control_limit=2)
+        self.assertTrue(queue.put(b"c1", MessageType.EXAM_START))
+        self.assertTrue(queue.put(b"c2", MessageType.BLOCK_APP))
+        
+        start = time.time()
+        self.assertFalse(queue.put(b"c3", MessageType.LOCK_SCREEN, timeout=0.1))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        
+        stats = queue.get_stats()
+        self.assertEqual(stats['control_depth'], 2)
+        self.assertEqual(stats['media_dropped'], 0)
+        self.assertEqual(stats['control_waits'], 1)
+    
+    def test_control_waits_for_space(self):
+        """Ждущий отправитель просыпается, когда писатель освобождает место"""
+        queue = OutboundQueue(control_limit=1)
+        queue.put(b"c1", MessageType.LOCK_SCREEN)
+        
+        threading.Timer(0.05, queue.get_nowait).start()
+        self.assertTrue(queue.put(b"c2", MessageType.UNLOCK_SCREEN, timeout=2.0))
+        self.assertEqual(queue.get_nowait(), b"c2")
+    
+    def test_priority_order(self):
+        """Управление обгоняет ранее поставленные объемные и медиа пакеты"""
+        queue = OutboundQueue()
+        queue.put(b"file", MessageType.FILE_TRANSFER_DATA)
+        queue.put(b"frame", MessageType.SCREEN_FRAME)
+        queue.put(b"chat", MessageType.CHAT_MESSAGE)
+        queue.put(b"lock", MessageType.LOCK_SCREEN)
+        
+        order = [queue.get_nowait() for _ in range(4)]
+        self.assertEqual(order, [b"lock", b"chat", b"frame", b"file"])
+    
+    def test_bulk_fragments_interleave_control(self):
+        """Объемный пакет режется на фрагменты, управление проходит между ними"""
+        queue = OutboundQueue(fragment_size=1000)
+        bulk = Protocol.pack(MessageType.FILE_TRANSFER_DATA, {"data": "x" * 5000}, compress=False)
+        lock = Protocol.pack(MessageType.LOCK_SCREEN, {})
+        queue.put(bulk, MessageType.FILE_TRANSFER_DATA)
+        
+        stream = [queue.get_nowait()]
+        queue.put(lock, MessageType.LOCK_SCREEN)
+        while True:
+            packet = queue.get_nowait()
+            if packet is None:
+                break
+            stream.append(packet)
+        
+        # Команда ушла сразу после первого фрагмента
+        self.assertEqual(stream[1], lock)
+        self.assertGreater(queue.get_stats()['fragments_sent'], 5)
+        
+        assembler = RingPacketAssembler()
+        messages = [Protocol.unpack(p) for p in assembler.feed(b"".join(bytes(p) for p in stream))]
+        self.assertEqual([m["type"] for m in messages],
+                         [MessageType.LOCK_SCREEN, MessageType.FILE_TRANSFER_DATA])
+        self.assertEqual(messages[1]["data"]["data"], "x" * 5000)
+    
+    def test_bulk_not_starved(self):
+        """Поток кадров не задерживает объемные данные навсегда"""
+        queue = OutboundQueue(media_limit=100)
+        queue.put(b"file", MessageType.FILE_TRANSFER_DATA)
+        for i in range(50):
+            queue.put(b"frame", MessageType.SCREEN_FRAME)
+        
+        order = [queue.get_nowait() for _ in range(20)]
+        self.assertIn(b"file", order)
+    
+    def test_close_wakes_waiters(self):
+        """Закрытие очереди будит ждущих отправителей и писателя"""
+        queue = OutboundQueue(control_limit=1)
+        queue.put(b"c1", MessageType.LOCK_SCREEN)
+        
+        threading.Timer(0.05, queue.close).start()
+        self.assertFalse(queue.put(b"c2", MessageType.LOCK_SCREEN))
+        self.assertIsNone(queue.get(timeout=2.0))
+
+
+class TestServerClientLoopback(unittest.TestCase):
+    """Интеграционные тесты сервер <-> клиент через localhost"""
+    
+    core = "threaded"
+    
+    def setUp(self):
+        from src.network.server import create_teacher_server
+        
+        self.server = create_teacher_server("Тест", port=_free_port(), core=self.core)
+        self.assertTrue(self.server.start())
+        self.clients = []
+    
+    def tearDown(self):
+        for client in self.clients:
+            client.stop()
+        self.server.stop()
+    
+    def _connect_client(self, name: str = "Студент"):
+        from src.network.client import StudentClient
+        from src.common.models import Teacher
+        
+        client = StudentClient(name)
+        # На одной машине у всех клиентов общий machine_id - различаем по имени
+        client.machine_id = f"{client.machine_id}-{name}"
+        client.running = True
+        received = []
+        client.on_message_received = received.append
+        teacher = Teacher(id="local", name="Тест", ip_address="127.0.0.1", port=self.server.port)
+        self.assertTrue(client.connect_to_teacher(teacher))
+        self.clients.append(client)
+        return client, received
+    
+    def _wait_for(self, predicate, timeout: float = 3.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+    
+    def test_binary_broadcast_negotiated(self):
+        """Новый клиент согласует v3 и получает кадр как memoryview"""
+        client, received = self._connect_client()
+        self.assertEqual(client.protocol_version, Protocol.VERSION)
+        self.assertEqual(client.codecs, available_codecs())
+        
+        frame = os.urandom(50000)
+        self.server.broadcast_to_all(MessageType.SCREEN_FRAME, {"frame_id": 1},
+                                     attachment=frame, attachment_field="payload")
+        
+        self.assertTrue(self._wait_for(lambda: received))
+        payload = received[0]["data"]["payload"]
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual(bytes(payload), frame)
+    
+    def test_connection_send_counters(self):
+        """Счетчики send() и пакетов по соединению, мелкие команды склеиваются"""
+        client, received = self._connect_client()
+        for i in range(20):
+            self.server.broadcast_to_all(MessageType.WHITEBOARD_COMMAND, {"points": [[i, i]]})
+        self.assertTrue(self._wait_for(lambda: len(received) >= 20))
+        
+        stats = self.server.get_stats()
+        connection = stats['connections'][client.student_id]
+        self.assertGreaterEqual(connection['packets_written'], 21)
+        self.assertLess(connection['send_calls'], connection['packets_written'])
+        self.assertEqual(stats['send_calls'], connection['send_calls'])
+    
+    def test_json_serializer_server(self):
+        """Сервер с Serializer = json остается на JSON, сообщения доходят"""
+        self.server.max_protocol_version = Protocol.BINARY_VERSION
+        client, received = self._connect_client()
+        self.assertLessEqual(client.protocol_version, Protocol.BINARY_VERSION)
+        
+        self.server.broadcast_to_all(MessageType.WHITEBOARD_COMMAND, {"action": "clear"})
+        self.assertTrue(self._wait_for(lambda: received))
+        self.assertEqual(received[0]["data"], {"action": "clear"})
+    
+    def test_legacy_client_gets_base64(self):
+        """Клиент без protocol_version получает JSON + base64"""
+        import base64
+        
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(sock.close)
+        legacy_connect = Protocol.pack(MessageType.STUDENT_CONNECT, {
+            "student_name": "Старый клиент",
+            "machine_id": "legacy"
+        })
+        sock.sendall(legacy_connect)
+        
+        assembler = TCPPacketAssembler()
+        sock.settimeout(3.0)
+        messages = []
+        while len(messages) < 2:
+            for packet in assembler.feed(sock.recv(65536)):
+                messages.append(Protocol.unpack(packet))
+            if len(messages) == 1:
+                self.server.broadcast_to_all(MessageType.WEBCAM_FRAME, {"frame_id": 5},
+                                             attachment=b"raw-jpeg")
+        
+        accepted, frame = messages
+        self.assertEqual(accepted["type"], MessageType.CONNECTION_ACCEPTED)
+        self.assertEqual(accepted["data"]["protocol_version"], Protocol.JSON_VERSION)
+        self.assertEqual(frame["data"]["frame_id"], 5)
+        self.assertEqual(base64.b64decode(frame["data"]["data"]), b"raw-jpeg")
+    
+    def test_stalled_student_does_not_block_class(self):
+        """Студент, который не читает сокет, не задерживает кадры остальным"""
+        client, received = self._connect_client("Быстрый")
+        
+        stalled = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(stalled.close)
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.connect(('127.0.0.1', self.server.port))
+        stalled.sendall(MessageBuilder.student_connect("Медленный", "stalled"))
+        self.assertTrue(self._wait_for(lambda: self.server.get_student_count() == 2))
+        
+        frame = os.urandom(1024 * 1024)
+        start = time.time()
+        for frame_id in range(40):
+            self.server.broadcast_to_all(MessageType.SCREEN_FRAME, {"frame_id": frame_id},
+                                         attachment=frame, attachment_field="payload")
+        self.server.broadcast_to_all(MessageType.LOCK_SCREEN, {})
+        elapsed = time.time() - start
+        
+        # 40 МБ в сокет, который никто не читает, - только очередь спасает от блокировки
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(self._wait_for(
+            lambda: any(msg["type"] == MessageType.LOCK_SCREEN for msg in received)))
+        
+        stats = self.server.get_stats()
+        self.assertGreater(stats['media_dropped'], 0)
+        self.assertGreater(stats['queue_depth_max'], 0)
+        
+        stalled_id = next(sid for sid in stats['send_queues'] if sid.startswith("stalled"))
+        stalled_queue = stats['send_queues'][stalled_id]
+        # Кадры копятся, а LOCK_SCREEN не теряется: ждет в очереди или уже ушел раньше кадров
+        self.assertGreater(stalled_queue['media_depth'], 0)
+        self.assertTrue(stalled_queue['control_depth'] == 1 or stalled_queue['control_wait_max_ms'] > 0)
+    
+    
+    def test_control_overtakes_file_push(self):
+        """LOCK_SCREEN не ждет окончания рассылки файла"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+        sock.connect(('127.0.0.1', self.server.port))
+        sock.sendall(MessageBuilder.student_connect("Студент", "bulk"))
+        self.assertTrue(self._wait_for(lambda: self.server.get_student_count() == 1))
+        
+        # Студент пока не читает: 30 чанков по 100 KB копятся в очереди
+        import base64
+        chunk = base64.b64encode(os.urandom(75 * 1024)).decode('ascii')
+        for index in range(30):
+            self.server.broadcast_to_all(MessageType.FILE_TRANSFER_DATA,
+                                         {"chunk_index": index, "data": chunk})
+        self.server.broadcast_to_all(MessageType.LOCK_SCREEN, {})
+        
+        assembler = RingPacketAssembler()
+        sock.settimeout(5.0)
+        types = []
+        while len(types) < 32:
+            assembler.recv_into(sock)
+            for packet in assembler.read_packets():
+                message = Protocol.unpack(packet)
+                types.append(message["type"])
+                if message["type"] == MessageType.FILE_TRANSFER_DATA:
+                    self.assertEqual(message["data"]["data"], chunk)
+        
+        # Обогнать можно все, кроме уже отданного ядру (буферы сокетов)
+        self.assertLess(types.index(MessageType.LOCK_SCREEN), 15)
+        self.assertEqual(types.count(MessageType.FILE_TRANSFER_DATA), 30)
+        self.assertGreater(assembler.get_stats()['fragments_received'], 0)
+
+
+class TestSelectorServerLoopback(TestServerClientLoopback):
+    """Те же сценарии на ядре selectors (один I/O поток)"""
+    
+    core = "selectors"
+    
+    def test_core_selected(self):
+        """Фабрика создает сервер на selectors"""
+        from src.network.event_server import SelectorTeacherServer
+        
+        self.assertIsInstance(self.server, SelectorTeacherServer)
+        self.assertEqual(self.server.get_stats()['core'], "selectors")
+    
+    def test_many_clients_one_thread(self):
+        """Несколько студентов обслуживаются без потока на каждого"""
+        threads_before = threading.active_count()
+        clients = [self._connect_client(f"Студент {i}") for i in range(5)]
+        
+        self.assertTrue(self._wait_for(lambda: self.server.get_student_count() == 5))
+        
+        received_by_server = []
+        self.server.on_message_received = lambda sid, msg: received_by_server.append(sid)
+        for client, _ in clients:
+            self.assertTrue(client.send_message(MessageType.CHAT_MESSAGE, {"content": "привет"}))
+        
+        self.assertTrue(self._wait_for(lambda: len(received_by_server) == 5))
+        self.assertEqual(len(set(received_by_server)), 5)
+        
+        # У каждого клиента 3 своих потока (прием, отправка, heartbeat), у сервера - ни одного нового
+        self.assertLessEqual(threading.active_count() - threads_before, 5 * 3)
+    
+    def test_disconnect_detected(self):
+        """Закрытие сокета студента снимает его с учета"""
+        disconnected = []
+        self.server.on_student_disconnected = disconnected.append
+        client, _ = self._connect_client()
+        self.assertTrue(self._wait_for(lambda: self.server.get_student_count() == 1))
+        
+        client.disconnect()
+        
+        self.assertTrue(self._wait_for(lambda: disconnected))
+        self.assertEqual(self.server.get_student_count(), 0)
+
+
+class TestClientHandshake(unittest.TestCase):
+    """Клиент с сервером-заглушкой"""
+    
+    def test_messages_after_accept_delivered(self):
+        """Сообщения, пришедшие одним сегментом с ответом на подключение, не теряются"""
+        from src.network.client import StudentClient
+        from src.common.models import Teacher
+        
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        accepted = []
+        
+        def serve():
+            conn, _ = listener.accept()
+            accepted.append(conn)
+            conn.recv(65536)
+            conn.sendall(MessageBuilder.connection_accepted("s1")
+                         + Protocol.pack(MessageType.CHAT_MESSAGE, {"content": "первое"})
+                         + Protocol.pack(MessageType.CHAT_MESSAGE, {"content": "второе"}))
+        
+        server_thread = threading.Thread(target=serve, daemon=True)
+        server_thread.start()
+        client = StudentClient("Студент")
+        received = []
+        client.on_message_received = received.append
+        teacher = Teacher(id="local", name="Тест", ip_address="127.0.0.1", port=listener.getsockname()[1])
+        try:
+            self.assertTrue(client.connect_to_teacher(teacher))
+            server_thread.join(timeout=2.0)
+            deadline = time.time() + 3.0
+            while len(received) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual([message["data"]["content"] for message in received], ["первое", "второе"])
+        finally:
+            client.stop()
+            for conn in accepted:
+                conn.close()
+            listener.close()
+    
+    def test_write_failure_disconnects(self):
+        """Запись в сокет не удалась - клиент отключается, а не копит очередь"""
+        from src.network.client import StudentClient
+        
+        client = StudentClient("Студент")
+        disconnected = []
+        client.on_disconnected = lambda: disconnected.append(True)
+        client.connected = True
+        client.outbound = OutboundQueue()
+        client.tcp_socket, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        client._send_buffers = lambda buffers, packets=1: False
+        
+        writer = threading.Thread(target=client._write_messages, daemon=True)
+        writer.start()
+        self.assertTrue(client.send_message(MessageType.CHAT_MESSAGE, {"content": "привет"}))
+        writer.join(timeout=2.0)
+        self.assertFalse(writer.is_alive())
+        self.assertFalse(client.connected)
+        self.assertEqual(disconnected, [True])
+        self.assertFalse(client.send_message(MessageType.CHAT_MESSAGE, {"content": "еще"}))
+
+
 class TestMessageBuilder(unittest.TestCase):
     """Тесты построителя сообщений"""
     
@@ -241,6 +1464,7 @@ class TestMessageBuilder(unittest.TestCase):
         self.assertEqual(unpacked["type"], MessageType.STUDENT_CONNECT)
         self.assertEqual(unpacked["data"]["student_name"], "Петров П.П.")
         self.assertEqual(unpacked["data"]["machine_id"], "machine123")
+        self.assertEqual(unpacked["data"]["protocol_version"], Protocol.VERSION)
     
     def test_chat_message(self):
         """Тест создания CHAT_MESSAGE"""
@@ -284,6 +1508,29 @@ class TestCyrillicSupport(unittest.TestCase):
         self.assertEqual(unpacked["data"]["сообщение"], data["сообщение"])
 
 
+class TestSwarm(unittest.TestCase):
+    """Нагрузочный рой: запуск без GUI, камеры и микрофона"""
+    
+    def test_small_swarm(self):
+        """Маленький рой получает кадры и голос, преподаватель - отчеты"""
+        import contextlib
+        import io
+        from src.tools import swarm
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = swarm.main(["--counts", "3", "--seconds", "1.5", "--fps", "5", "--frame-kb", "20",
+                                  "--activity-interval", "0.5", "--screenshot-interval", "1"])
+        
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertEqual(result['students'], 3)
+        self.assertGreater(result['teacher']['frames_sent'], 0)
+        self.assertGreater(result['delivered'], 0.5)
+        self.assertGreater(result['latency_p50'], 0)
+        self.assertGreater(result['teacher']['reports'], 0)
+        self.assertGreater(result['teacher']['screenshots'], 0)
+
+
 if __name__ == '__main__':
     # Запускаем тесты с подробным выводом
     unittest.main(verbosity=2)
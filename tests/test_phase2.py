@@ -3,6 +3,7 @@
 - Голосовая связь
 - Веб-камера
 - Интерактивная доска
+- Simulcast трансляции экрана
 """
 
 import pytest
@@ -184,6 +185,974 @@ class TestWebcamCapture:
         assert broadcaster.active == False
 
 
+class TestSimulcast:
+    """Тесты simulcast: слои качества трансляции экрана"""
+    
+    LAYERS = [
+        {"name": "720p", "resolution": (1280, 720), "quality": 70, "group": "239.255.1.1", "port": 5021},
+        {"name": "480p", "resolution": (854, 480), "quality": 50, "group": "239.255.1.2", "port": 5022},
+        {"name": "360p", "resolution": (640, 360), "quality": 40, "group": "239.255.1.3", "port": 5023},
+    ]
+    
+    def test_encode_layers(self):
+        """Один кадр - JPEG каждого слоя в его разрешении"""
+        import cv2
+        import numpy as np
+        from src.streaming.screen_capture_optimized import encode_layers, make_layers
+        
+        layers = make_layers(list(reversed(self.LAYERS)))
+        assert [layer.name for layer in layers] == ["720p", "480p", "360p"]
+        
+        frame = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
+        encoded = encode_layers(frame, layers)
+        
+        assert len(encoded) == 3
+        for data, layer in zip(encoded, layers):
+            decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            assert (decoded.shape[1], decoded.shape[0]) == layer.resolution
+        assert len(encoded[0]) > len(encoded[1]) > len(encoded[2])
+    
+    def feed(self, selector, decode_seconds, frames, start, interval=0.1):
+        """Кадры с заданным временем декодирования; вернуть время последнего"""
+        now = start
+        for _ in range(frames):
+            selector.record_frame(decode_seconds, now=now)
+            now += interval
+        return now - interval
+    
+    def test_selector_downgrades_slow_decode(self):
+        """Декодирование дольше половины интервала - слой ниже, но не раньше паузы"""
+        from src.streaming.screen_capture_optimized import LayerSelector, make_layers, LAYER_HOLD
+        
+        selector = LayerSelector(make_layers(self.LAYERS), now=0.0)
+        now = self.feed(selector, 0.08, 12, start=0.1)
+        assert now < LAYER_HOLD
+        assert selector.choose(1.0, now=now) == 0
+        
+        now = self.feed(selector, 0.08, 12, start=LAYER_HOLD)
+        assert selector.choose(1.0, now=now) == 1
+        # Оценки заново - сразу дальше не падаем
+        assert selector.choose(1.0, now=now + 0.1) == 1
+    
+    def test_selector_downgrades_on_loss(self):
+        """Мало собранных кадров - слой ниже даже при быстром декодировании"""
+        from src.streaming.screen_capture_optimized import LayerSelector, make_layers
+        
+        selector = LayerSelector(make_layers(self.LAYERS), now=0.0)
+        now = self.feed(selector, 0.005, 40, start=0.1)
+        assert selector.choose(0.95, now=now) == 0
+        assert selector.choose(0.7, now=now) == 1
+    
+    def test_selector_upgrades_with_headroom(self):
+        """Быстрое декодирование и нет потерь - слой выше после долгой паузы"""
+        from src.streaming.screen_capture_optimized import LayerSelector, make_layers, LAYER_UPGRADE_HOLD
+        
+        selector = LayerSelector(make_layers(self.LAYERS), layer=2, now=0.0)
+        now = self.feed(selector, 0.004, 30, start=0.1)
+        assert selector.choose(1.0, now=now) == 2
+        
+        now = self.feed(selector, 0.004, 30, start=LAYER_UPGRADE_HOLD)
+        assert selector.choose(0.9, now=now) == 2
+        assert selector.choose(1.0, now=now) == 1
+    
+    def test_capture_sends_every_layer(self):
+        """Кадр уходит в группу каждого слоя, NACK - в агрегатор своего слоя"""
+        from src.streaming.screen_capture_optimized import ScreenCaptureOptimized
+        
+        capture = ScreenCaptureOptimized(mode="multicast", layers=self.LAYERS)
+        try:
+            assert [sender.config.port for sender in capture.multicast_senders] == [5021, 5022, 5023]
+            
+            capture._send_frame([b"a" * 3000, b"b" * 2000, b"c" * 1000])
+            assert capture.multicast_frames == 1
+            
+            capture.handle_nack("student-1", {"id": 0, "missing": [0], "layer": 2})
+            assert capture.nack_aggregators[2].get_stats()["nacks_received"] == 1
+            assert capture.nack_aggregators[0].get_stats()["nacks_received"] == 0
+            assert len(capture.get_stats()["layers"]) == 3
+        finally:
+            capture.stop()
+    
+    def test_capture_skips_empty_layer(self):
+        """Кодировщик слоя не выдал кадр (None) - ни TCP, ни группа слоя его не получают"""
+        from src.streaming.screen_capture_optimized import ScreenCaptureOptimized
+        
+        capture = ScreenCaptureOptimized(mode="hybrid", layers=self.LAYERS)
+        try:
+            tcp = []
+            sent = {index: [] for index in range(3)}
+            capture.on_frame = lambda data, frame_id: tcp.append(data)
+            for index, sender in enumerate(capture.multicast_senders):
+                sender.send = lambda data, compress=True, index=index: sent[index].append(data)
+            
+            capture._send_frame([None, b"b" * 2000, None])
+            assert tcp == []
+            assert [len(sent[index]) for index in range(3)] == [0, 1, 0]
+        finally:
+            capture.stop()
+    
+    def test_receiver_set_layer(self):
+        """Переход на слой - подписка на его группу, повторы чужого слоя игнорируются"""
+        from src.streaming.screen_capture_optimized import ScreenReceiverOptimized
+        
+        sent = []
+        receiver = ScreenReceiverOptimized(mode="multicast", layers=self.LAYERS, auto_layer=False,
+                                           send_message=lambda msg_type, data: sent.append(data))
+        try:
+            assert receiver.multicast_receiver.config.port == 5021
+            assert receiver.set_layer(1)
+            assert receiver.multicast_receiver.config.port == 5022
+            assert receiver.get_stats()["layer"] == "480p"
+            assert receiver.set_layer(5) == False
+            
+            receiver._send_nack(3, [1], receiver.layer)
+            assert sent == [{"id": 3, "missing": [1], "layer": 1}]
+        finally:
+            receiver.stop()
+
+
+class TestStreamTransport:
+    """Тесты выбора транспорта трансляции по студентам (режим auto)"""
+    
+    LAYERS = [{"name": "main", "resolution": (320, 240), "quality": 70, "group": "239.255.1.1", "port": 5031}]
+    
+    def test_selector_promotes_and_falls_back(self):
+        """Два хороших отчета - multicast; потери или отставание - обратно на TCP"""
+        from src.streaming.screen_capture_optimized import TransportSelector
+        
+        selector = TransportSelector(fps=10)
+        good = {"received": 20, "span": 20, "last_frame": 100}
+        assert selector.report("s1", good, 101, now=0.0) == "tcp"
+        assert selector.report("s1", good, 101, now=2.0) == "multicast"
+        assert selector.multicast_students() == ["s1"]
+        
+        assert selector.report("s1", {"received": 10, "span": 20, "last_frame": 120}, 121, now=4.0) == "tcp"
+        selector.report("s1", good, 101, now=6.0)
+        assert selector.report("s1", good, 101, now=8.0) == "multicast"
+        assert selector.report("s1", good, 150, now=10.0) == "tcp"
+        assert selector.get_stats()["switches"] == 4
+    
+    def test_selector_falls_back_without_reports(self):
+        """Отчеты перестали приходить - multicast не доходит, обратно на TCP"""
+        from src.streaming.screen_capture_optimized import TransportSelector, TRANSPORT_REPORT_TIMEOUT
+        
+        selector = TransportSelector(fps=10)
+        for now in (0.0, 2.0):
+            selector.report("s1", {"received": 20, "span": 20, "last_frame": 5}, 5, now=now)
+        selector.check(now=2.0 + TRANSPORT_REPORT_TIMEOUT / 2)
+        assert selector.transport("s1") == "multicast"
+        selector.check(now=2.0 + TRANSPORT_REPORT_TIMEOUT + 0.1)
+        assert selector.transport("s1") == "tcp"
+        
+        selector.remove("s1")
+        assert selector.get_stats()["students"] == {}
+    
+    def test_capture_excludes_multicast_students(self):
+        """auto: TCP кадр всем, кроме подтвердивших multicast; экономия в статистике"""
+        from src.streaming.screen_capture_optimized import ScreenCaptureOptimized
+        
+        capture = ScreenCaptureOptimized(mode="auto", layers=self.LAYERS)
+        sent = []
+        capture.on_tcp_frame = lambda data, frame_id, exclude: sent.append((frame_id, exclude))
+        try:
+            for _ in range(2):
+                capture.handle_report("s1", {"received": 10, "span": 10, "last_frame": 0})
+            capture._send_frame([b"x" * 1000])
+            
+            assert sent == [(0, ["s1"])]
+            assert capture.multicast_frames == 1
+            stats = capture.get_stats()
+            assert stats["transports"]["students"]["s1"]["transport"] == "multicast"
+            assert stats["tcp_bytes_saved"] == 1000
+        finally:
+            capture.stop()
+    
+    def test_receiver_dedupes_and_reports(self):
+        """Кадр из TCP и тот же из multicast - показан один раз; в отчет идут кадры multicast"""
+        import cv2
+        import numpy as np
+        from src.common.constants import MessageType
+        from src.streaming.screen_capture_optimized import ScreenReceiverOptimized
+        
+        sent = []
+        receiver = ScreenReceiverOptimized(mode="auto", layers=self.LAYERS,
+                                           send_message=lambda msg_type, data: sent.append((msg_type, data)))
+        try:
+            _, jpeg = cv2.imencode(".jpg", np.zeros((240, 320, 3), dtype=np.uint8))
+            jpeg = jpeg.tobytes()
+            
+            assert receiver.decode_frame(jpeg, frame_id=7) is not None
+            receiver._on_multicast_data((7).to_bytes(4, "big") + jpeg)
+            assert receiver.decode_frame(jpeg, frame_id=7) is None
+            receiver._report_start -= 10
+            receiver._on_multicast_data((8).to_bytes(4, "big") + jpeg)
+            
+            stats = receiver.get_stats()
+            assert (stats["tcp_frames"], stats["multicast_frames"], stats["duplicate_frames"]) == (1, 1, 2)
+            assert stats["transport"] == "multicast"
+            assert sent == [(MessageType.MULTICAST_REPORT, {"received": 2, "span": 2, "last_frame": 8, "layer": 0})]
+        finally:
+            receiver.stop()
+
+
+class TestTileDelta:
+    """Тесты дельта-кодирования экрана по плиткам"""
+    
+    def make_slide(self):
+        import cv2
+        import numpy as np
+        
+        frame = np.full((720, 1280, 3), 235, dtype=np.uint8)
+        cv2.putText(frame, "Lecture 5: sorting", (80, 120), cv2.FONT_HERSHEY_SIMPLEX, 2, (30, 30, 30), 3)
+        return frame
+    
+    def test_delta_sends_only_dirty_tiles(self):
+        """Изменилась пара плиток - дельта намного меньше ключевого кадра и собирается в холст"""
+        import cv2
+        import numpy as np
+        from src.streaming.tile_delta import TileEncoder, TileCanvas, is_tile_delta
+        
+        encoder = TileEncoder(quality=70)
+        canvas = TileCanvas()
+        slide = self.make_slide()
+        keyframe = encoder.encode(slide, 0, now=0.0)
+        assert not is_tile_delta(keyframe)
+        canvas.apply(keyframe, 0)
+        
+        moved = slide.copy()
+        cv2.circle(moved, (700, 500), 8, (0, 0, 255), -1)  # Курсор
+        delta = encoder.encode(moved, 1, now=0.1)
+        assert is_tile_delta(delta)
+        assert len(delta) < len(keyframe) / 5
+        assert encoder.get_stats()["tiles_sent"] <= 4
+        
+        shown = canvas.apply(delta, 1)
+        assert shown.shape == moved.shape
+        assert np.abs(shown.astype(int) - moved).mean() < 2
+        
+        # Ничего не изменилось - только заголовок
+        empty = encoder.encode(moved, 2, now=0.2)
+        assert len(empty) < 20
+        assert canvas.apply(empty, 2) is not None
+    
+    def test_keyframes(self):
+        """Ключевой кадр: по интервалу, по запросу (не чаще порога) и при большом изменении"""
+        import numpy as np
+        from src.streaming.tile_delta import TileEncoder, is_tile_delta, TILE_KEYFRAME_INTERVAL
+        
+        encoder = TileEncoder(quality=70)
+        slide = self.make_slide()
+        encoder.encode(slide, 0, now=0.0)
+        assert is_tile_delta(encoder.encode(slide, 1, now=0.1))
+        
+        assert encoder.request_keyframe(now=0.15)
+        assert not encoder.request_keyframe(now=0.2)
+        assert not is_tile_delta(encoder.encode(slide, 2, now=0.2))
+        
+        noise = np.random.randint(0, 255, slide.shape, dtype=np.uint8)
+        assert not is_tile_delta(encoder.encode(noise, 3, now=0.3))
+        assert is_tile_delta(encoder.encode(noise, 4, now=0.4))
+        assert not is_tile_delta(encoder.encode(noise, 5, now=0.4 + TILE_KEYFRAME_INTERVAL))
+    
+    def test_receiver_waits_for_keyframe(self):
+        """Дельта без основы не применяется, ScreenReceiver просит ключевой кадр"""
+        from src.streaming.screen_capture import ScreenReceiver
+        from src.streaming.tile_delta import TileEncoder
+        
+        encoder = TileEncoder(quality=70)
+        slide = self.make_slide()
+        keyframe = encoder.encode(slide, 0, now=0.0)
+        encoder.encode(slide, 1, now=0.1)
+        delta = encoder.encode(slide, 2, now=0.2)
+        
+        requests = []
+        receiver = ScreenReceiver()
+        receiver.on_keyframe_needed = lambda: requests.append(True)
+        receiver.process_frame(keyframe, 0)
+        receiver.process_frame(delta, 2)  # Дельта 1 потеряна
+        receiver.process_frame(delta, 2)
+        
+        assert receiver.frames_received == 1
+        assert requests == [True]
+        assert receiver.get_stats()["canvas"]["deltas_skipped"] == 2
+    
+    def make_photo(self):
+        import numpy as np
+        
+        rng = np.random.default_rng(0)
+        return rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    
+    def test_lossless_tiles_classification(self):
+        """Текст и однотонный фон - без потерь, шум фото - JPEG"""
+        from src.streaming.tile_delta import _grid, lossless_tiles
+        
+        text = _grid(self.make_slide()[:704], 64).swapaxes(1, 2).reshape(-1, 64, 64, 3)
+        photo = _grid(self.make_photo()[:704], 64).swapaxes(1, 2).reshape(-1, 64, 64, 3)
+        assert lossless_tiles(text).all()
+        assert not lossless_tiles(photo).any()
+    
+    def test_adaptive_text_is_exact(self):
+        """adaptive: ключевой кадр без основы, текст на холсте без искажений, фото - JPEG"""
+        import numpy as np
+        from src.streaming.tile_delta import TileEncoder, TileCanvas, is_tile_delta
+        
+        frame = self.make_slide()
+        frame[400:] = self.make_photo()[400:]  # Низ экрана - фото
+        encoder = TileEncoder(quality=50, adaptive=True)
+        keyframe = encoder.encode(frame, 0, now=0.0)
+        assert is_tile_delta(keyframe)
+        
+        canvas = TileCanvas()
+        shown = canvas.apply(keyframe, 0)  # Основа не нужна
+        assert shown is not None and not canvas.needs_keyframe
+        assert np.array_equal(shown[:384], frame[:384])
+        assert not np.array_equal(shown[448:], frame[448:])
+        stats = encoder.get_stats()
+        assert 0 < stats["lossless_tiles"] < stats["tiles_sent"]
+        
+        # Плитки текста по-прежнему меньше, чем JPEG того же кадра
+        plain = TileEncoder(quality=90).encode(self.make_slide(), 0, now=0.0)
+        assert len(TileEncoder(quality=50, adaptive=True).encode(self.make_slide(), 0, now=0.0)) < len(plain)
+    
+    def test_adaptive_refines_text_after_motion(self):
+        """Текст, меняющийся каждый кадр, уходит JPEG и досылается без потерь, когда остановится"""
+        import cv2
+        import numpy as np
+        from src.streaming.tile_delta import TileEncoder, TileCanvas
+        
+        encoder = TileEncoder(quality=50, adaptive=True)
+        canvas = TileCanvas()
+        slide = self.make_slide()
+        canvas.apply(encoder.encode(slide, 0, now=0.0), 0)
+        
+        frame = slide
+        for frame_id in range(1, 4):
+            frame = slide.copy()
+            cv2.putText(frame, f"frame {frame_id}", (600, 500), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+            shown = canvas.apply(encoder.encode(frame, frame_id, now=frame_id * 0.04), frame_id)
+        assert not np.array_equal(shown, frame)  # Движется - JPEG
+        
+        shown = canvas.apply(encoder.encode(frame, 4, now=0.16), 4)
+        assert np.array_equal(shown, frame)
+        assert encoder.get_stats()["refined_tiles"] > 0
+    
+    
+    def test_keyframe_detection(self):
+        """is_keyframe: JPEG и плитки без основы - ключевые, дельта - нет"""
+        from src.streaming.screen_capture import is_keyframe
+        from src.streaming.tile_delta import TileEncoder
+        
+        slide = self.make_slide()
+        typed = slide.copy()
+        typed[300:316, 80:200] = 0
+        for adaptive in (False, True):
+            encoder = TileEncoder(70, adaptive=adaptive)
+            assert is_keyframe(encoder.encode(slide, 0, now=0.0))
+            assert not is_keyframe(encoder.encode(typed, 1, now=0.1))
+    
+    def test_codec_from_config(self):
+        """create_screen_capture: кодек по имени ([Streaming] ScreenCodec), неизвестный - MJPEG"""
+        from src.common.constants import ScreenCodec
+        from src.streaming.screen_capture import create_screen_capture
+        from src.streaming.tile_delta import TileEncoder
+        
+        capture = create_screen_capture(ScreenCodec.ADAPTIVE, cursor=False)
+        assert isinstance(capture.frame_encoder, TileEncoder) and capture.frame_encoder.adaptive
+        assert isinstance(create_screen_capture(ScreenCodec.DELTA).frame_encoder, TileEncoder)
+        assert create_screen_capture("vp9").frame_encoder is None
+    
+    def test_default_codec_for_old_students(self):
+        """По умолчанию (config.ini) - JPEG: студент v2 декодирует кадр из base64"""
+        import cv2
+        import numpy as np
+        from src.common.constants import MessageType
+        from src.network.protocol import Protocol
+        from src.streaming.screen_capture import create_screen_capture
+        
+        capture = create_screen_capture(cursor=False)
+        assert capture.frame_encoder is None
+        frame = capture._encode(self.make_slide(), 0)
+        packet = Protocol.pack_for_version(Protocol.JSON_VERSION, MessageType.SCREEN_FRAME, {"frame_id": 0},
+                                           attachment=frame, attachment_field="payload")
+        
+        message = Protocol.unpack(packet)
+        image = cv2.imdecode(np.frombuffer(base64.b64decode(message["data"]["payload"]), np.uint8),
+                             cv2.IMREAD_COLOR)
+        assert image is not None
+        
+        
+        """На время записи - JPEG каждого кадра, после - снова дельты с ключевого кадра"""
+        from src.streaming.screen_capture import ScreenCapture, ScreenReceiver
+        from src.streaming.tile_delta import is_tile_delta
+        
+        capture = ScreenCapture(adaptive=True)
+        receiver = ScreenReceiver()
+        requests = []
+        receiver.on_keyframe_needed = lambda: requests.append(True)
+        slide = self.make_slide()
+        
+        receiver.process_frame(capture._encode(slide, 0), 0)
+        capture.set_plain_jpeg(True)
+        recorded = capture._encode(slide, 1)
+        assert recorded[:2] == b'\xff\xd8'
+        receiver.process_frame(recorded, 1)
+        
+        capture.set_plain_jpeg(False)
+        typed = slide.copy()
+        typed[300:316, 80:200] = 0
+        resumed = capture._encode(typed, 2)
+        assert is_tile_delta(resumed)
+        receiver.process_frame(resumed, 2)
+        assert requests == []
+        assert (receiver.get_current_frame() == typed).all()
+
+
+class TestCapturePipeline:
+    """Тесты конвейера захват -> конвертация -> кодирование -> отправка"""
+    
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+    
+    def test_order_preserved(self):
+        """Кодировщики заканчивают не по порядку - отправка все равно по номерам кадров"""
+        from src.streaming.capture_pipeline import CapturePipeline
+        
+        sent = []
+        
+        def encode(frame, frame_id):
+            time.sleep(0.03 if frame_id % 3 == 0 else 0.001)  # Каждый третий кадр кодируется дольше
+            return f"jpeg{frame}".encode()
+        
+        pipeline = CapturePipeline(lambda raw: raw * 10, encode, lambda data, frame_id: sent.append((frame_id, data)),
+                                   workers=3, queue_size=20)
+        pipeline.start()
+        for raw in range(12):
+            assert pipeline.submit(raw)
+            time.sleep(0.002)
+        assert self.wait_for(lambda: len(sent) == 12)
+        pipeline.stop()
+        
+        assert [frame_id for frame_id, _ in sent] == list(range(12))
+        assert [data for _, data in sent] == [f"jpeg{raw * 10}".encode() for raw in range(12)]
+        stats = pipeline.get_stats()
+        assert stats["frames_sent"] == 12
+        assert stats["stages"]["encode"]["count"] == 12
+        assert stats["stages"]["encode"]["max_ms"] >= 25
+        assert stats["stages"]["total"]["avg_ms"] > 0
+    
+    def test_capture_never_waits_for_network(self):
+        """Отправка зависла - submit не ждет, выбрасываются старые кадры"""
+        import threading
+        from src.streaming.capture_pipeline import CapturePipeline
+        
+        release = threading.Event()
+        sent = []
+        
+        def send(data, frame_id):
+            release.wait(5)
+            sent.append(data)
+        
+        pipeline = CapturePipeline(lambda raw: raw, lambda frame, frame_id: bytes([frame]), send,
+                                   workers=1, queue_size=2)
+        pipeline.start()
+        start = time.perf_counter()
+        for raw in range(50):
+            pipeline.submit(raw)
+            time.sleep(0.001)
+        assert time.perf_counter() - start < 1.0
+        assert pipeline.stale_frames > 0
+        
+        release.set()
+        assert self.wait_for(lambda: pipeline.get_stats()["queued"] == 0 and len(sent) > 1)
+        time.sleep(0.05)
+        pipeline.stop()
+        
+        # Последний захваченный кадр дошел, порядок не нарушен
+        assert sent[-1] == bytes([49])
+        assert sent == sorted(sent)
+    
+    def test_encode_error_skips_frame(self):
+        """Ошибка кодирования - кадр пропущен, остальные уходят"""
+        from src.streaming.capture_pipeline import CapturePipeline
+        
+        sent = []
+        
+        def encode(frame, frame_id):
+            if frame == 1:
+                raise ValueError("bad frame")
+            return b"ok" if frame != 2 else None
+        
+        pipeline = CapturePipeline(lambda raw: raw, encode, lambda data, frame_id: sent.append(frame_id),
+                                   workers=2, queue_size=5)
+        pipeline.start()
+        for raw in range(4):
+            pipeline.submit(raw)
+        assert self.wait_for(lambda: len(sent) == 2)
+        pipeline.stop()
+        
+        assert sent == [0, 3]
+        assert pipeline.encode_errors == 2
+    
+    def test_unchanged_frames_skipped(self):
+        """convert вернул None - кадр не кодируется и не получает номер"""
+        from src.streaming.capture_pipeline import CapturePipeline
+        
+        sent = []
+        pipeline = CapturePipeline(lambda raw: raw if raw % 2 == 0 else None, lambda frame, frame_id: b"jpeg",
+                                   lambda data, frame_id: sent.append(frame_id), workers=2, queue_size=10)
+        pipeline.start()
+        for raw in range(6):
+            pipeline.submit(raw)
+        assert self.wait_for(lambda: len(sent) == 3)
+        pipeline.stop()
+        
+        assert sent == [0, 1, 2]
+        assert pipeline.skipped_frames == 3
+
+
+class TestStaticScreen:
+    """Тесты пропуска неподвижного экрана"""
+    
+    def make_screen(self):
+        import numpy as np
+        
+        screen = np.full((720, 1280, 4), 235, dtype=np.uint8)  # BGRA, как у mss
+        screen[100:140, 80:600] = 30  # "Заголовок слайда"
+        return screen
+    
+    def test_static_frames_skipped(self):
+        """Неподвижный экран: кадры не кодируются, раз в интервал - keepalive, по таймеру - обновление"""
+        from src.streaming.change_detector import (ChangeDetector, FRAME, KEEPALIVE, SKIP,
+                                                   STATIC_KEEPALIVE_INTERVAL, STATIC_REFRESH_INTERVAL)
+        
+        detector = ChangeDetector()
+        screen = self.make_screen()
+        assert detector.check(screen, now=0.0) == FRAME
+        assert detector.check(screen.copy(), now=0.04) == SKIP
+        assert detector.check(screen, now=STATIC_KEEPALIVE_INTERVAL) == KEEPALIVE
+        assert detector.check(screen, now=STATIC_KEEPALIVE_INTERVAL + 0.04) == SKIP
+        assert detector.check(screen, now=STATIC_REFRESH_INTERVAL) == FRAME
+        
+        # Изменился один символ текста
+        typed = screen.copy()
+        typed[300:312, 400:407] = 0
+        assert detector.check(typed, now=STATIC_REFRESH_INTERVAL + 0.04) == FRAME
+        
+        detector.request_refresh()
+        assert detector.check(typed, now=STATIC_REFRESH_INTERVAL + 0.08) == FRAME
+        
+        stats = detector.get_stats()
+        assert stats["frames"] == 4
+        assert stats["keepalives"] == 1
+        assert stats["refreshes"] == 2
+    
+    def test_disabled_sends_every_frame(self):
+        """Во время записи урока (enabled=False) каждый кадр кодируется"""
+        from src.streaming.change_detector import ChangeDetector, FRAME
+        
+        detector = ChangeDetector()
+        detector.enabled = False
+        screen = self.make_screen()
+        assert [detector.check(screen, now=i * 0.04) for i in range(5)] == [FRAME] * 5
+    
+    def test_receiver_keepalive_requests_lost_frame(self):
+        """Keepalive с номером кадра, которого у студента нет, - запрос кадра"""
+        import cv2
+        from src.streaming.screen_capture import ScreenReceiver
+        
+        _, jpeg = cv2.imencode('.jpg', self.make_screen()[:, :, :3])
+        requests = []
+        receiver = ScreenReceiver()
+        receiver.on_keyframe_needed = lambda: requests.append(True)
+        receiver.process_frame(jpeg.tobytes(), 5)
+        
+        receiver.process_keepalive(5)
+        assert requests == []
+        receiver.process_keepalive(6)  # Кадр 6 выброшен медиа очередью
+        assert requests == [True]
+        assert receiver.get_stats()["keepalives_received"] == 2
+
+
+class TestVideoCodec:
+    """Тесты H.264 трансляции"""
+    
+    def make_frames(self, count):
+        import numpy as np
+        
+        frame = np.full((360, 640, 3), 235, dtype=np.uint8)
+        frame[40:70, 40:400] = 30  # "Заголовок слайда"
+        frames = []
+        for i in range(count):
+            typed = frame.copy()
+            typed[200:216, 40:40 + 12 * (i + 1)] = 0  # Печатается текст
+            frames.append(typed)
+        return frames
+    
+    def test_roundtrip(self):
+        """Первый кадр ключевой, следующие - P-кадры меньше JPEG; декодируются близко к исходным"""
+        import cv2
+        import numpy as np
+        pytest.importorskip("av")
+        from src.streaming.video_codec import H264Encoder, H264Decoder, is_video_frame
+        
+        encoder = H264Encoder(fps=24)
+        decoder = H264Decoder()
+        frames = self.make_frames(5)
+        for frame_id, frame in enumerate(frames):
+            data = encoder.encode(frame, frame_id)
+            assert is_video_frame(data)
+            decoded = decoder.decode(data, frame_id)
+            assert decoded.shape == frame.shape
+            assert np.abs(decoded.astype(int) - frame).mean() < 3
+        
+        stats = encoder.get_stats()
+        assert stats["keyframes"] == 1
+        jpeg = cv2.imencode('.jpg', frames[-1], [int(cv2.IMWRITE_JPEG_QUALITY), 70])[1]
+        assert len(data) < len(jpeg) // 5
+    
+    def test_lost_frame_waits_for_keyframe(self):
+        """P-кадр после потерянного не применяется до ключевого кадра по запросу"""
+        pytest.importorskip("av")
+        from src.streaming.video_codec import H264Encoder, H264Decoder
+        
+        encoder = H264Encoder(fps=24)
+        decoder = H264Decoder()
+        frames = self.make_frames(5)
+        assert decoder.decode(encoder.encode(frames[0], 0), 0) is not None
+        encoder.encode(frames[1], 1)  # Выброшен медиа очередью
+        assert decoder.decode(encoder.encode(frames[2], 2), 2) is None
+        assert decoder.needs_keyframe
+        
+        assert encoder.request_keyframe(now=0.0)
+        assert not encoder.request_keyframe(now=0.1)  # Весь класс просит сразу
+        assert decoder.decode(encoder.encode(frames[3], 3), 3) is not None
+        assert decoder.decode(encoder.encode(frames[4], 4), 4) is not None
+        assert not decoder.needs_keyframe
+    
+    def test_keyframe_detection(self):
+        """is_keyframe: ключевой кадр H.264 - да, P-кадр - нет"""
+        pytest.importorskip("av")
+        from src.streaming.screen_capture import is_keyframe
+        from src.streaming.video_codec import H264Encoder
+        
+        encoder = H264Encoder(fps=24)
+        frames = self.make_frames(2)
+        assert is_keyframe(encoder.encode(frames[0], 0))
+        assert not is_keyframe(encoder.encode(frames[1], 1))
+    
+    def test_receiver_joins_mid_stream(self):
+        """Студент подключился посреди GOP: просит ключевой кадр и показывает экран с него"""
+        pytest.importorskip("av")
+        from src.streaming.screen_capture import ScreenReceiver
+        from src.streaming.video_codec import H264Encoder
+        
+        encoder = H264Encoder(fps=24)
+        frames = self.make_frames(4)
+        encoder.encode(frames[0], 0)
+        requests = []
+        receiver = ScreenReceiver()
+        receiver.on_keyframe_needed = lambda: requests.append(True)
+        
+        receiver.process_frame(encoder.encode(frames[1], 1), 1)
+        assert receiver.get_current_frame() is None
+        assert requests == [True]
+        
+        encoder.request_keyframe()
+        receiver.process_frame(encoder.encode(frames[2], 2), 2)
+        receiver.process_frame(encoder.encode(frames[3], 3), 3)
+        assert receiver.get_current_frame().shape == frames[3].shape
+        assert receiver.canvas.frame_id == 3
+
+
+class TestRateController:
+    """Тесты подстройки качества трансляции по обратной связи студентов"""
+    
+    def make_controller(self):
+        from src.core.performance_manager import PerformanceManager
+        from src.streaming.rate_controller import RateController
+        from src.streaming.screen_capture import ScreenCapture
+        
+        capture = ScreenCapture(delta=True)
+        controller = RateController(capture, PerformanceManager.get_profile_by_name("medium"),
+                                    target_mbps=0, now=0.0)
+        return capture, controller
+    
+    def report_all(self, controller, now, loss=0.0, students=4):
+        for i in range(students):
+            controller.report(f"s{i}", {"loss": loss, "decode_ms": 5.0}, now=now)
+    
+    def test_ladder(self):
+        """Лестница от потолка: трафик убывает, сначала частота кадров, последним - разрешение"""
+        from src.streaming.rate_controller import build_ladder
+        
+        ladder = build_ladder(70, 24, (1280, 720))
+        assert (ladder[0].quality, ladder[0].fps, ladder[0].resolution) == (70, 24, (1280, 720))
+        assert ladder[1].fps < 24 and ladder[1].quality == 70
+        assert ladder[-1].resolution == (640, 360)
+        costs = [level.cost for level in ladder]
+        assert costs == sorted(costs, reverse=True)
+    
+    def test_hysteresis(self):
+        """Вниз - только при устойчивой перегрузке; вверх - после паузы; неудачная попытка удваивает паузу"""
+        from src.streaming.rate_controller import RATE_UP_HOLD
+        
+        capture, controller = self.make_controller()
+        top = controller.current
+        
+        # Одна плохая проверка - не повод
+        self.report_all(controller, 3.0, loss=0.2)
+        assert controller.tick(now=3.0) is None
+        self.report_all(controller, 4.0, loss=0.2)
+        level = controller.tick(now=4.0)
+        assert controller.level == 1
+        assert capture.target_fps == level.fps < top.fps
+        assert capture.frame_encoder.quality == level.quality
+        
+        # Потери ушли - вверх не раньше RATE_UP_HOLD
+        self.report_all(controller, 5.0)
+        assert controller.tick(now=5.0) is None
+        self.report_all(controller, 4.0 + RATE_UP_HOLD)
+        assert controller.tick(now=4.0 + RATE_UP_HOLD) == top
+        
+        # Сразу снова потери: обратно вниз, следующая попытка - вдвое позже
+        now = 4.0 + RATE_UP_HOLD
+        for _ in range(2):
+            now += 1.0
+            self.report_all(controller, now, loss=0.2)
+            controller.tick(now=now)
+        assert controller.level == 1
+        assert controller.up_hold == 2 * RATE_UP_HOLD
+        assert len(controller.get_stats()["decisions"]) == 3
+    
+    def test_single_slow_student_ignored(self):
+        """Один перегруженный студент из четырех не снижает качество всем"""
+        _, controller = self.make_controller()
+        for now in (3.0, 4.0, 5.0):
+            self.report_all(controller, now)
+            controller.report("s0", {"loss": 0.5, "decode_ms": 5.0}, now=now)
+            controller.report("s4", {"loss": 0.0, "decode_ms": 5.0}, now=now)
+            controller.tick(now=now)
+        assert controller.level == 0
+    
+    def test_receiver_feedback(self):
+        """Студент считает потери по пропускам номеров кадров"""
+        import cv2
+        import numpy as np
+        from src.streaming.screen_capture import ScreenReceiver
+        
+        _, jpeg = cv2.imencode('.jpg', np.zeros((90, 160, 3), dtype=np.uint8))
+        receiver = ScreenReceiver()
+        receiver.get_feedback(now=0.0)
+        for frame_id in (0, 1, 2, 5, 6):  # 3 и 4 потеряны
+            receiver.process_frame(jpeg.tobytes(), frame_id)
+        feedback = receiver.get_feedback(now=2.0)
+        assert feedback["loss"] == round(2 / 7, 3)
+        assert feedback["fps"] == 2.5
+        assert feedback["kbps"] > 0
+        assert receiver.get_feedback(now=4.0)["loss"] == 0.0
+
+
+class TestJpegBudget:
+    """Тесты JPEG в бюджете кадра"""
+    
+    def make_busy(self, seed):
+        import numpy as np
+        
+        rng = np.random.default_rng(seed)
+        yy, xx = np.mgrid[0:360, 0:640]
+        base = (128 + 100 * np.sin(xx / 30 + seed))[..., None]
+        return np.clip(base + rng.normal(0, 25, (360, 640, 3)), 0, 255).astype(np.uint8)
+    
+    def make_slide(self):
+        import numpy as np
+        
+        frame = np.full((360, 640, 3), 240, dtype=np.uint8)
+        frame[40:60, 40:600] = 30
+        return frame
+    
+    def test_busy_frames_fit_budget(self):
+        """Тяжелые кадры укладываются в бюджет, не больше одного перекодирования на кадр"""
+        import cv2
+        from src.streaming.jpeg_budget import JpegBudgetEncoder, BUDGET_TOLERANCE
+        
+        fixed = len(cv2.imencode('.jpg', self.make_busy(0), [int(cv2.IMWRITE_JPEG_QUALITY), 70])[1])
+        budget = fixed // 2
+        encoder = JpegBudgetEncoder(budget, max_quality=70)
+        sizes = [len(encoder.encode(self.make_busy(seed))) for seed in range(10)]
+        
+        assert max(sizes[1:]) <= budget * BUDGET_TOLERANCE
+        stats = encoder.get_stats()
+        assert stats["reencodes"] <= stats["frames"]
+        assert stats["avg_quality"] < 70
+    
+    def test_simple_frames_keep_max_quality(self):
+        """Слайд в бюджете - качество не выше max_quality и не снижается"""
+        from src.streaming.jpeg_budget import JpegBudgetEncoder
+        
+        encoder = JpegBudgetEncoder(200_000, max_quality=70)
+        for _ in range(3):
+            encoder.encode(self.make_slide())
+        assert encoder.get_stats()["avg_quality"] == 70
+        assert encoder.get_stats()["reencodes"] == 0
+    
+    def test_quality_recovers_after_busy_content(self):
+        """После видео слайд снова кодируется с максимальным качеством"""
+        import cv2
+        from src.streaming.jpeg_budget import JpegBudgetEncoder
+        
+        fixed = len(cv2.imencode('.jpg', self.make_busy(0), [int(cv2.IMWRITE_JPEG_QUALITY), 70])[1])
+        encoder = JpegBudgetEncoder(fixed // 2, max_quality=70)
+        for seed in range(5):
+            encoder.encode(self.make_busy(seed))
+        assert encoder.get_stats()["avg_quality"] < 70
+        for _ in range(3):
+            encoder.encode(self.make_slide())
+        slide = encoder.encode(self.make_slide())
+        assert slide == cv2.imencode('.jpg', self.make_slide(), [int(cv2.IMWRITE_JPEG_QUALITY), 70])[1].tobytes()
+    
+    def test_profile_budget(self):
+        """Бюджет из профиля: оценка размера кадра, с multicast - не больше предела на кадр"""
+        from src.core.performance_manager import PerformanceManager
+        
+        profile = PerformanceManager.get_profile_by_name("medium")
+        budget = PerformanceManager.calculate_frame_budget(profile, max_bitrate_mbps=0)
+        assert budget == int(1280 * 720 * 0.7 * 0.2)
+        capped = PerformanceManager.calculate_frame_budget(profile, max_bitrate_mbps=10)
+        assert capped == int(10_000_000 / 8 / profile.screen_fps)
+        assert PerformanceManager.calculate_frame_budget(profile, (640, 360), max_bitrate_mbps=0) == budget // 4
+    
+    def test_set_encoding_rescales_budget(self):
+        """set_encoding: бюджет - по числу пикселей, предел multicast - по частоте кадров"""
+        from src.streaming.screen_capture import ScreenCapture
+        
+        capture = ScreenCapture(cursor=False)
+        width, height = capture.target_resolution
+        capture.set_frame_budget(100_000)
+        capture.set_encoding(70, 24, (width // 2, height // 2))
+        assert capture.budget_encoder.budget == 25_000
+        capture.set_encoding(70, 24, (width, height))
+        assert capture.budget_encoder.budget == 100_000
+        
+        capture.set_frame_budget(100_000, max_byte_rate=1_200_000)
+        assert capture.budget_encoder.budget == 1_200_000 // capture.target_fps
+        capture.set_encoding(70, 12, (width, height))
+        assert capture.budget_encoder.budget == 100_000
+        capture.set_encoding(70, 24, (width, height))
+        assert capture.budget_encoder.budget == 50_000
+
+
+class TestCursorChannel:
+    """Тесты курсора преподавателя отдельным каналом"""
+    
+    MONITOR = {"left": 100, "top": 0, "width": 1281, "height": 721}
+    
+    def make_tracker(self, state):
+        from src.streaming.cursor_channel import CursorTracker
+        
+        return CursorTracker(source=lambda: state[0], shape_reader=lambda handle: None)
+    
+    def test_tracker_sends_changes_only(self):
+        """Позиция уходит при изменении и раз в CURSOR_KEEPALIVE, новая форма - один раз"""
+        from src.streaming.cursor_channel import CURSOR_KEEPALIVE, CURSOR_SCALE, arrow_shape
+        
+        state = [(740, 360, True, 7)]
+        tracker = self.make_tracker(state)
+        update, shape = tracker.poll(self.MONITOR, now=0.0)
+        assert shape.key == arrow_shape().key
+        assert update == {"x": CURSOR_SCALE // 2, "y": CURSOR_SCALE // 2, "shape": shape.key}
+        
+        assert tracker.poll(self.MONITOR, now=0.1) == (None, None)
+        state[0] = (741, 360, True, 7)
+        update, shape = tracker.poll(self.MONITOR, now=0.2)
+        assert update["x"] > CURSOR_SCALE // 2 and shape is None
+        
+        update, _ = tracker.poll(self.MONITOR, now=0.2 + CURSOR_KEEPALIVE)
+        assert update is not None
+        assert tracker.get_stats()["shapes"] == 1
+    
+    def test_tracker_forgets_evicted_shapes(self):
+        """Форма выброшена из кэша - ее дескриптор читается и рассылается заново"""
+        import numpy as np
+        from src.streaming.cursor_channel import CURSOR_SHAPE_CACHE, CursorShape, CursorTracker
+        
+        def reader(handle):
+            image = np.full((4, 4, 4), handle % 256, dtype=np.uint8)
+            return CursorShape(image, (0, 0))
+        
+        state = [(740, 360, True, 0)]
+        tracker = CursorTracker(source=lambda: state[0], shape_reader=reader)
+        for handle in range(CURSOR_SHAPE_CACHE + 1):
+            state[0] = (740, 360, True, handle)
+            _, shape = tracker.poll(self.MONITOR, now=float(handle))
+            assert shape is not None
+        assert len(tracker._keys) == len(tracker.shapes) == CURSOR_SHAPE_CACHE
+        
+        state[0] = (740, 360, True, 0)
+        _, shape = tracker.poll(self.MONITOR, now=1000.0)
+        assert shape is not None and shape.key in tracker.shapes
+        
+        
+        """Скрытый курсор и курсор вне транслируемого экрана - ключ CURSOR_HIDDEN"""
+        from src.streaming.cursor_channel import CURSOR_HIDDEN
+        
+        state = [(50, 360, True, 7)]
+        tracker = self.make_tracker(state)
+        update, shape = tracker.poll(self.MONITOR, now=0.0)
+        assert update["shape"] == CURSOR_HIDDEN and shape is None
+        
+        state[0] = (740, 360, False, 7)
+        assert tracker.poll(self.MONITOR, now=0.1) == (None, None)
+        state[0] = None
+        assert tracker.poll(self.MONITOR, now=0.2) == (None, None)
+    
+    def test_receiver_requests_unknown_shape(self):
+        """Незнакомая форма запрашивается не чаще CURSOR_SHAPE_REQUEST_HOLD"""
+        from src.streaming.cursor_channel import CursorReceiver, CURSOR_SHAPE_REQUEST_HOLD, arrow_shape
+        
+        shape = arrow_shape()
+        requested = []
+        receiver = CursorReceiver()
+        receiver.on_shape_needed = requested.append
+        update = {"x": 0, "y": 0, "shape": shape.key}
+        receiver.process(update, now=0.0)
+        receiver.process(update, now=0.1)
+        receiver.process(update, now=CURSOR_SHAPE_REQUEST_HOLD)
+        assert requested == [shape.key, shape.key]
+        assert receiver.place(640, 360) is None
+        
+        receiver.process_shape(*shape.to_message())
+        receiver.process(update, now=10.0)
+        assert len(requested) == 2
+    
+    def test_receiver_place(self):
+        """Форма после PNG не меняется, угол формы - позиция минус точка касания"""
+        import numpy as np
+        from src.streaming.cursor_channel import CursorReceiver, CURSOR_SCALE, arrow_shape
+        
+        shape = arrow_shape()
+        receiver = CursorReceiver()
+        received = receiver.process_shape(*shape.to_message())
+        assert received.key == shape.key
+        assert np.array_equal(received.image, shape.image)
+        
+        receiver.process({"x": CURSOR_SCALE, "y": CURSOR_SCALE // 2, "shape": shape.key})
+        assert receiver.place(641, 361) == (640 - shape.hotspot[0], 180 - shape.hotspot[1])
+        receiver.clear()
+        assert receiver.place(641, 361) is None
+    
+    def test_cursor_message_is_small(self):
+        """Движение курсора - пакет в сотню-другую байт вместо кадра"""
+        from src.network.protocol import Protocol
+        from src.common.constants import MessageType
+        
+        data = {"x": 32767, "y": 40000, "shape": 0xFFFFFFFF}
+        packet = Protocol.pack_for_version(Protocol.local_version(), MessageType.SCREEN_CURSOR, data)
+        assert 0 < len(packet) < 200
+
+
 class TestWhiteboard:
     """Тесты интерактивной доски"""
     